@@ -1,3 +1,4 @@
+import sys
 import numpy as np
 import coalpy.gpu as g
 
@@ -6,6 +7,7 @@ from . import gpugeo
 from . import utilities
 from . import raster
 from . import overlay
+from . import vertex_format
 
 info = g.get_current_adapter_info()
 print("""
@@ -25,9 +27,9 @@ print("""
 print("device: {}".format(info[1]))
 initial_w = 1600 
 initial_h = 900
-geo = gpugeo.GpuGeo()
+geo = gpugeo.GpuGeo(vertex_format.VertexFormat.Compact if "--compact-vertices" in sys.argv else vertex_format.VertexFormat.Full)
 rasterizer = raster.Rasterizer(initial_w, initial_h)
-active_editor = editor.Editor(geo, None)
+active_editor = editor.Editor(geo, None, optimize_vertex_cache = "--optimize-vertex-cache" in sys.argv)
 active_editor.load_editor_state()
 
 def on_render(render_args : g.RenderArgs):
@@ -35,9 +37,9 @@ def on_render(render_args : g.RenderArgs):
     if render_args.width == 0 or render_args.height == 0:
         return False
 
+    active_editor.profiler.begin_capture()
     active_editor.build_ui(render_args.imgui, render_args.implot)
     viewports = active_editor.viewports
-    active_editor.profiler.begin_capture()
     active_editor.render_tools()
     for vp in viewports:
         cmd_list = g.CommandList()
@@ -76,4 +78,5 @@ w = g.Window(
 
 g.run()
 active_editor.save_editor_state()
+active_editor.shutdown()
 w = None
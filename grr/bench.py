@@ -0,0 +1,507 @@
+import sys
+import time
+import numpy as np
+from . import get_module_path
+from . import default_scenes as scenes
+from . import obj_loader
+from . import range_allocator
+from . import vertex_format
+from . import meshlet
+from . import camera
+from . import vertex_cache
+from . import instances
+
+# Benchmarks, CPU side unless noted. Usage: python -m grr.bench [benchmark names]
+# Runs all benchmarks when no names are given.
+
+def time_fn(fn, repeats = 3):
+    times = []
+    result = None
+    for _ in range(repeats):
+        begin = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - begin)
+    return (min(times), result)
+
+def default_scene_files():
+    return [(nm, get_module_path() + path) for (nm, path) in scenes.data.items() if isinstance(path, str)]
+
+# camera looking at the whole scene along +z.
+def scene_camera(mesh_data, w = 1920, h = 1080):
+    aabb_min = np.min(mesh_data.mesh_table['aabb_min'], axis=0)
+    aabb_max = np.max(mesh_data.mesh_table['aabb_max'], axis=0)
+    cam = camera.Camera(w, h)
+    cam.pos = (aabb_min + aabb_max) * 0.5 - np.array([0.0, 0.0, np.linalg.norm(aabb_max - aabb_min)])
+    return cam
+
+# gpu: durations in seconds of the markers named marker_name, over frame_count calls of render_fn.
+def gpu_marker_times(render_fn, marker_name, frame_count = 32):
+    import coalpy.gpu as g
+    times = []
+    for _ in range(frame_count):
+        g.begin_collect_markers()
+        render_fn()
+        marker_gpu_data = g.end_collect_markers()
+        request = g.ResourceDownloadRequest(marker_gpu_data.timestamp_buffer)
+        request.resolve()
+        timestamps = np.frombuffer(request.data_as_bytearray(), dtype=np.uint64)
+        times.extend([(float(timestamps[ei]) - float(timestamps[bi])) / marker_gpu_data.timestamp_frequency for (nm, _, bi, ei) in marker_gpu_data.markers if nm == marker_name])
+    return times
+
+def bench_obj_loader():
+    import pywavefront
+    print("[bench]: obj loading, native obj_loader vs pywavefront")
+    print(f"{'scene' : <12} {'triangles' : >10} {'native' : >12} {'pywavefront' : >12} {'speedup' : >8}")
+    for (nm, file_name) in default_scene_files():
+        (native_time, mesh_data) = time_fn(lambda: obj_loader.load_obj(file_name))
+        (pywavefront_time, _) = time_fn(lambda: pywavefront.Wavefront(file_name, create_materials=True, collect_faces=True), repeats = 1)
+        print(f"{nm : <12} {mesh_data.triangle_count : >10} {native_time * 1000 : >9.1f} ms {pywavefront_time * 1000 : >9.1f} ms {pywavefront_time / native_time : >7.1f}x")
+
+# allocate / free churn over a pool with a few thousand live ranges, then a full compaction.
+def bench_range_allocator(live_count = 4096, op_count = 100000):
+    print("[bench]: range allocator, " + str(live_count) + " live ranges, " + str(op_count) + " alloc/free pairs")
+    rng = np.random.default_rng(0)
+    sizes = rng.integers(1, 4096, size = live_count + op_count).tolist()
+    victims = rng.integers(0, live_count, size = op_count).tolist()
+    allocator = range_allocator.RangeAllocator(int(np.sum(sizes[0:live_count])) * 2)
+    live = [allocator.allocate(sz) for sz in sizes[0:live_count]]
+
+    def churn():
+        for i in range(op_count):
+            allocator.free(live[victims[i]])
+            offset = allocator.allocate(sizes[live_count + i])
+            if offset is None:
+                allocator.grow(allocator.capacity * 2)
+                offset = allocator.allocate(sizes[live_count + i])
+            live[victims[i]] = offset
+    (churn_time, _) = time_fn(churn, repeats = 1)
+
+    fragmented_size = allocator.fragmented_size
+    free_range_count = allocator.free_range_count
+    def compact():
+        move_count = 0
+        while allocator.compact_step() is not None:
+            move_count += 1
+        return move_count
+    (compact_time, move_count) = time_fn(compact, repeats = 1)
+    print(f"churn: {churn_time * 1e9 / op_count : .0f} ns per alloc/free pair, {free_range_count} free ranges, {fragmented_size} fragmented units")
+    print(f"compaction: {move_count} moves in {compact_time * 1000 : .1f} ms")
+
+# precision of the compact vertex format on the default scenes.
+def bench_vertex_format():
+    print("[bench]: compact vertex format error report")
+    print(f"{'scene' : <12} {'vertices' : >10} {'full' : >10} {'compact' : >10} {'pos err' : >10} {'pos err rel' : >12} {'normal err' : >11} {'uv err' : >10}")
+    for (nm, file_name) in default_scene_files():
+        mesh_data = obj_loader.load_obj(file_name)
+        (encode_time, _) = time_fn(lambda: vertex_format.encode_compact(mesh_data.vertices, mesh_data.mesh_table))
+        r = vertex_format.compact_error_report(mesh_data)
+        print(f"{nm : <12} {r['vertex_count'] : >10} {r['full_byte_size'] / (1024 * 1024) : >7.2f} mb {r['compact_byte_size'] / (1024 * 1024) : >7.2f} mb "
+              f"{r['max_position_error'] : >10.2e} {r['max_relative_position_error'] : >12.2e} {r['max_normal_error_degrees'] : >7.3f} deg {r['max_uv_error'] : >10.2e}"
+              f"   encode {encode_time * 1000 : .1f} ms")
+
+# cluster build time, and triangles surviving the cluster culling from a camera looking at the scene.
+def bench_meshlet():
+    print("[bench]: meshlet build and cluster culling")
+    print(f"{'scene' : <12} {'triangles' : >10} {'clusters' : >9} {'build' : >10} {'frustum' : >8} {'+backface' : >10}")
+    for (nm, file_name) in default_scene_files():
+        mesh_data = obj_loader.load_obj(file_name)
+        (build_time, clustered) = time_fn(lambda: meshlet.build(mesh_data), repeats = 1)
+        clusters = clustered.clusters
+        cam = scene_camera(mesh_data)
+        survivors = []
+        for flags in [0, meshlet.ClusterCullFlags.CLUSTER_CULL_FLAGS_BACKFACE]:
+            visible = meshlet.cull_clusters(clusters, cam.view_matrix, cam.proj_matrix, flags)
+            survivors.append(np.sum(clusters['triangle_count'][visible]) / max(mesh_data.triangle_count, 1))
+        print(f"{nm : <12} {mesh_data.triangle_count : >10} {len(clusters) : >9} {build_time * 1000 : >7.1f} ms {survivors[0] * 100 : >7.1f}% {survivors[1] * 100 : >9.1f}%")
+
+# fifo cache miss ratios before / after the vertex cache optimization.
+def bench_vertex_cache():
+    print("[bench]: vertex cache optimization, fifo cache of " + str(vertex_cache.g_cache_size) + " vertices")
+    print(f"{'scene' : <12} {'triangles' : >10} {'acmr' : >13} {'atvr' : >13} {'optimize' : >11}")
+    for (nm, file_name) in default_scene_files():
+        mesh_data = meshlet.build(obj_loader.load_obj(file_name))
+        (optimize_time, optimized) = time_fn(lambda: vertex_cache.optimize(mesh_data), repeats = 1)
+        before = vertex_cache.cache_metrics(mesh_data.indices)
+        after = vertex_cache.cache_metrics(optimized.indices)
+        print(f"{nm : <12} {mesh_data.triangle_count : >10} {before['acmr'] : >5.3f} -> {after['acmr'] : >5.3f} {before['atvr'] : >5.3f} -> {after['atvr'] : >5.3f} {optimize_time * 1000 : >8.1f} ms")
+
+# gpu: median binning and fine raster times with and without the vertex cache optimization.
+def bench_binning_vertex_cache(w = 1920, h = 1080):
+    import coalpy.gpu as g
+    from . import gpugeo
+    from . import raster
+    print("[bench]: gpu binning / fine raster times, " + str(w) + "x" + str(h) + ", original vs vertex cache optimized")
+    print(f"{'scene' : <12} {'variant' : <10} {'binning' : >10} {'fine raster' : >12}")
+    for (nm, file_name) in default_scene_files():
+        mesh_data = meshlet.build(obj_loader.load_obj(file_name))
+        cam = scene_camera(mesh_data, w, h)
+        for (variant, variant_data) in [("original", mesh_data), ("optimized", vertex_cache.optimize(mesh_data))]:
+            geo = gpugeo.GpuGeo()
+            geo.register_mesh(variant_data)
+            rasterizer = raster.Rasterizer(w, h)
+            def render():
+                cmd_list = g.CommandList()
+                rasterizer.rasterize(cmd_list, w, h, cam.view_matrix, cam.proj_matrix, geo)
+                g.schedule(cmd_list)
+            binning_time = np.median(gpu_marker_times(render, "raster_binning"))
+            fine_raster_time = np.median(gpu_marker_times(render, "fine_raster"))
+            print(f"{nm : <12} {variant : <10} {binning_time * 1000 : >7.3f} ms {fine_raster_time * 1000 : >9.3f} ms")
+
+# instance table churn, and the per frame cost of rebuilding the gpu table after moving every instance.
+def bench_instances(instance_count = 10000, op_count = 100000):
+    print("[bench]: instance table, " + str(instance_count) + " instances, " + str(op_count) + " moves / add-remove pairs")
+    rng = np.random.default_rng(0)
+    instance_table = instances.InstanceTable()
+    worlds = rng.random((instance_count, 4, 4)).astype('f')
+    ids = [instance_table.add(i % 16, worlds[i]) for i in range(instance_count)]
+    victims = rng.integers(0, instance_count, size = op_count).tolist()
+    mesh_ranges = { h : (h * 1000, 1000, h * 16, 16) for h in range(16) }
+
+    def moves():
+        for i in range(op_count):
+            instance_table.move(ids[victims[i]], worlds[victims[i]])
+    def add_removes():
+        for i in range(op_count):
+            instance_table.remove(ids[victims[i]])
+            ids[victims[i]] = instance_table.add(victims[i] % 16, worlds[victims[i]])
+    (move_time, _) = time_fn(moves, repeats = 1)
+    (add_remove_time, _) = time_fn(add_removes, repeats = 1)
+    (build_time, table) = time_fn(lambda: instance_table.build_table(mesh_ranges))
+    print(f"move: {move_time * 1e9 / op_count : .0f} ns, add + remove: {add_remove_time * 1e9 / op_count : .0f} ns")
+    print(f"gpu table: {build_time * 1000 : .2f} ms for {len(table)} instances, {table.nbytes / 1024 : .0f} kb upload")
+
+# matrices of many dirty objects, one Transform per object vs a single TransformArray.
+def bench_transform_array(count = 10000):
+    from . import transform
+    print("[bench]: " + str(count) + " dirty transforms, Transform.update_mats vs TransformArray.update_mats")
+    rng = np.random.default_rng(0)
+    translations = rng.normal(size = (count, 3)).astype('f')
+    rotations = rng.normal(size = (count, 4)).astype('f')
+    rotations /= np.linalg.norm(rotations, axis=1)[:, np.newaxis]
+    transforms = [transform.Transform() for _ in range(count)]
+    def update_objects():
+        for (t, tr, r) in zip(transforms, translations, rotations):
+            t.translation = tr
+            t.rotation = np.quaternion(*r.tolist())
+            t.update_mats()
+    transform_array = transform.TransformArray(count)
+    def update_array():
+        transform_array.set_translations(slice(None), translations)
+        transform_array.set_rotations(slice(None), rotations)
+        transform_array.update_mats()
+    (object_time, _) = time_fn(update_objects)
+    (array_time, _) = time_fn(update_array)
+    print(f"Transform: {object_time * 1000 : .2f} ms, TransformArray: {array_time * 1000 : .2f} ms, speedup {object_time / array_time : .1f}x")
+
+def bench_scene_graph(count = 100000):
+    from . import scene_graph
+    print("[bench]: scene graph of " + str(count) + " nodes, full vs incremental world matrix updates")
+    rng = np.random.default_rng(0)
+    #random recursive tree, each node is parented to an earlier one.
+    parents = (rng.random(count) * np.arange(count)).astype(np.int64)
+    parents[0] = -1
+    graph = scene_graph.SceneGraph()
+    graph.add_nodes(parents)
+    def update_all():
+        graph.set_translations(np.arange(count), rng.normal(size = (count, 3)).astype('f'))
+        return len(graph.update())
+    (structure_time, _) = time_fn(lambda: graph.update(), repeats = 1)
+    (full_time, _) = time_fn(update_all)
+    print(f"build order: {structure_time * 1000 : .2f} ms, depth {int(np.max(graph.depths))}, all nodes dirty: {full_time * 1000 : .2f} ms")
+    for changed in [1, 100, 1000]:
+        def update_some():
+            nodes = rng.choice(count, size = changed, replace = False)
+            graph.set_translations(nodes, rng.normal(size = (changed, 3)).astype('f'))
+            return len(graph.update())
+        (incremental_time, updated) = time_fn(update_some)
+        print(f"{changed} changed nodes: {incremental_time * 1000 : .2f} ms, {updated} world matrices updated")
+
+# gpu: single pass look-back scan vs the multi pass scan, exclusive, 1K to 16M elements.
+def bench_prefix_sum(sizes = [1 << 10, 1 << 14, 1 << 16, 1 << 18, 1 << 20, 1 << 22, 1 << 24]):
+    import coalpy.gpu as g
+    from . import prefix_sum
+    from . import utilities as utils
+    print("[bench]: gpu exclusive prefix sum, single pass look-back vs multi pass")
+    print(f"{'elements' : >10} {'single pass' : >12} {'multi pass' : >12} {'speedup' : >8} {'single pass rate' : >18}")
+    rng = np.random.default_rng(0)
+    for count in sizes:
+        input_buffer = g.Buffer(format = g.Format.R32_UINT, element_count = count)
+        cmd_list = g.CommandList()
+        cmd_list.upload_resource(source = rng.integers(0, 16, size = count).astype(np.uint32), destination = input_buffer)
+        g.schedule(cmd_list)
+        variants = [(prefix_sum.run, prefix_sum.allocate_args(count))]
+        #the first multi pass dispatch has one group per 128 elements and no second dimension.
+        if utils.divup(count, prefix_sum.g_group_size) <= prefix_sum.g_max_group_count_x:
+            variants.append((prefix_sum.run_multipass, prefix_sum.allocate_args_multipass(count)))
+        times = []
+        for (run_fn, args) in variants:
+            def render():
+                cmd_list = g.CommandList()
+                cmd_list.begin_marker("prefix_sum")
+                run_fn(cmd_list, input_buffer, args, is_exclusive = True)
+                cmd_list.end_marker()
+                g.schedule(cmd_list)
+            times.append(np.median(gpu_marker_times(render, "prefix_sum")))
+        single_pass = f"{times[0] * 1000 : >9.3f} ms"
+        multi_pass = f"{times[1] * 1000 : >9.3f} ms" if len(times) > 1 else f"{'-' : >12}"
+        speedup = f"{times[1] / times[0] : >7.2f}x" if len(times) > 1 else f"{'-' : >8}"
+        print(f"{count : >10} {single_pass} {multi_pass} {speedup} {count / times[0] * 1e-9 : >11.2f} Gelem/s")
+
+# gpu: median time and throughput of the primitives package at a few sizes.
+def bench_primitives(sizes = [1 << 16, 1 << 20, 1 << 22, 1 << 24]):
+    import coalpy.gpu as g
+    from . import primitives
+    print("[bench]: gpu primitives throughput")
+    print(f"{'primitive' : <16} {'elements' : >10} {'time' : >12} {'rate' : >14}")
+    rng = np.random.default_rng(0)
+    for count in sizes:
+        (values_buffer, flags_buffer, keys_buffer) = [g.Buffer(format = g.Format.R32_UINT, element_count = count) for _ in range(3)]
+        cmd_list = g.CommandList()
+        cmd_list.upload_resource(source = rng.integers(0, 1 << 16, size = count).astype(np.uint32), destination = values_buffer)
+        cmd_list.upload_resource(source = (rng.random(count) < 0.25).astype(np.uint32), destination = flags_buffer)
+        cmd_list.upload_resource(source = rng.integers(0, 1 << 32, size = count, dtype=np.uint64).astype(np.uint32), destination = keys_buffer)
+        g.schedule(cmd_list)
+
+        reduce_args = primitives.reduction.allocate_args(count)
+        scan_args = primitives.segmented_scan.allocate_args(count)
+        compact_args = primitives.compact.allocate_args(count)
+        sort_args = primitives.radix_sort.allocate_args(count)
+        variants = [
+            ("reduce", lambda cmd_list: primitives.reduction.run(cmd_list, values_buffer, reduce_args)),
+            ("segmented_scan", lambda cmd_list: primitives.segmented_scan.run(cmd_list, values_buffer, flags_buffer, scan_args)),
+            ("compact", lambda cmd_list: primitives.compact.run(cmd_list, values_buffer, flags_buffer, compact_args)),
+            ("radix_sort", lambda cmd_list: primitives.radix_sort.run(cmd_list, keys_buffer, values_buffer, sort_args))
+        ]
+        for (nm, run_fn) in variants:
+            def render():
+                cmd_list = g.CommandList()
+                cmd_list.begin_marker(nm)
+                run_fn(cmd_list)
+                cmd_list.end_marker()
+                g.schedule(cmd_list)
+            t = np.median(gpu_marker_times(render, nm))
+            print(f"{nm : <16} {count : >10} {t * 1000 : >9.3f} ms {count / t * 1e-9 : >6.2f} Gelem/s")
+
+# gpu: fine raster time and triangles shaded per fine tile, with and without depth sorted bins, on
+# high overdraw views from inside the scene along its long and short horizontal axes.
+def bench_depth_sorted_bins(scene = "sponza", w = 1920, h = 1080):
+    import coalpy.gpu as g
+    from . import gpugeo
+    from . import raster
+    from . import vec
+    print("[bench]: gpu depth sorted bins, " + scene + " " + str(w) + "x" + str(h))
+    print(f"{'view' : <12} {'bins' : <8} {'sort' : >10} {'fine raster' : >12} {'tris / tile' : >12}")
+    mesh_data = meshlet.build(obj_loader.load_obj(dict(default_scene_files())[scene]))
+    geo = gpugeo.GpuGeo()
+    geo.register_mesh(mesh_data)
+    rasterizer = raster.Rasterizer(w, h)
+    aabb_min = np.min(mesh_data.mesh_table['aabb_min'], axis=0)
+    aabb_max = np.max(mesh_data.mesh_table['aabb_max'], axis=0)
+    (fine_tiles_w, fine_tiles_h) = rasterizer.get_fine_tile_size(w, h)
+    #camera rotations about y, q_from_angle_axis turns by twice the angle: +x, then +z.
+    for (view_name, axis, angle) in [("long axis", 0, 0.25 * np.pi), ("short axis", 2, 0.0)]:
+        cam = camera.Camera(w, h)
+        cam.fov = np.radians(60.0)
+        pos = (aabb_min + aabb_max) * 0.5
+        pos[axis] = aabb_min[axis] + 0.05 * (aabb_max[axis] - aabb_min[axis])
+        cam.pos = pos
+        cam.rotation = vec.q_from_angle_axis(angle, vec.float3(0, 1, 0))
+        for depth_sorted_bins in [False, True]:
+            def render(view_settings):
+                cmd_list = g.CommandList()
+                rasterizer.rasterize(cmd_list, w, h, cam.view_matrix, cam.proj_matrix, geo, view_settings)
+                g.schedule(cmd_list)
+            view_settings = raster.ViewSettings(depth_sorted_bins = depth_sorted_bins)
+            fine_raster_time = np.median(gpu_marker_times(lambda: render(view_settings), "fine_raster"))
+            sort_time = np.median(gpu_marker_times(lambda: render(view_settings), "sort_bins")) if depth_sorted_bins else 0.0
+
+            render(raster.ViewSettings(depth_sorted_bins = depth_sorted_bins, debug_fine_tiles = True))
+            request = g.ResourceDownloadRequest(rasterizer.m_fine_tile_counter_buffer)
+            request.resolve()
+            shaded = np.frombuffer(request.data_as_bytearray(), dtype=np.uint32)[0:fine_tiles_w * fine_tiles_h]
+            print(f"{view_name : <12} {'sorted' if depth_sorted_bins else 'unsorted' : <8} {sort_time * 1000 : >7.3f} ms {fine_raster_time * 1000 : >9.3f} ms {np.mean(shaded) : >12.1f}")
+
+# gpu: binning and bin list times of the full (12 byte) and packed (8 byte) bin records, with the
+# records and bin elements memory.
+def bench_bin_records(w = 1920, h = 1080):
+    import coalpy.gpu as g
+    from . import gpugeo
+    from . import raster
+    print("[bench]: gpu bin record layouts, " + str(w) + "x" + str(h))
+    print(f"{'scene' : <12} {'layout' : <8} {'records' : >10} {'memory' : >10} {'binning' : >10} {'bin list' : >10}")
+    for (nm, file_name) in default_scene_files():
+        mesh_data = meshlet.build(obj_loader.load_obj(file_name))
+        cam = scene_camera(mesh_data, w, h)
+        geo = gpugeo.GpuGeo()
+        geo.register_mesh(mesh_data)
+        for (layout_name, layout) in [("full", raster.BinRecordLayout.Full), ("packed", raster.BinRecordLayout.Packed)]:
+            rasterizer = raster.Rasterizer(w, h, layout)
+            def render():
+                cmd_list = g.CommandList()
+                rasterizer.rasterize(cmd_list, w, h, cam.view_matrix, cam.proj_matrix, geo)
+                g.schedule(cmd_list)
+            binning_time = np.median(gpu_marker_times(render, "raster_binning"))
+            bin_list_time = np.median(gpu_marker_times(render, "generate_bin_list"))
+            request = g.ResourceDownloadRequest(rasterizer.m_total_records_buffer)
+            request.resolve()
+            record_count = int(np.frombuffer(request.data_as_bytearray(), dtype=np.uint32)[0])
+            print(f"{nm : <12} {layout_name if rasterizer.bin_record_layout == layout else layout_name + '*' : <8} {record_count : >10} {rasterizer.bin_record_byte_size / (1024 * 1024) : >7.1f} MB {binning_time * 1000 : >7.3f} ms {bin_list_time * 1000 : >7.3f} ms")
+
+# gpu: binning times of the triangle per thread and the load balanced binning, on close-up views
+# where the nearest triangles span many coarse tiles.
+def bench_load_balanced_binning(w = 1920, h = 1080):
+    import coalpy.gpu as g
+    from . import gpugeo
+    from . import raster
+    print("[bench]: gpu load balanced binning, " + str(w) + "x" + str(h))
+    print(f"{'scene' : <12} {'binning' : <14} {'binning' : >10} {'bin expand' : >11} {'bin list' : >10}")
+    scene_files = dict(default_scene_files())
+    for nm in ["teapot", "sponza"]:
+        mesh_data = meshlet.build(obj_loader.load_obj(scene_files[nm]))
+        aabb_min = np.min(mesh_data.mesh_table['aabb_min'], axis=0)
+        aabb_max = np.max(mesh_data.mesh_table['aabb_max'], axis=0)
+        #teapot: just outside its bounds. sponza: inside, near one end of its long axis.
+        cam = camera.Camera(w, h)
+        cam.fov = np.radians(60.0)
+        pos = (aabb_min + aabb_max) * 0.5
+        pos[2] = aabb_min[2] - 0.1 * (aabb_max[2] - aabb_min[2]) if nm == "teapot" else aabb_min[2] + 0.05 * (aabb_max[2] - aabb_min[2])
+        cam.pos = pos
+        geo = gpugeo.GpuGeo()
+        geo.register_mesh(mesh_data)
+        rasterizer = raster.Rasterizer(w, h)
+        for load_balanced_binning in [False, True]:
+            view_settings = raster.ViewSettings(load_balanced_binning = load_balanced_binning)
+            def render():
+                cmd_list = g.CommandList()
+                rasterizer.rasterize(cmd_list, w, h, cam.view_matrix, cam.proj_matrix, geo, view_settings)
+                g.schedule(cmd_list)
+            binning_time = np.median(gpu_marker_times(render, "raster_binning"))
+            expand_time = np.median(gpu_marker_times(render, "bin_expand")) if load_balanced_binning else 0.0
+            bin_list_time = np.median(gpu_marker_times(render, "generate_bin_list"))
+            print(f"{nm : <12} {'load balanced' if load_balanced_binning else 'per triangle' : <14} {binning_time * 1000 : >7.3f} ms {expand_time * 1000 : >8.3f} ms {bin_list_time * 1000 : >7.3f} ms")
+
+# gpu: binning times of the group staged records against two global atomics per record, over
+# instance grids of a random triangle soup up to millions of triangles.
+def bench_staged_binning(w = 1920, h = 1080, mesh_triangle_count = 1 << 16, instance_counts = [16, 32, 64]):
+    import coalpy.gpu as g
+    from . import gpugeo
+    from . import raster
+    from . import mesh
+    print("[bench]: gpu staged binning, " + str(w) + "x" + str(h) + ", no cluster culling")
+    print(f"{'triangles' : >10} {'records' : >10} {'atomics' : >10} {'staged' : >10} {'speedup' : >8}")
+    rng = np.random.default_rng(0)
+    vertices = np.zeros((mesh_triangle_count * 3, 8), dtype='f')
+    vertices[:, 0:3] = np.repeat(rng.uniform(-1.0, 1.0, (mesh_triangle_count, 3)), 3, axis=0) + rng.uniform(-0.05, 0.05, (mesh_triangle_count * 3, 3))
+    indices = np.arange(mesh_triangle_count * 3, dtype=np.uint32).reshape((-1, 3))
+    mesh_data = meshlet.build(mesh.MeshData(vertices, indices, "random", mesh.build_mesh_table(vertices, indices, [mesh_triangle_count])))
+    cam = camera.Camera(w, h)
+    cam.pos = np.array([0.0, 0.0, -24.0], dtype='f')
+    for instance_count in instance_counts:
+        geo = gpugeo.GpuGeo()
+        handle = geo.register_mesh(mesh_data)
+        grid_w = int(np.ceil(np.sqrt(instance_count)))
+        for i in range(1, instance_count):
+            world = np.identity(4, dtype='f')
+            world[0:2, 3] = [(i % grid_w - grid_w * 0.5) * 2.5, (i // grid_w - grid_w * 0.5) * 2.5]
+            geo.add_instance(handle, world)
+        geo.update_uploads()
+        rasterizer = raster.Rasterizer(w, h)
+        view_settings = raster.ViewSettings(cluster_culling = False)
+        def render():
+            cmd_list = g.CommandList()
+            rasterizer.rasterize(cmd_list, w, h, cam.view_matrix, cam.proj_matrix, geo, view_settings)
+            g.schedule(cmd_list)
+        times = []
+        for staged_binning in [False, True]:
+            rasterizer.staged_binning = staged_binning
+            times.append(np.median(gpu_marker_times(render, "raster_binning")))
+        request = g.ResourceDownloadRequest(rasterizer.m_total_records_buffer)
+        request.resolve()
+        record_count = int(np.frombuffer(request.data_as_bytearray(), dtype=np.uint32)[0])
+        print(f"{geo.instance_triangle_count : >10} {record_count : >10} {times[0] * 1000 : >7.3f} ms {times[1] * 1000 : >7.3f} ms {times[0] / times[1] : >7.2f}x")
+
+# gpu: bin list and fine raster times of the coarse bins against the fine bins, and the triangle
+# visits per pixel of the fine raster with each.
+def bench_fine_bins(w = 1920, h = 1080):
+    import coalpy.gpu as g
+    from . import gpugeo
+    from . import raster
+    print("[bench]: gpu fine bins, " + str(w) + "x" + str(h))
+    print(f"{'scene' : <12} {'bins' : <8} {'bin list' : >10} {'fine raster' : >12} {'visits/pixel' : >13}")
+    scene_files = dict(default_scene_files())
+    for nm in ["teapot", "sponza"]:
+        mesh_data = meshlet.build(obj_loader.load_obj(scene_files[nm]))
+        cam = camera.Camera(w, h)
+        cam.pos = (np.min(mesh_data.mesh_table['aabb_min'], axis=0) + np.max(mesh_data.mesh_table['aabb_max'], axis=0)) * 0.5
+        cam.pos[2] -= 2.0 * float(np.max(mesh_data.mesh_table['aabb_max'][:, 2] - mesh_data.mesh_table['aabb_min'][:, 2]))
+        geo = gpugeo.GpuGeo()
+        geo.register_mesh(mesh_data)
+        rasterizer = raster.Rasterizer(w, h)
+        for fine_bins in [False, True]:
+            view_settings = raster.ViewSettings(fine_bins = fine_bins)
+            def render():
+                cmd_list = g.CommandList()
+                rasterizer.rasterize(cmd_list, w, h, cam.view_matrix, cam.proj_matrix, geo, view_settings)
+                g.schedule(cmd_list)
+            bin_list_time = np.median(gpu_marker_times(render, "generate_bin_list"))
+            fine_raster_time = np.median(gpu_marker_times(render, "fine_raster"))
+            (coarse_visits, fine_visits) = rasterizer.read_triangle_visits_per_pixel(w, h, fine_bins)
+            visits = fine_visits if fine_bins else coarse_visits
+            print(f"{nm : <12} {'fine' if fine_bins else 'coarse' : <8} {bin_list_time * 1000 : >7.3f} ms {fine_raster_time * 1000 : >9.3f} ms {visits : >13.2f}")
+
+# gpu: memory / time trade-off of the triangle setups written by the binning, against the fine
+# raster transforming every triangle again, at 1080p and 4k.
+def bench_triangle_setup(resolutions = [(1920, 1080), (3840, 2160)]):
+    import coalpy.gpu as g
+    from . import gpugeo
+    from . import raster
+    print("[bench]: gpu triangle setup buffer")
+    print(f"{'scene' : <12} {'resolution' : <10} {'setup' : <6} {'memory' : >10} {'binning' : >10} {'fine raster' : >12} {'total' : >10}")
+    scene_files = dict(default_scene_files())
+    for nm in ["teapot", "sponza"]:
+        mesh_data = meshlet.build(obj_loader.load_obj(scene_files[nm]))
+        geo = gpugeo.GpuGeo()
+        geo.register_mesh(mesh_data)
+        for (w, h) in resolutions:
+            cam = camera.Camera(w, h)
+            cam.pos = (np.min(mesh_data.mesh_table['aabb_min'], axis=0) + np.max(mesh_data.mesh_table['aabb_max'], axis=0)) * 0.5
+            cam.pos[2] -= 2.0 * float(np.max(mesh_data.mesh_table['aabb_max'][:, 2] - mesh_data.mesh_table['aabb_min'][:, 2]))
+            rasterizer = raster.Rasterizer(w, h)
+            for triangle_setup in [False, True]:
+                rasterizer.triangle_setup = triangle_setup
+                def render():
+                    cmd_list = g.CommandList()
+                    rasterizer.rasterize(cmd_list, w, h, cam.view_matrix, cam.proj_matrix, geo)
+                    g.schedule(cmd_list)
+                binning_time = np.median(gpu_marker_times(render, "raster_binning"))
+                fine_raster_time = np.median(gpu_marker_times(render, "fine_raster"))
+                memory = rasterizer.triangle_setup_byte_size if triangle_setup else 0
+                print(f"{nm : <12} {str(w) + 'x' + str(h) : <10} {'on' if triangle_setup else 'off' : <6} {memory / (1024 * 1024) : >7.2f} mb {binning_time * 1000 : >7.3f} ms {fine_raster_time * 1000 : >9.3f} ms {(binning_time + fine_raster_time) * 1000 : >7.3f} ms")
+
+g_benchmarks = {
+    'obj_loader' : bench_obj_loader,
+    'range_allocator' : bench_range_allocator,
+    'vertex_format' : bench_vertex_format,
+    'meshlet' : bench_meshlet,
+    'vertex_cache' : bench_vertex_cache,
+    'binning_vertex_cache' : bench_binning_vertex_cache,
+    'instances' : bench_instances,
+    'transform_array' : bench_transform_array,
+    'scene_graph' : bench_scene_graph,
+    'prefix_sum' : bench_prefix_sum,
+    'primitives' : bench_primitives,
+    'depth_sorted_bins' : bench_depth_sorted_bins,
+    'bin_records' : bench_bin_records,
+    'load_balanced_binning' : bench_load_balanced_binning,
+    'staged_binning' : bench_staged_binning,
+    'fine_bins' : bench_fine_bins,
+    'triangle_setup' : bench_triangle_setup
+}
+
+if __name__ == "__main__":
+    names = sys.argv[1:] if len(sys.argv) > 1 else list(g_benchmarks.keys())
+    for nm in names:
+        if nm not in g_benchmarks:
+            print("[bench]: unknown benchmark " + nm + ", available: " + ", ".join(g_benchmarks.keys()))
+            continue
+        g_benchmarks[nm]()
@@ -0,0 +1,195 @@
+import argparse
+import json
+import sys
+import numpy as np
+from . import get_module_path
+from . import default_scenes as scenes
+from . import camera_path
+from . import scene_loader
+from . import raster
+from .raster import g_markers
+
+# Gpu rasterizer benchmark: sweeps scenes x resolutions x rasterizer configurations x camera
+# paths, and reports the median / p95 of the Rasterizer markers captured through the Profiler.
+# Usage: python -m grr.bench_raster [--scenes ...] [--resolutions ...] [--configs ...] [--paths ...] [--output report.json] [--baseline baseline.json]
+# With a baseline, runs whose median got slower than the threshold are reported as
+# regressions and the exit code is 1.
+
+g_report_version = 1
+
+g_resolutions = {
+    "720p" : (1280, 720),
+    "1080p" : (1920, 1080),
+    "4k" : (3840, 2160)
+}
+
+# the two global atomics binning only runs without cluster culling, "staged" is its reference.
+def _unstaged_config(w, h):
+    rasterizer = raster.Rasterizer(w, h)
+    rasterizer.staged_binning = False
+    return (rasterizer, raster.ViewSettings(cluster_culling = False))
+
+def _triangle_setup_config(w, h):
+    rasterizer = raster.Rasterizer(w, h)
+    rasterizer.triangle_setup = True
+    return (rasterizer, None)
+
+# rasterizer configurations: (w, h) -> (Rasterizer, view settings passed to rasterize).
+g_configs = {
+    "default" : lambda w, h: (raster.Rasterizer(w, h), None),
+    "full_records" : lambda w, h: (raster.Rasterizer(w, h, raster.BinRecordLayout.Full), None),
+    "load_balanced" : lambda w, h: (raster.Rasterizer(w, h), raster.ViewSettings(load_balanced_binning = True)),
+    "fine_bins" : lambda w, h: (raster.Rasterizer(w, h), raster.ViewSettings(fine_bins = True)),
+    "staged" : lambda w, h: (raster.Rasterizer(w, h), raster.ViewSettings(cluster_culling = False)),
+    "unstaged" : _unstaged_config,
+    "triangle_setup" : _triangle_setup_config
+}
+
+g_camera_paths = {
+    "orbit" : camera_path.CameraPath.orbit,
+    "dolly" : camera_path.CameraPath.dolly
+}
+
+# median, p95 and friends of a list of durations in seconds, in ms.
+def summarize(times):
+    times_ms = np.array(times, dtype=np.float64) * 1000.0
+    if len(times_ms) == 0:
+        return { 'samples' : 0 }
+    return {
+        'samples' : len(times_ms),
+        'median_ms' : float(np.median(times_ms)),
+        'p95_ms' : float(np.percentile(times_ms, 95)),
+        'mean_ms' : float(np.mean(times_ms)),
+        'min_ms' : float(np.min(times_ms)),
+        'max_ms' : float(np.max(times_ms))
+    }
+
+# reports written before the configuration axis only hold runs of the default configuration.
+def run_key(run):
+    return (run['scene'], run['resolution'], run.get('config', "default"), run['path'])
+
+# Regressions of report against baseline: (run key, marker, baseline median, median) of every
+# marker whose median grew more than threshold (relative) and min_delta_ms (absolute, noise floor).
+def compare_reports(report, baseline, threshold = 0.1, min_delta_ms = 0.01):
+    baseline_runs = { run_key(run) : run for run in baseline['runs'] }
+    regressions = []
+    for run in report['runs']:
+        baseline_run = baseline_runs.get(run_key(run), None)
+        if baseline_run is None:
+            continue
+        for (marker, stats) in run['markers'].items():
+            baseline_stats = baseline_run['markers'].get(marker, None)
+            if baseline_stats is None or 'median_ms' not in baseline_stats or 'median_ms' not in stats:
+                continue
+            (before, after) = (baseline_stats['median_ms'], stats['median_ms'])
+            if after > before * (1.0 + threshold) and (after - before) > min_delta_ms:
+                regressions.append((run_key(run), marker, before, after))
+    return regressions
+
+# Registers a default_scenes.data entry into geo: files go through the scene loader (and its
+# mesh cache), the other entries are GpuGeo loader functions.
+def load_scene(geo, scene):
+    entry = scenes.data[scene]
+    if isinstance(entry, str):
+        geo.register_mesh(scene_loader.load_scene(get_module_path() + entry))
+    else:
+        entry(geo)
+
+# Renders warmup_count + frame_count frames of the path, returns the summary of each marker.
+def run(geo, rasterizer, view_settings, path, w, h, warmup_count = 8):
+    import coalpy.gpu as g
+    from . import profiler
+    marker_times = { nm : [] for nm in g_markers }
+    def on_capture(marker_data):
+        frame_times = {}
+        for (name, end_time, begin_time, _) in marker_data:
+            if name in marker_times:
+                frame_times[name] = frame_times.get(name, 0.0) + (end_time - begin_time)
+        for (name, t) in frame_times.items():
+            marker_times[name].append(t)
+
+    cam = path.create_camera(w, h)
+    def render_frame(frame):
+        path.apply(cam, frame)
+        cmd_list = g.CommandList()
+        rasterizer.rasterize(cmd_list, w, h, cam.view_matrix, cam.proj_matrix, geo, view_settings)
+        g.schedule(cmd_list)
+
+    for _ in range(warmup_count):
+        render_frame(0)
+
+    frame_profiler = profiler.Profiler(on_capture)
+    for frame in range(path.frame_count):
+        frame_profiler.begin_capture()
+        render_frame(frame)
+        frame_profiler.end_capture()
+    frame_profiler.flush()
+    return { nm : summarize(times) for (nm, times) in marker_times.items() }
+
+def run_sweep(scene_names, resolution_names, config_names, path_names, frame_count, warmup_count = 8):
+    import coalpy.gpu as g
+    from . import gpugeo
+    report = {
+        'version' : g_report_version,
+        'device' : g.get_current_adapter_info()[1],
+        'frame_count' : frame_count,
+        'runs' : []
+    }
+    for scene in scene_names:
+        geo = gpugeo.GpuGeo()
+        load_scene(geo, scene)
+        for resolution in resolution_names:
+            (w, h) = g_resolutions[resolution]
+            for config in config_names:
+                (rasterizer, view_settings) = g_configs[config](w, h)
+                for path_name in path_names:
+                    path = g_camera_paths[path_name](geo.mesh_table, frame_count)
+                    markers = run(geo, rasterizer, view_settings, path, w, h, warmup_count)
+                    report['runs'].append({ 'scene' : scene, 'resolution' : resolution, 'width' : w, 'height' : h, 'config' : config, 'path' : path_name, 'markers' : markers })
+                    print_run(report['runs'][-1])
+    return report
+
+def print_header():
+    print(f"{'scene' : <16} {'resolution' : <10} {'config' : <16} {'path' : <8} " + " ".join([f"{nm : >24}" for nm in g_markers]))
+
+def print_run(run):
+    columns = []
+    for nm in g_markers:
+        stats = run['markers'].get(nm, {})
+        columns.append(f"{stats.get('median_ms', 0.0) : >9.3f} / {stats.get('p95_ms', 0.0) : >7.3f} ms" if stats.get('samples', 0) > 0 else f"{'-' : >24}")
+    print(f"{run['scene'] : <16} {run['resolution'] : <10} {run.get('config', 'default') : <16} {run['path'] : <8} " + " ".join(columns))
+
+def main(argv):
+    scene_names = list(scenes.data.keys())
+    parser = argparse.ArgumentParser(prog = "python -m grr.bench_raster", description = "Sweeps the gpu rasterizer over scenes, resolutions, configurations and camera paths.")
+    parser.add_argument("--scenes", nargs = "+", default = scene_names, choices = scene_names)
+    parser.add_argument("--resolutions", nargs = "+", default = list(g_resolutions.keys()), choices = list(g_resolutions.keys()))
+    parser.add_argument("--configs", nargs = "+", default = list(g_configs.keys()), choices = list(g_configs.keys()))
+    parser.add_argument("--paths", nargs = "+", default = list(g_camera_paths.keys()), choices = list(g_camera_paths.keys()))
+    parser.add_argument("--frames", type = int, default = 64, help = "captured frames per run")
+    parser.add_argument("--warmup", type = int, default = 8, help = "frames rendered before capturing")
+    parser.add_argument("--output", default = None, help = "json report file")
+    parser.add_argument("--baseline", default = None, help = "json report to compare against")
+    parser.add_argument("--threshold", type = float, default = 0.1, help = "relative median slow down flagged as a regression")
+    args = parser.parse_args(argv)
+
+    print("[bench_raster]: median / p95 per marker")
+    print_header()
+    report = run_sweep(args.scenes, args.resolutions, args.configs, args.paths, args.frames, args.warmup)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            f.write(json.dumps(report, indent = 4))
+
+    if args.baseline is None:
+        return 0
+
+    with open(args.baseline, "r") as f:
+        baseline = json.loads(f.read())
+    regressions = compare_reports(report, baseline, args.threshold)
+    for ((scene, resolution, config, path), marker, before, after) in regressions:
+        print(f"[bench_raster]: regression {scene} {resolution} {config} {path} {marker}: {before : .3f} ms -> {after : .3f} ms ({(after / before - 1.0) * 100 : +.1f}%)")
+    print("[bench_raster]: " + str(len(regressions)) + " regressions against " + args.baseline)
+    return 1 if len(regressions) > 0 else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,110 @@
+import json
+import numpy as np
+import quaternion
+from . import camera as c
+from . import transform as t
+from . import vec
+
+# Camera paths for offline rendering and benchmarks. A path is a list of keyframes
+# (position, rotation quaternion) sampled at frame_count evenly spaced frames, positions
+# are interpolated linearly and rotations spherically.
+#
+# File format (json), rotations are [w, x, y, z] and fov is in degrees:
+# {
+#     "fov" : 20.0, "near" : 0.01, "far" : 10000.0,
+#     "frame_count" : 240,
+#     "keyframes" : [ { "pos" : [0.0, 0.0, -20.0], "rotation" : [1.0, 0.0, 0.0, 0.0] }, ... ]
+# }
+# frame_count is optional, one frame per keyframe by default.
+
+# (center, size) of the bounding box of all the meshes of a mesh table.
+def _scene_bounds(mesh_table):
+    aabb_min = np.min(mesh_table['aabb_min'], axis=0)
+    aabb_max = np.max(mesh_table['aabb_max'], axis=0)
+    return ((aabb_min + aabb_max) * 0.5, max(float(vec.veclen(aabb_max - aabb_min)), 1e-3))
+
+class CameraPath:
+
+    def __init__(self, positions, rotations, frame_count = None, fov = 20 * t.to_radians(), near = 0.01, far = 10000.0):
+        #(keyframe_count, 3) float32
+        self.m_positions = np.array(positions, dtype='f').reshape((-1, 3))
+        #(keyframe_count,) np.quaternion
+        self.m_rotations = np.array([q.normalized() for q in rotations], dtype=np.quaternion)
+        if len(self.m_positions) == 0 or len(self.m_positions) != len(self.m_rotations):
+            raise ValueError("[CameraPath]: a path needs as many rotations as positions, and at least one keyframe")
+        self.m_frame_count = len(self.m_positions) if frame_count is None else int(frame_count)
+        self.m_fov = fov
+        self.m_near = near
+        self.m_far = far
+
+    def load(file_name):
+        with open(file_name, "r") as f:
+            desc = json.loads(f.read())
+        keyframes = desc['keyframes']
+        return CameraPath(
+            [k['pos'] for k in keyframes],
+            [np.quaternion(*k['rotation']) if 'rotation' in k else np.quaternion(1, 0, 0, 0) for k in keyframes],
+            desc.get('frame_count', None),
+            desc.get('fov', 20.0) * t.to_radians(),
+            desc.get('near', 0.01),
+            desc.get('far', 10000.0))
+
+    def save(self, file_name):
+        desc = {
+            'fov' : self.m_fov / t.to_radians(),
+            'near' : self.m_near,
+            'far' : self.m_far,
+            'frame_count' : self.m_frame_count,
+            'keyframes' : [{ 'pos' : p.tolist(), 'rotation' : [q.w, q.x, q.y, q.z] } for (p, q) in zip(self.m_positions, self.m_rotations)]
+        }
+        with open(file_name, "w") as f:
+            f.write(json.dumps(desc, indent = 4))
+
+    # Full turn around the meshes of mesh_table (mesh.g_mesh_table_dtype), looking at their center.
+    def orbit(mesh_table, frame_count, keyframe_count = 16):
+        (center, distance) = _scene_bounds(mesh_table)
+        angles = np.linspace(0.0, 2.0 * np.pi, keyframe_count + 1)
+        #q_from_angle_axis rotates by twice the angle, the camera front is (sin, 0, cos) of the turn.
+        fronts = np.stack([np.sin(angles), np.zeros(len(angles)), np.cos(angles)], axis=1)
+        positions = center - distance * fronts
+        rotations = [vec.q_from_angle_axis(a * 0.5, vec.float3(0, 1, 0)) for a in angles]
+        return CameraPath(positions, rotations, frame_count)
+
+    # Straight move along +z towards the center of the meshes of mesh_table, from twice
+    # to half the scene size.
+    def dolly(mesh_table, frame_count):
+        (center, distance) = _scene_bounds(mesh_table)
+        positions = [center - np.array([0.0, 0.0, 2.0 * distance]), center - np.array([0.0, 0.0, 0.5 * distance])]
+        return CameraPath(positions, [np.quaternion(1, 0, 0, 0)] * 2, frame_count)
+
+    @property
+    def frame_count(self):
+        return self.m_frame_count
+
+    @property
+    def keyframe_count(self):
+        return len(self.m_positions)
+
+    # (position, rotation) of a frame.
+    def sample(self, frame):
+        if len(self.m_positions) == 1 or self.m_frame_count <= 1:
+            return (self.m_positions[0].copy(), self.m_rotations[0].copy())
+        s = (frame / (self.m_frame_count - 1)) * (len(self.m_positions) - 1)
+        k = min(int(s), len(self.m_positions) - 2)
+        a = s - k
+        position = self.m_positions[k] * (1.0 - a) + self.m_positions[k + 1] * a
+        rotation = quaternion.slerp_evaluate(self.m_rotations[k], self.m_rotations[k + 1], a)
+        return (position.astype('f'), rotation)
+
+    def create_camera(self, w, h):
+        cam = c.Camera(w, h)
+        cam.fov = self.m_fov
+        cam.near = self.m_near
+        cam.far = self.m_far
+        cam.update_mats()
+        return cam
+
+    def apply(self, cam, frame):
+        (position, rotation) = self.sample(frame)
+        cam.pos = position
+        cam.rotation = rotation
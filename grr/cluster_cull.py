@@ -0,0 +1,43 @@
+import coalpy.gpu as g
+import numpy as np
+from . import utilities as utils
+
+g_group_size = 64
+g_cull_clusters_shader = g.Shader(file = "cluster_cull_cs.hlsl", name = "cull_clusters", main_function = "csMainCullClusters")
+g_write_cluster_args_shader = g.Shader(file = "cluster_cull_cs.hlsl", name = "cluster_args", main_function = "csWriteClusterArgs")
+
+def allocate_args(max_clusters):
+    return (g.Buffer(name = "visibleClusters", element_count = max(max_clusters, 1), format = g.Format.R32_UINT),
+            g.Buffer(name = "visibleClusterCount", element_count = 1, format = g.Format.R32_UINT),
+            g.Buffer(name = "visibleClusterArgs", element_count = 1, format = g.Format.RGBA_32_UINT),
+            max_clusters)
+
+# Culls the clusters of every instance of instance_buffer against the camera, see
+# meshlet.cull_clusters for the reference. cluster_count is the virtual cluster count (sum of
+# the instance cluster counts). Returns (visible virtual cluster ids, visible cluster count,
+# indirect args) buffers, the args dispatch one group per visible cluster.
+def run(cmd_list, cluster_buffer, instance_buffer, instance_count, cluster_count, view_matrix, proj_matrix, cull_args, flags = 0):
+    (visible_buffer, count_buffer, args_buffer, max_clusters) = cull_args
+    if cluster_count > max_clusters:
+        raise ValueError("[cluster_cull]: cluster count " + str(cluster_count) + " over the allocated " + str(max_clusters))
+
+    view_proj = np.matmul(proj_matrix, view_matrix)
+    camera_pos = np.linalg.inv(view_matrix)[0:3, 3]
+    const = view_proj.flatten().tolist()
+    const.extend(camera_pos.tolist())
+    const.extend([int(cluster_count), int(flags), int(instance_count), 0, 0])
+
+    utils.clear_uint_buffer(cmd_list, 0, count_buffer, 0, 1)
+    cmd_list.dispatch(
+        x = utils.divup(cluster_count, g_group_size), y = 1, z = 1,
+        shader = g_cull_clusters_shader,
+        constants = const,
+        inputs = [cluster_buffer, instance_buffer],
+        outputs = [visible_buffer, count_buffer])
+
+    cmd_list.dispatch(
+        x = 1, y = 1, z = 1,
+        shader = g_write_cluster_args_shader,
+        inputs = count_buffer,
+        outputs = args_buffer)
+    return (visible_buffer, count_buffer, args_buffer)
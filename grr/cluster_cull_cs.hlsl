@@ -0,0 +1,46 @@
+#include "geometry.hlsl"
+#include "meshlet.hlsl"
+
+cbuffer ConstantsCull : register(b0)
+{
+    float4x4 g_viewProj;
+    float3 g_cameraPos;
+    uint g_clusterCount;
+    uint g_cullFlags;
+    int g_instanceCount;
+    uint2 g_cullPadding;
+}
+
+//Appends the clusters that pass the frustum / cone tests to the visible cluster list.
+//Runs over the virtual clusters, the clusters of all instances. See cluster_cull.py
+StructuredBuffer<meshlet::Cluster> g_clusters : register(t0);
+StructuredBuffer<geometry::InstanceInfo> g_instances : register(t1);
+RWBuffer<uint> g_outVisibleClusters : register(u0);
+RWBuffer<uint> g_outVisibleClusterCount : register(u1);
+
+[numthreads(64,1,1)]
+void csMainCullClusters(int3 dti : SV_DispatchThreadID)
+{
+    if ((uint)dti.x >= g_clusterCount)
+        return;
+
+    geometry::InstanceInfo instance = geometry::findClusterInstance(g_instances, g_instanceCount, dti.x);
+    meshlet::Cluster cluster = g_clusters[instance.clusterOffset + (dti.x - instance.virtualClusterOffset)];
+    if (!meshlet::isVisible(cluster, instance.world, g_viewProj, g_cameraPos, g_cullFlags))
+        return;
+
+    uint outputIndex = 0;
+    InterlockedAdd(g_outVisibleClusterCount[0], 1, outputIndex);
+    g_outVisibleClusters[outputIndex] = dti.x;
+}
+
+//One group per visible cluster, laid out in 2d to go over the 65535 groups limit.
+Buffer<uint> g_visibleClusterCount : register(t0);
+RWBuffer<uint4> g_outClusterArgs : register(u0);
+
+[numthreads(1,1,1)]
+void csWriteClusterArgs()
+{
+    uint count = g_visibleClusterCount[0];
+    g_outClusterArgs[0] = uint4(min(count, 65535u), (count + 65534u) / 65535u, 1, 0);
+}
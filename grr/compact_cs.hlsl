@@ -0,0 +1,42 @@
+// This value must match the group size in primitives/compact.py
+#define GROUP_SIZE 128
+
+Buffer<uint> g_inputBuffer : register(t0);
+Buffer<uint> g_flagsBuffer : register(t1);
+Buffer<uint> g_offsetsBuffer : register(t2);
+RWBuffer<uint> g_outputBuffer : register(u0);
+RWBuffer<uint> g_outputCount : register(u1);
+RWBuffer<uint4> g_outputArgs : register(u2);
+
+cbuffer ConstantsCompact : register(b0)
+{
+    int4 g_compactArgs0;
+}
+
+#define inputCount g_compactArgs0.x
+#define argsGroupSize g_compactArgs0.y
+#define groupCountX g_compactArgs0.z
+
+//Scatters the flagged elements to the exclusive prefix sum of the flags (0 or 1), which keeps
+//their order. The last element writes the count and the indirect args, one group of
+//argsGroupSize threads per kept element.
+[numthreads(GROUP_SIZE, 1, 1)]
+void csCompactScatter(int3 groupID : SV_GroupID, int groupIndex : SV_GroupIndex)
+{
+    uint index = (groupID.y * groupCountX + groupID.x) * GROUP_SIZE + groupIndex;
+    uint count = 0;
+    if (index < (uint)inputCount)
+    {
+        uint offset = g_offsetsBuffer[index];
+        uint flag = g_flagsBuffer[index];
+        if (flag)
+            g_outputBuffer[offset] = g_inputBuffer[index];
+        count = offset + flag;
+    }
+
+    if (index == (uint)max(inputCount, 1) - 1)
+    {
+        g_outputCount[0] = count;
+        g_outputArgs[0] = uint4((count + argsGroupSize - 1) / argsGroupSize, 1, 1, 0);
+    }
+}
@@ -4,14 +4,15 @@ import numpy as np
 import os.path
 import sys
 import pathlib
-import pywavefront
 import json
 from . import gpugeo
+from . import scene_loader
 from . import default_scenes as scenes
 from . import get_module_path
 from . import camera as c
 from . import transform as t
 from . import profiler as profiler
+from .profiler import cpu_marker_fn
 from . import coverage_lut_tool
 from . import vec
 
@@ -55,12 +56,26 @@ class EditorViewport:
         self.m_debug_coarse_tiles = False
         self.m_debug_fine_tiles = False
 
+        #culling settings
+        self.m_cluster_culling = True
+        self.m_cluster_backface_culling = False
+
+        #raster settings
+        self.m_depth_sorted_bins = False
+        self.m_load_balanced_binning = False
+        self.m_fine_bins = False
+
     def save_editor_state(self):
         return {
             'id' : self.m_id,
             'name' : self.m_name,
             'debug_coarse_tiles' : self.m_debug_coarse_tiles,
-            'debug_fine_tiles' : self.m_debug_fine_tiles
+            'debug_fine_tiles' : self.m_debug_fine_tiles,
+            'cluster_culling' : self.m_cluster_culling,
+            'cluster_backface_culling' : self.m_cluster_backface_culling,
+            'depth_sorted_bins' : self.m_depth_sorted_bins,
+            'load_balanced_binning' : self.m_load_balanced_binning,
+            'fine_bins' : self.m_fine_bins
         }
 
     def load_editor_state(self, json):
@@ -68,6 +83,11 @@ class EditorViewport:
         self.m_name = json['name']
         self.m_debug_coarse_tiles = json['debug_coarse_tiles'] if 'debug_coarse_tiles' in json else False
         self.m_debug_fine_tiles = json['debug_fine_tiles'] if 'debug_fine_tiles' in json else False
+        self.m_cluster_culling = json['cluster_culling'] if 'cluster_culling' in json else True
+        self.m_cluster_backface_culling = json['cluster_backface_culling'] if 'cluster_backface_culling' in json else False
+        self.m_depth_sorted_bins = json['depth_sorted_bins'] if 'depth_sorted_bins' in json else False
+        self.m_load_balanced_binning = json['load_balanced_binning'] if 'load_balanced_binning' in json else False
+        self.m_fine_bins = json['fine_bins'] if 'fine_bins' in json else False
 
     def build_ui(self, imgui: g.ImguiBuilder):
         self.m_active = imgui.begin(self.m_name, self.m_active)
@@ -149,6 +169,7 @@ class EditorViewport:
             self.m_last_mouse = self.m_curr_mouse
             self.m_curr_mouse = curr_mouse_pos
 
+    @cpu_marker_fn("EditorViewport.update")
     def update(self, delta_time):
         self.m_editor_camera.w = self.m_width
         self.m_editor_camera.h = self.m_height
@@ -215,20 +236,62 @@ class EditorViewport:
     @debug_fine_tiles.setter
     def debug_fine_tiles(self, value):
         self.m_debug_fine_tiles = value
+
+    @property
+    def cluster_culling(self):
+        return self.m_cluster_culling
+
+    @cluster_culling.setter
+    def cluster_culling(self, value):
+        self.m_cluster_culling = value
+
+    @property
+    def cluster_backface_culling(self):
+        return self.m_cluster_backface_culling
+
+    @cluster_backface_culling.setter
+    def cluster_backface_culling(self, value):
+        self.m_cluster_backface_culling = value
+
+    @property
+    def depth_sorted_bins(self):
+        return self.m_depth_sorted_bins
+
+    @depth_sorted_bins.setter
+    def depth_sorted_bins(self, value):
+        self.m_depth_sorted_bins = value
+
+    @property
+    def load_balanced_binning(self):
+        return self.m_load_balanced_binning
+
+    @load_balanced_binning.setter
+    def load_balanced_binning(self, value):
+        self.m_load_balanced_binning = value
+
+    @property
+    def fine_bins(self):
+        return self.m_fine_bins
+
+    @fine_bins.setter
+    def fine_bins(self, value):
+        self.m_fine_bins = value
     
 class Editor:
     
-    def __init__(self, geo : gpugeo.GpuGeo, default_scene : str):
+    def __init__(self, geo : gpugeo.GpuGeo, default_scene : str, optimize_vertex_cache = False):
         self.m_active_scene_name = None
         self.m_active_scene = None
         self.m_geo = geo
         self.m_active_scene = default_scene
+        self.m_active_scene_handle = None
         self.m_set_default_layout = False
         self.m_ui_frame_it = 0
         self.m_selected_viewport = None
         self.m_viewports = {}
         self.m_profiler = profiler.Profiler()
         self.m_coverage_lut_tool = coverage_lut_tool.CoverageLUTTool()
+        self.m_scene_loader = scene_loader.SceneLoader(optimize_vertex_cache)
 
         self.m_tools = self.createToolPanels()
         self.m_active_scene_name = get_module_path() + scenes.data['teapot']
@@ -285,9 +348,11 @@ class Editor:
                         if valid_results:
                             scene_data = scenes.data[valid_results[0]]
                             if inspect.isfunction(scene_data):
+                                self.m_scene_loader.cancel()
+                                self.m_geo.unregister_all_meshes()
                                 self.m_active_scene_name = "Procedural"
                                 self.m_active_scene = None
-                                scene_data(self.m_geo)
+                                self.m_active_scene_handle = scene_data(self.m_geo)
                             else:
                                 self.m_active_scene_name = get_module_path() + scene_data
                                 self.reload_scene()
@@ -307,8 +372,19 @@ class Editor:
                 if (imgui.menu_item(label = "Reset Layout")):
                     self.m_set_default_layout = True
                 imgui.end_menu()
+            self.build_scene_loading_status(imgui)
             imgui.end_main_menu_bar()
 
+    def build_scene_loading_status(self, imgui : g.ImguiBuilder):
+        request = self.m_scene_loader.request
+        upload_progress = self.m_geo.upload_progress
+        if request is not None:
+            imgui.text("Loading " + request.name)
+            imgui.progress_bar(fraction = request.progress, size_arg = (200, 0), overlay = request.stage)
+        elif upload_progress is not None:
+            imgui.text("Uploading " + self.m_active_scene.name)
+            imgui.progress_bar(fraction = upload_progress, size_arg = (200, 0), overlay = "uploading")
+
     def build_view_settings_panel(self, imgui : g.ImguiBuilder):
         panel = self.m_tools['view_panel']
         if not panel.state:
@@ -336,6 +412,15 @@ class Editor:
             if (imgui.collapsing_header("Debug", g.ImGuiTreeNodeFlags.DefaultOpen)):
                 self.m_selected_viewport.debug_coarse_tiles = imgui.checkbox(label = "Show coarse tiles", v = self.m_selected_viewport.debug_coarse_tiles)
                 self.m_selected_viewport.debug_fine_tiles = imgui.checkbox(label = "Show fine tiles", v = self.m_selected_viewport.debug_fine_tiles)
+
+            if (imgui.collapsing_header("Culling", g.ImGuiTreeNodeFlags.DefaultOpen)):
+                self.m_selected_viewport.cluster_culling = imgui.checkbox(label = "Cluster culling", v = self.m_selected_viewport.cluster_culling)
+                self.m_selected_viewport.cluster_backface_culling = imgui.checkbox(label = "Cluster backface culling", v = self.m_selected_viewport.cluster_backface_culling)
+
+            if (imgui.collapsing_header("Raster", g.ImGuiTreeNodeFlags.DefaultOpen)):
+                self.m_selected_viewport.depth_sorted_bins = imgui.checkbox(label = "Depth sorted bins", v = self.m_selected_viewport.depth_sorted_bins)
+                self.m_selected_viewport.load_balanced_binning = imgui.checkbox(label = "Load balanced binning", v = self.m_selected_viewport.load_balanced_binning)
+                self.m_selected_viewport.fine_bins = imgui.checkbox(label = "Fine bins", v = self.m_selected_viewport.fine_bins)
         if self.m_coverage_lut_tool.active:
             self.m_coverage_lut_tool.build_ui_properties(imgui)
 
@@ -389,6 +474,7 @@ class Editor:
         self.m_set_default_layout = False
 
 
+    @cpu_marker_fn("Editor.build_ui")
     def build_ui(self, imgui : g.ImguiBuilder, implot : g.ImplotBuilder):
         root_d_id = imgui.get_id("RootDock")
         imgui.begin(name="MainWindow", is_fullscreen = True)
@@ -396,6 +482,7 @@ class Editor:
         imgui.end()
 
         self.build_menu_bar(imgui)
+        self.update_scene_loading()
         self.build_view_settings_panel(imgui)
         self.build_profiler(imgui, implot)
         self.build_coverage_lut_tool(imgui)
@@ -415,11 +502,18 @@ class Editor:
         if self.m_active_scene_name == None:
             return
         print ("[Editor]: loading scene: "+'"'+self.m_active_scene_name+"'")
-        try:
-            self.m_active_scene = pywavefront.Wavefront(file_name= self.m_active_scene_name, create_materials=True, collect_faces=True)
-            self.m_geo.register_wavefront_obj(self.m_active_scene)
-        except Exception as err:
-            print ("[Editor]: failed parsing scene, reason: " + str(err))
+        self.m_scene_loader.load(self.m_active_scene_name)
+
+    def update_scene_loading(self):
+        mesh_data = self.m_scene_loader.poll()
+        if mesh_data is not None:
+            print ("[Editor]: loaded " + mesh_data.name + ": " + str(mesh_data.mesh_count) + " meshes, " + str(mesh_data.triangle_count) + " triangles")
+            self.m_active_scene = mesh_data
+            self.m_active_scene_handle = self.m_geo.begin_mesh_upload(mesh_data, replaces = self.m_active_scene_handle)
+        self.m_geo.update_uploads()
+
+    def shutdown(self):
+        self.m_scene_loader.shutdown()
 
     def render_tools(self):
         if not self.m_coverage_lut_tool.active:
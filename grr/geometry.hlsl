@@ -4,6 +4,15 @@
 //Geometry file with utitlies and definitions.
 #include "depth_utils.hlsl"
 
+//Vertex stride in dwords, must match vertex_format.py
+//Full: 3 floats (pos) + 3 floats (normal) + 2 floats (uv).
+//Compact: 16 bit unorm positions in the mesh AABB, 8 bit octahedral normal, half uv.
+#if VERTEX_FORMAT_COMPACT
+#define VERTEX_FORMAT_DWORD_STRIDE 3
+#else
+#define VERTEX_FORMAT_DWORD_STRIDE 8
+#endif
+
 namespace geometry
 {
     //------------------------------------------
@@ -30,6 +39,107 @@ namespace geometry
         //float2 uv;
     };
 
+    //Entry of the mesh table. Must match mesh.g_mesh_table_dtype in mesh.py
+    //Indices in the index pool are global, vertexBase / vertexCount is the range they reference.
+    struct MeshInfo
+    {
+        uint indexOffset;
+        uint triangleCount;
+        uint vertexBase;
+        uint vertexCount;
+        float3 aabbMin;
+        float3 aabbMax;
+    };
+
+    //Mesh owning a triangle, binary search over the mesh table sorted by indexOffset.
+    MeshInfo findMesh(StructuredBuffer<MeshInfo> meshTable, int meshCount, int triangleId)
+    {
+        uint indexOffset = (uint)triangleId * 3;
+        int begin = 0;
+        int end = meshCount;
+        while ((end - begin) > 1)
+        {
+            int mid = (begin + end) >> 1;
+            if (meshTable[mid].indexOffset <= indexOffset)
+                begin = mid;
+            else
+                end = mid;
+        }
+        return meshTable[begin];
+    }
+
+    //Entry of the instance table. Must match instances.g_instance_dtype in instances.py
+    //Triangle and cluster ranges are those of the instanced mesh. Binning and culling run
+    //over the virtual ranges, prefix sums of the instance triangle / cluster counts.
+    struct InstanceInfo
+    {
+        float4x4 world;
+        uint triangleOffset;
+        uint triangleCount;
+        uint virtualTriangleOffset;
+        uint clusterOffset;
+        uint clusterCount;
+        uint virtualClusterOffset;
+        uint2 padding;
+    };
+
+    //Instance owning a virtual triangle, binary search over the instance table.
+    InstanceInfo findInstance(StructuredBuffer<InstanceInfo> instanceTable, int instanceCount, uint virtualTriangleId)
+    {
+        int begin = 0;
+        int end = instanceCount;
+        while ((end - begin) > 1)
+        {
+            int mid = (begin + end) >> 1;
+            if (instanceTable[mid].virtualTriangleOffset <= virtualTriangleId)
+                begin = mid;
+            else
+                end = mid;
+        }
+        return instanceTable[begin];
+    }
+
+    //Instance owning a virtual cluster, binary search over the instance table.
+    InstanceInfo findClusterInstance(StructuredBuffer<InstanceInfo> instanceTable, int instanceCount, uint virtualClusterId)
+    {
+        int begin = 0;
+        int end = instanceCount;
+        while ((end - begin) > 1)
+        {
+            int mid = (begin + end) >> 1;
+            if (instanceTable[mid].virtualClusterOffset <= virtualClusterId)
+                begin = mid;
+            else
+                end = mid;
+        }
+        return instanceTable[begin];
+    }
+
+    float3 decodeCompactPosition(uint2 data, float3 aabbMin, float3 aabbMax)
+    {
+        float3 q = float3(data.x & 0xffff, data.x >> 16, data.y & 0xffff);
+        return aabbMin + q * ((aabbMax - aabbMin) / 65535.0);
+    }
+
+    float3 decodeOctahedral(float2 p)
+    {
+        float3 n = float3(p.xy, 1.0 - abs(p.x) - abs(p.y));
+        float t = saturate(-n.z);
+        n.xy += float2(n.x >= 0.0 ? -t : t, n.y >= 0.0 ? -t : t);
+        return normalize(n);
+    }
+
+    float3 decodeCompactNormal(uint data)
+    {
+        float2 p = float2((data >> 16) & 0xff, data >> 24) / 255.0;
+        return decodeOctahedral(p * 2.0 - 1.0);
+    }
+
+    float2 decodeCompactUV(uint data)
+    {
+        return f16tof32(uint2(data & 0xffff, data >> 16));
+    }
+
     //Triangle with indices.
     struct TriangleI
     {
@@ -56,7 +166,7 @@ namespace geometry
         Vertex loadVertex(ByteAddressBuffer vertBuffer, int index)
         {
             Vertex v;
-            v.p = asfloat(vertBuffer.Load3((index * 3)  << 2));
+            v.p = asfloat(vertBuffer.Load3((index * VERTEX_FORMAT_DWORD_STRIDE) << 2));
             return v;
         }
 
@@ -66,6 +176,28 @@ namespace geometry
             b = loadVertex(vertices, indices.b);
             c = loadVertex(vertices, indices.c);
         }
+
+        Vertex loadCompactVertex(ByteAddressBuffer vertBuffer, int index, in MeshInfo meshInfo)
+        {
+            Vertex v;
+            v.p = decodeCompactPosition(vertBuffer.Load2((index * VERTEX_FORMAT_DWORD_STRIDE) << 2), meshInfo.aabbMin, meshInfo.aabbMax);
+            return v;
+        }
+
+        void transform(float4x4 world)
+        {
+            a.p = mul(float4(a.p, 1.0), world).xyz;
+            b.p = mul(float4(b.p, 1.0), world).xyz;
+            c.p = mul(float4(c.p, 1.0), world).xyz;
+        }
+
+        //Compact vertices are relative to the AABB of the mesh owning the triangle.
+        void loadCompact(ByteAddressBuffer vertices, in TriangleI indices, in MeshInfo meshInfo)
+        {
+            a = loadCompactVertex(vertices, indices.a, meshInfo);
+            b = loadCompactVertex(vertices, indices.b, meshInfo);
+            c = loadCompactVertex(vertices, indices.c, meshInfo);
+        }
     };
 
     // Interpolation result with 3 baricenters. See TriangleH::interp
@@ -2,7 +2,20 @@ import coalpy.gpu as g
 import array
 import numpy as np
 import math
+from . import mesh
+from . import meshlet
+from . import instances
+from . import range_allocator
+from . import utilities
+from . import vertex_format as vf
 
+g_rebase_indices_shader = g.Shader(file = "gpugeo_cs.hlsl", name = "rebase_indices", main_function = "csMainRebaseIndices")
+
+# Global vertex and index pools. Meshes get a vertex range and a triangle range each,
+# sub allocated with a RangeAllocator. Pools grow with a gpu copy when full, and are
+# compacted in the background a few megabytes per frame (see update_uploads).
+# Indices are global into the vertex pool, freed triangle ranges are cleared to 0
+# (degenerate triangles) so the rasterizer can dispatch up to the high water mark.
 class GpuGeo:
 
     # 32 megabytes.
@@ -11,75 +24,506 @@ class GpuGeo:
     # 16 megabytes
     index_pool_byte_size = 16 * 1024 * 1024
 
-    # 3 floats (pos) + 3 floats (normal) + 2 floats (uv)
+    # 3 floats (pos) + 3 floats (normal) + 2 floats (uv). See vertex_format.py for the compact format.
     vertex_format_byte_size = ((4 * 3) + (4 * 3) +  (4 * 2))
 
     #32 bits for now
     index_format_byte_size = 4
 
-    def __init__(self):
+    triangle_byte_size = 3 * index_format_byte_size
+
+    # index offset, triangle count, vertex base, vertex count, aabb min, aabb max. See mesh.g_mesh_table_dtype
+    mesh_info_byte_size = mesh.g_mesh_table_dtype.itemsize
+
+    # triangle range, bounding sphere, aabb and normal cone. See meshlet.g_cluster_dtype
+    cluster_info_byte_size = meshlet.g_cluster_dtype.itemsize
+
+    # world matrix, triangle and cluster ranges of the mesh. See instances.g_instance_dtype
+    instance_info_byte_size = instances.g_instance_dtype.itemsize
+
+    # bytes streamed to the gpu per frame while a mesh upload is in flight.
+    upload_chunk_byte_size = 8 * 1024 * 1024
 
-        self.m_vertex_buffer = g.Buffer(
+    # bytes moved per frame by the background compaction.
+    compaction_byte_budget = 4 * 1024 * 1024
+
+    # intermediate buffer for moves inside a pool, larger moves are split.
+    scratch_byte_size = 4 * 1024 * 1024
+
+    def __init__(self, vertex_format = vf.VertexFormat.Full):
+        self.m_vertex_format = vertex_format
+        self.m_vertex_byte_size = vf.vertex_byte_size(vertex_format)
+        self.m_vertex_allocator = range_allocator.RangeAllocator(GpuGeo.vertex_pool_byte_size // self.m_vertex_byte_size)
+        self.m_index_allocator = range_allocator.RangeAllocator(GpuGeo.index_pool_byte_size // GpuGeo.triangle_byte_size)
+        self.m_vertex_buffer = self._create_vertex_buffer(self.m_vertex_allocator.capacity)
+        self.m_index_buffer = GpuGeo._create_index_buffer(self.m_index_allocator.capacity)
+        self.m_scratch_buffer = None
+        self.m_mesh_table_capacity = 1
+        self.m_mesh_table_buffer = GpuGeo._create_mesh_table_buffer(self.m_mesh_table_capacity)
+        self.m_mesh_table = np.zeros(0, dtype=mesh.g_mesh_table_dtype)
+        self.m_mesh_table_dirty = False
+        self.m_cluster_table_capacity = 1
+        self.m_cluster_table_buffer = GpuGeo._create_cluster_table_buffer(self.m_cluster_table_capacity)
+        self.m_cluster_table = np.zeros(0, dtype=meshlet.g_cluster_dtype)
+        self.m_instances = instances.InstanceTable()
+        self.m_instance_table_capacity = 1
+        self.m_instance_table_buffer = GpuGeo._create_instance_table_buffer(self.m_instance_table_capacity)
+        self.m_instance_table = np.zeros(0, dtype=instances.g_instance_dtype)
+        self.m_mesh_ranges = {}
+        self.m_next_handle = 0
+        self.m_allocations = {}
+        self.m_vertex_owners = {}
+        self.m_index_owners = {}
+        self.m_pending_uploads = []
+        self.triCounts = 0
+
+    def _create_vertex_buffer(self, vertex_capacity):
+        return g.Buffer(
             name ="global_vertex_buffer",
             type = g.BufferType.Raw,
             stride = 4,
-            element_count = math.ceil(GpuGeo.vertex_pool_byte_size/4)
+            element_count = math.ceil(vertex_capacity * self.m_vertex_byte_size / 4)
         )
 
-
-        self.m_index_buffer = g.Buffer(
+    def _create_index_buffer(triangle_capacity):
+        return g.Buffer(
             name = "global_index_buffer",
             type = g.BufferType.Standard,
             format = g.Format.R32_UINT,
-            element_count = math.ceil(GpuGeo.index_pool_byte_size/GpuGeo.index_format_byte_size)
+            element_count = triangle_capacity * 3
         )
 
-        self.triCounts = 0
+    def _create_mesh_table_buffer(mesh_count):
+        return g.Buffer(
+            name = "global_mesh_table_buffer",
+            type = g.BufferType.Structured,
+            stride = GpuGeo.mesh_info_byte_size,
+            element_count = max(mesh_count, 1)
+        )
+
+    def _create_cluster_table_buffer(cluster_count):
+        return g.Buffer(
+            name = "global_cluster_table_buffer",
+            type = g.BufferType.Structured,
+            stride = GpuGeo.cluster_info_byte_size,
+            element_count = max(cluster_count, 1)
+        )
+
+    def _create_instance_table_buffer(instance_count):
+        return g.Buffer(
+            name = "global_instance_table_buffer",
+            type = g.BufferType.Structured,
+            stride = GpuGeo.instance_info_byte_size,
+            element_count = max(instance_count, 1)
+        )
+
+    @property
+    def mesh_table(self):
+        return self.m_mesh_table
+
+    @property
+    def cluster_table(self):
+        return self.m_cluster_table
+
+    @property
+    def cluster_count(self):
+        return len(self.m_cluster_table)
+
+    @property
+    def instances(self):
+        return self.m_instances
+
+    # instances on the gpu, those of resident meshes.
+    @property
+    def instance_table(self):
+        return self.m_instance_table
+
+    @property
+    def instance_count(self):
+        return len(self.m_instance_table)
+
+    # triangles / clusters of all the gpu instances, the ranges binning and culling run over.
+    @property
+    def instance_triangle_count(self):
+        return int(np.sum(self.m_instance_table['triangle_count'], dtype=np.int64))
+
+    @property
+    def instance_cluster_count(self):
+        return int(np.sum(self.m_instance_table['cluster_count'], dtype=np.int64))
+
+    @property
+    def mesh_count(self):
+        return len(self.m_mesh_table)
+
+    @property
+    def vertex_format(self):
+        return self.m_vertex_format
+
+    @property
+    def vertex_byte_size(self):
+        return self.m_vertex_byte_size
+
+    @property
+    def vertex_allocator(self):
+        return self.m_vertex_allocator
+
+    @property
+    def index_allocator(self):
+        return self.m_index_allocator
+
+    @property
+    def vertex_buffer_byte_size(self):
+        return self.m_vertex_allocator.capacity * self.m_vertex_byte_size
+
+    @property
+    def index_buffer_byte_size(self):
+        return self.m_index_allocator.capacity * GpuGeo.triangle_byte_size
 
-    
     #simple testing function
     def load_simple_triangle(self):
         tri_data = array.array('f', [
-             #v.x,  v.y,  v.z,    # uv.x, uv.y, n.x,  n.y,  n.z
-              -1.0,  1.0,  2.0,  # 0.0,  0.0,  0.0,  0.0,  1.0,
-               1.0,  1.0,  2.0,  # 1.0,  0.0,  0.0,  0.0,  1.0,
-               0.0,  -0.5,  -2.0,   # 0.5,  1.0,  0.0,  0.0,  1.0
-
-             #v.x,  v.y,  v.z,    # uv.x, uv.y, n.x,  n.y,  n.z
-               1.0,  -0.5,  -4.0,  # 0.0,  0.0,  0.0,  0.0,  1.0,
-              -1.0,  -0.5,  -4.0,  # 1.0,  0.0,  0.0,  0.0,  1.0,
-               0.0,   1.0,  0.0    # 0.5,  1.0,  0.0,  0.0,  1.0
+             #v.x,  v.y,  v.z,    n.x,  n.y,  n.z,   uv.x, uv.y
+              -1.0,  1.0,  2.0,   0.0,  0.0,  1.0,   0.0,  0.0,
+               1.0,  1.0,  2.0,   0.0,  0.0,  1.0,   1.0,  0.0,
+               0.0, -0.5, -2.0,   0.0,  0.0,  1.0,   0.5,  1.0,
+
+             #v.x,  v.y,  v.z,    n.x,  n.y,  n.z,   uv.x, uv.y
+               1.0, -0.5, -4.0,   0.0,  0.0,  1.0,   0.0,  0.0,
+              -1.0, -0.5, -4.0,   0.0,  0.0,  1.0,   1.0,  0.0,
+               0.0,  1.0,  0.0,   0.0,  0.0,  1.0,   0.5,  1.0
         ])
 
-        index_data = [0, 1, 2, 3, 4, 5]
+        index_data = np.arange(6, dtype=np.uint32).reshape((-1, 3))
+        return self.register_mesh(mesh.MeshData(np.array(tri_data, dtype='f').reshape((-1, 8)), index_data, "simple_triangle"))
+
+    def _grow_pool(self, cmd_list, allocator, buffer, element_byte_size, create_fn, min_capacity):
+        new_capacity = max(2 * allocator.capacity, min_capacity)
+        new_buffer = create_fn(new_capacity)
+        copy_byte_size = allocator.high_water * element_byte_size
+        if copy_byte_size > 0:
+            cmd_list.copy_resource(source = buffer, destination = new_buffer, source_offset = 0, destination_offset = 0, size = copy_byte_size)
+        allocator.grow(new_capacity)
+        return new_buffer
+
+    def _allocate_ranges(self, cmd_list, vertex_count, triangle_count):
+        # empty meshes still get a range, so every allocation owns a distinct offset.
+        (vertex_count, triangle_count) = (max(vertex_count, 1), max(triangle_count, 1))
+        vertex_offset = self.m_vertex_allocator.allocate(vertex_count)
+        if vertex_offset is None:
+            self.m_vertex_buffer = self._grow_pool(
+                cmd_list, self.m_vertex_allocator, self.m_vertex_buffer, self.m_vertex_byte_size,
+                self._create_vertex_buffer, self.m_vertex_allocator.capacity + vertex_count)
+            vertex_offset = self.m_vertex_allocator.allocate(vertex_count)
+
+        index_offset = self.m_index_allocator.allocate(triangle_count)
+        if index_offset is None:
+            self.m_index_buffer = self._grow_pool(
+                cmd_list, self.m_index_allocator, self.m_index_buffer, GpuGeo.triangle_byte_size,
+                GpuGeo._create_index_buffer, self.m_index_allocator.capacity + triangle_count)
+            index_offset = self.m_index_allocator.allocate(triangle_count)
+
+        # pending triangles stay degenerate until the upload completes.
+        utilities.clear_uint_buffer(cmd_list, 0, self.m_index_buffer, 3 * index_offset, 3 * triangle_count)
+        return (vertex_offset, index_offset)
+
+    # Starts streaming a mesh into the pools, returns its handle. Vertices are streamed
+    # a chunk per frame and the triangles are written at once at the end, so the mesh
+    # appears atomically. The mesh of the replaces handle is unregistered at that point
+    # and its instances draw the new mesh, otherwise the new mesh gets an identity instance.
+    def begin_mesh_upload(self, mesh_data, replaces = None):
+        pending = next((u for u in self.m_pending_uploads if u.allocation.handle == replaces), None)
+        if pending is not None:
+            # superseded before it made it to the gpu.
+            replaces = pending.replaces
+            self.unregister_mesh(pending.allocation.handle)
+
+        if mesh_data.clusters is None:
+            mesh_data = meshlet.build(mesh_data, reorder = False)
 
         c = g.CommandList()
-        c.upload_resource(
-            source = tri_data,
-            destination = self.m_vertex_buffer            
-        )
+        (vertex_offset, index_offset) = self._allocate_ranges(c, mesh_data.vertex_count, mesh_data.triangle_count)
+        g.schedule(c)
 
-        c.upload_resource(
-            source = index_data,
-            destination = self.m_index_buffer
-        )
+        allocation = GeoAllocation(self.m_next_handle, mesh_data, vertex_offset, index_offset)
+        self.m_next_handle += 1
+        self.m_allocations[allocation.handle] = allocation
+        self.m_vertex_owners[vertex_offset] = allocation
+        self.m_index_owners[index_offset] = allocation
+        self.m_pending_uploads.append(MeshUpload(allocation, replaces, self.m_vertex_format))
+        if replaces is None:
+            self.m_instances.add(allocation.handle)
+        self.triCounts = self.m_index_allocator.high_water
+        return allocation.handle
+
+    def cancel_mesh_upload(self):
+        for upload in list(self.m_pending_uploads):
+            self.unregister_mesh(upload.allocation.handle)
+
+    @property
+    def upload_progress(self):
+        if not self.m_pending_uploads:
+            return None
+        return sum([u.progress for u in self.m_pending_uploads]) / len(self.m_pending_uploads)
+
+    def _free_allocation(self, cmd_list, allocation):
+        del self.m_allocations[allocation.handle]
+        del self.m_vertex_owners[allocation.vertex_offset]
+        del self.m_index_owners[allocation.index_offset]
+        triangle_count = self.m_index_allocator.size_of(allocation.index_offset)
+        utilities.clear_uint_buffer(cmd_list, 0, self.m_index_buffer, 3 * allocation.index_offset, 3 * triangle_count)
+        self.m_vertex_allocator.free(allocation.vertex_offset)
+        self.m_index_allocator.free(allocation.index_offset)
+        self.m_mesh_table_dirty = self.m_mesh_table_dirty or allocation.is_resident
+
+    # Instances of a mesh, world_matrix is the object to world matrix (column vectors, see
+    # transform.py). Changes are uploaded at once by the next update_uploads.
+    def add_instance(self, handle, world_matrix = None):
+        return self.m_instances.add(handle, world_matrix)
 
+    def move_instance(self, instance_id, world_matrix):
+        self.m_instances.move(instance_id, world_matrix)
+
+    def move_instances(self, instance_ids, world_matrices):
+        self.m_instances.move_many(instance_ids, world_matrices)
+
+    def remove_instance(self, instance_id):
+        self.m_instances.remove(instance_id)
+
+    def unregister_mesh(self, handle):
+        self.m_instances.remove_mesh(handle)
+        if handle not in self.m_allocations:
+            return
+        self.m_pending_uploads = [u for u in self.m_pending_uploads if u.allocation.handle != handle]
+        c = g.CommandList()
+        self._free_allocation(c, self.m_allocations[handle])
+        self._update_mesh_table(c)
         g.schedule(c)
-        self.triCounts = 2
+        self.triCounts = self.m_index_allocator.high_water
 
-    def register_wavefront_obj(self, wavefront_obj):
-        self.triCounts = 0
+    def unregister_all_meshes(self):
+        for handle in list(self.m_allocations.keys()):
+            self.unregister_mesh(handle)
+
+    def _get_scratch_buffer(self):
+        if self.m_scratch_buffer is None:
+            self.m_scratch_buffer = g.Buffer(
+                name = "geo_scratch_buffer",
+                type = g.BufferType.Raw,
+                stride = 4,
+                element_count = GpuGeo.scratch_byte_size // 4)
+        return self.m_scratch_buffer
+
+    # moves bytes towards the start of a pool through the scratch buffer. Ranges may overlap,
+    # copying in increasing offsets never overwrites bytes that are still to be read.
+    def _move_range(self, cmd_list, buffer, src_byte_offset, dst_byte_offset, byte_size):
+        scratch = self._get_scratch_buffer()
+        for chunk_offset in range(0, byte_size, GpuGeo.scratch_byte_size):
+            chunk_size = min(GpuGeo.scratch_byte_size, byte_size - chunk_offset)
+            cmd_list.copy_resource(source = buffer, destination = scratch, source_offset = src_byte_offset + chunk_offset, destination_offset = 0, size = chunk_size)
+            cmd_list.copy_resource(source = scratch, destination = buffer, source_offset = 0, destination_offset = dst_byte_offset + chunk_offset, size = chunk_size)
+
+    def _compact_triangles(self, cmd_list, move):
+        (src, dst, size) = move
+        allocation = self.m_index_owners.pop(src)
+        allocation.index_offset = dst
+        self.m_index_owners[dst] = allocation
+        self._move_range(cmd_list, self.m_index_buffer, src * GpuGeo.triangle_byte_size, dst * GpuGeo.triangle_byte_size, size * GpuGeo.triangle_byte_size)
+        vacated_begin = max(dst + size, src)
+        utilities.clear_uint_buffer(cmd_list, 0, self.m_index_buffer, 3 * vacated_begin, 3 * (src + size - vacated_begin))
+        return size * GpuGeo.triangle_byte_size
+
+    def _compact_vertices(self, cmd_list, move):
+        (src, dst, size) = move
+        allocation = self.m_vertex_owners.pop(src)
+        allocation.vertex_offset = dst
+        self.m_vertex_owners[dst] = allocation
+        self._move_range(cmd_list, self.m_vertex_buffer, src * self.m_vertex_byte_size, dst * self.m_vertex_byte_size, size * self.m_vertex_byte_size)
+        index_count = 3 * self.m_index_allocator.size_of(allocation.index_offset)
+        cmd_list.dispatch(
+            shader = g_rebase_indices_shader,
+            constants = [int(3 * allocation.index_offset), int(index_count), int(dst - src)],
+            outputs = self.m_index_buffer,
+            x = math.ceil(index_count / 64),
+            y = 1,
+            z = 1)
+        return size * self.m_vertex_byte_size
+
+    # Slides allocations down into free ranges until the byte budget is spent.
+    # Each move is complete within the command list, the renderer never sees a partial move.
+    def compact(self, cmd_list, byte_budget):
+        while byte_budget > 0:
+            move = self.m_index_allocator.compact_step()
+            if move is not None:
+                byte_budget -= self._compact_triangles(cmd_list, move)
+            else:
+                move = self.m_vertex_allocator.compact_step()
+                if move is None:
+                    break
+                byte_budget -= self._compact_vertices(cmd_list, move)
+            self.m_mesh_table_dirty = True
+        self.triCounts = self.m_index_allocator.high_water
+
+    # mesh, cluster and instance tables of the resident meshes.
+    def _update_mesh_table(self, cmd_list):
+        if self.m_mesh_table_dirty:
+            self._update_resident_tables(cmd_list)
+        if self.m_instances.dirty:
+            self._update_instance_table(cmd_list)
+
+    def _update_instance_table(self, cmd_list):
+        self.m_instances.dirty = False
+        self.m_instance_table = self.m_instances.build_table(self.m_mesh_ranges)
+        if len(self.m_instance_table) > self.m_instance_table_capacity:
+            self.m_instance_table_capacity = max(2 * self.m_instance_table_capacity, len(self.m_instance_table))
+            self.m_instance_table_buffer = GpuGeo._create_instance_table_buffer(self.m_instance_table_capacity)
+        if len(self.m_instance_table) > 0:
+            cmd_list.upload_resource(source = self.m_instance_table.view(np.uint8), destination = self.m_instance_table_buffer)
+
+    def _update_resident_tables(self, cmd_list):
+        self.m_mesh_table_dirty = False
+        resident = sorted([a for a in self.m_allocations.values() if a.is_resident], key = lambda a: a.index_offset)
+        tables = [a.mesh_table() for a in resident]
+        self.m_mesh_table = np.concatenate(tables) if tables else np.zeros(0, dtype=mesh.g_mesh_table_dtype)
+        if len(self.m_mesh_table) > self.m_mesh_table_capacity:
+            self.m_mesh_table_capacity = max(2 * self.m_mesh_table_capacity, len(self.m_mesh_table))
+            self.m_mesh_table_buffer = GpuGeo._create_mesh_table_buffer(self.m_mesh_table_capacity)
+        if len(self.m_mesh_table) > 0:
+            cmd_list.upload_resource(source = self.m_mesh_table.view(np.uint8), destination = self.m_mesh_table_buffer)
+
+        tables = [a.cluster_table() for a in resident]
+        self.m_cluster_table = np.concatenate(tables) if tables else np.zeros(0, dtype=meshlet.g_cluster_dtype)
+        if len(self.m_cluster_table) > self.m_cluster_table_capacity:
+            self.m_cluster_table_capacity = max(2 * self.m_cluster_table_capacity, len(self.m_cluster_table))
+            self.m_cluster_table_buffer = GpuGeo._create_cluster_table_buffer(self.m_cluster_table_capacity)
+        if len(self.m_cluster_table) > 0:
+            cmd_list.upload_resource(source = self.m_cluster_table.view(np.uint8), destination = self.m_cluster_table_buffer)
 
+        #triangle and cluster ranges of each resident mesh, for the instance table.
+        cluster_offsets = np.cumsum([0] + [len(t) for t in tables])
+        self.m_mesh_ranges = { a.handle : (a.index_offset, a.mesh_data.triangle_count, int(cluster_offsets[i]), len(tables[i])) for (i, a) in enumerate(resident) }
+        self.m_instances.dirty = True
+
+    # Call once per frame. Uploads the next chunk of pending mesh uploads, or compacts
+    # the pools when nothing is being uploaded.
+    def update_uploads(self, byte_budget = None):
+        byte_budget = GpuGeo.upload_chunk_byte_size if byte_budget is None else byte_budget
+        c = g.CommandList()
         try:
-            vertex_data = np.array(wavefront_obj.vertices, dtype='f')
-            index_data = np.array(wavefront_obj.mesh_list[0].faces, dtype='i')
-            c = g.CommandList()
-            c.upload_resource(source = vertex_data, destination = self.m_vertex_buffer)
-            c.upload_resource(source = index_data, destination = self.m_index_buffer)
-            g.schedule(c)
-            self.triCounts = len(wavefront_obj.mesh_list[0].faces) 
+            for upload in list(self.m_pending_uploads):
+                if byte_budget <= 0:
+                    break
+                (is_done, uploaded_bytes) = upload.upload_next(c, self.m_vertex_buffer, self.m_index_buffer, byte_budget)
+                byte_budget -= uploaded_bytes
+                if not is_done:
+                    continue
+                self.m_pending_uploads.remove(upload)
+                upload.allocation.is_resident = True
+                self.m_mesh_table_dirty = True
+                if upload.replaces in self.m_allocations:
+                    self.m_instances.replace_mesh(upload.replaces, upload.allocation.handle)
+                    self._free_allocation(c, self.m_allocations[upload.replaces])
+
+            if not self.m_pending_uploads and self.m_vertex_allocator.fragmented_size + self.m_index_allocator.fragmented_size > 0:
+                self.compact(c, GpuGeo.compaction_byte_budget)
+
+            self._update_mesh_table(c)
         except Exception as err:
-            print("[gpugeo]: Failed uploading wavefront obj to GPU: " + str(err))
+            print("[gpugeo]: Failed uploading mesh to GPU: " + str(err))
+            self.cancel_mesh_upload()
+
+        g.schedule(c)
+        self.triCounts = self.m_index_allocator.high_water
+
+    # all meshes of mesh_data go in a single command list. Returns the mesh handle.
+    def register_mesh(self, mesh_data):
+        handle = self.begin_mesh_upload(mesh_data)
+        self.update_uploads(byte_budget = math.inf)
+        return handle
+
+    def register_wavefront_obj(self, wavefront_obj):
+        return self.register_mesh(mesh.from_wavefront(wavefront_obj))
+
+# Vertex and triangle ranges of a registered mesh, offsets move during compaction.
+class GeoAllocation:
+    def __init__(self, handle, mesh_data, vertex_offset, index_offset):
+        self.m_handle = handle
+        self.m_mesh_data = mesh_data
+        self.vertex_offset = vertex_offset
+        #in triangles
+        self.index_offset = index_offset
+        self.is_resident = False
+
+    @property
+    def handle(self):
+        return self.m_handle
+
+    @property
+    def mesh_data(self):
+        return self.m_mesh_data
+
+    # mesh table of the mesh, relative to the pools.
+    def mesh_table(self):
+        table = np.array(self.m_mesh_data.mesh_table)
+        table['index_offset'] += 3 * self.index_offset
+        table['vertex_base'] += self.vertex_offset
+        return table
+
+    # cluster table of the mesh, relative to the index pool.
+    def cluster_table(self):
+        table = np.array(self.m_mesh_data.clusters)
+        table['triangle_offset'] += self.index_offset
+        return table
+
+# Streams the vertices of a mesh a chunk at a time, then writes its triangles at once.
+# Compact vertices are encoded a chunk at a time too, right before being uploaded.
+class MeshUpload:
+    def __init__(self, allocation, replaces, vertex_format):
+        self.m_allocation = allocation
+        self.m_replaces = replaces
+        self.m_vertex_format = vertex_format
+        self.m_vertex_byte_size = vf.vertex_byte_size(vertex_format)
+        self.m_vertex_count = allocation.mesh_data.vertex_count
+        self.m_index_byte_size = allocation.mesh_data.indices.nbytes
+        self.m_uploaded_vertices = 0
+        self.m_uploaded_bytes = 0
+
+    @property
+    def allocation(self):
+        return self.m_allocation
+
+    @property
+    def replaces(self):
+        return self.m_replaces
+
+    @property
+    def progress(self):
+        total_bytes = self.m_vertex_count * self.m_vertex_byte_size + self.m_index_byte_size
+        return 1.0 if total_bytes == 0 else self.m_uploaded_bytes / total_bytes
+
+    def _encode_vertices(self, first_vertex, vertex_count):
+        mesh_data = self.m_allocation.mesh_data
+        vertices = mesh_data.vertices[first_vertex:first_vertex + vertex_count]
+        if self.m_vertex_format == vf.VertexFormat.Compact:
+            vertices = vf.encode_compact(np.asarray(vertices, dtype='f'), mesh_data.mesh_table, first_vertex)
+        return np.ascontiguousarray(vertices).reshape(-1).view(np.uint8)
 
-        
+    # returns (is_done, uploaded byte count).
+    def upload_next(self, cmd_list, vertex_buffer, index_buffer, byte_budget):
+        first_vertex = self.m_uploaded_vertices
+        vertex_count = int(min(self.m_vertex_count - first_vertex, max(byte_budget // self.m_vertex_byte_size, 1)))
+        chunk_size = vertex_count * self.m_vertex_byte_size
+        if vertex_count > 0:
+            vertex_byte_offset = (self.m_allocation.vertex_offset + first_vertex) * self.m_vertex_byte_size
+            cmd_list.upload_resource(source = self._encode_vertices(first_vertex, vertex_count), destination = vertex_buffer, destination_offset = vertex_byte_offset)
+            self.m_uploaded_vertices += vertex_count
+            self.m_uploaded_bytes += chunk_size
+        if self.m_uploaded_vertices < self.m_vertex_count:
+            return (False, chunk_size)
 
+        # indices of the mesh are relative to its first vertex, make them global.
+        indices = self.m_allocation.mesh_data.indices
+        if len(indices) > 0:
+            global_indices = np.ascontiguousarray(indices, dtype=np.uint32) + np.uint32(self.m_allocation.vertex_offset)
+            cmd_list.upload_resource(source = global_indices.reshape(-1), destination = index_buffer, destination_offset = self.m_allocation.index_offset * GpuGeo.triangle_byte_size)
+        self.m_uploaded_bytes += self.m_index_byte_size
+        return (True, chunk_size + self.m_index_byte_size)
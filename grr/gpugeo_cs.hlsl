@@ -0,0 +1,19 @@
+cbuffer ConstantsRebase : register(b0)
+{
+    int g_rebaseOffset;
+    int g_rebaseCount;
+    int g_rebaseDelta;
+}
+
+//Adds a delta to a range of the global index buffer, used when the vertices
+//of a mesh are moved inside the vertex pool. See GpuGeo in gpugeo.py
+RWBuffer<uint> g_indices : register(u0);
+[numthreads(64,1,1)]
+void csMainRebaseIndices(int3 dti : SV_DispatchThreadID)
+{
+    if (dti.x >= g_rebaseCount)
+        return;
+
+    int i = g_rebaseOffset + dti.x;
+    g_indices[i] = (uint)((int)g_indices[i] + g_rebaseDelta);
+}
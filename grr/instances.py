@@ -0,0 +1,116 @@
+import numpy as np
+
+# Entry of the gpu instance table. Must match geometry::InstanceInfo in geometry.hlsl
+# world: object to world matrix, flattened like the view / projection constants.
+# triangle / cluster ranges are those of the instanced mesh in the GpuGeo pools. The virtual
+# offsets are prefix sums over the instances, binning and culling run over the virtual ranges
+# and map them back to (instance, triangle) / (instance, cluster) with a binary search.
+g_instance_dtype = np.dtype([
+    ('world', '<f4', (16,)),
+    ('triangle_offset', '<u4'),
+    ('triangle_count', '<u4'),
+    ('virtual_triangle_offset', '<u4'),
+    ('cluster_offset', '<u4'),
+    ('cluster_count', '<u4'),
+    ('virtual_cluster_offset', '<u4'),
+    ('padding', '<u4', (2,))])
+
+# Instances of the meshes of a GpuGeo, kept densely packed in arrays so the gpu table is a
+# single upload. add / move / remove are O(1), removal moves the last instance into the hole.
+class InstanceTable:
+
+    def __init__(self, capacity = 64):
+        self.m_worlds = np.zeros((capacity, 4, 4), dtype='f')
+        self.m_mesh_handles = np.zeros(capacity, dtype=np.int64)
+        self.m_ids = np.zeros(capacity, dtype=np.int64)
+        self.m_slots = {}
+        self.m_count = 0
+        self.m_next_id = 0
+        self.m_dirty = False
+
+    @property
+    def count(self):
+        return self.m_count
+
+    @property
+    def dirty(self):
+        return self.m_dirty
+
+    @dirty.setter
+    def dirty(self, value):
+        self.m_dirty = value
+
+    def ids(self):
+        return self.m_ids[0:self.m_count].tolist()
+
+    def mesh_handle(self, instance_id):
+        return int(self.m_mesh_handles[self.m_slots[instance_id]])
+
+    def world_matrix(self, instance_id):
+        return np.array(self.m_worlds[self.m_slots[instance_id]])
+
+    def _grow(self):
+        capacity = 2 * len(self.m_ids)
+        self.m_worlds = np.concatenate([self.m_worlds, np.zeros((capacity - len(self.m_ids), 4, 4), dtype='f')])
+        self.m_mesh_handles = np.resize(self.m_mesh_handles, capacity)
+        self.m_ids = np.resize(self.m_ids, capacity)
+
+    def add(self, mesh_handle, world_matrix = None):
+        if self.m_count == len(self.m_ids):
+            self._grow()
+        slot = self.m_count
+        instance_id = self.m_next_id
+        self.m_next_id += 1
+        self.m_worlds[slot] = np.identity(4, dtype='f') if world_matrix is None else world_matrix
+        self.m_mesh_handles[slot] = mesh_handle
+        self.m_ids[slot] = instance_id
+        self.m_slots[instance_id] = slot
+        self.m_count += 1
+        self.m_dirty = True
+        return instance_id
+
+    def move(self, instance_id, world_matrix):
+        self.m_worlds[self.m_slots[instance_id]] = world_matrix
+        self.m_dirty = True
+
+    # moves many instances at once, world_matrices is (N,4,4) or (N,16). See transform.TransformArray
+    def move_many(self, instance_ids, world_matrices):
+        slots = np.array([self.m_slots[i] for i in instance_ids], dtype=np.int64)
+        self.m_worlds[slots] = np.asarray(world_matrices, dtype='f').reshape((-1, 4, 4))
+        self.m_dirty = True
+
+    def remove(self, instance_id):
+        slot = self.m_slots.pop(instance_id)
+        last = self.m_count - 1
+        if slot != last:
+            self.m_worlds[slot] = self.m_worlds[last]
+            self.m_mesh_handles[slot] = self.m_mesh_handles[last]
+            self.m_ids[slot] = self.m_ids[last]
+            self.m_slots[int(self.m_ids[slot])] = slot
+        self.m_count = last
+        self.m_dirty = True
+
+    def remove_mesh(self, mesh_handle):
+        for instance_id in self.m_ids[0:self.m_count][self.m_mesh_handles[0:self.m_count] == mesh_handle].tolist():
+            self.remove(instance_id)
+
+    # instances of old_handle now draw new_handle, used when a mesh is replaced by a new upload.
+    def replace_mesh(self, old_handle, new_handle):
+        handles = self.m_mesh_handles[0:self.m_count]
+        if np.any(handles == old_handle):
+            handles[handles == old_handle] = new_handle
+            self.m_dirty = True
+
+    # gpu table of the instances whose mesh is in mesh_ranges, a dict of
+    # handle -> (triangle_offset, triangle_count, cluster_offset, cluster_count).
+    def build_table(self, mesh_ranges):
+        (mesh_handles, instance_meshes) = np.unique(self.m_mesh_handles[0:self.m_count], return_inverse=True)
+        ranges = np.array([mesh_ranges.get(h, (0, 0, 0, 0)) for h in mesh_handles.tolist()], dtype=np.int64).reshape((-1, 4))[instance_meshes]
+        visible = np.array([h in mesh_ranges for h in mesh_handles.tolist()], dtype=bool)[instance_meshes]
+
+        table = np.zeros(int(np.sum(visible)), dtype=g_instance_dtype)
+        table['world'] = self.m_worlds[0:self.m_count][visible].reshape((-1, 16))
+        (table['triangle_offset'], table['triangle_count'], table['cluster_offset'], table['cluster_count']) = ranges[visible].T
+        table['virtual_triangle_offset'] = np.cumsum(table['triangle_count'], dtype=np.int64) - table['triangle_count']
+        table['virtual_cluster_offset'] = np.cumsum(table['cluster_count'], dtype=np.int64) - table['cluster_count']
+        return table
@@ -0,0 +1,141 @@
+import numpy as np
+
+# One entry per mesh of a scene, must match geometry::MeshInfo in geometry.hlsl.
+# Meshes own a contiguous range of triangles and vertices in the global pools.
+# index_offset is in index elements (3 per triangle). Indices are global, not relative to vertex_base.
+g_mesh_table_dtype = np.dtype([
+    ('index_offset', '<u4'),
+    ('triangle_count', '<u4'),
+    ('vertex_base', '<u4'),
+    ('vertex_count', '<u4'),
+    ('aabb_min', '<f4', (3,)),
+    ('aabb_max', '<f4', (3,))])
+
+# Builds the mesh table out of the triangle count of each mesh. Triangles and vertices
+# of each mesh must be contiguous, and meshes must follow each other in the pools.
+# Meshes without triangles get no vertices, based where the previous mesh ends.
+def build_mesh_table(vertices, indices, triangle_counts):
+    triangle_counts = np.asarray(triangle_counts, dtype=np.int64)
+    mesh_table = np.zeros(len(triangle_counts), dtype=g_mesh_table_dtype)
+    if len(mesh_table) == 0:
+        return mesh_table
+
+    first_triangles = np.concatenate([[0], np.cumsum(triangle_counts[:-1])])
+    mesh_table['index_offset'] = first_triangles * 3
+    mesh_table['triangle_count'] = triangle_counts
+    if len(indices) == 0:
+        return mesh_table
+
+    # reduceat does not reduce empty segments, so only the meshes with triangles go through it.
+    # Reductions run over columns and rows of contiguous copies, reducing along short rows is slow.
+    non_empty = triangle_counts > 0
+    mesh_indices = indices.reshape((-1, 3))
+    triangle_min = np.minimum(np.minimum(mesh_indices[:, 0], mesh_indices[:, 1]), mesh_indices[:, 2])
+    triangle_max = np.maximum(np.maximum(mesh_indices[:, 0], mesh_indices[:, 1]), mesh_indices[:, 2])
+    vertex_min = np.minimum.reduceat(triangle_min, first_triangles[non_empty]).astype(np.int64)
+    vertex_max = np.maximum.reduceat(triangle_max, first_triangles[non_empty]).astype(np.int64)
+    vertex_ends = np.zeros(len(mesh_table), dtype=np.int64)
+    vertex_ends[non_empty] = vertex_max + 1
+    vertex_ends = np.maximum.accumulate(vertex_ends)
+    mesh_table['vertex_base'] = np.concatenate([[0], vertex_ends[:-1]])
+    mesh_table['vertex_base'][non_empty] = vertex_min
+    mesh_table['vertex_count'][non_empty] = vertex_max - vertex_min + 1
+    positions = np.ascontiguousarray(vertices[:, 0:3].T)
+    for (i, b, e) in zip(np.flatnonzero(non_empty).tolist(), vertex_min.tolist(), (vertex_max + 1).tolist()):
+        mesh_table['aabb_min'][i] = np.min(positions[:, b:e], axis=1)
+        mesh_table['aabb_max'][i] = np.max(positions[:, b:e], axis=1)
+    return mesh_table
+
+# CPU side geometry, already packed in the layout that GpuGeo uploads.
+class MeshData:
+
+    def __init__(self, vertices, indices, name = "", mesh_table = None, mesh_names = None, clusters = None):
+        #(vertex_count, 8) float32: position, normal, uv. See vertex_format.py
+        self.m_vertices = vertices
+        #(triangle_count, 3) uint32
+        self.m_indices = indices
+        self.m_name = name
+        #(mesh_count,) g_mesh_table_dtype, a single mesh covering everything by default.
+        self.m_mesh_table = build_mesh_table(vertices, indices, [len(indices)]) if mesh_table is None else mesh_table
+        self.m_mesh_names = [name] * len(self.m_mesh_table) if mesh_names is None else mesh_names
+        #(cluster_count,) meshlet.g_cluster_dtype, None until built by meshlet.build
+        self.m_clusters = clusters
+
+    @property
+    def name(self):
+        return self.m_name
+
+    @property
+    def vertices(self):
+        return self.m_vertices
+
+    @property
+    def indices(self):
+        return self.m_indices
+
+    @property
+    def mesh_table(self):
+        return self.m_mesh_table
+
+    @property
+    def mesh_names(self):
+        return self.m_mesh_names
+
+    @property
+    def mesh_count(self):
+        return len(self.m_mesh_table)
+
+    @property
+    def clusters(self):
+        return self.m_clusters
+
+    @property
+    def vertex_count(self):
+        return len(self.m_vertices)
+
+    @property
+    def triangle_count(self):
+        return len(self.m_indices)
+
+    # arrays and info dictionary that mesh_cache stores on disk.
+    def to_cache(self):
+        arrays = {
+            'vertices' : self.m_vertices,
+            'indices' : self.m_indices,
+            'mesh_table' : self.m_mesh_table
+        }
+        if self.m_clusters is not None:
+            arrays['clusters'] = self.m_clusters
+        info = {
+            'name' : self.m_name,
+            'mesh_names' : self.m_mesh_names,
+            'vertex_count' : self.vertex_count,
+            'triangle_count' : self.triangle_count
+        }
+        return (arrays, info)
+
+    def from_cache(arrays, info):
+        return MeshData(arrays['vertices'], arrays['indices'], info['name'], arrays['mesh_table'], info['mesh_names'], arrays.get('clusters'))
+
+def from_wavefront(wavefront_obj, name = ""):
+    positions = np.array(wavefront_obj.vertices, dtype='f').reshape((len(wavefront_obj.vertices), -1))
+    meshes = [m for m in wavefront_obj.mesh_list if len(m.faces) > 0]
+
+    # pywavefront meshes share a single vertex list, each mesh gets a copy of the vertices it uses
+    # so the vertex ranges of the meshes don't overlap.
+    mesh_vertices = []
+    mesh_faces = []
+    vertex_base = 0
+    for m in meshes:
+        (used_vertices, faces) = np.unique(np.array(m.faces, dtype=np.int64), return_inverse=True)
+        mesh_vertices.append(used_vertices)
+        mesh_faces.append(faces.reshape((-1, 3)).astype(np.uint32) + np.uint32(vertex_base))
+        vertex_base += len(used_vertices)
+
+    # faces only index positions, normals and uvs are left to 0. Vertex colors are dropped.
+    vertex_data = np.zeros((vertex_base, 8), dtype='f')
+    if mesh_vertices:
+        vertex_data[:, 0:3] = positions[np.concatenate(mesh_vertices), 0:3]
+    index_data = np.concatenate(mesh_faces) if mesh_faces else np.zeros((0, 3), dtype=np.uint32)
+    mesh_table = build_mesh_table(vertex_data, index_data, [len(f) for f in mesh_faces])
+    return MeshData(vertex_data, index_data, name, mesh_table, [m.name if m.name else name for m in meshes])
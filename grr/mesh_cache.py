@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+from . import mesh
+
+# Bump whenever the layout of MeshData.to_cache changes, invalidates all entries.
+g_cache_version = 4
+g_meta_file_name = "meta.json"
+g_hash_chunk_size = 4 * 1024 * 1024
+
+def get_user_cache_dir():
+    if "GRR_CACHE_DIR" in os.environ:
+        return os.environ["GRR_CACHE_DIR"]
+
+    if os.name == "nt" and "LOCALAPPDATA" in os.environ:
+        base_dir = os.environ["LOCALAPPDATA"]
+    else:
+        base_dir = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(base_dir, "grr", "mesh_cache")
+
+def get_local_cache_dir(source_path):
+    return os.path.join(os.path.dirname(os.path.abspath(source_path)), ".grr_cache")
+
+def file_hash(file_path):
+    h = hashlib.sha1()
+    with open(file_path, "rb") as f:
+        chunk = f.read(g_hash_chunk_size)
+        while chunk:
+            h.update(chunk)
+            chunk = f.read(g_hash_chunk_size)
+    return h.hexdigest()
+
+def _entry_dir(cache_dir, source_path, variant = ""):
+    abs_path = os.path.normcase(os.path.abspath(source_path))
+    path_hash = hashlib.sha1(abs_path.encode("utf-8")).hexdigest()[:16]
+    variant_suffix = "." + variant if variant else ""
+    return os.path.join(cache_dir, os.path.basename(source_path) + variant_suffix + "-" + path_hash)
+
+def _read_meta(entry_dir):
+    meta_path = os.path.join(entry_dir, g_meta_file_name)
+    if not os.path.exists(meta_path):
+        return None
+    try:
+        with open(meta_path, "r") as f:
+            meta = json.loads(f.read())
+        return meta if meta.get('version', -1) == g_cache_version else None
+    except Exception as err:
+        print("[mesh_cache]: ignoring unreadable entry " + entry_dir + ": " + str(err))
+        return None
+
+def _write_meta(entry_dir, meta):
+    tmp_path = os.path.join(entry_dir, g_meta_file_name + ".tmp")
+    with open(tmp_path, "w") as f:
+        f.write(json.dumps(meta))
+    os.replace(tmp_path, os.path.join(entry_dir, g_meta_file_name))
+
+def _load_entry(entry_dir, meta):
+    arrays = { nm : np.load(os.path.join(entry_dir, nm + ".npy"), mmap_mode='r') for nm in meta['arrays'] }
+    return mesh.MeshData.from_cache(arrays, meta['info'])
+
+def _store_entry(entry_dir, mesh_data, source_meta):
+    (arrays, info) = mesh_data.to_cache()
+    os.makedirs(entry_dir, exist_ok = True)
+
+    # meta is written last, a partially written entry never validates.
+    meta_path = os.path.join(entry_dir, g_meta_file_name)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+
+    for (nm, arr) in arrays.items():
+        tmp_path = os.path.join(entry_dir, nm + ".tmp.npy")
+        np.save(tmp_path, np.ascontiguousarray(arr))
+        os.replace(tmp_path, os.path.join(entry_dir, nm + ".npy"))
+
+    meta = dict(source_meta)
+    meta['version'] = g_cache_version
+    meta['arrays'] = list(arrays.keys())
+    meta['info'] = info
+    _write_meta(entry_dir, meta)
+
+def _source_meta(source_path, content_hash):
+    st = os.stat(source_path)
+    return {
+        'source' : os.path.abspath(source_path),
+        'size' : st.st_size,
+        'mtime_ns' : st.st_mtime_ns,
+        'hash' : content_hash
+    }
+
+# Returns the cached MeshData for source_path, or builds it with build_fn(source_path)
+# and stores it. Entries are validated by file size, then mtime, then content hash.
+# Cached arrays are memory mapped, read only. variant names a different build of the
+# same source (for example with load time optimizations), stored in its own entry.
+def load(source_path, build_fn, cache_dir = None, variant = ""):
+    cache_dirs = [cache_dir] if cache_dir is not None else [get_user_cache_dir(), get_local_cache_dir(source_path)]
+    st = os.stat(source_path)
+    content_hash = None
+    for c_dir in cache_dirs:
+        entry_dir = _entry_dir(c_dir, source_path, variant)
+        meta = _read_meta(entry_dir)
+        if meta is None or meta['size'] != st.st_size:
+            continue
+
+        if meta['mtime_ns'] != st.st_mtime_ns:
+            content_hash = file_hash(source_path) if content_hash is None else content_hash
+            if meta['hash'] != content_hash:
+                continue
+            meta['mtime_ns'] = st.st_mtime_ns
+            try:
+                _write_meta(entry_dir, meta)
+            except Exception as err:
+                print("[mesh_cache]: failed refreshing entry " + entry_dir + ": " + str(err))
+
+        try:
+            return _load_entry(entry_dir, meta)
+        except Exception as err:
+            print("[mesh_cache]: failed loading entry " + entry_dir + ": " + str(err))
+
+    mesh_data = build_fn(source_path)
+    content_hash = file_hash(source_path) if content_hash is None else content_hash
+    source_meta = _source_meta(source_path, content_hash)
+    for c_dir in cache_dirs:
+        entry_dir = _entry_dir(c_dir, source_path, variant)
+        try:
+            _store_entry(entry_dir, mesh_data, source_meta)
+            print("[mesh_cache]: stored " + entry_dir)
+            break
+        except Exception as err:
+            print("[mesh_cache]: failed storing entry " + entry_dir + ": " + str(err))
+
+    return mesh_data
+
+def clear(cache_dir = None):
+    c_dir = get_user_cache_dir() if cache_dir is None else cache_dir
+    if os.path.exists(c_dir):
+        shutil.rmtree(c_dir)
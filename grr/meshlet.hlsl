@@ -0,0 +1,60 @@
+#ifndef __MESHLET__
+#define __MESHLET__
+
+//Cluster culling flags, must match ClusterCullFlags in meshlet.py
+#define CLUSTER_CULL_FLAGS_BACKFACE 1 << 0
+
+namespace meshlet
+{
+    //Entry of the cluster table. Must match meshlet.g_cluster_dtype in meshlet.py
+    //triangleOffset is in triangles, into the global index pool.
+    struct Cluster
+    {
+        uint triangleOffset;
+        uint triangleCount;
+        float3 center;
+        float radius;
+        float3 aabbMin;
+        float3 aabbMax;
+        float3 coneAxis;
+        float coneCutoff;
+    };
+
+    //Frustum test of the 8 corners of the cluster AABB in clip space: the cluster is culled
+    //when all corners are behind the same plane. Normal cone test is optional, since the
+    //rasterizer draws back faces, and skipped under non uniform scales.
+    //world is the object to world matrix of the instance. Reference in meshlet.cull_clusters.
+    bool isVisible(in Cluster cluster, float4x4 world, float4x4 viewProj, float3 cameraPos, uint flags)
+    {
+        float4x4 worldViewProj = mul(world, viewProj);
+        uint4 outsideMask = 1;
+        bool behind = true;
+        [unroll]
+        for (uint i = 0; i < 8; ++i)
+        {
+            float3 corner = float3((i & 1) ? cluster.aabbMax.x : cluster.aabbMin.x, (i & 2) ? cluster.aabbMax.y : cluster.aabbMin.y, (i & 4) ? cluster.aabbMax.z : cluster.aabbMin.z);
+            float4 h = mul(float4(corner, 1.0), worldViewProj);
+            outsideMask &= uint4(h.x < -h.w ? 1 : 0, h.x > h.w ? 1 : 0, h.y < -h.w ? 1 : 0, h.y > h.w ? 1 : 0);
+            behind = behind && h.w <= 0.0;
+        }
+
+        if (any(outsideMask != 0) || behind)
+            return false;
+
+        float3 scales = float3(length(world[0].xyz), length(world[1].xyz), length(world[2].xyz));
+        float maxScale = max(scales.x, max(scales.y, scales.z));
+        bool uniformScale = (maxScale - min(scales.x, min(scales.y, scales.z))) <= 1e-3 * maxScale;
+        if ((flags & CLUSTER_CULL_FLAGS_BACKFACE) != 0 && uniformScale)
+        {
+            float3 center = mul(float4(cluster.center, 1.0), world).xyz;
+            float3 coneAxis = normalize(mul(float4(cluster.coneAxis, 0.0), world).xyz);
+            float3 toCenter = center - cameraPos;
+            if (dot(toCenter, coneAxis) >= cluster.coneCutoff * length(toCenter) + cluster.radius * maxScale)
+                return false;
+        }
+
+        return true;
+    }
+}
+
+#endif
@@ -0,0 +1,130 @@
+import numpy as np
+from . import mesh
+
+# Clusters of up to g_cluster_size triangles, built at load time. Triangles of each mesh
+# are sorted in morton order of their centroids, then cut in contiguous runs, so a cluster
+# is a triangle range of the index buffer. Must match meshlet::Cluster in meshlet.hlsl
+# The binning pass runs a 64 thread group per cluster, so clusters can't go over 64 triangles.
+g_cluster_size = 64
+
+g_cluster_dtype = np.dtype([
+    ('triangle_offset', '<u4'),
+    ('triangle_count', '<u4'),
+    ('center', '<f4', (3,)),
+    ('radius', '<f4'),
+    ('aabb_min', '<f4', (3,)),
+    ('aabb_max', '<f4', (3,)),
+    ('cone_axis', '<f4', (3,)),
+    ('cone_cutoff', '<f4')])
+
+#enums, must match those in meshlet.hlsl
+class ClusterCullFlags:
+    CLUSTER_CULL_FLAGS_BACKFACE = 1 << 0
+
+def _part_bits(v):
+    v = v.astype(np.uint64) & 0x3ff
+    v = (v | (v << 16)) & 0x030000ff
+    v = (v | (v << 8)) & 0x0300f00f
+    v = (v | (v << 4)) & 0x030c30c3
+    v = (v | (v << 2)) & 0x09249249
+    return v
+
+def _morton_codes(points, aabb_min, aabb_max):
+    extents = aabb_max - aabb_min
+    scales = np.where(extents > 0.0, 1023.0 / np.where(extents > 0.0, extents, 1.0), 0.0)
+    q = np.clip((points - aabb_min) * scales, 0, 1023).astype(np.uint32)
+    return _part_bits(q[:, 0]) | (_part_bits(q[:, 1]) << np.uint64(1)) | (_part_bits(q[:, 2]) << np.uint64(2))
+
+def _triangle_mesh_ids(triangle_count, mesh_table):
+    return np.repeat(np.arange(len(mesh_table)), mesh_table['triangle_count'].astype(np.int64))[0:triangle_count]
+
+# triangle order that sorts the triangles of each mesh in morton order, meshes keep their range.
+def sort_triangles(vertices, indices, mesh_table):
+    if len(indices) == 0:
+        return np.zeros(0, dtype=np.int64)
+    mesh_ids = _triangle_mesh_ids(len(indices), mesh_table)
+    corners = vertices[indices.astype(np.int64), 0:3]
+    centroids = (corners[:, 0] + corners[:, 1] + corners[:, 2]) * (1.0 / 3.0)
+    codes = _morton_codes(centroids, mesh_table['aabb_min'][mesh_ids], mesh_table['aabb_max'][mesh_ids])
+    return np.lexsort((codes, mesh_ids))
+
+# cluster table of already sorted triangles, clusters never cross meshes.
+def build_clusters(vertices, indices, mesh_table, cluster_size = g_cluster_size):
+    triangle_counts = mesh_table['triangle_count'].astype(np.int64)
+    cluster_counts = (triangle_counts + cluster_size - 1) // cluster_size
+    clusters = np.zeros(int(np.sum(cluster_counts)), dtype=g_cluster_dtype)
+    if len(clusters) == 0:
+        return clusters
+
+    cluster_meshes = np.repeat(np.arange(len(mesh_table)), cluster_counts)
+    first_cluster = np.concatenate([[0], np.cumsum(cluster_counts)[:-1]])
+    cluster_in_mesh = np.arange(len(clusters)) - first_cluster[cluster_meshes]
+    cluster_offsets = mesh_table['index_offset'][cluster_meshes].astype(np.int64) // 3 + cluster_in_mesh * cluster_size
+    cluster_ends = np.minimum(cluster_offsets + cluster_size, (mesh_table['index_offset'].astype(np.int64) // 3 + triangle_counts)[cluster_meshes])
+    clusters['triangle_offset'] = cluster_offsets
+    clusters['triangle_count'] = cluster_ends - cluster_offsets
+
+    # mesh tables cover all triangles with contiguous ranges, so clusters do too and
+    # per cluster values reduce over the cluster offsets.
+    starts = cluster_offsets
+    corners = vertices[indices.astype(np.int64), 0:3]
+    corner_min = np.minimum(np.minimum(corners[:, 0], corners[:, 1]), corners[:, 2])
+    corner_max = np.maximum(np.maximum(corners[:, 0], corners[:, 1]), corners[:, 2])
+    clusters['aabb_min'] = np.minimum.reduceat(corner_min, starts, axis=0)
+    clusters['aabb_max'] = np.maximum.reduceat(corner_max, starts, axis=0)
+
+    center = (clusters['aabb_min'] + clusters['aabb_max']) * 0.5
+    triangle_cluster = np.repeat(np.arange(len(clusters)), clusters['triangle_count'].astype(np.int64))
+    offsets = corners - center[triangle_cluster][:, np.newaxis, :]
+    distances = np.einsum('ijk,ijk->ij', offsets, offsets)
+    clusters['center'] = center
+    clusters['radius'] = np.sqrt(np.maximum.reduceat(np.maximum(np.maximum(distances[:, 0], distances[:, 1]), distances[:, 2]), starts))
+
+    # normal cone: axis is the area weighted average normal, cutoff the sine of the cone half
+    # angle. Cones of 90 degrees or wider never cull (cutoff 1). Degenerate triangles are ignored.
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    axis = np.add.reduceat(normals, starts, axis=0)
+    axis_lengths = np.linalg.norm(axis, axis=1)
+    axis = axis / np.where(axis_lengths > 0.0, axis_lengths, 1.0)[:, np.newaxis]
+    normal_lengths = np.linalg.norm(normals, axis=1)
+    dots = np.sum(normals * axis[triangle_cluster], axis=1) / np.where(normal_lengths > 0.0, normal_lengths, 1.0)
+    min_dots = np.minimum.reduceat(np.where(normal_lengths > 0.0, dots, 1.0), starts)
+    clusters['cone_axis'] = axis
+    clusters['cone_cutoff'] = np.where((min_dots > 0.0) & (axis_lengths > 0.0), np.sqrt(np.maximum(1.0 - min_dots * min_dots, 0.0)), 1.0)
+    return clusters
+
+# returns a MeshData with the triangles sorted for clustering and its cluster table.
+def build(mesh_data, cluster_size = g_cluster_size, reorder = True):
+    vertices = np.asarray(mesh_data.vertices)
+    indices = np.asarray(mesh_data.indices)
+    if reorder:
+        indices = indices[sort_triangles(vertices, indices, mesh_data.mesh_table)]
+    clusters = build_clusters(vertices, indices, mesh_data.mesh_table, cluster_size)
+    return mesh.MeshData(vertices, indices, mesh_data.name, mesh_data.mesh_table, mesh_data.mesh_names, clusters)
+
+# Reference of csMainCullClusters in cluster_cull_cs.hlsl. view and proj are the camera
+# matrices, world the object to world matrix of the instance (column vectors, see transform.py).
+# Returns a bool mask of the visible clusters.
+def cull_clusters(clusters, view_matrix, proj_matrix, flags = 0, world_matrix = None):
+    world_matrix = np.identity(4, dtype='f') if world_matrix is None else np.asarray(world_matrix, dtype='f')
+    view_proj = np.matmul(np.matmul(proj_matrix, view_matrix), world_matrix).astype('f')
+    corner_bits = np.array([[(i >> 0) & 1, (i >> 1) & 1, (i >> 2) & 1] for i in range(8)], dtype='f')
+    corners = clusters['aabb_min'][:, np.newaxis, :] + corner_bits * (clusters['aabb_max'] - clusters['aabb_min'])[:, np.newaxis, :]
+    h = np.matmul(corners, view_proj[:, 0:3].T) + view_proj[:, 3]
+    (x, y, w) = (h[:, :, 0], h[:, :, 1], h[:, :, 3])
+
+    # all corners behind the same clip plane.
+    outside = np.all(x < -w, axis=1) | np.all(x > w, axis=1) | np.all(y < -w, axis=1) | np.all(y > w, axis=1) | np.all(w <= 0.0, axis=1)
+
+    # cones are only tested under uniform scales.
+    scales = np.linalg.norm(world_matrix[0:3, 0:3], axis=0)
+    uniform_scale = np.max(scales) - np.min(scales) <= 1e-3 * np.max(scales)
+    if (flags & ClusterCullFlags.CLUSTER_CULL_FLAGS_BACKFACE) != 0 and uniform_scale:
+        camera_pos = np.linalg.inv(view_matrix)[0:3, 3]
+        centers = np.matmul(clusters['center'], world_matrix[0:3, 0:3].T) + world_matrix[0:3, 3]
+        axes = np.matmul(clusters['cone_axis'], world_matrix[0:3, 0:3].T)
+        axes = axes / np.maximum(np.linalg.norm(axes, axis=1), 1e-30)[:, np.newaxis]
+        to_center = centers - camera_pos
+        distances = np.linalg.norm(to_center, axis=1)
+        outside |= np.sum(to_center * axes, axis=1) >= clusters['cone_cutoff'] * distances + clusters['radius'] * np.max(scales)
+    return ~outside
@@ -0,0 +1,290 @@
+import os
+import numpy as np
+from . import mesh
+
+# Native wavefront obj reader. Statement lines are classified and gathered in
+# bulk with numpy, then tokenized with a single np.fromstring per statement type.
+# Faces are fan triangulated with array operations. The output is already in the
+# GpuGeo vertex / index layout. o, g and usemtl statements start a new mesh.
+
+class Statement:
+    Unknown = 0
+    V = 1
+    VT = 2
+    VN = 3
+    F = 4
+    Mesh = 5
+
+def _exclusive_sum(counts):
+    offsets = np.zeros(len(counts), dtype=np.int64)
+    np.cumsum(counts[:-1], out=offsets[1:])
+    return offsets
+
+def _is_blank(c):
+    return (c == ord(' ')) | (c == ord('\t'))
+
+def _classify_lines(chars, line_starts):
+    last_char = len(chars) - 1
+    (c0, c1, c2) = [chars[np.minimum(line_starts + i, last_char)] for i in range(3)]
+    is_v = c0 == ord('v')
+    kinds = np.zeros(len(line_starts), dtype=np.uint8)
+    kinds[is_v & _is_blank(c1)] = Statement.V
+    kinds[is_v & (c1 == ord('t')) & _is_blank(c2)] = Statement.VT
+    kinds[is_v & (c1 == ord('n')) & _is_blank(c2)] = Statement.VN
+    kinds[(c0 == ord('f')) & _is_blank(c1)] = Statement.F
+    kinds[((c0 == ord('o')) | (c0 == ord('g'))) & _is_blank(c1)] = Statement.Mesh
+    kinds[(c0 == ord('u')) & (c1 == ord('s'))] = Statement.Mesh
+    return kinds
+
+# mesh statement lines (o, g, usemtl) and mesh names, "group/material" when both are
+# present. Few lines, parsed one by one.
+def _parse_mesh_statements(data, line_starts, line_ends, line_ids):
+    mesh_lines = []
+    mesh_names = []
+    (group, material) = ("", "")
+    for (line_id, b, e) in zip(line_ids.tolist(), line_starts[line_ids].tolist(), line_ends[line_ids].tolist()):
+        tokens = data[b:e].split(maxsplit = 1)
+        if tokens[0] not in (b'o', b'g', b'usemtl'):
+            continue
+        value = tokens[1].strip().decode('utf-8', errors = 'replace') if len(tokens) > 1 else ""
+        if tokens[0] == b'usemtl':
+            material = value
+        else:
+            group = value
+        mesh_lines.append(line_id)
+        mesh_names.append(group + "/" + material if group and material else group + material)
+    return (np.array(mesh_lines, dtype=np.int64), mesh_names)
+
+# Concatenates all the lines of a statement type, and returns the offset of each line end in
+# the result. Lines of the same type are mostly contiguous in obj files, so this only copies a
+# few large runs of text.
+def _gather_lines(text, line_starts, line_ends, line_ids):
+    joined_line_ends = np.cumsum(line_ends[line_ids] - line_starts[line_ids] + 1) - 1
+    if len(line_ids) == 0:
+        return (b'', joined_line_ends)
+    run_breaks = np.flatnonzero(np.diff(line_ids) != 1)
+    run_first = line_ids[np.concatenate([[0], run_breaks + 1])]
+    run_last = line_ids[np.concatenate([run_breaks, [len(line_ids) - 1]])]
+    joined = b''.join([text[b:e] for (b, e) in zip(line_starts[run_first].tolist(), (line_ends[run_last] + 1).tolist())])
+    return (joined, joined_line_ends)
+
+# number of whitespace separated tokens in each line of a byte string, and the offset of every
+# token.
+def _tokenize(joined, line_ends):
+    chars = np.frombuffer(joined, dtype=np.uint8)
+    is_space = chars <= ord(' ')
+    token_begins = np.flatnonzero(~is_space[1:] & is_space[:-1]) + 1
+    if len(chars) > 0 and not is_space[0]:
+        token_begins = np.concatenate([[0], token_begins])
+    token_counts = np.diff(np.searchsorted(token_begins, line_ends), prepend=0)
+    return (token_counts, token_begins)
+
+# parses the first col_count floats of each statement body. Missing values are 0.
+def _parse_rows(joined, line_ends, col_count):
+    row_count = len(line_ends)
+    if row_count == 0:
+        return np.zeros((0, col_count), dtype='f')
+
+    values = np.fromstring(joined, dtype='f', sep=' ')
+    if len(values) == row_count * col_count:
+        return values.reshape((row_count, col_count))
+
+    # rows with a different amount of components (w coordinates, vertex colors).
+    (counts, _) = _tokenize(joined, line_ends)
+    offsets = _exclusive_sum(counts)
+    cols = np.arange(col_count)
+    gather = offsets[:, np.newaxis] + cols
+    valid = cols < counts[:, np.newaxis]
+    rows = np.zeros((row_count, col_count), dtype='f')
+    rows[valid] = values[gather[valid]]
+    return rows
+
+# corner formats of the face lines, and the columns (v, vt, vn) of their slash separated values.
+class CornerFormat:
+    Mixed = 0
+    V = 1
+    VVt = 2
+    VVn = 3
+    VVtVn = 4
+
+g_corner_format_columns = [[], [0], [0, 1], [0, 2], [0, 1, 2]]
+
+# format of the corners of each face line, from its first corner. Mixed when a corner of the line
+# has other slashes than the first one.
+def _line_corner_formats(chars, corner_counts, token_begins, line_ends):
+    slashes = np.flatnonzero(chars == ord('/'))
+    line_slash_ends = np.searchsorted(slashes, line_ends)
+    line_slash_begins = np.concatenate([[0], line_slash_ends[:-1]])
+    # doubled slashes of each line, the last slash of a line never starts a pair.
+    doubled_slash_sums = np.zeros(len(slashes) + 1, dtype=np.int32)
+    np.cumsum(np.diff(slashes) == 1, out=doubled_slash_sums[1:len(slashes)])
+    doubled_slash_sums[-1] = doubled_slash_sums[-2] if len(slashes) > 0 else 0
+    line_double_counts = doubled_slash_sums[line_slash_ends] - doubled_slash_sums[line_slash_begins]
+
+    # the first three slashes of each line, past the end when missing, in its first corner or not.
+    first_tokens = np.minimum(_exclusive_sum(corner_counts), len(token_begins) - 1)
+    first_token_ends = np.minimum(np.append(token_begins, len(chars))[first_tokens + 1], line_ends)
+    padded_slashes = np.append(slashes, [len(chars)] * 3)
+    (s0, s1, s2) = [padded_slashes[line_slash_begins + i] for i in range(3)]
+    slash_counts = (s0 < first_token_ends).astype(np.int64) + (s1 < first_token_ends) + (s2 < first_token_ends)
+    double_counts = ((slash_counts == 2) & (s1 == s0 + 1)).astype(np.int64)
+
+    # every corner of a line has the slashes of the first one.
+    is_uniform = (line_slash_ends - line_slash_begins == corner_counts * slash_counts) & (line_double_counts == corner_counts * double_counts)
+    is_uniform &= slash_counts <= 2
+    formats = np.array([CornerFormat.V, CornerFormat.VVt, CornerFormat.VVtVn])[np.minimum(slash_counts, 2)] - double_counts
+    return np.where(is_uniform, formats, CornerFormat.Mixed)
+
+# a single pass over the values of every corner, the slashes are separators. None when the
+# values don't match the corner formats (empty or missing components).
+def _parse_uniform_corners(joined, corner_counts, line_formats, used_formats):
+    values = np.fromstring(joined.replace(b'/', b' '), dtype=np.int64, sep=' ')
+    value_counts = np.array([len(columns) for columns in g_corner_format_columns])[line_formats]
+    if len(values) != int(np.sum(corner_counts * value_counts)):
+        return None
+
+    corners = np.zeros((int(np.sum(corner_counts)), 3), dtype=np.int64)
+    if len(used_formats) == 1:
+        columns = g_corner_format_columns[used_formats[0]]
+        corners[:, columns] = values.reshape((-1, len(columns)))
+    else:
+        corner_formats = np.repeat(line_formats, corner_counts)
+        corner_offsets = _exclusive_sum(np.repeat(value_counts, corner_counts))
+        for corner_format in used_formats.tolist():
+            is_format = corner_formats == corner_format
+            for (i, column) in enumerate(g_corner_format_columns[corner_format]):
+                corners[is_format, column] = values[corner_offsets[is_format] + i]
+    return corners
+
+# returns a (corner_count, 3) int64 array with v, vt and vn indices, 0 for missing ones.
+def _parse_corners(joined, corner_counts, token_begins, line_ends):
+    line_formats = _line_corner_formats(np.frombuffer(joined, dtype=np.uint8), corner_counts, token_begins, line_ends)
+    used_formats = np.unique(line_formats[corner_counts > 0])
+    corners = _parse_uniform_corners(joined, corner_counts, line_formats, used_formats) if used_formats[0] != CornerFormat.Mixed else None
+    if corners is None:
+        # corners of different formats in a line, or empty components, slow path.
+        corners = np.zeros((int(np.sum(corner_counts)), 3), dtype=np.int64)
+        for (i, token) in enumerate(joined.split()):
+            for (c, component) in enumerate(token.split(b'/')[0:3]):
+                if component:
+                    corners[i, c] = int(component)
+    return corners
+
+# converts obj indices (1 based, negatives relative to the end) into 0 based ones, -1 when missing.
+def _resolve_indices(indices, declared_counts, element_count, statement):
+    (min_index, max_index) = (np.min(indices), np.max(indices)) if len(indices) > 0 else (1, 1)
+    if min_index > 0 or max_index == 0:
+        # only positive indices, or none at all.
+        resolved = indices - 1
+        is_valid = max_index <= element_count
+    else:
+        resolved = np.where(indices > 0, indices - 1, declared_counts + indices)
+        resolved[indices == 0] = -1
+        is_valid = not (np.any(resolved >= element_count) or np.any((resolved < 0) & (indices != 0)))
+    if not is_valid:
+        raise ValueError("face references a " + statement + " statement out of range")
+    return resolved
+
+def _fan_triangulate(corner_counts):
+    corner_offsets = _exclusive_sum(corner_counts)
+    tri_counts = np.maximum(corner_counts - 2, 0)
+    face_of_tri = np.repeat(np.arange(len(corner_counts)), tri_counts)
+    tri_in_face = np.arange(len(face_of_tri)) - np.repeat(_exclusive_sum(tri_counts), tri_counts)
+    first_corner = corner_offsets[face_of_tri]
+    return np.stack([first_corner, first_corner + tri_in_face + 1, first_corner + tri_in_face + 2], axis=1)
+
+def _no_progress(progress, stage):
+    pass
+
+# progress_fn(progress, stage) is called between the parsing stages, with progress in [0, 1].
+def parse_obj(data, name = "", progress_fn = _no_progress):
+    if not data.endswith(b'\n'):
+        data = data + b'\n'
+
+    chars = np.frombuffer(data, dtype=np.uint8)
+    line_ends = np.flatnonzero(chars == ord('\n'))
+    line_starts = np.concatenate([[0], line_ends[:-1] + 1])
+    line_kinds = _classify_lines(chars, line_starts)
+    (v_lines, vt_lines, vn_lines, f_lines, m_lines) = [np.flatnonzero(line_kinds == k) for k in [Statement.V, Statement.VT, Statement.VN, Statement.F, Statement.Mesh]]
+    (mesh_lines, mesh_names) = _parse_mesh_statements(data, line_starts, line_ends, m_lines)
+
+    # blank out the statement keywords so only numbers are left to tokenize.
+    text = bytearray(data)
+    text_chars = np.frombuffer(text, dtype=np.uint8)
+    text_chars[line_starts[(line_kinds != Statement.Unknown) & (line_kinds != Statement.Mesh)]] = ord(' ')
+    text_chars[line_starts[(line_kinds == Statement.VT) | (line_kinds == Statement.VN)] + 1] = ord(' ')
+
+    progress_fn(0.2, "parsing vertices")
+    positions = _parse_rows(*_gather_lines(text, line_starts, line_ends, v_lines), 3)
+    uvs = _parse_rows(*_gather_lines(text, line_starts, line_ends, vt_lines), 2)
+    normals = _parse_rows(*_gather_lines(text, line_starts, line_ends, vn_lines), 3)
+
+    progress_fn(0.4, "parsing faces")
+    (f_joined, f_line_ends) = _gather_lines(text, line_starts, line_ends, f_lines)
+    (corner_counts, token_begins) = _tokenize(f_joined, f_line_ends)
+    corners = _parse_corners(f_joined, corner_counts, token_begins, f_line_ends) if len(token_begins) > 0 else np.zeros((0, 3), dtype=np.int64)
+
+    # negative indices are relative to the elements declared before the face statement.
+    declared = [np.repeat(np.searchsorted(element_lines, f_lines), corner_counts) for element_lines in [v_lines, vt_lines, vn_lines]]
+    v_idx  = _resolve_indices(corners[:, 0], declared[0], len(positions), "v")
+    vt_idx = _resolve_indices(corners[:, 1], declared[1], len(uvs), "vt")
+    vn_idx = _resolve_indices(corners[:, 2], declared[2], len(normals), "vn")
+    if np.any(v_idx < 0):
+        raise ValueError("face corner without a v index")
+
+    progress_fn(0.6, "triangulating")
+    tri_corners = _fan_triangulate(corner_counts)
+
+    # mesh of each face, faces before the first mesh statement go to an unnamed mesh.
+    face_mesh = np.searchsorted(mesh_lines, f_lines, side='right')
+    mesh_names = [name] + mesh_names
+    (used_meshes, face_mesh) = np.unique(face_mesh, return_inverse=True)
+    face_mesh = face_mesh.reshape(-1)
+    mesh_names = [mesh_names[m] if mesh_names[m] else name for m in used_meshes.tolist()]
+    mesh_count = len(used_meshes)
+    mesh_triangle_counts = np.bincount(face_mesh, weights=np.maximum(corner_counts - 2, 0), minlength=mesh_count).astype(np.int64)
+
+    if mesh_count <= 1 and not np.any(vt_idx >= 0) and not np.any(vn_idx >= 0):
+        # only positions are referenced, no need to weld corners.
+        vertices = np.zeros((len(positions), 8), dtype='f')
+        vertices[:, 0:3] = positions
+        indices = v_idx[tri_corners]
+    else:
+        # weld corners with the same (mesh, v, vt, vn) into a single vertex. The mesh is
+        # the most significant part of the key, so each mesh gets a contiguous vertex range.
+        progress_fn(0.7, "welding vertices")
+        corner_mesh = np.repeat(face_mesh, corner_counts)
+        (v_range, vt_range, vn_range) = (len(positions), len(uvs) + 1, len(normals) + 1)
+        if mesh_count * v_range * vt_range * vn_range < np.iinfo(np.int64).max:
+            keys = ((corner_mesh * v_range + v_idx) * vt_range + (vt_idx + 1)) * vn_range + (vn_idx + 1)
+            # np.unique's return_index needs a stable sort, any corner of a key has the same attributes.
+            order = np.argsort(keys)
+            sorted_keys = keys[order]
+            is_first = np.concatenate([[True], sorted_keys[1:] != sorted_keys[:-1]])
+            first_corner = order[is_first]
+            corner_vertex = np.empty(len(keys), dtype=np.int64)
+            corner_vertex[order] = np.cumsum(is_first) - 1
+        else:
+            (_, first_corner, corner_vertex) = np.unique(np.stack([corner_mesh, v_idx, vt_idx, vn_idx], axis=1), axis=0, return_index=True, return_inverse=True)
+        corner_vertex = corner_vertex.reshape(-1)
+
+        # missing normals and uvs (-1) take the zero row appended last.
+        vertices = np.empty((len(first_corner), 8), dtype='f')
+        vertices[:, 0:3] = np.take(positions, v_idx[first_corner], axis=0)
+        vertices[:, 3:6] = np.take(np.vstack([normals, np.zeros((1, 3), dtype='f')]), vn_idx[first_corner], axis=0)
+        vertices[:, 6:8] = np.take(np.vstack([uvs, np.zeros((1, 2), dtype='f')]), vt_idx[first_corner], axis=0)
+        indices = corner_vertex[tri_corners]
+
+    indices = indices.astype(np.uint32).reshape((-1, 3))
+    mesh_table = mesh.build_mesh_table(vertices, indices, mesh_triangle_counts)
+    progress_fn(1.0, "parsed")
+    return mesh.MeshData(vertices, indices, name, mesh_table, mesh_names)
+
+def load_obj(file_name, progress_fn = _no_progress):
+    progress_fn(0.0, "reading")
+    with open(file_name, "rb") as f:
+        data = f.read()
+    try:
+        return parse_obj(data, os.path.basename(file_name), progress_fn)
+    except ValueError as err:
+        raise ValueError("[obj_loader]: failed parsing " + file_name + ": " + str(err))
@@ -7,8 +7,76 @@ g_prefix_sum_group_exclusive = g.Shader(file = "prefix_sum_cs.hlsl", main_functi
 g_prefix_sum_next_input = g.Shader(file = "prefix_sum_cs.hlsl", main_function = "csPrefixSumNextInput")
 g_prefix_sum_resolve_parent = g.Shader(file = "prefix_sum_cs.hlsl", main_function = "csPrefixSumResolveParent")
 g_prefix_sum_resolve_parent_exclusive = g.Shader(file = "prefix_sum_cs.hlsl", main_function = "csPrefixSumResolveParent", defines = ["EXCLUSIVE_PREFIX"])
+g_prefix_sum_single_pass = g.Shader(file = "prefix_sum_cs.hlsl", main_function = "csPrefixSumSinglePass")
+g_prefix_sum_single_pass_exclusive = g.Shader(file = "prefix_sum_cs.hlsl", main_function = "csPrefixSumSinglePass", defines = ["EXCLUSIVE_PREFIX"])
+
+#elements scanned per group of the single pass scan, must match SCAN_PARTITION_SIZE in prefix_sum_cs.hlsl
+g_partition_size = g_group_size * 8
+g_max_group_count_x = 65535
+#status words keep the run epoch in their upper 30 bits, see prefix_sum_cs.hlsl
+g_epoch_limit = 1 << 30
+
+# Buffers of the single pass scan: the output, and the look-back state (partition counter
+# then status / aggregate / inclusive prefix per partition, see prefix_sum_model.py).
+class PrefixSumArgs:
+
+    def __init__(self, input_counts):
+        self.m_input_counts = input_counts
+        self.m_partition_count = max(utils.divup(input_counts, g_partition_size), 1)
+        self.m_output_buffer = g.Buffer(name = "prefixSumOutput", element_count = max(input_counts, 1), format = g.Format.R32_UINT)
+        self.m_state_buffer = g.Buffer(name = "prefixSumLookbackState", element_count = 1 + 3 * self.m_partition_count, format = g.Format.R32_UINT)
+        self.m_epoch = 0
+
+    @property
+    def input_counts(self):
+        return self.m_input_counts
+
+    @property
+    def partition_count(self):
+        return self.m_partition_count
+
+    @property
+    def output_buffer(self):
+        return self.m_output_buffer
+
+    @property
+    def state_buffer(self):
+        return self.m_state_buffer
+
+    # epoch of the next run, the state needs a clear when it is 1 (first run or wrap around).
+    def next_epoch(self):
+        self.m_epoch = self.m_epoch + 1 if self.m_epoch + 1 < g_epoch_limit else 1
+        return self.m_epoch
 
 def allocate_args(input_counts):
+    return PrefixSumArgs(input_counts)
+
+# Single dispatch scan of input_counts elements of input_buffer (all of the allocated count by default),
+# returns the output buffer.
+def run(cmd_list, input_buffer, prefix_sum_args, is_exclusive = False, input_counts = -1):
+    if (input_counts == -1):
+        input_counts = prefix_sum_args.input_counts
+    partition_count = utils.divup(input_counts, g_partition_size)
+    if partition_count == 0:
+        return prefix_sum_args.output_buffer
+
+    epoch = prefix_sum_args.next_epoch()
+    if epoch == 1:
+        utils.clear_uint_buffer(cmd_list, 0, prefix_sum_args.state_buffer, 0, 1 + 3 * prefix_sum_args.partition_count)
+
+    group_count_x = min(partition_count, g_max_group_count_x)
+    group_count_y = utils.divup(partition_count, group_count_x)
+    cmd_list.dispatch(
+        x = group_count_x, y = group_count_y, z = 1,
+        shader = g_prefix_sum_single_pass_exclusive if is_exclusive else g_prefix_sum_single_pass,
+        inputs = input_buffer,
+        outputs = [prefix_sum_args.output_buffer, prefix_sum_args.state_buffer],
+        constants = [input_counts, epoch, group_count_x * group_count_y, 0])
+    return prefix_sum_args.output_buffer
+
+# Multi pass scan: per group scans, reduced and resolved back through log128(N) levels. Kept as
+# the baseline of bench.py's prefix_sum benchmark.
+def allocate_args_multipass(input_counts):
     aligned_bin_count = utils.alignup(input_counts, g_group_size)
     reduction_count = 0
     c = input_counts
@@ -22,7 +90,7 @@ def allocate_args(input_counts):
             g.Buffer(name = "reductionBufferOutput", element_count = reduction_count, format = g.Format.R32_UINT),
             input_counts)
 
-def run(cmd_list, input_buffer, prefix_sum_args, is_exclusive = False, input_counts = -1):
+def run_multipass(cmd_list, input_buffer, prefix_sum_args, is_exclusive = False, input_counts = -1):
     reduction_buffer_in = prefix_sum_args[0]
     reduction_buffer_out = prefix_sum_args[1]
     if (input_counts == -1):
@@ -59,3 +59,92 @@ void csPrefixSumResolveParent(int3 dispatchThreadID : SV_DispatchThreadID, int g
     g_outputBuffer[index] += parentSum;
 #endif
 }
+
+// Single pass scan, decoupled look-back (Merrill & Garland). Each group scans a partition of
+// SCAN_PARTITION_SIZE elements, publishes its aggregate, then walks back over the status of the
+// previous partitions until it finds an inclusive prefix. Must match g_partition_size in prefix_sum.py
+#define SCAN_ITEMS_PER_THREAD 8
+#define SCAN_PARTITION_SIZE (GROUP_SIZE * SCAN_ITEMS_PER_THREAD)
+
+// [0] partition counter, then per partition: status word, aggregate, inclusive prefix.
+globallycoherent RWBuffer<uint> g_scanState : register(u1);
+
+#define scanInputCount g_bufferArgs0.x
+#define scanEpoch g_bufferArgs0.y
+#define scanGroupCount g_bufferArgs0.z
+
+#include "scan_lookback.hlsl"
+
+groupshared uint gs_partitionIndex;
+groupshared uint gs_partitionPrefix;
+groupshared uint gs_partitionValues[SCAN_PARTITION_SIZE];
+
+[numthreads(GROUP_SIZE, 1, 1)]
+void csPrefixSumSinglePass(int groupIndex : SV_GroupIndex)
+{
+    if (groupIndex == 0)
+        gs_partitionIndex = scanAcquirePartition();
+    GroupMemoryBarrierWithGroupSync();
+
+    uint partitionIndex = gs_partitionIndex;
+    uint partitionOffset = partitionIndex * SCAN_PARTITION_SIZE;
+    if (partitionOffset >= (uint)scanInputCount)
+        return;
+
+    [unroll]
+    for (uint i = 0; i < SCAN_ITEMS_PER_THREAD; ++i)
+    {
+        uint index = partitionOffset + i * GROUP_SIZE + groupIndex;
+        gs_partitionValues[i * GROUP_SIZE + groupIndex] = index < (uint)scanInputCount ? g_inputBuffer[index] : 0u;
+    }
+    GroupMemoryBarrierWithGroupSync();
+
+    //each thread scans SCAN_ITEMS_PER_THREAD consecutive elements, then the thread sums are scanned on the group.
+    uint threadPrefixes[SCAN_ITEMS_PER_THREAD];
+    uint threadSum = 0;
+    [unroll]
+    for (uint j = 0; j < SCAN_ITEMS_PER_THREAD; ++j)
+    {
+        threadPrefixes[j] = threadSum;
+        threadSum += gs_partitionValues[groupIndex * SCAN_ITEMS_PER_THREAD + j];
+    }
+
+    Threading::Group group;
+    group.init((uint)groupIndex);
+    uint threadOffset, partitionSum;
+    group.prefixExclusive(threadSum, threadOffset, partitionSum);
+
+    if (groupIndex == 0)
+    {
+        uint exclusivePrefix = 0;
+        if (partitionIndex > 0)
+        {
+            scanPublish(partitionIndex, SCAN_STATUS_AGGREGATE, partitionSum);
+            exclusivePrefix = scanLookBack(partitionIndex);
+        }
+        scanPublish(partitionIndex, SCAN_STATUS_PREFIX, exclusivePrefix + partitionSum);
+        gs_partitionPrefix = exclusivePrefix;
+    }
+    GroupMemoryBarrierWithGroupSync();
+
+    threadOffset += gs_partitionPrefix;
+    [unroll]
+    for (uint k = 0; k < SCAN_ITEMS_PER_THREAD; ++k)
+    {
+        uint localIndex = groupIndex * SCAN_ITEMS_PER_THREAD + k;
+#ifdef EXCLUSIVE_PREFIX
+        gs_partitionValues[localIndex] = threadOffset + threadPrefixes[k];
+#else
+        gs_partitionValues[localIndex] += threadOffset + threadPrefixes[k];
+#endif
+    }
+    GroupMemoryBarrierWithGroupSync();
+
+    [unroll]
+    for (uint l = 0; l < SCAN_ITEMS_PER_THREAD; ++l)
+    {
+        uint index = partitionOffset + l * GROUP_SIZE + groupIndex;
+        if (index < (uint)scanInputCount)
+            g_outputBuffer[index] = gs_partitionValues[l * GROUP_SIZE + groupIndex];
+    }
+}
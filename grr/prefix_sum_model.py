@@ -0,0 +1,96 @@
+import numpy as np
+
+# NumPy model of the single pass decoupled look-back scan of prefix_sum_cs.hlsl (csPrefixSumSinglePass),
+# runs headless. Groups are generators advancing one state machine step at a time, interleaved by a
+# random scheduler with a bounded number of resident groups, over the same state layout as the gpu:
+# [0] partition counter, then per partition a status word, the aggregate and the inclusive prefix.
+
+g_status_aggregate = 1
+g_status_prefix = 2
+
+def status_word(epoch, status):
+    return np.uint32((epoch << 2) | status)
+
+def status_index(partition_index):
+    return 1 + partition_index * 3
+
+def allocate_state(partition_count):
+    return np.zeros(1 + 3 * partition_count, dtype=np.uint32)
+
+# One group of the dispatch. Yields after every access to the shared state, yields True while
+# spinning on a partition that has not published yet.
+def _group(state, values, output, epoch, group_count, partition_size, is_exclusive, stats):
+    partition_index = int(state[0])
+    state[0] += 1
+    if partition_index == group_count - 1:
+        state[0] = 0
+    yield False
+
+    partition_begin = partition_index * partition_size
+    if partition_begin >= len(values):
+        return
+    partition_values = values[partition_begin:partition_begin + partition_size]
+    inclusive = np.cumsum(partition_values, dtype=np.uint32)
+    partition_sum = inclusive[-1]
+
+    si = status_index(partition_index)
+    exclusive_prefix = np.uint32(0)
+    if partition_index > 0:
+        state[si + 1] = partition_sum
+        state[si] = status_word(epoch, g_status_aggregate)
+        yield False
+
+        lookback_index = partition_index - 1
+        while True:
+            li = status_index(lookback_index)
+            status = state[li]
+            stats['lookback_steps'] += 1
+            if status == status_word(epoch, g_status_prefix):
+                exclusive_prefix += state[li + 2]
+                break
+            elif status == status_word(epoch, g_status_aggregate):
+                exclusive_prefix += state[li + 1]
+                lookback_index -= 1
+                yield False
+            else:
+                stats['spins'] += 1
+                yield True
+
+    state[si + 2] = exclusive_prefix + partition_sum
+    state[si] = status_word(epoch, g_status_prefix)
+    yield False
+
+    result = inclusive + exclusive_prefix
+    output[partition_begin:partition_begin + partition_size] = result - partition_values if is_exclusive else result
+
+# Scans values (uint32, wrapping like the gpu) with the look-back state machine. state comes from
+# allocate_state and is reused across runs with increasing epochs, like PrefixSumArgs. At most
+# resident_groups groups run at once, launched in order when a slot frees. Returns (output, stats).
+def run(state, values, epoch, is_exclusive = False, partition_size = 1024, resident_groups = 8, rng = None, max_spins = 1000000):
+    values = np.asarray(values, dtype=np.uint32)
+    rng = np.random.default_rng(0) if rng is None else rng
+    partition_count = (len(values) + partition_size - 1) // partition_size
+    output = np.zeros(len(values), dtype=np.uint32)
+    stats = { 'partitions' : partition_count, 'lookback_steps' : 0, 'spins' : 0 }
+    if partition_count == 0:
+        return (output, stats)
+    if len(state) < 1 + 3 * partition_count:
+        raise ValueError("[prefix_sum_model]: state of " + str(len(state)) + " words is too small for " + str(partition_count) + " partitions")
+
+    launched = 0
+    resident = []
+    consecutive_spins = 0
+    while launched < partition_count or resident:
+        while launched < partition_count and len(resident) < resident_groups:
+            resident.append(_group(state, values, output, epoch, partition_count, partition_size, is_exclusive, stats))
+            launched += 1
+        gi = int(rng.integers(0, len(resident)))
+        try:
+            spinning = next(resident[gi])
+        except StopIteration:
+            resident.pop(gi)
+            spinning = False
+        consecutive_spins = consecutive_spins + 1 if spinning else 0
+        if consecutive_spins > max_spins:
+            raise RuntimeError("[prefix_sum_model]: look-back did not make progress")
+    return (output, stats)
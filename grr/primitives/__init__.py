@@ -0,0 +1,11 @@
+# Gpu data parallel primitives. Every module follows the prefix_sum convention: allocate_args(input_counts)
+# creates the buffers once, run(cmd_list, ..., args, input_counts = -1) records the dispatches and returns
+# the output buffers, in place primitives (segmented_sort) have nothing to allocate. reference.py holds the NumPy version of each primitive, bench.py's primitives
+# benchmark their throughput.
+from .. import prefix_sum
+from . import reduction
+from . import segmented_scan
+from . import compact
+from . import radix_sort
+from . import segmented_sort
+from . import reference
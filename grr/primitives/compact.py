@@ -0,0 +1,33 @@
+import coalpy.gpu as g
+from .. import utilities as utils
+from .. import prefix_sum
+
+g_group_size = 128
+g_max_group_count_x = 65535
+g_compact_scatter_shader = g.Shader(file = "compact_cs.hlsl", name = "compact_scatter", main_function = "csCompactScatter")
+
+def allocate_args(input_counts):
+    return (g.Buffer(name = "compactOutput", element_count = max(input_counts, 1), format = g.Format.R32_UINT),
+            g.Buffer(name = "compactCount", element_count = 1, format = g.Format.R32_UINT),
+            g.Buffer(name = "compactArgs", element_count = 1, format = g.Format.RGBA_32_UINT),
+            prefix_sum.allocate_args(input_counts),
+            input_counts)
+
+# Keeps the elements of input_buffer whose flag in flags_buffer is 1 (flags are 0 or 1), in order.
+# Returns (compacted elements, count, indirect args) buffers, the args dispatch one group of
+# args_group_size threads per kept element like cluster_cull.run.
+def run(cmd_list, input_buffer, flags_buffer, compact_args, args_group_size = 64, input_counts = -1):
+    (output_buffer, count_buffer, args_buffer, scan_args, allocated_counts) = compact_args
+    if input_counts == -1:
+        input_counts = allocated_counts
+
+    offsets_buffer = prefix_sum.run(cmd_list, flags_buffer, scan_args, is_exclusive = True, input_counts = input_counts)
+    group_count = max(utils.divup(input_counts, g_group_size), 1)
+    group_count_x = min(group_count, g_max_group_count_x)
+    cmd_list.dispatch(
+        x = group_count_x, y = utils.divup(group_count, group_count_x), z = 1,
+        shader = g_compact_scatter_shader,
+        inputs = [input_buffer, flags_buffer, offsets_buffer],
+        outputs = [output_buffer, count_buffer, args_buffer],
+        constants = [input_counts, args_group_size, group_count_x, 0])
+    return (output_buffer, count_buffer, args_buffer)
@@ -0,0 +1,57 @@
+import coalpy.gpu as g
+from .. import utilities as utils
+from .. import prefix_sum
+
+#must match radix_sort_cs.hlsl
+g_group_size = 128
+g_radix_bits = 4
+g_radix_size = 1 << g_radix_bits
+g_max_group_count_x = 65535
+
+g_radix_histogram_shader = g.Shader(file = "radix_sort_cs.hlsl", name = "radix_histogram", main_function = "csRadixHistogram")
+g_radix_scatter_shader = g.Shader(file = "radix_sort_cs.hlsl", name = "radix_scatter", main_function = "csRadixScatter")
+
+def allocate_args(input_counts):
+    partition_count = max(utils.divup(input_counts, g_group_size), 1)
+    element_count = max(input_counts, 1)
+    return ([(g.Buffer(name = "radixSortKeys" + str(i), element_count = element_count, format = g.Format.R32_UINT),
+              g.Buffer(name = "radixSortValues" + str(i), element_count = element_count, format = g.Format.R32_UINT)) for i in range(2)],
+            g.Buffer(name = "radixSortHistogram", element_count = g_radix_size * partition_count, format = g.Format.R32_UINT),
+            prefix_sum.allocate_args(g_radix_size * partition_count),
+            input_counts)
+
+# Stable LSD sort of the uint keys of keys_buffer and the values of values_buffer along with them,
+# over the low key_bits bits of the keys, g_radix_bits per pass. The inputs are not modified.
+# Returns the (sorted keys, sorted values) buffers.
+def run(cmd_list, keys_buffer, values_buffer, sort_args, key_bits = 32, input_counts = -1):
+    (ping_pong_buffers, histogram_buffer, scan_args, allocated_counts) = sort_args
+    if input_counts == -1:
+        input_counts = allocated_counts
+    if input_counts == 0:
+        return (keys_buffer, values_buffer)
+
+    partition_count = utils.divup(input_counts, g_group_size)
+    group_count_x = min(partition_count, g_max_group_count_x)
+    group_count_y = utils.divup(partition_count, group_count_x)
+    (source_keys, source_values) = (keys_buffer, values_buffer)
+    for pass_index in range(utils.divup(key_bits, g_radix_bits)):
+        const = [input_counts, pass_index * g_radix_bits, partition_count, group_count_x]
+        cmd_list.dispatch(
+            x = group_count_x, y = group_count_y, z = 1,
+            shader = g_radix_histogram_shader,
+            inputs = source_keys,
+            outputs = histogram_buffer,
+            constants = const)
+
+        offsets_buffer = prefix_sum.run(cmd_list, histogram_buffer, scan_args, is_exclusive = True, input_counts = g_radix_size * partition_count)
+
+        #the histogram only fills the u0 slot of the scatter, which doesn't write it.
+        (target_keys, target_values) = ping_pong_buffers[pass_index % 2]
+        cmd_list.dispatch(
+            x = group_count_x, y = group_count_y, z = 1,
+            shader = g_radix_scatter_shader,
+            inputs = [source_keys, source_values, offsets_buffer],
+            outputs = [histogram_buffer, target_keys, target_values],
+            constants = const)
+        (source_keys, source_values) = (target_keys, target_values)
+    return (source_keys, source_values)
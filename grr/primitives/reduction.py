@@ -0,0 +1,45 @@
+import coalpy.gpu as g
+from .. import utilities as utils
+
+g_group_size = 128
+#elements per group, must match REDUCE_PARTITION_SIZE in reduce_cs.hlsl
+g_partition_size = g_group_size * 8
+g_max_group_count_x = 65535
+
+class ReduceOp:
+    Sum = 0
+    Min = 1
+    Max = 2
+
+g_reduce_identities = {
+    ReduceOp.Sum : 0,
+    ReduceOp.Min : 0xffffffff,
+    ReduceOp.Max : 0
+}
+
+g_reduce_shaders = { op : g.Shader(file = "reduce_cs.hlsl", name = "reduce_" + str(op), main_function = "csReduce", defines = ["REDUCE_OP=" + str(op)]) for op in g_reduce_identities.keys() }
+
+def allocate_args(input_counts):
+    return (g.Buffer(name = "reduceOutput", element_count = 1, format = g.Format.R32_UINT),
+            input_counts)
+
+# Reduces input_counts uint elements of input_buffer (all of the allocated count by default), returns
+# the buffer holding the result in its single element. Sums wrap around at 32 bits.
+def run(cmd_list, input_buffer, reduce_args, op = ReduceOp.Sum, input_counts = -1):
+    (output_buffer, allocated_counts) = reduce_args
+    if input_counts == -1:
+        input_counts = allocated_counts
+
+    utils.clear_uint_buffer(cmd_list, g_reduce_identities[op], output_buffer, 0, 1)
+    partition_count = utils.divup(input_counts, g_partition_size)
+    if partition_count == 0:
+        return output_buffer
+
+    group_count_x = min(partition_count, g_max_group_count_x)
+    cmd_list.dispatch(
+        x = group_count_x, y = utils.divup(partition_count, group_count_x), z = 1,
+        shader = g_reduce_shaders[op],
+        inputs = input_buffer,
+        outputs = output_buffer,
+        constants = [input_counts, group_count_x, 0, 0])
+    return output_buffer
@@ -0,0 +1,49 @@
+import numpy as np
+
+# NumPy references of the gpu primitives, on uint32 values wrapping around like the shaders.
+
+# reduction.ReduceOp order: sum, min, max.
+g_reduce_fns = [
+    lambda v: np.sum(v, dtype=np.uint32),
+    lambda v: np.min(v) if len(v) > 0 else np.uint32(0xffffffff),
+    lambda v: np.max(v) if len(v) > 0 else np.uint32(0)
+]
+
+def reduce(values, op = 0):
+    return np.uint32(g_reduce_fns[op](np.asarray(values, dtype=np.uint32)))
+
+def segmented_scan(values, head_flags, is_exclusive = False):
+    values = np.asarray(values, dtype=np.uint32)
+    if len(values) == 0:
+        return values.copy()
+    inclusive = np.cumsum(values, dtype=np.uint32)
+    heads = np.asarray(head_flags) != 0
+    heads[0] = True
+    #sum of everything before the head of each element's segment.
+    segment_begin = np.maximum.accumulate(np.where(heads, np.arange(len(values)), 0))
+    result = inclusive - (inclusive[segment_begin] - values[segment_begin])
+    return result - values if is_exclusive else result
+
+def compact(values, flags):
+    return np.asarray(values, dtype=np.uint32)[np.asarray(flags) != 0]
+
+# LSD passes like radix_sort.run: the gpu ranks every key after the keys of smaller digits, then of
+# the same digit in earlier partitions, then earlier in its partition, which is a stable sort by digit.
+def radix_sort(keys, values, key_bits = 32, radix_bits = 4):
+    keys = np.asarray(keys, dtype=np.uint32)
+    values = np.asarray(values, dtype=np.uint32)
+    for shift in range(0, key_bits, radix_bits):
+        digits = (keys >> np.uint32(shift)) & np.uint32((1 << radix_bits) - 1)
+        order = np.argsort(digits, kind='stable')
+        (keys, values) = (keys[order], values[order])
+    return (keys, values)
+
+# segmented_sort.run: every segment sorted by key then value.
+def segmented_sort(keys, values, offsets, counts):
+    keys = np.array(keys, dtype=np.uint32)
+    values = np.array(values, dtype=np.uint32)
+    for (offset, count) in zip(np.asarray(offsets).tolist(), np.asarray(counts).tolist()):
+        (begin, end) = (offset, offset + count)
+        order = np.lexsort((values[begin:end], keys[begin:end]))
+        (keys[begin:end], values[begin:end]) = (keys[begin:end][order], values[begin:end][order])
+    return (keys, values)
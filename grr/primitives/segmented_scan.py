@@ -0,0 +1,37 @@
+import coalpy.gpu as g
+from .. import utilities as utils
+from .. import prefix_sum
+
+g_group_size = 128
+#elements per group, must match SCAN_PARTITION_SIZE in segmented_scan_cs.hlsl
+g_partition_size = g_group_size * 8
+
+g_segmented_scan = g.Shader(file = "segmented_scan_cs.hlsl", name = "segmented_scan", main_function = "csSegmentedScan")
+g_segmented_scan_exclusive = g.Shader(file = "segmented_scan_cs.hlsl", name = "segmented_scan_exclusive", main_function = "csSegmentedScan", defines = ["EXCLUSIVE_PREFIX"])
+
+# same partitions and look-back state as the prefix sum, see prefix_sum_model.py.
+def allocate_args(input_counts):
+    return prefix_sum.PrefixSumArgs(input_counts)
+
+# Single dispatch scan of input_buffer restarting at every element with a non zero head flag in
+# head_flags_buffer, the first element always starts a segment. Returns the output buffer.
+def run(cmd_list, input_buffer, head_flags_buffer, scan_args, is_exclusive = False, input_counts = -1):
+    if input_counts == -1:
+        input_counts = scan_args.input_counts
+    partition_count = utils.divup(input_counts, g_partition_size)
+    if partition_count == 0:
+        return scan_args.output_buffer
+
+    epoch = scan_args.next_epoch()
+    if epoch == 1:
+        utils.clear_uint_buffer(cmd_list, 0, scan_args.state_buffer, 0, 1 + 3 * scan_args.partition_count)
+
+    group_count_x = min(partition_count, prefix_sum.g_max_group_count_x)
+    group_count_y = utils.divup(partition_count, group_count_x)
+    cmd_list.dispatch(
+        x = group_count_x, y = group_count_y, z = 1,
+        shader = g_segmented_scan_exclusive if is_exclusive else g_segmented_scan,
+        inputs = [input_buffer, head_flags_buffer],
+        outputs = [scan_args.output_buffer, scan_args.state_buffer],
+        constants = [input_counts, epoch, group_count_x * group_count_y, 0])
+    return scan_args.output_buffer
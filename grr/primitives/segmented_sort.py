@@ -0,0 +1,27 @@
+import coalpy.gpu as g
+from .. import utilities as utils
+
+#must match segmented_sort_cs.hlsl
+g_group_size = 256
+#segments longer than this are sorted in LDS in chunks of g_sort_capacity pairs, then the chunks are merged.
+g_sort_capacity = 2048
+g_max_group_count_x = 65535
+
+g_segmented_sort_shader = g.Shader(file = "segmented_sort_cs.hlsl", name = "segmented_sort", main_function = "csSegmentedSort")
+
+# Sorts in place the (key, value) pairs of each of the segment_count segments, given by the start
+# offsets_buffer and size counts_buffer of the segments, by key then value. The segment sizes only
+# live on the gpu, like the bins of the rasterizer. Sorts in place so there is nothing to allocate.
+# Returns (keys_buffer, values_buffer).
+def run(cmd_list, keys_buffer, values_buffer, offsets_buffer, counts_buffer, segment_count):
+    if segment_count == 0:
+        return (keys_buffer, values_buffer)
+
+    group_count_x = min(segment_count, g_max_group_count_x)
+    cmd_list.dispatch(
+        x = group_count_x, y = utils.divup(segment_count, group_count_x), z = 1,
+        shader = g_segmented_sort_shader,
+        inputs = [offsets_buffer, counts_buffer],
+        outputs = [keys_buffer, values_buffer],
+        constants = [segment_count, group_count_x, 0, 0])
+    return (keys_buffer, values_buffer)
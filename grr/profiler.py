@@ -1,15 +1,135 @@
 import coalpy.gpu as g
 import numpy as nm
 import math as m
+import collections
+import functools
+import json
+import time
 
-class Profiler:
+#----------------------------------------------------------------------------------------------
+# cpu markers
+#----------------------------------------------------------------------------------------------
+# Host side spans, recorded between Profiler.begin_capture and end_capture of the active
+# profiler and shown along the gpu markers. Outside of a capture (or with the profiler
+# disabled) markers are a shared no-op object.
+#
+#   with profiler.cpu_marker("build_ui"):
+#       ...
+#
+#   @profiler.cpu_marker_fn("update")
+#   def update(self, delta_time):
+#       ...
+
+class _CpuRecorder:
     def __init__(self):
+        #[name, end ns, begin ns, parent id], same layout as the marker data.
+        self.spans = []
+        self.stack = []
+
+class _CpuMarker:
+    __slots__ = ('m_recorder', 'm_name', 'm_id')
+
+    def __init__(self, recorder, name):
+        self.m_recorder = recorder
+        self.m_name = name
+
+    def __enter__(self):
+        recorder = self.m_recorder
+        self.m_id = len(recorder.spans)
+        recorder.spans.append([self.m_name, 0, time.perf_counter_ns(), recorder.stack[-1] if recorder.stack else -1])
+        recorder.stack.append(self.m_id)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.m_recorder.spans[self.m_id][1] = time.perf_counter_ns()
+        self.m_recorder.stack.pop()
+        return False
+
+class _NullCpuMarker:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+g_null_cpu_marker = _NullCpuMarker()
+
+#recorder of the profiler currently capturing, None otherwise.
+g_cpu_recorder = None
+
+def cpu_marker(name):
+    recorder = g_cpu_recorder
+    return g_null_cpu_marker if recorder is None else _CpuMarker(recorder, name)
+
+# decorator version of cpu_marker, the marker is named after the function by default.
+def cpu_marker_fn(name = None):
+    def decorator(fn):
+        marker_name = fn.__qualname__ if name is None else name
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            recorder = g_cpu_recorder
+            if recorder is None:
+                return fn(*args, **kwargs)
+            with _CpuMarker(recorder, marker_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+#----------------------------------------------------------------------------------------------
+# profiler
+#----------------------------------------------------------------------------------------------
+
+# Rolling window of the durations of a marker, one per captured frame, in ms.
+class MarkerHistory:
+    def __init__(self, capacity):
+        self.m_times = nm.zeros(capacity, dtype=nm.float64)
+        self.m_count = 0
+
+    def push(self, time_ms):
+        self.m_times[self.m_count % len(self.m_times)] = time_ms
+        self.m_count += 1
+
+    @property
+    def count(self):
+        return self.m_count
+
+    # durations in the window, not in capture order once the window wrapped.
+    @property
+    def times(self):
+        return self.m_times[0:min(self.m_count, len(self.m_times))]
+
+    def stats(self):
+        times = self.times
+        if len(times) == 0:
+            return { 'min' : 0.0, 'avg' : 0.0, 'p50' : 0.0, 'p99' : 0.0 }
+        (p50, p99) = nm.percentile(times, [50, 99])
+        return { 'min' : float(nm.min(times)), 'avg' : float(nm.mean(times)), 'p50' : float(p50), 'p99' : float(p99) }
+
+# Gpu markers of each captured frame are read back asynchronously. Captures wait in a bounded
+# ring of in flight readbacks: every ready capture is resolved each frame, and the oldest
+# one is waited on once max_in_flight is reached. Cpu markers of a frame are resolved with it.
+class Profiler:
+    # on_capture(marker_data) is called for every resolved capture, see marker_data.
+    def __init__(self, on_capture = None, max_in_flight = 8, history_capacity = 256, trace_capacity = 4096):
         self.m_active = True
-        self.m_gpu_queue = []
+        self.m_on_capture = on_capture
+        self.m_max_in_flight = max_in_flight
+        self.m_in_flight = collections.deque()
+        self.m_cpu_recorder = None
+        self.m_cpu_frame_begin = 0
+        self.m_frame_index = 0
         self.m_marker_data = []
+        self.m_cpu_marker_data = []
+        self.m_history_capacity = history_capacity
+        self.m_gpu_history = {}
+        self.m_cpu_history = {}
+        #(frame index, cpu frame begin, cpu frame end, cpu marker data, gpu marker data) of the last resolved frames.
+        self.m_trace_frames = collections.deque(maxlen = trace_capacity)
+        self.m_trace_file_name = "grr_trace.json"
         self.m_plot_capacity = 200
         self.m_curr_tick = 0
         self.m_gpu_plot_data = nm.zeros((self.m_plot_capacity, 2), dtype='f')
+        self.m_cpu_plot_data = nm.zeros((self.m_plot_capacity, 2), dtype='f')
 
     @property
     def active(self):
@@ -28,29 +148,48 @@ class Profiler:
             if imgui.begin_tab_item("Hierarchy"):
                 self._build_hierarchy_ui(imgui)
                 imgui.end_tab_item()
+            if imgui.begin_tab_item("Markers"):
+                self._build_markers_ui(imgui)
+                imgui.end_tab_item()
             if imgui.begin_tab_item("Raw Counters"):
                 self._build_raw_counter_ui(imgui)
                 imgui.end_tab_item()
             imgui.end_tab_bar()
         imgui.end()
 
+    # cpu and gpu markers of the last resolved frame, each under a root frame marker.
+    def _merged_marker_data(self):
+        merged = []
+        for (frame_name, marker_data) in [("cpu frame", self.m_cpu_marker_data), ("gpu frame", self.m_marker_data)]:
+            if len(marker_data) == 0:
+                continue
+            root_id = len(merged)
+            begin_timestamp = min([b for (_, _, b, _) in marker_data])
+            end_timestamp = max([e for (_, e, _, _) in marker_data])
+            merged.append((frame_name, end_timestamp, begin_timestamp, -1))
+            merged.extend([(name, e, b, root_id if pid == -1 else root_id + 1 + pid) for (name, e, b, pid) in marker_data])
+        return merged
+
     def _build_raw_counter_ui(self, imgui : g.ImguiBuilder):
         titles = ["ID", "ParentID", "Name", "Time", "BeginTimestamp", "EndTimestamp"]
         imgui.text(f"{titles[0] : <4} {titles[1] : <8} {titles[2] : <32} {titles[3] : ^10} {titles[4] : ^18} {titles[5] : ^18} ")
-        for id in range(0, len(self.m_marker_data)):
-            (name, end_timestamp, begin_timestamp, parent_id) = self.m_marker_data[id]
+        marker_data = self._merged_marker_data()
+        for id in range(0, len(marker_data)):
+            (name, end_timestamp, begin_timestamp, parent_id) = marker_data[id]
             time = end_timestamp - begin_timestamp
             time_str = "%.4f ms" % (time * 1000)
             imgui.text(f"{id: <4} {parent_id : <8} {name : <32} {time_str : ^10} {begin_timestamp : ^18} {end_timestamp : ^18} ")
 
+    @cpu_marker_fn("Profiler._build_hierarchy_ui")
     def _build_hierarchy_ui(self, imgui : g.ImguiBuilder):
-        if len(self.m_marker_data) == 0:
+        marker_data = self._merged_marker_data()
+        if len(marker_data) == 0:
             return
 
-        hierarchy = [(id, []) for id in range(0, len(self.m_marker_data))]
+        hierarchy = [(id, []) for id in range(0, len(marker_data))]
         node_stack = []
-        for id in range(0, len(self.m_marker_data)):
-            (_, _, _, parent_id) = self.m_marker_data[id]
+        for id in range(0, len(marker_data)):
+            (_, _, _, parent_id) = marker_data[id]
             if parent_id != -1:
                 hierarchy[parent_id][1].append(id)
             else:
@@ -65,7 +204,7 @@ class Profiler:
             if was_visited:
                 imgui.tree_pop()
             else:
-                (name, timestamp_end, timestamp_begin, _) = self.m_marker_data[id]
+                (name, timestamp_end, timestamp_begin, _) = marker_data[id]
                 children = hierarchy[id][1]
                 flags = (g.ImGuiTreeNodeFlags.Leaf|g.ImGuiTreeNodeFlags.Bullet) if len(children) == 0 else 0
                 timestamp_str = "%.4f ms" % ((timestamp_end - timestamp_begin) * 1000)
@@ -73,40 +212,136 @@ class Profiler:
                     node_stack.append((id, True)) #set was_visited to True
                     node_stack.extend([(child_id, False) for child_id in children])
 
+    def _build_markers_ui(self, imgui : g.ImguiBuilder):
+        if imgui.button("Export trace"):
+            self.export_trace(self.m_trace_file_name)
+        imgui.text(str(len(self.m_trace_frames)) + " frames, last " + str(self.m_history_capacity) + " per marker")
+        imgui.text(f"{'Name' : <40} {'min' : >10} {'avg' : >10} {'p50' : >10} {'p99' : >10}")
+        for (kind, histories) in [("cpu", self.m_cpu_history), ("gpu", self.m_gpu_history)]:
+            for (name, history) in histories.items():
+                s = history.stats()
+                imgui.text(f"{kind + ' ' + name : <40} {s['min'] : >7.3f} ms {s['avg'] : >7.3f} ms {s['p50'] : >7.3f} ms {s['p99'] : >7.3f} ms")
+
     def _build_timeline_ui(self, imgui : g.ImguiBuilder, implot : g.ImplotBuilder):
         if implot.begin_plot("Timeline"):
             implot.setup_axes("Tick", "Time (ms)", 0, g.ImPlotAxisFlags.AutoFit)
             implot.setup_axis_limits(g.ImAxis.X1, self.m_curr_tick - self.m_plot_capacity, self.m_curr_tick, g.ImPlotCond.Always)
             implot.plot_shaded("gpu time", self.m_gpu_plot_data, self.m_plot_capacity, -float('inf'),(self.m_curr_tick % self.m_plot_capacity))
+            implot.plot_shaded("cpu time", self.m_cpu_plot_data, self.m_plot_capacity, -float('inf'),(self.m_curr_tick % self.m_plot_capacity))
             implot.end_plot()
 
     def begin_capture(self):
-        if not self.active:
+        global g_cpu_recorder
+        if not self.active or self.m_cpu_recorder is not None:
             return
 
         g.begin_collect_markers()
+        self.m_cpu_recorder = _CpuRecorder()
+        self.m_cpu_frame_begin = time.perf_counter_ns()
+        g_cpu_recorder = self.m_cpu_recorder
 
-    def end_capture(self):        
-        if not self.active:
+    # closes the capture opened by begin_capture, even if the profiler got disabled in between.
+    def end_capture(self):
+        global g_cpu_recorder
+        if self.m_cpu_recorder is None:
             return
 
+        cpu_frame_end = time.perf_counter_ns()
+        cpu_spans = self.m_cpu_recorder.spans
+        self.m_cpu_recorder = None
+        g_cpu_recorder = None
+
         marker_gpu_data = g.end_collect_markers()
         request = g.ResourceDownloadRequest(marker_gpu_data.timestamp_buffer)
-        self.m_gpu_queue.append((marker_gpu_data, request))
-
-        if self.m_gpu_queue[0][1].is_ready():
-            #extract markers
-            (data, req) = self.m_gpu_queue.pop(0)
-            gpu_timestamps = nm.frombuffer(req.data_as_bytearray(), dtype=nm.uint64)
-            self.m_marker_data = [ (name, gpu_timestamps[ei]/data.timestamp_frequency, gpu_timestamps[bi]/data.timestamp_frequency, pid) for (name, pid, bi, ei) in data.markers]
-
-            #process history
-            root_tstamps = [(b, e) for (_, e, b, pid) in self.m_marker_data if pid == -1]
-            if len(root_tstamps) > 0:
-                begin_timestamp = min([t for (t, _) in root_tstamps])
-                end_timestamp = max([t for (_, t) in root_tstamps])
-                plot_idx = (self.m_curr_tick % self.m_plot_capacity)
-                self.m_gpu_plot_data[plot_idx][0] = self.m_curr_tick
-                self.m_gpu_plot_data[plot_idx][1] = (end_timestamp - begin_timestamp) * 1000
-            self.m_curr_tick = self.m_curr_tick + 1
-        
+        self.m_in_flight.append((self.m_frame_index, marker_gpu_data, request, self.m_cpu_frame_begin, cpu_frame_end, cpu_spans))
+        self.m_frame_index += 1
+
+        if len(self.m_in_flight) > self.m_max_in_flight:
+            self.m_in_flight[0][2].resolve()
+        while len(self.m_in_flight) > 0 and self.m_in_flight[0][2].is_ready():
+            self._resolve_capture()
+
+    # blocks until all the captures in flight are resolved.
+    def flush(self):
+        while len(self.m_in_flight) > 0:
+            self.m_in_flight[0][2].resolve()
+            self._resolve_capture()
+
+    # gpu markers of the last resolved capture: (name, end seconds, begin seconds, parent id)
+    @property
+    def marker_data(self):
+        return self.m_marker_data
+
+    # cpu markers of the last resolved capture, same layout as marker_data.
+    @property
+    def cpu_marker_data(self):
+        return self.m_cpu_marker_data
+
+    # min / avg / p50 / p99 in ms of a marker over the last history_capacity frames.
+    def marker_stats(self, name, cpu = False):
+        history = (self.m_cpu_history if cpu else self.m_gpu_history).get(name, None)
+        return None if history is None else history.stats()
+
+    def _push_history(self, histories, marker_data):
+        frame_times = {}
+        for (name, end_timestamp, begin_timestamp, _) in marker_data:
+            frame_times[name] = frame_times.get(name, 0.0) + (end_timestamp - begin_timestamp) * 1000
+        for (name, time_ms) in frame_times.items():
+            if name not in histories:
+                histories[name] = MarkerHistory(self.m_history_capacity)
+            histories[name].push(time_ms)
+
+    def _resolve_capture(self):
+        #extract markers
+        (frame_index, data, req, cpu_frame_begin, cpu_frame_end, cpu_spans) = self.m_in_flight.popleft()
+        gpu_timestamps = nm.frombuffer(req.data_as_bytearray(), dtype=nm.uint64)
+        self.m_marker_data = [ (name, gpu_timestamps[ei]/data.timestamp_frequency, gpu_timestamps[bi]/data.timestamp_frequency, pid) for (name, pid, bi, ei) in data.markers]
+        self.m_cpu_marker_data = [ (name, end_ns * 1e-9, begin_ns * 1e-9, pid) for (name, end_ns, begin_ns, pid) in cpu_spans]
+        self._push_history(self.m_gpu_history, self.m_marker_data)
+        self._push_history(self.m_cpu_history, self.m_cpu_marker_data)
+        self.m_trace_frames.append((frame_index, cpu_frame_begin * 1e-9, cpu_frame_end * 1e-9, self.m_cpu_marker_data, self.m_marker_data))
+
+        #process history
+        plot_idx = (self.m_curr_tick % self.m_plot_capacity)
+        root_tstamps = [(b, e) for (_, e, b, pid) in self.m_marker_data if pid == -1]
+        if len(root_tstamps) > 0:
+            begin_timestamp = min([t for (t, _) in root_tstamps])
+            end_timestamp = max([t for (_, t) in root_tstamps])
+            self.m_gpu_plot_data[plot_idx][0] = self.m_curr_tick
+            self.m_gpu_plot_data[plot_idx][1] = (end_timestamp - begin_timestamp) * 1000
+        self.m_cpu_plot_data[plot_idx][0] = self.m_curr_tick
+        self.m_cpu_plot_data[plot_idx][1] = (cpu_frame_end - cpu_frame_begin) * 1e-6
+        self.m_curr_tick = self.m_curr_tick + 1
+        if self.m_on_capture is not None:
+            self.m_on_capture(self.m_marker_data)
+
+    # Chrome trace / Perfetto json of the last trace_capacity resolved frames, cpu and gpu markers
+    # in two tracks. Gpu and cpu clocks are not correlated, the gpu markers of a frame are moved
+    # to start at the end of its cpu capture, when its work got submitted.
+    def trace_events(self):
+        events = [
+            { 'name' : 'thread_name', 'ph' : 'M', 'pid' : 0, 'tid' : 0, 'args' : { 'name' : 'cpu' } },
+            { 'name' : 'thread_name', 'ph' : 'M', 'pid' : 0, 'tid' : 1, 'args' : { 'name' : 'gpu' } }]
+        if len(self.m_trace_frames) == 0:
+            return events
+
+        origin = self.m_trace_frames[0][1]
+        for (frame_index, cpu_frame_begin, cpu_frame_end, cpu_marker_data, gpu_marker_data) in self.m_trace_frames:
+            args = { 'frame' : frame_index }
+            events.append({ 'name' : 'frame', 'ph' : 'X', 'pid' : 0, 'tid' : 0, 'ts' : (cpu_frame_begin - origin) * 1e6, 'dur' : (cpu_frame_end - cpu_frame_begin) * 1e6, 'args' : args })
+            for (name, end_timestamp, begin_timestamp, _) in cpu_marker_data:
+                events.append({ 'name' : name, 'ph' : 'X', 'pid' : 0, 'tid' : 0, 'ts' : (begin_timestamp - origin) * 1e6, 'dur' : (end_timestamp - begin_timestamp) * 1e6, 'args' : args })
+            if len(gpu_marker_data) == 0:
+                continue
+            gpu_offset = cpu_frame_end - min([b for (_, _, b, _) in gpu_marker_data])
+            for (name, end_timestamp, begin_timestamp, _) in gpu_marker_data:
+                events.append({ 'name' : name, 'ph' : 'X', 'pid' : 0, 'tid' : 1, 'ts' : (begin_timestamp + gpu_offset - origin) * 1e6, 'dur' : (end_timestamp - begin_timestamp) * 1e6, 'args' : args })
+        return events
+
+    def export_trace(self, file_name):
+        try:
+            with open(file_name, "w") as f:
+                f.write(json.dumps({ 'traceEvents' : self.trace_events(), 'displayTimeUnit' : 'ms' }))
+            print("[Profiler]: exported " + str(len(self.m_trace_frames)) + " frames to " + file_name)
+        except Exception as err:
+            print("[Profiler]: error exporting trace " + str(err))
@@ -0,0 +1,96 @@
+// These values must match primitives/radix_sort.py
+#define GROUP_SIZE 128
+#define RADIX_BITS 4
+#define RADIX_SIZE (1 << RADIX_BITS)
+#define RADIX_MASK (RADIX_SIZE - 1)
+
+// One LSD pass over RADIX_BITS bits of the keys: csRadixHistogram counts the digits of every
+// partition of GROUP_SIZE keys into a digit major table, which prefix_sum scans into the
+// destination of each (digit, partition). csRadixScatter then moves every key / value to its
+// destination plus its rank among the keys of the same digit before it in the partition.
+
+Buffer<uint> g_keysBuffer : register(t0);
+Buffer<uint> g_valuesBuffer : register(t1);
+Buffer<uint> g_digitOffsetsBuffer : register(t2);
+RWBuffer<uint> g_outputHistogram : register(u0);
+RWBuffer<uint> g_outputKeys : register(u1);
+RWBuffer<uint> g_outputValues : register(u2);
+
+cbuffer ConstantsRadixSort : register(b0)
+{
+    int4 g_sortArgs0;
+}
+
+#define inputCount g_sortArgs0.x
+#define digitShift g_sortArgs0.y
+#define partitionCount g_sortArgs0.z
+#define groupCountX g_sortArgs0.w
+
+groupshared uint gs_histogram[RADIX_SIZE];
+
+uint partitionIndex(uint3 groupID)
+{
+    return groupID.y * groupCountX + groupID.x;
+}
+
+[numthreads(GROUP_SIZE, 1, 1)]
+void csRadixHistogram(int3 groupID : SV_GroupID, int groupIndex : SV_GroupIndex)
+{
+    uint partition = partitionIndex(groupID);
+    //the padding groups of the last row would write the counts of the next digit.
+    if (partition >= (uint)partitionCount)
+        return;
+
+    if (groupIndex < RADIX_SIZE)
+        gs_histogram[groupIndex] = 0;
+    GroupMemoryBarrierWithGroupSync();
+
+    uint index = partition * GROUP_SIZE + groupIndex;
+    if (index < (uint)inputCount)
+    {
+        uint digit = (g_keysBuffer[index] >> digitShift) & RADIX_MASK;
+        InterlockedAdd(gs_histogram[digit], 1);
+    }
+    GroupMemoryBarrierWithGroupSync();
+
+    if (groupIndex < RADIX_SIZE)
+        g_outputHistogram[groupIndex * partitionCount + partition] = gs_histogram[groupIndex];
+}
+
+#define MASK_WORDS (GROUP_SIZE / 32)
+
+//a bit per thread for each digit, the rank of a key is the count of the bits before its own.
+groupshared uint gs_digitMasks[RADIX_SIZE * MASK_WORDS];
+
+[numthreads(GROUP_SIZE, 1, 1)]
+void csRadixScatter(int3 groupID : SV_GroupID, int groupIndex : SV_GroupIndex)
+{
+    uint partition = partitionIndex(groupID);
+    if (partition >= (uint)partitionCount)
+        return;
+
+    if (groupIndex < RADIX_SIZE * MASK_WORDS)
+        gs_digitMasks[groupIndex] = 0;
+    GroupMemoryBarrierWithGroupSync();
+
+    uint index = partition * GROUP_SIZE + groupIndex;
+    bool isValid = index < (uint)inputCount;
+    uint key = isValid ? g_keysBuffer[index] : 0;
+    uint digit = (key >> digitShift) & RADIX_MASK;
+    uint word = groupIndex / 32;
+    uint bit = 1u << (groupIndex % 32);
+    if (isValid)
+        InterlockedOr(gs_digitMasks[digit * MASK_WORDS + word], bit);
+    GroupMemoryBarrierWithGroupSync();
+
+    if (!isValid)
+        return;
+
+    uint rank = countbits(gs_digitMasks[digit * MASK_WORDS + word] & (bit - 1));
+    for (uint w = 0; w < word; ++w)
+        rank += countbits(gs_digitMasks[digit * MASK_WORDS + w]);
+
+    uint destination = g_digitOffsetsBuffer[digit * partitionCount + partition] + rank;
+    g_outputKeys[destination] = key;
+    g_outputValues[destination] = g_valuesBuffer[index];
+}
@@ -0,0 +1,142 @@
+import bisect
+
+# Sub allocator of [0, capacity) ranges, in abstract units (vertices, indices...).
+# Pure python bookkeeping, the owner of the memory applies the results (see GpuGeo).
+# Allocations are first fit, lowest address first, which keeps the pool packed
+# towards offset 0. Free ranges are coalesced with their neighbours.
+class RangeAllocator:
+
+    def __init__(self, capacity):
+        self.m_capacity = capacity
+        #sorted offsets of the free ranges, and free range sizes by offset.
+        self.m_free_offsets = []
+        self.m_free_sizes = {}
+        #allocation sizes by offset.
+        self.m_allocations = {}
+        self.m_used = 0
+        if capacity > 0:
+            self._insert_free(0, capacity)
+
+    @property
+    def capacity(self):
+        return self.m_capacity
+
+    @property
+    def used(self):
+        return self.m_used
+
+    @property
+    def free_size(self):
+        return self.m_capacity - self.m_used
+
+    @property
+    def allocation_count(self):
+        return len(self.m_allocations)
+
+    @property
+    def free_range_count(self):
+        return len(self.m_free_offsets)
+
+    # end of the last allocation.
+    @property
+    def high_water(self):
+        if not self.m_free_offsets:
+            return self.m_capacity
+        last_offset = self.m_free_offsets[-1]
+        return last_offset if last_offset + self.m_free_sizes[last_offset] == self.m_capacity else self.m_capacity
+
+    # free space below the high water mark, 0 when the pool is packed.
+    @property
+    def fragmented_size(self):
+        return self.high_water - self.m_used
+
+    def size_of(self, offset):
+        return self.m_allocations[offset]
+
+    def allocations(self):
+        return sorted(self.m_allocations.items())
+
+    def free_ranges(self):
+        return [(o, self.m_free_sizes[o]) for o in self.m_free_offsets]
+
+    def _insert_free(self, offset, size):
+        bisect.insort(self.m_free_offsets, offset)
+        self.m_free_sizes[offset] = size
+
+    def _remove_free(self, offset):
+        del self.m_free_offsets[bisect.bisect_left(self.m_free_offsets, offset)]
+        del self.m_free_sizes[offset]
+
+    # returns the offset of the new range, or None if no free range is large enough.
+    def allocate(self, size):
+        if size <= 0:
+            raise ValueError("[RangeAllocator]: invalid allocation size " + str(size))
+
+        for offset in self.m_free_offsets:
+            free_size = self.m_free_sizes[offset]
+            if free_size < size:
+                continue
+            self._remove_free(offset)
+            if free_size > size:
+                self._insert_free(offset + size, free_size - size)
+            self.m_allocations[offset] = size
+            self.m_used += size
+            return offset
+        return None
+
+    def free(self, offset):
+        size = self.m_allocations.pop(offset)
+        self.m_used -= size
+
+        #coalesce with the previous and next free ranges.
+        i = bisect.bisect_left(self.m_free_offsets, offset)
+        if i > 0:
+            prev_offset = self.m_free_offsets[i - 1]
+            if prev_offset + self.m_free_sizes[prev_offset] == offset:
+                self._remove_free(prev_offset)
+                size += offset - prev_offset
+                offset = prev_offset
+        next_offset = offset + size
+        if next_offset in self.m_free_sizes:
+            size += self.m_free_sizes[next_offset]
+            self._remove_free(next_offset)
+        self._insert_free(offset, size)
+
+    def grow(self, new_capacity):
+        if new_capacity <= self.m_capacity:
+            return
+        (old_capacity, self.m_capacity) = (self.m_capacity, new_capacity)
+        if self.m_free_offsets:
+            last_offset = self.m_free_offsets[-1]
+            last_size = self.m_free_sizes[last_offset]
+            if last_offset + last_size == old_capacity:
+                self.m_free_sizes[last_offset] = last_size + new_capacity - old_capacity
+                return
+        self._insert_free(old_capacity, new_capacity - old_capacity)
+
+    # Slides the allocation right after the lowest free range down into it.
+    # Returns the (src_offset, dst_offset, size) move that must be applied to the memory,
+    # or None when the pool is packed. Source and destination ranges may overlap,
+    # copies must go in increasing offset order.
+    def compact_step(self):
+        if not self.m_free_offsets:
+            return None
+        hole_offset = self.m_free_offsets[0]
+        hole_size = self.m_free_sizes[hole_offset]
+        src_offset = hole_offset + hole_size
+        if src_offset == self.m_capacity:
+            return None
+
+        size = self.m_allocations.pop(src_offset)
+        self._remove_free(hole_offset)
+        self.m_allocations[hole_offset] = size
+
+        #the hole moves above the allocation, merging with the next free range if any.
+        free_offset = hole_offset + size
+        free_size = hole_size
+        next_offset = src_offset + size
+        if next_offset in self.m_free_sizes:
+            free_size += self.m_free_sizes[next_offset]
+            self._remove_free(next_offset)
+        self._insert_free(free_offset, free_size)
+        return (src_offset, hole_offset, size)
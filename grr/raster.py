@@ -1,28 +1,129 @@
 import coalpy.gpu as g
 import numpy as np
 import math
+import collections
 from . import gpugeo
 from . import utilities
 from . import prefix_sum
+from . import cluster_cull
+from . import meshlet
+from . import vertex_format
+from . import profiler
+from .primitives import segmented_sort
+from .primitives import reduction
+from .primitives import compact
 
 #enums, must match those in raster_cs.hlsl
 class RasterizerFlags:
     RASTERIZER_FLAGS_OUTPUT_FINE_RASTER_COUNT = 1 << 0
+    RASTERIZER_FLAGS_DEPTH_SORT_BINS = 1 << 1
+    RASTERIZER_FLAGS_FINE_BINS = 1 << 2
+    RASTERIZER_FLAGS_TRIANGLE_SETUP = 1 << 3
+
+class FinePassFlags:
+    FINE_PASS_FLAGS_LOAD_DEPTH = 1 << 0
+    FINE_PASS_FLAGS_STORE_DEPTH = 1 << 1
+
+# timed gpu markers of Rasterizer.rasterize
+g_markers = ["rasterize", "raster_binning", "generate_bin_list", "fine_raster"]
 
 g_fine_raster_shader = g.Shader(file = "raster_cs.hlsl", name = "raster_fine_tile", main_function = "csMainFineRaster", defines = ["FINE_RASTER"])
-g_bin_triangle_shader = g.Shader(file = "raster_cs.hlsl", name = "raster_bining", main_function = "csMainBinTriangles" )
+g_fine_raster_compact_shader = g.Shader(file = "raster_cs.hlsl", name = "raster_fine_tile_compact", main_function = "csMainFineRaster", defines = ["FINE_RASTER", "VERTEX_FORMAT_COMPACT=1"])
 g_bin_elements_args_shader = g.Shader(file = "raster_cs.hlsl", name = "raster_elements_args", main_function = "csWriteBinElementArgsBuffer");
-g_bin_elements_shader = g.Shader(file = "raster_cs.hlsl", name = "raster_elements", main_function = "csMainWriteBinElements");
+g_mark_occupied_tiles_shader = g.Shader(file = "raster_cs.hlsl", name = "raster_mark_occupied_tiles", main_function = "csMarkOccupiedTiles")
+g_fine_raster_args_shader = g.Shader(file = "raster_cs.hlsl", name = "raster_fine_raster_args", main_function = "csWriteFineRasterArgsBuffer")
+
+#bin record layouts, must match BIN_RECORD_LAYOUT in raster_cs.hlsl
+class BinRecordLayout:
+    Full = 0
+    Packed = 1
+
+# byte size per record, see raster_util.hlsl.
+# Full: triangleId (4b), binOffset (4b), binId (4b).
+# Packed: triangleId (4b), binOffset << tile bits | binId (4b).
+g_bin_record_byte_sizes = {
+    BinRecordLayout.Full : 4 + 4 + 4,
+    BinRecordLayout.Packed : 4 + 4
+}
+
+# byte size per triangle setup, see raster::TriangleSetup in raster_util.hlsl.
+# screen points: 3 float3, unclipped w with the clip bits: float3.
+g_triangle_setup_byte_size = 4 * 12
+
+# Shaders reading or writing the bin records, one per layout.
+def _bin_record_shaders(name, main_function, defines = []):
+    return { layout : g.Shader(file = "raster_cs.hlsl", name = name + ("_packed" if layout == BinRecordLayout.Packed else ""), main_function = main_function, defines = defines + ["BIN_RECORD_LAYOUT=" + str(layout)]) for layout in g_bin_record_byte_sizes.keys() }
+
+# binning shaders per (cluster culling, compact vertices, load balanced) variant.
+g_bin_triangle_shaders = {
+    (cluster_culling, is_compact, bin_expand) : _bin_record_shaders(
+        "raster_bining" + ("_clusters" if cluster_culling else "") + ("_compact" if is_compact else "") + ("_expand" if bin_expand else ""),
+        "csMainBinTriangles",
+        (["CLUSTER_CULLING=1"] if cluster_culling else []) + (["VERTEX_FORMAT_COMPACT=1"] if is_compact else []) + (["BIN_EXPAND=1"] if bin_expand else []))
+    for cluster_culling in [False, True] for is_compact in [False, True] for bin_expand in [False, True] }
+# binning with two global atomics per (triangle, tile) pair instead of the group staging, only
+# kept to benchmark against, see Rasterizer.staged_binning.
+g_bin_triangle_unstaged_shaders = _bin_record_shaders("raster_bining_unstaged", "csMainBinTriangles", ["BIN_STAGING=0"])
+g_bin_triangle_tiles_shaders = { is_compact : _bin_record_shaders("raster_bining_tiles" + ("_compact" if is_compact else ""), "csMainBinTriangleTiles", ["VERTEX_FORMAT_COMPACT=1"] if is_compact else []) for is_compact in [False, True] }
+g_bin_expand_args_shader = g.Shader(file = "raster_cs.hlsl", name = "raster_bining_expand_args", main_function = "csWriteBinExpandArgsBuffer")
+g_bin_elements_shaders = _bin_record_shaders("raster_elements", "csMainWriteBinElements")
+g_bin_elements_depth_sort_shaders = _bin_record_shaders("raster_elements_depth_sort", "csMainWriteBinElements", ["DEPTH_SORT_BINS=1"])
+# fine bins, refining the coarse bin lists, always with full records.
+g_bin_fine_tiles_shaders = { is_compact : g.Shader(file = "raster_cs.hlsl", name = "raster_bining_fine_tiles" + ("_compact" if is_compact else ""), main_function = "csMainBinFineTiles", defines = ["VERTEX_FORMAT_COMPACT=1"] if is_compact else []) for is_compact in [False, True] }
+
+# Rasterizer options of a view outside the editor, same properties as editor.EditorViewport.
+class ViewSettings:
+
+    def __init__(self, depth_sorted_bins = False, cluster_culling = True, cluster_backface_culling = False, debug_fine_tiles = False, load_balanced_binning = False, fine_bins = False):
+        self.depth_sorted_bins = depth_sorted_bins
+        self.load_balanced_binning = load_balanced_binning
+        self.fine_bins = fine_bins
+        self.cluster_culling = cluster_culling
+        self.cluster_backface_culling = cluster_backface_culling
+        self.debug_fine_tiles = debug_fine_tiles
 
 class Rasterizer:
 
-    # triangleId (4b), binOffset (4b), binId (4b). See raster_utils.hlsl
-    bin_intersection_record_byte_size = (4 + 4 + 4) 
-
     # single uint buffer, with the triangle ID
     bin_element_size = 4 
-    bin_record_buffer_byte_size = (256 * 1024 * 1024) 
-    bin_record_buffer_element_count = math.ceil(bin_record_buffer_byte_size / (bin_intersection_record_byte_size + bin_element_size))
+
+    # The bin record capacity starts at bin_records_per_tile per coarse tile, then follows the
+    # record counts read back from the gpu: it grows by bin_record_growth past any overflow (binning
+    # drops the records past the capacity but keeps counting them), and shrinks to twice the peak
+    # once the peak of the last bin_record_history_length frames is under a quarter of it.
+    bin_records_per_tile = 256
+    min_bin_record_count = 64 * 1024
+    bin_record_growth = 1.5
+    bin_record_history_length = 120
+    max_bin_record_readbacks = 8
+
+    # Bin elements per coarse tile and fine raster pass. Bins past it are rasterized over several
+    # passes carrying the depth, up to max_fine_raster_passes, the last pass takes all the
+    # remaining elements. The pass count follows the largest bin read back from the gpu.
+    fine_raster_pass_element_count = 8192
+    max_fine_raster_passes = 8
+
+    # With load balanced binning, triangles over bin_expand_tile_threshold coarse tiles are binned
+    # one (triangle, tile) pair per thread instead of one triangle per thread.
+    bin_expand_tile_threshold = 16
+
+    # Binning stages its records in group shared memory and reserves them with one atomic per
+    # group. False goes back to two global atomics per record, on the triangle per thread binning
+    # without cluster culling of full vertices only.
+    staged_binning = True
+
+    # With fine bins the coarse bin lists are refined into a bin list per fine tile, so the fine
+    # raster only loads the triangles of its own 8x8 tile. The fine records get
+    # fine_bin_record_ratio times the coarse capacity, and grow with it.
+    fine_bin_record_ratio = 4
+
+    # Binning writes the setup of every binned triangle (its screen points and w) to a buffer per
+    # virtual triangle. The fine raster, the fine bins and the tiles of the load balanced binning
+    # read it instead of loading and transforming the triangle again. False transforms in each pass.
+    # Off by default: the buffer takes 48 bytes per virtual triangle, and at low resolutions most
+    # triangles touch a single fine tile, so the write costs more than it saves. See bench triangle_setup
+    # and the triangle_setup configuration of bench_raster.
+    triangle_setup = False
 
     #coarse tile size in pixels
     coarse_tile_size = (1 << 5)
@@ -30,13 +131,33 @@ class Rasterizer:
     #coarse tile size in pixels
     fine_tile_size = (1 << 3)
 
-    def __init__(self, w, h):
+    # bin_record_layout is the preferred layout: Packed records fall back to Full ones once the
+    # largest bin read back gets to half the elements the bin offset bits can hold.
+    def __init__(self, w, h, bin_record_layout = BinRecordLayout.Packed):
+        self.m_bin_record_layout = bin_record_layout
+        self.m_bin_record_tile_bits = 0
         self.m_max_w = 0
         self.m_max_h = 0
         self.m_total_tiles = 0 
         self.m_bin_offsets_buffer = None
         self.m_fine_tile_counter_buffer = None
         self.m_constant_buffer = None
+        self.m_cluster_cull_args = None
+        self.m_triangle_sort_key_buffer = None
+        self.m_bin_sort_key_buffer = None
+        self.m_triangle_setup_buffer = None
+        self.m_triangle_setup_count = 0
+        self.m_bin_record_capacity = 0
+        self.m_active_bin_record_layout = bin_record_layout
+        self.m_bin_record_readbacks = collections.deque()
+        self.m_bin_record_history = collections.deque(maxlen = Rasterizer.bin_record_history_length)
+        self.m_max_bin_count = 0
+        self.m_fine_pass_args_buffers = {}
+        self.m_bin_expand_slot_capacity = 0
+        self.m_fine_bin_record_capacity = 0
+        self.m_fine_bin_sort_key_buffer = None
+        self.m_fine_bin_offsets_buffer = None
+        self.m_fine_constant_buffer = None
         self.update_view(w, h)
         self.allocate_raster_resources()
         return
@@ -47,6 +168,7 @@ class Rasterizer:
     def get_fine_tile_size(self, w, h):
         return (math.ceil(w / Rasterizer.fine_tile_size), math.ceil(h / Rasterizer.fine_tile_size))
 
+    @profiler.cpu_marker_fn("Rasterizer.rasterize")
     def rasterize(self, cmd_list, w, h, view_matrix, proj_matrix, geo, view_settings = None):
 
         cmd_list.begin_marker("rasterize")
@@ -56,34 +178,83 @@ class Rasterizer:
             self.m_visibility_buffer, w, h)
 
         self.update_view(w, h)
+        self.update_bin_record_capacity()
 
-        flags = 0
+        flags = RasterizerFlags.RASTERIZER_FLAGS_TRIANGLE_SETUP if self.triangle_setup else 0
+        depth_sort_bins = view_settings is not None and view_settings.depth_sorted_bins
+        fine_bins = view_settings is not None and view_settings.fine_bins
         if view_settings != None:
             flags |= RasterizerFlags.RASTERIZER_FLAGS_OUTPUT_FINE_RASTER_COUNT if view_settings.debug_fine_tiles else 0
-        self.setup_constants(cmd_list, w, h, view_matrix, proj_matrix, int(geo.triCounts), flags)
+            flags |= RasterizerFlags.RASTERIZER_FLAGS_DEPTH_SORT_BINS if depth_sort_bins else 0
+            flags |= RasterizerFlags.RASTERIZER_FLAGS_FINE_BINS if fine_bins else 0
+        if fine_bins:
+            self.allocate_fine_bin_records()
+        self.allocate_sort_key_buffers(geo.instance_triangle_count, depth_sort_bins, fine_bins)
+        self.allocate_triangle_setup_buffer(geo.instance_triangle_count)
+
+        cluster_culling = geo.instance_cluster_count > 0 and (view_settings is None or view_settings.cluster_culling)
+        cluster_cull_flags = meshlet.ClusterCullFlags.CLUSTER_CULL_FLAGS_BACKFACE if view_settings is not None and view_settings.cluster_backface_culling else 0
+
+        #a slot per triangle of the binning dispatch, clusters have up to 64 triangles.
+        load_balanced_binning = view_settings is not None and view_settings.load_balanced_binning
+        bin_expand_slot_count = (64 * geo.instance_cluster_count if cluster_culling else geo.instance_triangle_count) if load_balanced_binning else 0
+        self.allocate_bin_expand_buffers(bin_expand_slot_count)
+        self.setup_constants(cmd_list, w, h, view_matrix, proj_matrix, geo.instance_triangle_count, flags, geo.mesh_count, geo.instance_count, bin_expand_slot_count)
+        if fine_bins:
+            self.setup_fine_bin_constants(cmd_list, w, h, view_matrix, proj_matrix, geo.instance_triangle_count, flags, geo.mesh_count, geo.instance_count)
 
         self.bin_tri_records(
             cmd_list, w, h, 
             view_matrix,
             proj_matrix,
-            geo)
+            geo,
+            cluster_culling,
+            cluster_cull_flags,
+            bin_expand_slot_count)
 
         self.generate_bin_list(
-            cmd_list, w, h)
+            cmd_list, w, h, depth_sort_bins, fine_bins, geo)
 
         self.dispatch_fine_raster(
             cmd_list,
             w, h,
             view_matrix,
             proj_matrix,
-            geo)
+            geo,
+            flags)
 
         cmd_list.end_marker()
         
 
-    def setup_constants(self, cmd_list, w, h, view_matrix, proj_matrix, triangle_counts, flags):
+    # triangle_counts is the virtual triangle count, the triangles of all instances.
+    @profiler.cpu_marker_fn("Rasterizer.setup_constants")
+    def setup_constants(self, cmd_list, w, h, view_matrix, proj_matrix, triangle_counts, flags, mesh_count = 0, instance_count = 0, bin_expand_slot_count = 0):
 
         cmd_list.begin_marker("setup_constants")
+        const = self.get_constants(w, h, view_matrix, proj_matrix, triangle_counts, flags, mesh_count, instance_count, self.m_bin_record_capacity, self.m_bin_record_tile_bits, bin_expand_slot_count)
+
+        if self.m_constant_buffer is None:
+            self.m_constant_buffer = g.Buffer(
+                name = "ConstantBuffer", type=g.BufferType.Standard,
+                format = g.Format.R32_FLOAT, element_count = len(const), usage = g.BufferUsage.Constant)
+
+    
+        cmd_list.upload_resource( source = const, destination = self.m_constant_buffer)
+        cmd_list.end_marker()
+
+    # Constants of the fine bins: same as the coarse ones, with the capacity and tile bits of the
+    # fine records.
+    def setup_fine_bin_constants(self, cmd_list, w, h, view_matrix, proj_matrix, triangle_counts, flags, mesh_count = 0, instance_count = 0):
+        (fine_tiles_w, fine_tiles_h) = self.get_fine_tile_size(w, h)
+        const = self.get_constants(w, h, view_matrix, proj_matrix, triangle_counts, flags, mesh_count, instance_count, self.m_fine_bin_record_capacity, max(int(fine_tiles_w * fine_tiles_h - 1).bit_length(), 1))
+        if self.m_fine_constant_buffer is None:
+            self.m_fine_constant_buffer = g.Buffer(
+                name = "FineBinConstantBuffer", type=g.BufferType.Standard,
+                format = g.Format.R32_FLOAT, element_count = len(const), usage = g.BufferUsage.Constant)
+        cmd_list.upload_resource( source = const, destination = self.m_fine_constant_buffer)
+
+    # Constants of raster_cs.hlsl, in the Constants cbuffer order.
+    def get_constants(self, w, h, view_matrix, proj_matrix, triangle_counts, flags, mesh_count, instance_count, bin_record_capacity, bin_record_tile_bits, bin_expand_slot_count = 0):
         tiles_w, tiles_h = self.get_tile_size(w, h)
         fine_tiles_w, fine_tiles_h = self.get_fine_tile_size(w, h)
 
@@ -94,15 +265,9 @@ class Rasterizer:
         ]
         const.extend(view_matrix.flatten().tolist())
         const.extend(proj_matrix.flatten().tolist())
-
-        if self.m_constant_buffer is None:
-            self.m_constant_buffer = g.Buffer(
-                name = "ConstantBuffer", type=g.BufferType.Standard,
-                format = g.Format.R32_FLOAT, element_count = len(const), usage = g.BufferUsage.Constant)
-
-    
-        cmd_list.upload_resource( source = const, destination = self.m_constant_buffer)
-        cmd_list.end_marker()
+        const.extend([int(mesh_count), int(instance_count), int(bin_record_capacity), int(bin_record_tile_bits)])
+        const.extend([int(self.bin_expand_tile_threshold), int(bin_expand_slot_count), 0, 0])
+        return const
 
     def allocate_raster_resources(self):
         self.m_total_records_buffer = g.Buffer(
@@ -111,24 +276,175 @@ class Rasterizer:
                 format = g.Format.R32_UINT,
                 element_count = 1)
 
+        self.allocate_bin_records(max(self.m_total_tiles * Rasterizer.bin_records_per_tile, Rasterizer.min_bin_record_count))
+
+        self.m_bin_elements_args_buffer = g.Buffer(
+            name = "bin_elements_arg_buffer",
+            type = g.BufferType.Standard,
+            format = g.Format.RGBA_32_UINT,
+            element_count = 1)
+
+        self.m_fine_total_records_buffer = g.Buffer(
+                name = "fine_total_bins_buffer",
+                type = g.BufferType.Standard,
+                format = g.Format.R32_UINT,
+                element_count = 1)
+
+        self.m_fine_bin_elements_args_buffer = g.Buffer(
+            name = "fine_bin_elements_arg_buffer",
+            type = g.BufferType.Standard,
+            format = g.Format.RGBA_32_UINT,
+            element_count = 1)
+
+    def allocate_bin_records(self, capacity):
+        self.m_bin_record_capacity = capacity
+        self.m_active_bin_record_layout = self.get_bin_record_layout()
         self.m_bin_record_buffer = g.Buffer(
             name = "bin_record_buffer",
             type = g.BufferType.Structured,
-            element_count = Rasterizer.bin_record_buffer_element_count,
-            stride = Rasterizer.bin_intersection_record_byte_size)
+            element_count = capacity,
+            stride = g_bin_record_byte_sizes[self.m_active_bin_record_layout])
 
         self.m_bin_element_buffer = g.Buffer(
             name = "bin_element_buffer",
             type = g.BufferType.Standard,
             format = g.Format.R32_UINT,
-            element_count = Rasterizer.bin_record_buffer_element_count)
+            element_count = capacity)
 
-        self.m_bin_elements_args_buffer = g.Buffer(
-            name = "bin_elements_arg_buffer",
+        self.m_bin_sort_key_buffer = None
+
+    # Fine bin records and elements, fine_bin_record_ratio times the coarse capacity.
+    def allocate_fine_bin_records(self):
+        capacity = self.m_bin_record_capacity * Rasterizer.fine_bin_record_ratio
+        if capacity == self.m_fine_bin_record_capacity:
+            return
+
+        self.m_fine_bin_record_capacity = capacity
+        self.m_fine_bin_record_buffer = g.Buffer(
+            name = "fine_bin_record_buffer",
+            type = g.BufferType.Structured,
+            element_count = capacity,
+            stride = g_bin_record_byte_sizes[BinRecordLayout.Full])
+
+        self.m_fine_bin_element_buffer = g.Buffer(
+            name = "fine_bin_element_buffer",
+            type = g.BufferType.Standard,
+            format = g.Format.R32_UINT,
+            element_count = capacity)
+
+        self.m_fine_bin_sort_key_buffer = None
+
+    # Packed records hold bin offsets in the bits left above the tile ids, see raster_util.hlsl.
+    def get_bin_record_layout(self):
+        if self.m_bin_record_layout == BinRecordLayout.Packed and self.m_max_bin_count * 2 <= (1 << (32 - self.m_bin_record_tile_bits)):
+            return BinRecordLayout.Packed
+        return BinRecordLayout.Full
+
+    # Packed records only switch to Full ones, back to Packed on the next resize.
+    def needs_bin_record_layout_fallback(self):
+        return self.m_active_bin_record_layout == BinRecordLayout.Packed and self.get_bin_record_layout() != BinRecordLayout.Packed
+
+    # Resolves the readbacks of the previous frames that are ready, resizes the bin records from
+    # them, then reads back the counts of the last scheduled frame. The fine records count against
+    # the coarse capacity they are sized from.
+    def update_bin_record_capacity(self):
+        while len(self.m_bin_record_readbacks) > 0 and all([request.is_ready() for request in self.m_bin_record_readbacks[0]]):
+            (total_records_request, max_bin_count_request, fine_total_records_request) = self.m_bin_record_readbacks.popleft()
+            total_records_request.resolve()
+            max_bin_count_request.resolve()
+            fine_total_records_request.resolve()
+            total_records = int(np.frombuffer(total_records_request.data_as_bytearray(), dtype=np.uint32)[0])
+            fine_total_records = int(np.frombuffer(fine_total_records_request.data_as_bytearray(), dtype=np.uint32)[0])
+            self.m_bin_record_history.append(max(total_records, utilities.divup(fine_total_records, Rasterizer.fine_bin_record_ratio)))
+            self.m_max_bin_count = int(np.frombuffer(max_bin_count_request.data_as_bytearray(), dtype=np.uint32)[0])
+
+        if len(self.m_bin_record_history) > 0:
+            peak = max(self.m_bin_record_history)
+            capacity = self.m_bin_record_capacity
+            if peak > capacity:
+                capacity = utilities.alignup(int(peak * Rasterizer.bin_record_growth), Rasterizer.min_bin_record_count)
+            elif len(self.m_bin_record_history) == Rasterizer.bin_record_history_length and peak * 4 < capacity:
+                capacity = max(utilities.alignup(peak * 2, Rasterizer.min_bin_record_count), Rasterizer.min_bin_record_count)
+            if capacity != self.m_bin_record_capacity:
+                self.allocate_bin_records(capacity)
+                self.m_bin_record_history.clear()
+
+        if self.needs_bin_record_layout_fallback():
+            self.allocate_bin_records(self.m_bin_record_capacity)
+
+        if len(self.m_bin_record_readbacks) < Rasterizer.max_bin_record_readbacks:
+            self.m_bin_record_readbacks.append((
+                g.ResourceDownloadRequest(self.m_total_records_buffer),
+                g.ResourceDownloadRequest(self.m_max_bin_count_args[0]),
+                g.ResourceDownloadRequest(self.m_fine_total_records_buffer)))
+
+    # Sort keys of the depth sorted bins: nearest depth per virtual triangle, and per bin element.
+    # Binning always binds the triangle keys, so a single key is kept while sorting is off. With
+    # fine bins only the fine bin elements are sorted.
+    def allocate_sort_key_buffers(self, triangle_count, depth_sort_bins, fine_bins = False):
+        triangle_key_count = max(triangle_count, 1) if depth_sort_bins else 1
+        if self.m_triangle_sort_key_buffer is None or self.m_triangle_sort_key_buffer_count < triangle_key_count:
+            self.m_triangle_sort_key_buffer_count = triangle_key_count
+            self.m_triangle_sort_key_buffer = g.Buffer(
+                name = "triangle_sort_key_buffer",
+                type = g.BufferType.Standard,
+                format = g.Format.R32_UINT,
+                element_count = triangle_key_count)
+
+        if depth_sort_bins and not fine_bins and self.m_bin_sort_key_buffer is None:
+            self.m_bin_sort_key_buffer = g.Buffer(
+                name = "bin_sort_key_buffer",
+                type = g.BufferType.Standard,
+                format = g.Format.R32_UINT,
+                element_count = self.m_bin_record_capacity)
+
+        if depth_sort_bins and fine_bins and self.m_fine_bin_sort_key_buffer is None:
+            self.m_fine_bin_sort_key_buffer = g.Buffer(
+                name = "fine_bin_sort_key_buffer",
+                type = g.BufferType.Standard,
+                format = g.Format.R32_UINT,
+                element_count = self.m_fine_bin_record_capacity)
+
+    # Triangle setups per virtual triangle. Binning always binds them, so a single setup is kept
+    # while triangle_setup is off.
+    def allocate_triangle_setup_buffer(self, triangle_count):
+        setup_count = max(triangle_count, 1) if self.triangle_setup else 1
+        if self.m_triangle_setup_buffer is not None and self.m_triangle_setup_count >= setup_count:
+            return
+
+        self.m_triangle_setup_count = setup_count
+        self.m_triangle_setup_buffer = g.Buffer(
+            name = "triangle_setup_buffer",
+            type = g.BufferType.Structured,
+            element_count = setup_count,
+            stride = g_triangle_setup_byte_size)
+
+    # Per slot tile counts and triangle ids of the load balanced binning, and their scan.
+    def allocate_bin_expand_buffers(self, slot_count):
+        if slot_count <= self.m_bin_expand_slot_capacity:
+            return
+
+        self.m_bin_expand_slot_capacity = slot_count
+        self.m_bin_expand_counts_buffer = g.Buffer(
+            name = "bin_expand_counts",
+            type = g.BufferType.Standard,
+            format = g.Format.R32_UINT,
+            element_count = slot_count)
+
+        self.m_bin_expand_tri_ids_buffer = g.Buffer(
+            name = "bin_expand_tri_ids",
+            type = g.BufferType.Standard,
+            format = g.Format.R32_UINT,
+            element_count = slot_count)
+
+        self.m_bin_expand_args_buffer = g.Buffer(
+            name = "bin_expand_args",
             type = g.BufferType.Standard,
             format = g.Format.RGBA_32_UINT,
             element_count = 1)
 
+        self.m_bin_expand_scan_args = prefix_sum.allocate_args(slot_count)
+
     def update_view(self, w, h):
         if w <= self.m_max_w and h <= self.m_max_h:
             return
@@ -144,7 +460,17 @@ class Rasterizer:
         tiles_w, tiles_h = self.get_tile_size(w, h)
 
         self.m_total_tiles = tiles_w * tiles_h
+        self.m_bin_record_tile_bits = max(int(self.m_total_tiles - 1).bit_length(), 1)
+        if self.m_bin_record_capacity > 0 and self.needs_bin_record_layout_fallback():
+            self.allocate_bin_records(self.m_bin_record_capacity)
         self.m_prefix_sum_bins_args = prefix_sum.allocate_args(self.m_total_tiles)
+        self.m_max_bin_count_args = reduction.allocate_args(self.m_total_tiles)
+
+        #depth carried between the fine raster passes
+        self.m_fine_depth_buffer = g.Texture(
+            name = "fine_depth_buffer",
+            format = g.Format.R32_FLOAT,
+            width = w, height = h)
 
         self.m_bin_counter_buffer = g.Buffer(
             name = "bin_coarse_tiles_counter",
@@ -159,17 +485,63 @@ class Rasterizer:
             format = g.Format.R32_UINT,
             element_count = fine_tiles_w * fine_tiles_h)
 
+        self.m_fine_bin_counter_buffer = g.Buffer(
+            name = "bin_fine_tiles_counter",
+            type = g.BufferType.Standard,
+            format = g.Format.R32_UINT,
+            element_count = fine_tiles_w * fine_tiles_h)
+        self.m_fine_prefix_sum_bins_args = prefix_sum.allocate_args(fine_tiles_w * fine_tiles_h)
+
+        #coarse tiles with bin elements, and the indirect args of their fine tiles.
+        self.m_occupied_tile_flags_buffer = g.Buffer(
+            name = "occupied_tile_flags",
+            type = g.BufferType.Standard,
+            format = g.Format.R32_UINT,
+            element_count = self.m_total_tiles)
+
+        self.m_tile_ids_buffer = g.Buffer(
+            name = "tile_ids",
+            type = g.BufferType.Standard,
+            format = g.Format.R32_UINT,
+            element_count = self.m_total_tiles)
+
+        self.m_occupied_tiles_args = compact.allocate_args(self.m_total_tiles)
+
+        self.m_fine_raster_args_buffer = g.Buffer(
+            name = "fine_raster_args",
+            type = g.BufferType.Standard,
+            format = g.Format.RGBA_32_UINT,
+            element_count = 1)
+
     def clear_counter_buffers(self, cmd_list, w, h):
         tiles_w, tiles_h = self.get_tile_size(w, h)
         utilities.clear_uint_buffer(cmd_list, 0, self.m_bin_counter_buffer, 0, tiles_w * tiles_h)
         utilities.clear_uint_buffer(cmd_list, 0, self.m_total_records_buffer, 0, 1)
+        utilities.clear_uint_buffer(cmd_list, 0, self.m_fine_total_records_buffer, 0, 1)
         return
     
+    def cull_clusters(self, cmd_list, view_matrix, proj_matrix, gpugeo, flags):
+        cmd_list.begin_marker("cluster_culling")
+        cluster_count = gpugeo.instance_cluster_count
+        if self.m_cluster_cull_args is None or self.m_cluster_cull_args[3] < cluster_count:
+            self.m_cluster_cull_args = cluster_cull.allocate_args(max(2 * cluster_count, 1024))
+        result = cluster_cull.run(
+            cmd_list, gpugeo.m_cluster_table_buffer, gpugeo.m_instance_table_buffer, gpugeo.instance_count, cluster_count,
+            view_matrix, proj_matrix, self.m_cluster_cull_args, flags)
+        cmd_list.end_marker()
+        return result
+
     def bin_tri_records(
         self,
         cmd_list,
         w, h, view_matrix, proj_matrix,
-        gpugeo : gpugeo.GpuGeo):
+        gpugeo : gpugeo.GpuGeo,
+        cluster_culling = False,
+        cluster_cull_flags = 0,
+        bin_expand_slot_count = 0):
+
+        if cluster_culling:
+            (visible_clusters, visible_cluster_count, cluster_args) = self.cull_clusters(cmd_list, view_matrix, proj_matrix, gpugeo, cluster_cull_flags)
 
         cmd_list.begin_marker("raster_binning")
         self.clear_counter_buffers(cmd_list, w, h)
@@ -177,27 +549,103 @@ class Rasterizer:
         tiles_w = math.ceil(w / Rasterizer.coarse_tile_size)
         tiles_h = math.ceil(h / Rasterizer.coarse_tile_size)
 
+        is_compact = gpugeo.vertex_format == vertex_format.VertexFormat.Compact
+        bin_expand = bin_expand_slot_count > 0
+        bin_shader = g_bin_triangle_shaders[(cluster_culling, is_compact, bin_expand)][self.m_active_bin_record_layout]
+        if not self.staged_binning and not (cluster_culling or is_compact or bin_expand):
+            bin_shader = g_bin_triangle_unstaged_shaders[self.m_active_bin_record_layout]
+        bin_outputs = [
+            self.m_total_records_buffer,
+            self.m_bin_counter_buffer,
+            self.m_bin_record_buffer,
+            self.m_triangle_sort_key_buffer,
+            self.m_triangle_setup_buffer
+        ]
+        if bin_expand:
+            #slots of culled or small triangles are never written.
+            utilities.clear_uint_buffer(cmd_list, 0, self.m_bin_expand_counts_buffer, 0, bin_expand_slot_count)
+            bin_outputs.extend([self.m_bin_expand_counts_buffer, self.m_bin_expand_tri_ids_buffer])
+
+        if cluster_culling:
+            #only triangles of the surviving clusters, a group per cluster.
+            cmd_list.dispatch(
+                shader = bin_shader,
+                constants = self.m_constant_buffer,
+                inputs = [
+                    gpugeo.m_vertex_buffer,
+                    gpugeo.m_index_buffer,
+                    gpugeo.m_mesh_table_buffer,
+                    gpugeo.m_instance_table_buffer,
+                    gpugeo.m_cluster_table_buffer,
+                    visible_clusters,
+                    visible_cluster_count
+                ],
+                outputs = bin_outputs,
+                indirect_args = cluster_args)
+        else:
+            cmd_list.dispatch(
+                shader = bin_shader,
+                constants = self.m_constant_buffer,#const,  
+
+                inputs = [
+                    gpugeo.m_vertex_buffer,
+                    gpugeo.m_index_buffer,
+                    gpugeo.m_mesh_table_buffer,
+                    gpugeo.m_instance_table_buffer
+                ],
+
+                outputs = bin_outputs,
+
+                x = math.ceil(gpugeo.instance_triangle_count / 64),
+                y = 1,
+                z = 1)
+
+        if bin_expand:
+            self.bin_expanded_triangles(cmd_list, gpugeo, is_compact, bin_expand_slot_count)
+        cmd_list.end_marker()
+
+    # Second phase of the load balanced binning: scans the tile counts of the large triangles,
+    # then bins one (triangle, tile) pair per thread.
+    def bin_expanded_triangles(self, cmd_list, gpugeo, is_compact, bin_expand_slot_count):
+        cmd_list.begin_marker("bin_expand")
+        expand_scan = prefix_sum.run(cmd_list, self.m_bin_expand_counts_buffer, self.m_bin_expand_scan_args, is_exclusive = False, input_counts = bin_expand_slot_count)
+
         cmd_list.dispatch(
-            shader = g_bin_triangle_shader,
-            constants = self.m_constant_buffer,#const,  
+            x = 1, y = 1, z = 1,
+            shader = g_bin_expand_args_shader,
+            constants = self.m_constant_buffer,
+            inputs = expand_scan,
+            outputs = self.m_bin_expand_args_buffer)
 
+        cmd_list.dispatch(
+            shader = g_bin_triangle_tiles_shaders[is_compact][self.m_active_bin_record_layout],
+            constants = self.m_constant_buffer,
             inputs = [
                 gpugeo.m_vertex_buffer,
-                gpugeo.m_index_buffer
+                gpugeo.m_index_buffer,
+                gpugeo.m_mesh_table_buffer,
+                gpugeo.m_instance_table_buffer,
+                expand_scan,
+                self.m_bin_expand_tri_ids_buffer,
+                #t6 - t9 are unused, the triangle setups are t10 like in the fine raster.
+                self.m_bin_expand_tri_ids_buffer,
+                self.m_bin_expand_tri_ids_buffer,
+                self.m_bin_expand_tri_ids_buffer,
+                self.m_bin_expand_tri_ids_buffer,
+                self.m_triangle_setup_buffer
             ],
-
             outputs = [
                 self.m_total_records_buffer,
                 self.m_bin_counter_buffer,
                 self.m_bin_record_buffer
             ],
-
-            x = math.ceil(gpugeo.triCounts / 64),
-            y = 1,
-            z = 1)
+            indirect_args = self.m_bin_expand_args_buffer)
         cmd_list.end_marker()
 
-    def generate_bin_list(self, cmd_list, w, h):
+    # With depth_sort_bins the elements of every bin are then sorted nearest first, so the fine
+    # raster gs_furthestZ rejection discards the triangles hidden by the first batches. With
+    # fine_bins the coarse bin lists are then refined into the fine ones, see bin_fine_tiles.
+    def generate_bin_list(self, cmd_list, w, h, depth_sort_bins = False, fine_bins = False, gpugeo = None):
 
         tiles_w = math.ceil(w / Rasterizer.coarse_tile_size)
         tiles_h = math.ceil(h / Rasterizer.coarse_tile_size)
@@ -207,45 +655,244 @@ class Rasterizer:
         cmd_list.dispatch(
             x = 1, y = 1, z = 1,
             shader = g_bin_elements_args_shader,
+            constants = self.m_constant_buffer,
             inputs = self.m_total_records_buffer,
             outputs = self.m_bin_elements_args_buffer)
 
+        #largest bin, read back to split the fine raster in passes.
+        reduction.run(cmd_list, self.m_bin_counter_buffer, self.m_max_bin_count_args, reduction.ReduceOp.Max, tiles_w * tiles_h)
+
         self.m_bin_offsets_buffer = prefix_sum.run(cmd_list, self.m_bin_counter_buffer, self.m_prefix_sum_bins_args, is_exclusive = True, input_counts = tiles_w * tiles_h)
 
+        if depth_sort_bins and not fine_bins:
+            cmd_list.dispatch(
+                indirect_args = self.m_bin_elements_args_buffer,
+                shader = g_bin_elements_depth_sort_shaders[self.m_active_bin_record_layout],
+                constants = self.m_constant_buffer,
+                inputs = [self.m_total_records_buffer, self.m_bin_offsets_buffer, self.m_bin_record_buffer, self.m_triangle_sort_key_buffer],
+                outputs = [self.m_bin_element_buffer, self.m_bin_sort_key_buffer])
+
+            cmd_list.begin_marker("sort_bins")
+            segmented_sort.run(cmd_list, self.m_bin_sort_key_buffer, self.m_bin_element_buffer, self.m_bin_offsets_buffer, self.m_bin_counter_buffer, tiles_w * tiles_h)
+            cmd_list.end_marker()
+        else:
+            cmd_list.dispatch(
+                indirect_args = self.m_bin_elements_args_buffer,
+                #x = 1, y = 1, z = 1,
+                shader = g_bin_elements_shaders[self.m_active_bin_record_layout],
+                constants = self.m_constant_buffer,
+                inputs = [self.m_total_records_buffer, self.m_bin_offsets_buffer, self.m_bin_record_buffer ],
+                outputs = self.m_bin_element_buffer)
+
+        if fine_bins:
+            self.bin_fine_tiles(cmd_list, w, h, gpugeo, depth_sort_bins)
+
+        self.compact_occupied_tiles(cmd_list, w, h)
+        cmd_list.end_marker()
+
+    # Second binning level: a thread per coarse bin element tests the triangle against the fine
+    # tiles of its coarse tile, then the fine records go through the same bin list steps as the
+    # coarse ones, with the fine bin constants.
+    def bin_fine_tiles(self, cmd_list, w, h, gpugeo, depth_sort_bins = False):
+        (fine_tiles_w, fine_tiles_h) = self.get_fine_tile_size(w, h)
+        cmd_list.begin_marker("bin_fine_tiles")
+        utilities.clear_uint_buffer(cmd_list, 0, self.m_fine_bin_counter_buffer, 0, fine_tiles_w * fine_tiles_h)
+
         cmd_list.dispatch(
-            indirect_args = self.m_bin_elements_args_buffer,
-            #x = 1, y = 1, z = 1,
-            shader = g_bin_elements_shader,
-            inputs = [self.m_total_records_buffer, self.m_bin_offsets_buffer, self.m_bin_record_buffer ],
-            outputs = self.m_bin_element_buffer)
+            shader = g_bin_fine_tiles_shaders[gpugeo.vertex_format == vertex_format.VertexFormat.Compact],
+            constants = self.m_fine_constant_buffer,
+            inputs = [
+                gpugeo.m_vertex_buffer,
+                gpugeo.m_index_buffer,
+                gpugeo.m_mesh_table_buffer,
+                gpugeo.m_instance_table_buffer,
+                self.m_bin_counter_buffer,
+                self.m_bin_offsets_buffer,
+                self.m_bin_element_buffer,
+                #t7 - t9 are unused, the triangle setups are t10 like in the fine raster.
+                self.m_bin_element_buffer,
+                self.m_bin_element_buffer,
+                self.m_bin_element_buffer,
+                self.m_triangle_setup_buffer
+            ],
+            outputs = [
+                self.m_fine_total_records_buffer,
+                self.m_fine_bin_counter_buffer,
+                self.m_fine_bin_record_buffer
+            ],
+            indirect_args = self.m_bin_elements_args_buffer)
 
+        cmd_list.dispatch(
+            x = 1, y = 1, z = 1,
+            shader = g_bin_elements_args_shader,
+            constants = self.m_fine_constant_buffer,
+            inputs = self.m_fine_total_records_buffer,
+            outputs = self.m_fine_bin_elements_args_buffer)
+
+        self.m_fine_bin_offsets_buffer = prefix_sum.run(cmd_list, self.m_fine_bin_counter_buffer, self.m_fine_prefix_sum_bins_args, is_exclusive = True, input_counts = fine_tiles_w * fine_tiles_h)
+
+        if depth_sort_bins:
+            cmd_list.dispatch(
+                indirect_args = self.m_fine_bin_elements_args_buffer,
+                shader = g_bin_elements_depth_sort_shaders[BinRecordLayout.Full],
+                constants = self.m_fine_constant_buffer,
+                inputs = [self.m_fine_total_records_buffer, self.m_fine_bin_offsets_buffer, self.m_fine_bin_record_buffer, self.m_triangle_sort_key_buffer],
+                outputs = [self.m_fine_bin_element_buffer, self.m_fine_bin_sort_key_buffer])
+
+            cmd_list.begin_marker("sort_bins")
+            segmented_sort.run(cmd_list, self.m_fine_bin_sort_key_buffer, self.m_fine_bin_element_buffer, self.m_fine_bin_offsets_buffer, self.m_fine_bin_counter_buffer, fine_tiles_w * fine_tiles_h)
+            cmd_list.end_marker()
+        else:
+            cmd_list.dispatch(
+                indirect_args = self.m_fine_bin_elements_args_buffer,
+                shader = g_bin_elements_shaders[BinRecordLayout.Full],
+                constants = self.m_fine_constant_buffer,
+                inputs = [self.m_fine_total_records_buffer, self.m_fine_bin_offsets_buffer, self.m_fine_bin_record_buffer],
+                outputs = self.m_fine_bin_element_buffer)
         cmd_list.end_marker()
 
     def dispatch_fine_raster(
         self,
         cmd_list,
         w, h, view_matrix, proj_matrix,
-        gpugeo : gpugeo.GpuGeo):
+        gpugeo : gpugeo.GpuGeo,
+        flags = 0):
+
+        #empty tiles are never dispatched, they keep the cleared visibility and fine tile counts.
+        if (flags & RasterizerFlags.RASTERIZER_FLAGS_OUTPUT_FINE_RASTER_COUNT) != 0:
+            (fine_tiles_x, fine_tiles_y) = self.get_fine_tile_size(w, h)
+            utilities.clear_uint_buffer(cmd_list, 0, self.m_fine_tile_counter_buffer, 0, fine_tiles_x * fine_tiles_y)
+
+        #fine bins are never larger than their coarse bin, the coarse pass count covers them.
+        fine_bins = (flags & RasterizerFlags.RASTERIZER_FLAGS_FINE_BINS) != 0
+        (bin_counters, bin_offsets, bin_elements) = (
+            (self.m_fine_bin_counter_buffer, self.m_fine_bin_offsets_buffer, self.m_fine_bin_element_buffer) if fine_bins else
+            (self.m_bin_counter_buffer, self.m_bin_offsets_buffer, self.m_bin_element_buffer))
 
-        (fine_tiles_x, fine_tiles_y) = self.get_fine_tile_size(w, h)
+        pass_count = self.fine_raster_pass_count
         cmd_list.begin_marker("fine_raster")
+        for pass_index in range(pass_count):
+            cmd_list.dispatch(
+                shader = g_fine_raster_compact_shader if gpugeo.vertex_format == vertex_format.VertexFormat.Compact else g_fine_raster_shader,
+                constants = self.m_constant_buffer,#const,
+                inputs = [
+                    gpugeo.m_vertex_buffer, 
+                    gpugeo.m_index_buffer,
+                    gpugeo.m_mesh_table_buffer,
+                    gpugeo.m_instance_table_buffer,
+                    bin_counters,
+                    bin_offsets,
+                    bin_elements,
+                    self.get_fine_pass_args(cmd_list, pass_index, pass_index == pass_count - 1),
+                    self.m_occupied_tiles_buffer,
+                    self.m_occupied_tile_count_buffer,
+                    self.m_triangle_setup_buffer],
+                outputs = [
+                    self.m_visibility_buffer,
+                    self.m_fine_tile_counter_buffer,
+                    self.m_fine_depth_buffer ],
+                indirect_args = self.m_fine_raster_args_buffer)
+        cmd_list.end_marker()
+
+    # List of the coarse tiles with bin elements, and the indirect args of the fine raster: a group
+    # per fine tile of the listed coarse tiles.
+    def compact_occupied_tiles(self, cmd_list, w, h):
+        (tiles_w, tiles_h) = self.get_tile_size(w, h)
+        cmd_list.begin_marker("compact_occupied_tiles")
         cmd_list.dispatch(
-            shader = g_fine_raster_shader,
-            constants = self.m_constant_buffer,#const,
-            inputs = [
-                gpugeo.m_vertex_buffer, 
-                gpugeo.m_index_buffer,
-                self.m_bin_counter_buffer,
-                self.m_bin_offsets_buffer,
-                self.m_bin_element_buffer],
-            outputs = [
-                self.m_visibility_buffer,
-                self.m_fine_tile_counter_buffer ],
-            x = fine_tiles_x,
-            y = fine_tiles_y,
-            z = 1)
+            x = utilities.divup(tiles_w * tiles_h, 64), y = 1, z = 1,
+            shader = g_mark_occupied_tiles_shader,
+            constants = self.m_constant_buffer,
+            inputs = self.m_bin_counter_buffer,
+            outputs = [self.m_occupied_tile_flags_buffer, self.m_tile_ids_buffer])
+
+        (self.m_occupied_tiles_buffer, self.m_occupied_tile_count_buffer, _) = compact.run(
+            cmd_list, self.m_tile_ids_buffer, self.m_occupied_tile_flags_buffer, self.m_occupied_tiles_args, input_counts = tiles_w * tiles_h)
+
+        cmd_list.dispatch(
+            x = 1, y = 1, z = 1,
+            shader = g_fine_raster_args_shader,
+            inputs = self.m_occupied_tile_count_buffer,
+            outputs = self.m_fine_raster_args_buffer)
         cmd_list.end_marker()
 
+    # Bin element range and depth flags of a fine raster pass, as [offset, count, flags, 0].
+    # The last pass takes all the remaining elements of the bins. Uploaded once, on creation.
+    def get_fine_pass_args(self, cmd_list, pass_index, is_last):
+        key = (pass_index, is_last)
+        if key not in self.m_fine_pass_args_buffers:
+            flags = FinePassFlags.FINE_PASS_FLAGS_LOAD_DEPTH if pass_index > 0 else 0
+            flags |= 0 if is_last else FinePassFlags.FINE_PASS_FLAGS_STORE_DEPTH
+            pass_args = g.Buffer(
+                name = "fine_pass_args_" + str(pass_index) + ("_last" if is_last else ""),
+                type = g.BufferType.Standard,
+                format = g.Format.RGBA_32_UINT,
+                element_count = 1)
+            cmd_list.upload_resource(
+                source = np.array([
+                    pass_index * self.fine_raster_pass_element_count,
+                    0xffffffff if is_last else self.fine_raster_pass_element_count,
+                    flags, 0], dtype=np.uint32),
+                destination = pass_args)
+            self.m_fine_pass_args_buffers[key] = pass_args
+        return self.m_fine_pass_args_buffers[key]
+
+    # Triangle visits per pixel of the last rasterize, read back from the bin counts (blocking):
+    # every pixel of a fine raster group loops over the triangles of its bin. Without fine bins
+    # that is the coarse bin of the pixel, with them the fine bin. Returns
+    # (coarse visits per pixel, fine visits per pixel or None without fine bins).
+    def read_triangle_visits_per_pixel(self, w, h, fine_bins = False):
+        (tiles_w, tiles_h) = self.get_tile_size(w, h)
+        (fine_tiles_w, fine_tiles_h) = self.get_fine_tile_size(w, h)
+
+        def download(buffer, count):
+            request = g.ResourceDownloadRequest(resource = buffer)
+            request.resolve()
+            return np.frombuffer(request.data_as_bytearray(), dtype=np.uint32)[0:count].astype(np.float64)
+
+        # pixels of every fine tile, the last row and column can be partial.
+        tile_pixels = np.outer(
+            np.minimum(h - np.arange(fine_tiles_h) * Rasterizer.fine_tile_size, Rasterizer.fine_tile_size),
+            np.minimum(w - np.arange(fine_tiles_w) * Rasterizer.fine_tile_size, Rasterizer.fine_tile_size))
+
+        shift = int(Rasterizer.coarse_tile_size // Rasterizer.fine_tile_size).bit_length() - 1
+        coarse_counts = download(self.m_bin_counter_buffer, tiles_w * tiles_h).reshape((tiles_h, tiles_w))
+        coarse_counts = coarse_counts[np.arange(fine_tiles_h)[:, None] >> shift, np.arange(fine_tiles_w)[None, :] >> shift]
+        coarse_visits = float(np.sum(coarse_counts * tile_pixels)) / (w * h)
+        if not fine_bins:
+            return (coarse_visits, None)
+
+        fine_counts = download(self.m_fine_bin_counter_buffer, fine_tiles_w * fine_tiles_h).reshape((fine_tiles_h, fine_tiles_w))
+        return (coarse_visits, float(np.sum(fine_counts * tile_pixels)) / (w * h))
+
+    @property
+    def fine_raster_pass_count(self):
+        return min(max(utilities.divup(self.m_max_bin_count, self.fine_raster_pass_element_count), 1), self.max_fine_raster_passes)
+
+    @property
+    def bin_record_capacity(self):
+        return self.m_bin_record_capacity
+
+    # layout of the allocated bin records, see BinRecordLayout.
+    @property
+    def bin_record_layout(self):
+        return self.m_active_bin_record_layout
+
+    # bytes of the bin records and bin elements.
+    @property
+    def bin_record_byte_size(self):
+        return self.m_bin_record_capacity * (g_bin_record_byte_sizes[self.m_active_bin_record_layout] + Rasterizer.bin_element_size)
+
+    # bytes of the triangle setups.
+    @property
+    def triangle_setup_byte_size(self):
+        return self.m_triangle_setup_count * g_triangle_setup_byte_size
+
+    # bytes of the fine bin records and elements, 0 until fine bins are used.
+    @property
+    def fine_bin_record_byte_size(self):
+        return self.m_fine_bin_record_capacity * (g_bin_record_byte_sizes[BinRecordLayout.Full] + Rasterizer.bin_element_size)
+
     @property
     def visibility_buffer(self):
         return self.m_visibility_buffer
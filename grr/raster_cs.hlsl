@@ -2,11 +2,33 @@
 #include "raster_util.hlsl"
 #include "coverage.hlsl"
 #include "depth_utils.hlsl"
+#include "meshlet.hlsl"
 
 #define FINE_TILE_THREAD_COUNT (FINE_TILE_SIZE * FINE_TILE_SIZE)
 #define COARSE_TILE_THREAD_COUNT (COARSE_TILE_SIZE * COARSE_TILE_SIZE)
 
 #define RASTERIZER_FLAGS_OUTPUT_FINE_RASTER_COUNT 1 << 0
+#define RASTERIZER_FLAGS_DEPTH_SORT_BINS 1 << 1
+#define RASTERIZER_FLAGS_FINE_BINS 1 << 2
+#define RASTERIZER_FLAGS_TRIANGLE_SETUP 1 << 3
+
+//flags of a fine raster pass, must match raster.py
+#define FINE_PASS_FLAGS_LOAD_DEPTH 1 << 0
+#define FINE_PASS_FLAGS_STORE_DEPTH 1 << 1
+
+//bin record layouts, must match BinRecordLayout in raster.py
+#define BIN_RECORD_LAYOUT_FULL 0
+#define BIN_RECORD_LAYOUT_PACKED 1
+
+#ifndef BIN_RECORD_LAYOUT
+#define BIN_RECORD_LAYOUT BIN_RECORD_LAYOUT_FULL
+#endif
+
+#if BIN_RECORD_LAYOUT == BIN_RECORD_LAYOUT_PACKED
+typedef raster::PackedBinIntersectionRecord BinRecord;
+#else
+typedef raster::BinIntersectionRecord BinRecord;
+#endif
 
 #ifdef FINE_RASTER
 #define GroupSize FINE_TILE_THREAD_COUNT
@@ -22,11 +44,23 @@
 //Shared inputs
 ByteAddressBuffer g_verts : register(t0);
 Buffer<int> g_indices : register(t1);
-Buffer<uint> g_rasterBinCounts   : register(t2);
-Buffer<uint> g_rasterBinOffsets  : register(t3);
-Buffer<uint> g_rasterBinTriIds  : register(t4);
+StructuredBuffer<geometry::MeshInfo> g_meshTable : register(t2);
+StructuredBuffer<geometry::InstanceInfo> g_instances : register(t3);
+Buffer<uint> g_rasterBinCounts   : register(t4);
+Buffer<uint> g_rasterBinOffsets  : register(t5);
+Buffer<uint> g_rasterBinTriIds  : register(t6);
 RWTexture2D<float4> g_output  : register(u0);
 RWBuffer<uint> g_outputFineTileCount : register(u1);
+//(first bin element, bin element count, FINE_PASS_FLAGS) of the fine raster pass, a count of
+//0xffffffff takes all the remaining elements. The depth is carried between passes in g_fineDepth.
+Buffer<uint4> g_finePassArgs : register(t7);
+RWTexture2D<float> g_fineDepth : register(u2);
+//coarse tiles with bin elements and their count, the fine raster only runs on their fine tiles.
+Buffer<uint> g_occupiedTiles : register(t8);
+Buffer<uint> g_occupiedTileCount : register(t9);
+//triangle setups written by csMainBinTriangles, with RASTERIZER_FLAGS_TRIANGLE_SETUP. Read by the
+//fine raster and the binning passes after it, see loadBinTriangle.
+StructuredBuffer<raster::TriangleSetup> g_triangleSetups : register(t10);
 
 cbuffer Constants : register(b0)
 {
@@ -41,6 +75,34 @@ cbuffer Constants : register(b0)
 
     float4x4 g_view;
     float4x4 g_proj;
+
+    int g_meshCount;
+    int g_instanceCount;
+    int g_binRecordCapacity;
+    uint g_binRecordTileBits;
+
+    int g_binExpandTileThreshold;
+    int g_binExpandSlotCount;
+    int2 g_padding;
+}
+
+//Triangle ids in bins are virtual, see geometry::InstanceInfo. Returns the triangle in world space.
+geometry::TriangleV loadTriangle(int virtualTriId)
+{
+    geometry::InstanceInfo instance = geometry::findInstance(g_instances, g_instanceCount, virtualTriId);
+    int triId = instance.triangleOffset + (virtualTriId - instance.virtualTriangleOffset);
+
+    geometry::TriangleI ti;
+    ti.load(g_indices, triId);
+
+    geometry::TriangleV tv;
+#if VERTEX_FORMAT_COMPACT
+    tv.loadCompact(g_verts, ti, geometry::findMesh(g_meshTable, g_meshCount, triId));
+#else
+    tv.load(g_verts, ti);
+#endif
+    tv.transform(instance.world);
+    return tv;
 }
 
 groupshared int gs_tileCount;
@@ -71,12 +133,16 @@ void fineTileCullTriangleBatch(int groupThreadIndex, int3 groupID, int2 pixelCov
     if (groupThreadIndex < gs_tileCount) 
     {
         int triId = g_rasterBinTriIds[groupThreadIndex + gs_tileOffset];
-        geometry::TriangleI ti;
-        ti.load(g_indices, triId);
-        
-        geometry::TriangleV tv;
-        tv.load(g_verts, ti);
-        th.init(tv, g_view, g_proj);
+        bool hasSetup = (g_flags & RASTERIZER_FLAGS_TRIANGLE_SETUP) != 0;
+        if (hasSetup)
+            th = g_triangleSetups[triId].triangle();
+
+        //the setup of a triangle crossing the near plane lacks the unclipped vertices of its barycentrics.
+        if (!hasSetup || th.clipZMask != 0)
+        {
+            geometry::TriangleV tv = loadTriangle(triId);
+            th.init(tv, g_view, g_proj);
+        }
 
     #if ENABLE_FINE_COVERAGE_LUT 
         if (IsDepthLess(asuint(th.aabb().end.z), gs_furthestZ))
@@ -126,15 +192,37 @@ void nextTriangleBatch(int groupThreadIndex)
 
 [numthreads(FINE_TILE_SIZE, FINE_TILE_SIZE, 1)]
 void csMainFineRaster(
-    int3 dispatchThreadId : SV_DispatchThreadID,
     int3 groupID : SV_GroupID,
     int2 groupThreadID : SV_GroupThreadID,
     int groupThreadIndex : SV_GroupIndex)
 {
+    //indirect dispatch, see csWriteFineRasterArgsBuffer: the fine tiles of each occupied coarse tile.
+    uint fineGroupIndex = groupID.y * 65535 + groupID.x;
+    uint occupiedIndex = fineGroupIndex >> (2 * FINE_TILE_TO_TILE_SHIFT);
+    if (occupiedIndex >= g_occupiedTileCount[0])
+        return;
+
+    int tileId = g_occupiedTiles[occupiedIndex];
+    uint fineTileInTile = fineGroupIndex & ((1u << (2 * FINE_TILE_TO_TILE_SHIFT)) - 1u);
+    int2 fineTile = (int2(tileId % (int)g_coarseTileSize.x, tileId / (int)g_coarseTileSize.x) << FINE_TILE_TO_TILE_SHIFT)
+        + int2(fineTileInTile & ((1u << FINE_TILE_TO_TILE_SHIFT) - 1u), fineTileInTile >> FINE_TILE_TO_TILE_SHIFT);
+    if (any(fineTile >= (int2)g_fineTileSize))
+        return;
+
+    int2 pixelCoord = fineTile * FINE_TILE_SIZE + groupThreadID;
+    uint4 finePass = g_finePassArgs[0];
+    //with RASTERIZER_FLAGS_FINE_BINS the bin inputs are the fine bins, see csMainBinFineTiles.
+    int binId = (g_flags & RASTERIZER_FLAGS_FINE_BINS) != 0 ? fineTile.y * (int)g_fineTileSize.x + fineTile.x : tileId;
+    uint binCount = g_rasterBinCounts[binId];
+
+    //tiles with no elements left were completed by the previous passes.
+    if (finePass.x > 0 && binCount <= finePass.x)
+        return;
+
     coverage::genLUT(groupThreadIndex);
     GroupMemoryBarrierWithGroupSync();
 
-    float2 uv = geometry::pixelToUV(dispatchThreadId.xy, g_outputSizeInts);
+    float2 uv = geometry::pixelToUV(pixelCoord, g_outputSizeInts);
     float2 hCoords = uv * float2(2.0,2.0) - float2(1.0, 1.0);
     int2 pixelCoverageCoordinate = int2(groupThreadID.x, FINE_TILE_SIZE - groupThreadID.y - 1); 
 
@@ -144,27 +232,24 @@ void csMainFineRaster(
 
     if (groupThreadIndex == 0)
     {
-        int tileX = groupID.x >> FINE_TILE_TO_TILE_SHIFT;
-        int tileY = groupID.y >> FINE_TILE_TO_TILE_SHIFT;
-        int tileId = tileY * g_coarseTileSize.x + tileX;
-        gs_tileCount = min(g_rasterBinCounts[tileId], 10000);
-        gs_tileOffset = g_rasterBinOffsets[tileId];
-        gs_tileBounds.begin = float3(geometry::uvToH(geometry::pixelToUV(groupID.xy * FINE_TILE_SIZE, g_outputSize.xy)), 0.0);
-        gs_tileBounds.end = float3(geometry::uvToH(geometry::pixelToUV((groupID.xy + int2(1,1)) * FINE_TILE_SIZE, g_outputSize.xy)), 1.0);
+        gs_tileCount = min(binCount - finePass.x, finePass.y);
+        gs_tileOffset = g_rasterBinOffsets[binId] + finePass.x;
+        gs_tileBounds.begin = float3(geometry::uvToH(geometry::pixelToUV(fineTile * FINE_TILE_SIZE, g_outputSize.xy)), 0.0);
+        gs_tileBounds.end = float3(geometry::uvToH(geometry::pixelToUV((fineTile + int2(1,1)) * FINE_TILE_SIZE, g_outputSize.xy)), 1.0);
         gs_writtenFineTileCount = 0;
         initFurthestDepth();
     }
     
     GroupMemoryBarrierWithGroupSync();
 
-    float zBuffer = MAX_DEPTH;
+    float zBuffer = (finePass.z & FINE_PASS_FLAGS_LOAD_DEPTH) != 0 ? g_fineDepth[pixelCoord] : MAX_DEPTH;
     while (gs_tileCount > 0)
     {
         uint unusedVal;
         InterlockedMaxDepth(gs_furthestZ, asuint(zBuffer), unusedVal);
         GroupMemoryBarrierWithGroupSync();
 
-        fineTileCullTriangleBatch(groupThreadIndex, groupID, pixelCoverageCoordinate);
+        fineTileCullTriangleBatch(groupThreadIndex, int3(fineTile, 0), pixelCoverageCoordinate);
         GroupMemoryBarrierWithGroupSync();
 
         for (uint triIndex = 0; triIndex < gs_triangleBatchCount; ++triIndex)
@@ -201,95 +286,439 @@ void csMainFineRaster(
     }
 
     if (groupThreadIndex == 0 && (g_flags & RASTERIZER_FLAGS_OUTPUT_FINE_RASTER_COUNT) != 0)
-        g_outputFineTileCount[groupID.y * (int)g_fineTileSize.x + groupID.x] = gs_writtenFineTileCount;
+    {
+        int fineTileId = fineTile.y * (int)g_fineTileSize.x + fineTile.x;
+        g_outputFineTileCount[fineTileId] = (finePass.x > 0 ? g_outputFineTileCount[fineTileId] : 0) + gs_writtenFineTileCount;
+    }
 
     if (writeColor)
-        g_output[dispatchThreadId.xy] = color;
+        g_output[pixelCoord] = color;
+
+    if ((finePass.z & FINE_PASS_FLAGS_STORE_DEPTH) != 0)
+        g_fineDepth[pixelCoord] = zBuffer;
 }
 
 RWBuffer<uint> g_outTotalRecords : register(u0);
 RWBuffer<uint> g_binCounters : register(u1);
-RWStructuredBuffer<raster::BinIntersectionRecord> g_binOutputRecords : register(u2);
+RWStructuredBuffer<BinRecord> g_binOutputRecords : register(u2);
+//nearest depth sort key per virtual triangle, with RASTERIZER_FLAGS_DEPTH_SORT_BINS
+RWBuffer<uint> g_outTriangleSortKeys : register(u3);
+//setup per virtual triangle for the fine raster, with RASTERIZER_FLAGS_TRIANGLE_SETUP
+RWStructuredBuffer<raster::TriangleSetup> g_outTriangleSetups : register(u4);
+
+//Cluster culling inputs, written by csMainCullClusters in cluster_cull_cs.hlsl
+StructuredBuffer<meshlet::Cluster> g_clusters : register(t4);
+Buffer<uint> g_visibleClusters : register(t5);
+Buffer<uint> g_visibleClusterCount : register(t6);
+
+//Transforms and culls a triangle for binning, false when it covers no coarse tile.
+bool setupBinTriangle(int triId, out geometry::TriangleH th, out geometry::AABB aabb)
+{
+    geometry::TriangleV tv = loadTriangle(triId);
+    th.init(tv, g_view, g_proj);
+    aabb = th.aabb();
 
-[numthreads(64, 1, 1)]
-void csMainBinTriangles(int3 dti : SV_DispatchThreadID)
+    //if ((th.clipZMask & ((1 << 3) - 1)) != 0)
+    //    return false;
+
+    if (all(abs(th.og0.xyz) > th.og0.w) && all(abs(th.og0.xyz) > th.og0.w) && all(abs(th.og0.xyz) > th.og0.w))
+        return false;
+
+    if (any(aabb.begin.xy > float2(1,1)) || any(aabb.end.xy < float2(-1,-1)))
+        return false;
+
+    if (any(aabb.extents().xy < g_outputSize.zw))
+        return false;
+
+    return true;
+}
+
+//Setup of a triangle csMainBinTriangles accepted, for the binning passes after it. With
+//RASTERIZER_FLAGS_TRIANGLE_SETUP it is read back from g_triangleSetups instead of transformed again.
+void loadBinTriangle(int triId, out geometry::TriangleH th, out geometry::AABB aabb)
 {
-    if (dti.x >= g_binTriCounts)
-        return;
+    if ((g_flags & RASTERIZER_FLAGS_TRIANGLE_SETUP) != 0)
+    {
+        th = g_triangleSetups[triId].triangle();
+        aabb = th.aabb();
+    }
+    else
+    {
+        setupBinTriangle(triId, th, aabb);
+    }
+}
 
-    int triId = dti.x;
+//Inclusive rectangle of the tiles of tileSize pixels (out of tileCounts) under a triangle's bounds.
+void getBinTileRect(geometry::AABB aabb, int tileSize, int2 tileCounts, out int2 beginTiles, out int2 endTiles)
+{
+    int2 tilePointA = (geometry::hToUV(aabb.begin.xy) * g_outputSize.xy) / tileSize;
+    int2 tilePointB =   (geometry::hToUV(aabb.end.xy) * g_outputSize.xy) / tileSize;
 
-    geometry::TriangleI ti;
-    ti.load(g_indices, triId);
+    beginTiles = clamp(min(tilePointA, tilePointB), int2(0,0), tileCounts - 1);
+    endTiles   = clamp(max(tilePointA, tilePointB), int2(0,0), tileCounts - 1);
+}
 
-    geometry::TriangleV tv;
-    tv.load(g_verts, ti);
+//True when a triangle intersects a tile of tileSize pixels.
+bool intersectsBinTile(geometry::TriangleH th, geometry::AABB aabb, int tileX, int tileY, int tileSize)
+{
+    int2 tileB = int2(tileX, tileY);
+    int2 tileE = tileB + 1;
+    geometry::AABB tile;
 
-    geometry::TriangleH th;
-    th.init(tv, g_view, g_proj);
+    tile.begin = float3(geometry::uvToH(geometry::pixelToUV(tileB * tileSize, g_outputSize.xy)), MAX_DEPTH);
+    tile.end = float3(geometry::uvToH(geometry::pixelToUV(tileE * tileSize, g_outputSize.xy)), MIN_DEPTH);
 
-    //if ((th.clipZMask & ((1 << 3) - 1)) != 0)
-    //    return;
+    if (any(aabb.begin.xy > tile.end.xy) || any(aabb.end.xy < tile.begin.xy))
+    if (!aabb.intersects(tile))
+        return false;
+    
+    return geometry::intersectsSAT(th, tile);
+}
 
-    if (all(abs(th.og0.xyz) > th.og0.w) && all(abs(th.og0.xyz) > th.og0.w) && all(abs(th.og0.xyz) > th.og0.w))
+//Writes the bin record at globalOffset, reserved in g_outTotalRecords. The total keeps counting
+//past the capacity, raster.py grows the records from it.
+void writeBinRecord(int binId, int triId, uint globalOffset)
+{
+    if (globalOffset >= (uint)g_binRecordCapacity)
         return;
 
-    geometry::AABB aabb = th.aabb();
-    if (any(aabb.begin.xy > float2(1,1)) || any(aabb.end.xy < float2(-1,-1)))
+    uint binOffset = 0;
+    InterlockedAdd(g_binCounters[binId], 1, binOffset);
+
+    BinRecord record;
+    record.init(binId, triId, binOffset, g_binRecordTileBits);
+#if BIN_RECORD_LAYOUT == BIN_RECORD_LAYOUT_PACKED
+    //full bin: give the element back (the count settles at the limit) and leave a dropped record.
+    if (binOffset >= raster::packedMaxBinCount(g_binRecordTileBits))
+    {
+        InterlockedAdd(g_binCounters[binId], -1);
+        record.triangleId = -1;
+    }
+#endif
+    g_binOutputRecords[globalOffset] = record;
+}
+
+#ifndef BIN_STAGING
+#define BIN_STAGING 1
+#endif
+
+//With BIN_STAGING the binning threads append their (bin, triangle) pairs to group shared memory,
+//then the group reserves its records with a single atomic on g_outTotalRecords and writes them
+//together. Only the bin offsets order the elements of a bin, so the record order is free.
+#define BIN_STAGE_CAPACITY 256
+#define BIN_GROUP_SIZE 64
+
+groupshared uint2 gs_binStage[BIN_STAGE_CAPACITY];
+groupshared uint gs_binStageCount;
+groupshared uint gs_binStageBase;
+groupshared uint gs_binPendingThreads;
+
+//False when the stage is full, the pair goes in the next one.
+bool stageBinRecord(int binId, int triId)
+{
+    uint stageIndex = 0;
+    InterlockedAdd(gs_binStageCount, 1, stageIndex);
+    if (stageIndex >= BIN_STAGE_CAPACITY)
+        return false;
+
+    gs_binStage[stageIndex] = uint2(binId, triId);
+    return true;
+}
+
+//Writes the staged pairs and empties the stage, all the threads of the group must call it.
+void flushBinStage(int groupThreadIndex)
+{
+    GroupMemoryBarrierWithGroupSync();
+
+    if (groupThreadIndex == 0)
+    {
+        uint stageCount = min(gs_binStageCount, BIN_STAGE_CAPACITY);
+        uint stageBase = 0;
+        if (stageCount > 0)
+            InterlockedAdd(g_outTotalRecords[0], stageCount, stageBase);
+        gs_binStageCount = stageCount;
+        gs_binStageBase = stageBase;
+        gs_binPendingThreads = 0;
+    }
+
+    GroupMemoryBarrierWithGroupSync();
+
+    for (uint i = groupThreadIndex; i < gs_binStageCount; i += BIN_GROUP_SIZE)
+        writeBinRecord(gs_binStage[i].x, gs_binStage[i].y, gs_binStageBase + i);
+
+    GroupMemoryBarrierWithGroupSync();
+
+    if (groupThreadIndex == 0)
+        gs_binStageCount = 0;
+}
+
+//Writes the bin record of a triangle and a coarse tile, if they intersect.
+void binTriangleTile(geometry::TriangleH th, geometry::AABB aabb, int triId, int tileX, int tileY)
+{
+    if (!intersectsBinTile(th, aabb, tileX, tileY, COARSE_TILE_SIZE))
         return;
 
-    if (any(aabb.extents().xy < g_outputSize.zw))
+    uint globalOffset = 0;
+    InterlockedAdd(g_outTotalRecords[0], 1, globalOffset);
+    writeBinRecord(tileY * g_coarseTileSize.x + tileX, triId, globalOffset);
+}
+
+//Stages the records of a triangle over the tileCount tiles of the rectangle at beginTiles, tiles of
+//tileSize pixels and bins tileY * tilesPerRow + tileX. The stage is flushed whenever it fills up,
+//until the tiles of every thread are done, all the threads of the group must call it.
+void stageBinTileRect(geometry::TriangleH th, geometry::AABB aabb, int triId, int2 beginTiles, int2 rectSize, uint tileCount, int tileSize, int tilesPerRow, int groupThreadIndex)
+{
+    uint tileIndex = 0;
+    while (true)
+    {
+        for (; tileIndex < tileCount; ++tileIndex)
+        {
+            int tileX = beginTiles.x + (int)(tileIndex % rectSize.x);
+            int tileY = beginTiles.y + (int)(tileIndex / rectSize.x);
+            if (intersectsBinTile(th, aabb, tileX, tileY, tileSize) && !stageBinRecord(tileY * tilesPerRow + tileX, triId))
+                break;
+        }
+
+        flushBinStage(groupThreadIndex);
+
+        if (tileIndex < tileCount)
+            InterlockedAdd(gs_binPendingThreads, 1);
+
+        GroupMemoryBarrierWithGroupSync();
+
+        if (gs_binPendingThreads == 0)
+            break;
+    }
+}
+
+//Load balanced binning, with BIN_EXPAND csMainBinTriangles only bins the triangles of up to
+//g_binExpandTileThreshold tiles. The larger ones write their tile count and id to their slot,
+//the counts are scanned and csMainBinTriangleTiles tests one (triangle, tile) pair per thread.
+RWBuffer<uint> g_outBinExpandCounts : register(u5);
+RWBuffer<uint> g_outBinExpandTriIds : register(u6);
+
+[numthreads(BIN_GROUP_SIZE, 1, 1)]
+void csMainBinTriangles(int3 dti : SV_DispatchThreadID, int3 groupID : SV_GroupID, int groupThreadIndex : SV_GroupIndex)
+{
+#if CLUSTER_CULLING
+    //one group per visible cluster, clusters have up to 64 triangles.
+    uint visibleClusterIndex = groupID.y * 65535 + groupID.x;
+    if (visibleClusterIndex >= g_visibleClusterCount[0])
         return;
 
-    int2 tilePointA = (geometry::hToUV(aabb.begin.xy) * g_outputSize.xy) / COARSE_TILE_SIZE;
-    int2 tilePointB =   (geometry::hToUV(aabb.end.xy) * g_outputSize.xy) / COARSE_TILE_SIZE;
+    //visible clusters are virtual, (instance, cluster) pairs.
+    uint virtualClusterId = g_visibleClusters[visibleClusterIndex];
+    geometry::InstanceInfo instance = geometry::findClusterInstance(g_instances, g_instanceCount, virtualClusterId);
+    meshlet::Cluster cluster = g_clusters[instance.clusterOffset + (virtualClusterId - instance.virtualClusterOffset)];
+    bool isValid = (uint)groupThreadIndex < cluster.triangleCount;
+
+    int triId = instance.virtualTriangleOffset + (cluster.triangleOffset - instance.triangleOffset) + groupThreadIndex;
+    uint expandSlot = visibleClusterIndex * 64 + groupThreadIndex;
+#else
+    bool isValid = dti.x < g_binTriCounts;
+
+    int triId = dti.x;
+    uint expandSlot = dti.x;
+#endif
+
+    geometry::TriangleH th = (geometry::TriangleH)0;
+    geometry::AABB aabb = (geometry::AABB)0;
+    if (isValid)
+        isValid = setupBinTriangle(triId, th, aabb);
+
+    //same nearest depth as the gs_furthestZ rejection of the fine raster.
+    if (isValid && (g_flags & RASTERIZER_FLAGS_DEPTH_SORT_BINS) != 0)
+        g_outTriangleSortKeys[triId] = raster::depthSortKey(aabb.end.z);
+
+    if (isValid && (g_flags & RASTERIZER_FLAGS_TRIANGLE_SETUP) != 0)
+    {
+        raster::TriangleSetup setup;
+        setup.init(th);
+        g_outTriangleSetups[triId] = setup;
+    }
 
-    int2 beginTiles = clamp(min(tilePointA, tilePointB), int2(0,0), int2(g_coarseTileSize) - 1);
-    int2 endTiles   = clamp(max(tilePointA, tilePointB), int2(0,0), int2(g_coarseTileSize) - 1);
+    int2 beginTiles, endTiles;
+    getBinTileRect(aabb, COARSE_TILE_SIZE, int2(g_coarseTileSize), beginTiles, endTiles);
+    int2 rectSize = endTiles - beginTiles + 1;
+    uint tileCount = isValid ? rectSize.x * rectSize.y : 0;
 
+#if BIN_EXPAND
+    if (tileCount > (uint)g_binExpandTileThreshold)
+    {
+        g_outBinExpandCounts[expandSlot] = tileCount;
+        g_outBinExpandTriIds[expandSlot] = triId;
+        tileCount = 0;
+    }
+#endif
+
+#if BIN_STAGING
+    if (groupThreadIndex == 0)
+        gs_binStageCount = 0;
+
+    GroupMemoryBarrierWithGroupSync();
+
+    stageBinTileRect(th, aabb, triId, beginTiles, rectSize, tileCount, COARSE_TILE_SIZE, (int)g_coarseTileSize.x, groupThreadIndex);
+#else
     //go for each tile in this tri
-    for (int tileX = beginTiles.x; tileX <= endTiles.x; ++tileX)
+    for (uint tileIndex = 0; tileIndex < tileCount; ++tileIndex)
+        binTriangleTile(th, aabb, triId, beginTiles.x + (int)(tileIndex % rectSize.x), beginTiles.y + (int)(tileIndex / rectSize.x));
+#endif
+}
+
+//inclusive scan of g_outBinExpandCounts, and the triangle ids of the slots.
+Buffer<uint> g_binExpandScan : register(t4);
+Buffer<uint> g_binExpandTriIds : register(t5);
+
+groupshared uint gs_expandSlotBegin;
+groupshared uint gs_expandSlotEnd;
+
+//first slot in [slotBegin, slotEnd] whose inclusive scan is past pairIndex.
+uint findExpandSlot(uint pairIndex, uint slotBegin, uint slotEnd)
+{
+    while (slotBegin < slotEnd)
     {
-        for (int tileY = beginTiles.y; tileY <= endTiles.y; ++tileY)
-        {
-            int2 tileB = int2(tileX, tileY);
-            int2 tileE = tileB + 1;
-            geometry::AABB tile;
+        uint mid = (slotBegin + slotEnd) >> 1;
+        if (g_binExpandScan[mid] > pairIndex)
+            slotEnd = mid;
+        else
+            slotBegin = mid + 1;
+    }
+    return slotBegin;
+}
 
-            tile.begin = float3(geometry::uvToH(geometry::pixelToUV(tileB * COARSE_TILE_SIZE, g_outputSize.xy)), MAX_DEPTH);
-            tile.end = float3(geometry::uvToH(geometry::pixelToUV(tileE * COARSE_TILE_SIZE, g_outputSize.xy)), MIN_DEPTH);
+[numthreads(BIN_GROUP_SIZE, 1, 1)]
+void csMainBinTriangleTiles(int3 groupID : SV_GroupID, int groupThreadIndex : SV_GroupIndex)
+{
+    uint pairCount = g_binExpandScan[g_binExpandSlotCount - 1];
+    uint groupPairBegin = (groupID.y * 65535 + groupID.x) * BIN_GROUP_SIZE;
+    if (groupPairBegin >= pairCount)
+        return;
 
-            if (any(aabb.begin.xy > tile.end.xy) || any(aabb.end.xy < tile.begin.xy))
-            if (!aabb.intersects(tile))
-                continue;
-            
-            if (!geometry::intersectsSAT(th, tile))
-                continue;
+    //slot range of the group, then each thread searches within it.
+    if (groupThreadIndex == 0)
+    {
+        gs_expandSlotBegin = findExpandSlot(groupPairBegin, 0, g_binExpandSlotCount - 1);
+        gs_binStageCount = 0;
+    }
+    else if (groupThreadIndex == 1)
+        gs_expandSlotEnd = findExpandSlot(min(groupPairBegin + BIN_GROUP_SIZE - 1, pairCount - 1), 0, g_binExpandSlotCount - 1);
 
-            //TODO: Optimize this by caching into LDS, and writting then 64 tris per batch
-            int binId = (tileY * g_coarseTileSize.x + tileX);
-            uint binOffset = 0, globalOffset = 0;
-            InterlockedAdd(g_binCounters[binId], 1, binOffset);
-            InterlockedAdd(g_outTotalRecords[0], 1, globalOffset);
+    GroupMemoryBarrierWithGroupSync();
 
-            raster::BinIntersectionRecord record;
-            record.init(binId, triId, binOffset);
-            g_binOutputRecords[globalOffset] = record;
-        }
+    uint pairIndex = groupPairBegin + groupThreadIndex;
+    if (pairIndex < pairCount)
+    {
+        uint slot = findExpandSlot(pairIndex, gs_expandSlotBegin, gs_expandSlotEnd);
+        uint tileIndex = pairIndex - (slot > 0 ? g_binExpandScan[slot - 1] : 0);
+        int triId = g_binExpandTriIds[slot];
+
+        geometry::TriangleH th;
+        geometry::AABB aabb;
+        loadBinTriangle(triId, th, aabb);
+
+        int2 beginTiles, endTiles;
+        getBinTileRect(aabb, COARSE_TILE_SIZE, int2(g_coarseTileSize), beginTiles, endTiles);
+        int rectWidth = endTiles.x - beginTiles.x + 1;
+        int tileX = beginTiles.x + (int)(tileIndex % rectWidth);
+        int tileY = beginTiles.y + (int)(tileIndex / rectWidth);
+#if BIN_STAGING
+        //a pair per thread always fits in the stage.
+        if (intersectsBinTile(th, aabb, tileX, tileY, COARSE_TILE_SIZE))
+            stageBinRecord(tileY * g_coarseTileSize.x + tileX, triId);
+#else
+        binTriangleTile(th, aabb, triId, tileX, tileY);
+#endif
     }
+
+#if BIN_STAGING
+    flushBinStage(groupThreadIndex);
+#endif
+}
+
+//Fine bins, a second binning level refining the coarse bin lists (g_rasterBinCounts, offsets and
+//elements) into per fine tile records. Runs with the fine bin constants: the record capacity and
+//tile bits are those of the fine records, which always use the full layout.
+groupshared uint gs_coarseBinElementCount;
+
+//coarse tile of a coarse bin element, the last tile whose bin starts at or before it.
+uint findCoarseBin(uint elementIndex, uint tileCount)
+{
+    uint tileBegin = 0;
+    uint tileEnd = tileCount - 1;
+    while (tileBegin < tileEnd)
+    {
+        uint mid = (tileBegin + tileEnd + 1) >> 1;
+        if (g_rasterBinOffsets[mid] <= elementIndex)
+            tileBegin = mid;
+        else
+            tileEnd = mid - 1;
+    }
+    return tileBegin;
+}
+
+[numthreads(BIN_GROUP_SIZE, 1, 1)]
+void csMainBinFineTiles(int3 dti : SV_DispatchThreadID, int groupThreadIndex : SV_GroupIndex)
+{
+    uint coarseTileCount = (uint)g_coarseTileSize.x * (uint)g_coarseTileSize.y;
+    if (groupThreadIndex == 0)
+    {
+        gs_coarseBinElementCount = g_rasterBinOffsets[coarseTileCount - 1] + g_rasterBinCounts[coarseTileCount - 1];
+        gs_binStageCount = 0;
+    }
+
+    GroupMemoryBarrierWithGroupSync();
+
+    //one coarse bin element per thread, clipped to the fine tiles of its coarse tile.
+    geometry::TriangleH th = (geometry::TriangleH)0;
+    geometry::AABB aabb = (geometry::AABB)0;
+    int triId = 0;
+    int2 beginTiles = int2(0,0);
+    int2 rectSize = int2(0,0);
+    uint tileCount = 0;
+    if ((uint)dti.x < gs_coarseBinElementCount)
+    {
+        uint coarseTileId = findCoarseBin(dti.x, coarseTileCount);
+        int2 coarseTile = int2(coarseTileId % (uint)g_coarseTileSize.x, coarseTileId / (uint)g_coarseTileSize.x);
+        triId = g_rasterBinTriIds[dti.x];
+        loadBinTriangle(triId, th, aabb);
+
+        int2 endTiles;
+        getBinTileRect(aabb, FINE_TILE_SIZE, int2(g_fineTileSize), beginTiles, endTiles);
+        beginTiles = max(beginTiles, coarseTile << FINE_TILE_TO_TILE_SHIFT);
+        endTiles = min(endTiles, ((coarseTile + 1) << FINE_TILE_TO_TILE_SHIFT) - 1);
+        rectSize = max(endTiles - beginTiles + 1, int2(0,0));
+        tileCount = rectSize.x * rectSize.y;
+    }
+
+    stageBinTileRect(th, aabb, triId, beginTiles, rectSize, tileCount, FINE_TILE_SIZE, (int)g_fineTileSize.x, groupThreadIndex);
 }
 
 Buffer<uint> g_totalRecords : register(t0);
 Buffer<uint> g_binOffsets : register(t1);
-StructuredBuffer<raster::BinIntersectionRecord> g_binRecords : register(t2);
+StructuredBuffer<BinRecord> g_binRecords : register(t2);
 RWBuffer<uint> g_outBinElements : register(u0);
+#if DEPTH_SORT_BINS
+Buffer<uint> g_triangleSortKeys : register(t3);
+RWBuffer<uint> g_outBinSortKeys : register(u1);
+#endif
 
 RWBuffer<uint4> g_outArgsBuffer : register(u0);
 
 [numthreads(1,1,1)]
 void csWriteBinElementArgsBuffer()
 {
-    g_outArgsBuffer[0] = uint4((g_totalRecords[0] + 63)/64,1,1,0);
+    g_outArgsBuffer[0] = uint4((min(g_totalRecords[0], (uint)g_binRecordCapacity) + 63)/64,1,1,0);
+}
+
+Buffer<uint> g_binExpandPairs : register(t0);
+
+//2D group count of csMainBinTriangleTiles, one thread per pair.
+[numthreads(1,1,1)]
+void csWriteBinExpandArgsBuffer()
+{
+    uint groupCount = (g_binExpandPairs[g_binExpandSlotCount - 1] + 63) / 64;
+    uint groupCountX = min(groupCount, 65535);
+    g_outArgsBuffer[0] = uint4(groupCountX, groupCountX == 0 ? 0 : (groupCount + groupCountX - 1) / groupCountX, 1, 0);
 }
 
 groupshared uint gs_totalRecords;
@@ -299,7 +728,7 @@ void csMainWriteBinElements(int3 dispatchThreadId : SV_DispatchThreadID, int gro
 {
     if (groupThreadIndex == 0)
     {
-        gs_totalRecords = g_totalRecords[0];
+        gs_totalRecords = min(g_totalRecords[0], (uint)g_binRecordCapacity);
     }
 
     GroupMemoryBarrierWithGroupSync();
@@ -307,9 +736,41 @@ void csMainWriteBinElements(int3 dispatchThreadId : SV_DispatchThreadID, int gro
     if (dispatchThreadId.x >= gs_totalRecords)
         return;
 
-    raster::BinIntersectionRecord record = g_binRecords[dispatchThreadId.x];
-    int binIndex = record.tileId;
-    int outputIndex = g_binOffsets[binIndex] + record.binOffset;
+    BinRecord record = g_binRecords[dispatchThreadId.x];
+    if (record.triangleId < 0)
+        return;
+
+    int binIndex = record.getTileId(g_binRecordTileBits);
+    int outputIndex = g_binOffsets[binIndex] + record.getBinOffset(g_binRecordTileBits);
     g_outBinElements[outputIndex] = record.triangleId;
+#if DEPTH_SORT_BINS
+    g_outBinSortKeys[outputIndex] = g_triangleSortKeys[record.triangleId];
+#endif
+}
+
+Buffer<uint> g_binCountsToMark : register(t0);
+RWBuffer<uint> g_outOccupiedTileFlags : register(u0);
+RWBuffer<uint> g_outTileIds : register(u1);
+
+//1 for the coarse tiles with bin elements, compacted into the fine raster tile list.
+[numthreads(64,1,1)]
+void csMarkOccupiedTiles(int3 dispatchThreadId : SV_DispatchThreadID)
+{
+    int tileCount = (int)g_coarseTileSize.x * (int)g_coarseTileSize.y;
+    if (dispatchThreadId.x >= tileCount)
+        return;
+
+    g_outOccupiedTileFlags[dispatchThreadId.x] = g_binCountsToMark[dispatchThreadId.x] > 0 ? 1 : 0;
+    g_outTileIds[dispatchThreadId.x] = dispatchThreadId.x;
 }
 
+Buffer<uint> g_occupiedTileCountForArgs : register(t0);
+
+//2D group count of csMainFineRaster, a group per fine tile of the occupied coarse tiles.
+[numthreads(1,1,1)]
+void csWriteFineRasterArgsBuffer()
+{
+    uint groupCount = g_occupiedTileCountForArgs[0] << (2 * FINE_TILE_TO_TILE_SHIFT);
+    uint groupCountX = min(groupCount, 65535);
+    g_outArgsBuffer[0] = uint4(groupCountX, groupCountX == 0 ? 0 : (groupCount + groupCountX - 1) / groupCountX, 1, 0);
+}
@@ -0,0 +1,489 @@
+import numpy as np
+import math
+from . import meshlet
+from . import instances
+
+# NumPy reference of Rasterizer (raster.py / raster_cs.hlsl), runs without a gpu. Mirrors each
+# pass: triangle setup (geometry::TriangleH::init), coarse binning with the SAT test, exclusive
+# prefix sum of the bin counters, bin elements, and the 8x8 fine raster with the coverage LUT
+# masks and reversed Z. Math is in float32 like the shaders. The gpu fills bins with atomics,
+# here bins list their triangles in triangle order, so only depth ties can resolve differently.
+# Positions are the full format ones, compact vertex format decoding is not modeled.
+
+#must match raster_util.hlsl and raster_cs.hlsl
+g_coarse_tile_size = 1 << 5
+g_fine_tile_size = 1 << 3
+g_fine_tiles_per_tile = g_coarse_tile_size // g_fine_tile_size
+g_triangle_cache_count = g_fine_tile_size * g_fine_tile_size
+
+#reversed Z, see depth_utils.hlsl
+g_max_depth = 0.0
+g_min_depth = 1.0
+
+#coarse tiles whose current batch is rasterized at once, bounds the temporaries of fine_raster.
+g_fine_raster_tile_batch = 256
+
+#----------------------------------------------------------------------------------------------
+# coverage masks, mirrors coverage.hlsl. Masks are pairs of uint32 arrays (low, high).
+#----------------------------------------------------------------------------------------------
+
+def _build_quad_mask(increment_mask):
+    c = 0
+    mask = 0xF
+    for r in range(4):
+        c |= mask << (r * 4)
+        if increment_mask == 0:
+            break
+        b = (increment_mask & -increment_mask).bit_length() - 1
+        mask = (0xF << (b + 1)) & 0xF
+        increment_mask ^= 1 << b
+    return c
+
+# gs_quadMask after genLUT, already expanded like sampleLUT does.
+def _sample_lut_table():
+    masks = [_build_quad_mask(i) for i in range(16)]
+    return np.array([(m & 0xF) | ((m & 0xF0) << 4) | ((m & 0xF00) << 8) | ((m & 0xF000) << 12) for m in masks], dtype=np.uint32)
+
+g_sample_lut = _sample_lut_table()
+
+_u32 = np.uint32
+
+def _count_bits(v):
+    v = v - ((v >> _u32(1)) & _u32(0x55555555))
+    v = (v & _u32(0x33333333)) + ((v >> _u32(2)) & _u32(0x33333333))
+    v = (v + (v >> _u32(4))) & _u32(0x0F0F0F0F)
+    return (v * _u32(0x01010101)) >> _u32(24)
+
+def _transpose_mask(x, y):
+    x = ((x & _u32(0x00aa00aa)) << _u32(7)) | ((x & _u32(0x55005500)) >> _u32(7)) | (x & _u32(0xaa55aa55))
+    y = ((y & _u32(0x00aa00aa)) << _u32(7)) | ((y & _u32(0x55005500)) >> _u32(7)) | (y & _u32(0xaa55aa55))
+    x = ((x & _u32(0x0000cccc)) << _u32(14)) | ((x & _u32(0x33330000)) >> _u32(14)) | (x & _u32(0xcccc3333))
+    y = ((y & _u32(0x0000cccc)) << _u32(14)) | ((y & _u32(0x33330000)) >> _u32(14)) | (y & _u32(0xcccc3333))
+    return (((y & _u32(0x0f0f0f0f)) << _u32(4)) | (x & _u32(0x0f0f0f0f)), ((x & _u32(0xf0f0f0f0)) >> _u32(4)) | (y & _u32(0xf0f0f0f0)))
+
+def _mirror_x_mask(m):
+    m = ((m & _u32(0x55555555)) << _u32(1)) | ((m & _u32(0xaaaaaaaa)) >> _u32(1))
+    m = ((m & _u32(0xcccccccc)) >> _u32(2)) | ((m & _u32(0x33333333)) << _u32(2))
+    return ((m & _u32(0xf0f0f0f0)) >> _u32(4)) | ((m & _u32(0x0f0f0f0f)) << _u32(4))
+
+def _mirror_y_mask(m):
+    m = ((m & _u32(0x0000ffff)) << _u32(16)) | ((m & _u32(0xffff0000)) >> _u32(16))
+    return ((m & _u32(0x00ff00ff)) << _u32(8)) | ((m & _u32(0xff00ff00)) >> _u32(8))
+
+# coverage::createCoverageMask(coverage::buildLineArea(v0, v1)), v0 / v1 are (..., 2) float32.
+def line_coverage_mask(v0, v1):
+    (x0, y0, x1, y1) = (v0[..., 0], v0[..., 1], v1[..., 0], v1[..., 1])
+
+    #buildPositiveLine
+    x_flip = x0 > x1
+    (x0, x1) = (np.where(x_flip, np.float32(1.0) - x0, x0), np.where(x_flip, np.float32(1.0) - x1, x1))
+    y_flip = y0 > y1
+    (y0, y1) = (np.where(y_flip, np.float32(1.0) - y0, y0), np.where(y_flip, np.float32(1.0) - y1, y1))
+    (lx, ly) = (x1 - x0, y1 - y0)
+    transpose = np.abs(ly) > np.abs(lx)
+    (lx, ly) = (np.where(transpose, ly, lx), np.where(transpose, lx, ly))
+    (x0, y0) = (np.where(transpose, y0, x0), np.where(transpose, x0, y0))
+    (x1, y1) = (np.where(transpose, y1, x1), np.where(transpose, x1, y1))
+    valid = (x1 != x0) | (y1 != y0)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        a = ly / lx
+        b = y1 - a * x1
+
+        #buildLineArea
+        xs = ((np.arange(8) + 0.5) / 8.0).astype('f')
+        ys = a[..., np.newaxis] * xs + b[..., np.newaxis]
+        ysi = np.clip(np.nan_to_num(np.floor(ys * np.float32(8.0) - np.float32(0.5)), nan=0.0), -1, 8).astype(np.int32)
+    dys = (ysi[..., 1:8] - ysi[..., 0:7]).astype(_u32)
+    mask0 = dys[..., 0] | (dys[..., 1] << _u32(1)) | (dys[..., 2] << _u32(2)) | (dys[..., 3] << _u32(3))
+    mask1 = dys[..., 4] | (dys[..., 5] << _u32(1)) | (dys[..., 6] << _u32(2))
+    offsets = (ysi[..., 0], _count_bits(mask0).astype(np.int32) + ysi[..., 0])
+
+    #createCoverageMask
+    horizontal_masks = (_u32(0x0F0F0F0F), _u32(0xF0F0F0F0))
+    side_masks = (g_sample_lut[mask0 & _u32(0xF)], g_sample_lut[mask1 & _u32(0xF)] << _u32(4))
+    half_masks = []
+    for (offset, quadrant) in [(offsets[0], 0), (offsets[1], 0), (offsets[0], 4), (offsets[1], 4)]:
+        side = len(half_masks) & 1
+        q = np.clip((offset - quadrant) << 3, -31, 31)
+        shifted_up = (~side_masks[side] & horizontal_masks[side]) << np.maximum(q, 0).astype(_u32)
+        shifted_down = ~(side_masks[side] >> np.maximum(-q, 0).astype(_u32))
+        half_masks.append(np.where(q > 0, shifted_up, shifted_down) & horizontal_masks[side])
+    (x, y) = (half_masks[0] | half_masks[1], half_masks[2] | half_masks[3])
+
+    (tx, ty) = _transpose_mask(x, y)
+    (x, y) = (np.where(transpose, ~tx, x), np.where(transpose, ~ty, y))
+    (x, y) = (np.where(x_flip, ~_mirror_x_mask(x), x), np.where(x_flip, ~_mirror_x_mask(y), y))
+    (x, y) = (np.where(y_flip, ~_mirror_y_mask(y), x), np.where(y_flip, ~_mirror_y_mask(x), y))
+    return (np.where(valid, ~x, _u32(0)), np.where(valid, ~y, _u32(0)))
+
+# coverage::triangleCoverageMask(v0, v1, v2, true, false), front faces only like the fine raster.
+def triangle_coverage_mask(v0, v1, v2):
+    masks = [line_coverage_mask(a, b) for (a, b) in [(v0, v1), (v1, v2), (v2, v0)]]
+    return (masks[0][0] & masks[1][0] & masks[2][0], masks[0][1] & masks[1][1] & masks[2][1])
+
+#----------------------------------------------------------------------------------------------
+# passes
+#----------------------------------------------------------------------------------------------
+
+# Virtual triangle ids drawn by csMainBinTriangles: all of them, or those of the clusters
+# surviving meshlet.cull_clusters when clusters is not None.
+def virtual_triangle_ids(instance_table, clusters = None, view_matrix = None, proj_matrix = None, cull_flags = 0):
+    if clusters is None:
+        return np.arange(int(np.sum(instance_table['triangle_count'], dtype=np.int64)), dtype=np.int64)
+    ids = []
+    for instance in instance_table:
+        cluster_range = clusters[int(instance['cluster_offset']):int(instance['cluster_offset']) + int(instance['cluster_count'])]
+        visible = cluster_range[meshlet.cull_clusters(cluster_range, view_matrix, proj_matrix, cull_flags, instance['world'].reshape((4, 4)))]
+        first_ids = int(instance['virtual_triangle_offset']) + visible['triangle_offset'].astype(np.int64) - int(instance['triangle_offset'])
+        counts = visible['triangle_count'].astype(np.int64)
+        ids.append(np.repeat(first_ids - (np.cumsum(counts) - counts), counts) + np.arange(int(np.sum(counts))))
+    return np.concatenate(ids) if ids else np.zeros(0, dtype=np.int64)
+
+# loadTriangle: world space corners (N,3,3) of virtual triangles.
+def load_triangles(positions, indices, instance_table, virtual_ids):
+    instance_ids = np.maximum(np.searchsorted(instance_table['virtual_triangle_offset'], virtual_ids, side='right') - 1, 0)
+    table = instance_table[instance_ids]
+    triangle_ids = table['triangle_offset'].astype(np.int64) + (virtual_ids - table['virtual_triangle_offset'].astype(np.int64))
+    corners = np.asarray(positions, dtype='f')[np.asarray(indices).reshape((-1, 3))[triangle_ids].astype(np.int64), 0:3]
+    worlds = table['world'].reshape((-1, 4, 4)).astype('f')
+    return np.matmul(corners, np.transpose(worlds[:, 0:3, 0:3], (0, 2, 1))) + worlds[:, np.newaxis, 0:3, 3]
+
+# geometry::TriangleH::init, returns (og, h, p): homogeneous corners (N,3,4) before and after
+# the near plane clip of clipVert, and the projected corners (N,3,3).
+def setup_triangles(corners, view_matrix, proj_matrix):
+    corners_h = np.concatenate([corners, np.ones(corners.shape[0:2] + (1,), dtype='f')], axis=-1).astype('f')
+    og = np.matmul(np.matmul(corners_h, np.asarray(view_matrix, dtype='f').T), np.asarray(proj_matrix, dtype='f').T)
+    h = og.copy()
+    dominant = og[:, [2, 2, 1]]
+    clipped = ~(h[..., 2] < h[..., 3])
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        slopes = (h[..., 0:2] - dominant[..., 0:2]) / (h[..., 3] - dominant[..., 3])[..., np.newaxis]
+        h[..., 0:2] = np.where(clipped[..., np.newaxis], h[..., 0:2] + slopes * (np.float32(g_min_depth) - h[..., 3])[..., np.newaxis], h[..., 0:2])
+        h[..., 3] = np.where(clipped, np.float32(g_min_depth), h[..., 3])
+        p = h[..., 0:3] / h[..., 3:4]
+    return (og, h, p)
+
+def _aabb(p):
+    return (np.fmin(p[:, 0], np.fmin(p[:, 1], p[:, 2])), np.fmax(p[:, 0], np.fmax(p[:, 1], p[:, 2])))
+
+# geometry::pixelToUV then geometry::uvToH.
+def _pixel_to_h(pixels, size):
+    return ((pixels.astype('f') + np.float32(0.5)) / size) * np.float32(2.0) - np.float32(1.0)
+
+# geometry::intersectsSATAxis over arrays of (N,3) vectors.
+def _sat_axis(extents, axis, v0, v1, v2):
+    (p0, p1, p2) = (np.sum(v0 * axis, axis=-1), np.sum(v1 * axis, axis=-1), np.sum(v2 * axis, axis=-1))
+    r = np.sum(extents * np.abs(axis), axis=-1)
+    return ~(np.fmax(-np.fmax(p0, np.fmax(p1, p2)), np.fmin(p0, np.fmin(p1, p2))) > r)
+
+# geometry::intersectsSAT between triangles p (N,3,3) and boxes (N,3).
+def intersects_sat(p, box_begin, box_end):
+    with np.errstate(invalid='ignore', over='ignore'):
+        c = (box_begin + box_end) * np.float32(0.5)
+        e = (box_end - box_begin) * np.float32(0.5)
+        (v0, v1, v2) = (p[:, 0] - c, p[:, 1] - c, p[:, 2] - c)
+        (f0, f1, f2) = (v1 - v0, v2 - v1, v0 - v2)
+        units = np.identity(3, dtype='f')
+        #same axes as the shader, which tests u2 x f2 in place of u1 x f2 and skips u2 x f0.
+        axes = [(0, f0), (0, f1), (0, f2), (1, f0), (1, f1), (2, f2), (2, f1), (2, f2)]
+        result = np.ones(len(p), dtype=bool)
+        for (u, f) in axes:
+            result &= _sat_axis(e, np.cross(units[u], f), v0, v1, v2)
+        (tri_begin, tri_end) = _aabb(p)
+        result &= np.all(box_begin < tri_end, axis=-1) & np.all(tri_begin < box_end, axis=-1)
+        result &= _sat_axis(e, np.cross(f0, f1), v0, v1, v2)
+    return result
+
+# (owner, x, y) of every cell of the inclusive [begin, end] (N,2) rectangles, y is the inner loop.
+def _expand_rects(begin, end):
+    (spans_x, spans_y) = (end[:, 0] - begin[:, 0] + 1, end[:, 1] - begin[:, 1] + 1)
+    counts = spans_x * spans_y
+    owners = np.repeat(np.arange(len(begin)), counts)
+    local = np.arange(int(np.sum(counts))) - np.repeat(np.cumsum(counts) - counts, counts)
+    return (owners, begin[owners, 0] + local // spans_y[owners], begin[owners, 1] + local % spans_y[owners])
+
+# csMainBinTriangles: (bin ids, triangle ids) of every bin intersection record, in
+# triangle order. virtual_ids are the ids written to the bins.
+def bin_triangles(og, p, virtual_ids, w, h):
+    (tiles_w, tiles_h) = (math.ceil(w / g_coarse_tile_size), math.ceil(h / g_coarse_tile_size))
+    size = np.array([w, h], dtype='f')
+    (aabb_begin, aabb_end) = _aabb(p)
+    with np.errstate(invalid='ignore'):
+        culled = np.all(np.abs(og[:, 0, 0:3]) > og[:, 0, 3:4], axis=1)
+        culled |= np.any(aabb_begin[:, 0:2] > 1.0, axis=1) | np.any(aabb_end[:, 0:2] < -1.0, axis=1)
+        culled |= np.any((aabb_end[:, 0:2] - aabb_begin[:, 0:2]) * np.float32(0.5) < np.float32(1.0) / size, axis=1)
+
+    survivors = np.flatnonzero(~culled)
+    def tile_point(hc):
+        t = ((hc * np.float32(0.5) + np.float32(0.5)) * size) / np.float32(g_coarse_tile_size)
+        return np.trunc(np.clip(np.nan_to_num(t, nan=0.0), -2, max(tiles_w, tiles_h) + 1)).astype(np.int64)
+    (tile_a, tile_b) = (tile_point(aabb_begin[survivors, 0:2]), tile_point(aabb_end[survivors, 0:2]))
+    tile_limits = np.array([tiles_w - 1, tiles_h - 1])
+    begin_tiles = np.clip(np.minimum(tile_a, tile_b), 0, tile_limits)
+    end_tiles = np.clip(np.maximum(tile_a, tile_b), 0, tile_limits)
+
+    #one candidate per (triangle, tile) of the tile rectangle of each triangle.
+    (owners, tile_x, tile_y) = _expand_rects(begin_tiles, end_tiles)
+    candidates = survivors[owners]
+
+    tile_begin = np.zeros((len(candidates), 3), dtype='f')
+    tile_end = np.full((len(candidates), 3), g_min_depth, dtype='f')
+    tile_begin[:, 0:2] = _pixel_to_h(np.stack([tile_x, tile_y], axis=1) * g_coarse_tile_size, size)
+    tile_end[:, 0:2] = _pixel_to_h(np.stack([tile_x + 1, tile_y + 1], axis=1) * g_coarse_tile_size, size)
+    with np.errstate(invalid='ignore'):
+        overlaps = ~(np.any(aabb_begin[candidates, 0:2] > tile_end[:, 0:2], axis=1) | np.any(aabb_end[candidates, 0:2] < tile_begin[:, 0:2], axis=1))
+    hits = np.flatnonzero(overlaps)
+    hits = hits[intersects_sat(p[candidates[hits]], tile_begin[hits], tile_end[hits])]
+    return (tile_y[hits] * tiles_w + tile_x[hits], virtual_ids[candidates[hits]])
+
+# prefix sum of the bin counters and csMainWriteBinElements: (counts, offsets, elements).
+def write_bin_elements(bin_ids, triangle_ids, tile_count):
+    counts = np.bincount(bin_ids, minlength=tile_count).astype(np.uint32)
+    offsets = (np.cumsum(counts, dtype=np.int64) - counts).astype(np.uint32)
+    elements = triangle_ids[np.argsort(bin_ids, kind='stable')].astype(np.uint32)
+    return (counts, offsets, elements)
+
+# geometry::computeBaryCoordPerspective at h coordinates hc (N,2) of triangles og (N,3,4).
+def perspective_barycentrics(og, hc):
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        xy = og[..., 0:2] / og[..., 3:4]
+        (a, b, c) = (xy[:, 0], xy[:, 1], xy[:, 2])
+        def area(a, b, c):
+            return np.float32(0.5) * (a[:, 0] * (b[:, 1] - c[:, 1]) + b[:, 0] * (c[:, 1] - a[:, 1]) + c[:, 0] * (a[:, 1] - b[:, 1]))
+        total = area(a, b, c)
+        (bx, by) = (area(b, c, hc) / total, area(c, a, hc) / total)
+        bari = np.stack([bx, by, np.float32(1.0) - (bx + by)], axis=1) / og[:, :, 3]
+        return bari / np.sum(bari, axis=1)[:, np.newaxis]
+
+# Depth of the fine raster, pZ = eval(h.z) / eval(h.w) with the perspective barycentrics, as the
+# ratio of two planes in pixel coordinates: (N,2,3) float64 (numerator, denominator) c0 + c1 x + c2 y.
+def depth_planes(og, h, width, height):
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        xy = og[..., 0:2].astype(np.float64) / og[..., 3:4]
+        def area_plane(u, v):
+            return 0.5 * np.stack([u[:, 0] * v[:, 1] - v[:, 0] * u[:, 1], u[:, 1] - v[:, 1], v[:, 0] - u[:, 0]], axis=1)
+        total = area_plane(xy[:, 1], xy[:, 2])[:, 0] + area_plane(xy[:, 2], xy[:, 0])[:, 0] + area_plane(xy[:, 0], xy[:, 1])[:, 0]
+        b0 = area_plane(xy[:, 1], xy[:, 2]) / total[:, np.newaxis]
+        b1 = area_plane(xy[:, 2], xy[:, 0]) / total[:, np.newaxis]
+        b2 = np.array([1.0, 0.0, 0.0]) - b0 - b1
+        bari = np.stack([b0, b1, b2], axis=1) / og[:, :, 3, np.newaxis]
+        planes = np.stack([np.sum(bari * h[:, :, 2, np.newaxis], axis=1), np.sum(bari * h[:, :, 3, np.newaxis], axis=1)], axis=1)
+        #h coordinates are (pixel + 0.5) * 2 / size - 1
+        (sx, sy) = (2.0 / width, 2.0 / height)
+        return np.stack([planes[..., 0] + planes[..., 1] * (sx * 0.5 - 1.0) + planes[..., 2] * (sy * 0.5 - 1.0), planes[..., 1] * sx, planes[..., 2] * sy], axis=-1)
+
+# float32 depths as uint32 keys with the same order, nan as -inf.
+def _depth_order_keys(z):
+    bits = np.where(np.isnan(z), np.float32(-np.inf), z).astype('f').view(np.uint32)
+    return np.where(bits >= _u32(0x80000000), ~bits, bits | _u32(0x80000000))
+
+def _depth_from_order_keys(keys):
+    keys = keys.astype(np.uint32)
+    return np.where(keys >= _u32(0x80000000), keys & _u32(0x7fffffff), ~keys).view(np.float32)
+
+# csMainFineRaster over all fine tiles. Triangle ids of the bins index og / h / p. Returns
+# (visibility (h,w,4) float32, depth (h,w) float32, fine tile counts). Each coarse tile rasterizes
+# its bin in batches of g_triangle_cache_count triangles, the k-th batch of every tile runs at once.
+def fine_raster(og, h, p, counts, offsets, elements, width, height):
+    (tiles_w, tiles_h) = (math.ceil(width / g_coarse_tile_size), math.ceil(height / g_coarse_tile_size))
+    (fine_w, fine_h) = (tiles_w * g_fine_tiles_per_tile, tiles_h * g_fine_tiles_per_tile)
+    size = np.array([width, height], dtype='f')
+    pixel_count = g_fine_tile_size * g_fine_tile_size
+
+    #per fine tile, per group thread index (y * 8 + x) state.
+    depth = np.full((fine_w * fine_h, pixel_count), g_max_depth, dtype='f')
+    winners = np.full((fine_w * fine_h, pixel_count), -1, dtype=np.int64)
+    fine_counts = np.zeros(fine_w * fine_h, dtype=np.int64)
+
+    (fine_x, fine_y) = np.meshgrid(np.arange(g_fine_tiles_per_tile), np.arange(g_fine_tiles_per_tile))
+    (fine_x, fine_y) = (fine_x.reshape(-1), fine_y.reshape(-1))
+    counts = counts.astype(np.int64)
+    offsets = offsets.astype(np.int64)
+    end_z = _aabb(p)[1][:, 2].astype('f').view(np.uint32)
+    triangle_planes = depth_planes(og, h, width, height)
+    bit_pixels = np.arange(pixel_count)
+    #coverage bit b is the pixel (b % 8, 7 - b // 8) of the tile.
+    bit_thread = (g_fine_tile_size - 1 - bit_pixels // g_fine_tile_size) * g_fine_tile_size + bit_pixels % g_fine_tile_size
+
+    #fine raster v coordinates before the tile offset, and the fine tiles near each triangle,
+    #with a tile of margin. Non finite bounds span every tile.
+    with np.errstate(invalid='ignore', over='ignore'):
+        screen = (p[:, :, 0:2] * np.float32(0.5) + np.float32(0.5)) * size
+        fine_limit = max(fine_w, fine_h) + 1
+        fine_begin = np.clip(np.nan_to_num(np.floor(np.min(screen, axis=1) / g_fine_tile_size) - 1, nan=-1), -1, fine_limit).astype(np.int64)
+        fine_end = np.clip(np.nan_to_num(np.floor(np.max(screen, axis=1) / g_fine_tile_size) + 1, nan=fine_limit), -1, fine_limit).astype(np.int64)
+
+    batch_count = int(np.max((counts + g_triangle_cache_count - 1) // g_triangle_cache_count)) if len(counts) > 0 else 0
+    for batch in range(batch_count):
+        active_tiles = np.flatnonzero(counts > batch * g_triangle_cache_count)
+        for tile_chunk in np.array_split(active_tiles, max(1, math.ceil(len(active_tiles) / g_fine_raster_tile_batch))):
+            batch_sizes = np.minimum(counts[tile_chunk] - batch * g_triangle_cache_count, g_triangle_cache_count)
+            batch_tiles = np.repeat(tile_chunk, batch_sizes)
+            slots = np.arange(int(np.sum(batch_sizes))) - np.repeat(np.cumsum(batch_sizes) - batch_sizes, batch_sizes)
+            batch_tris = elements[offsets[batch_tiles] + batch * g_triangle_cache_count + slots].astype(np.int64)
+            batch_starts = np.cumsum(batch_sizes) - batch_sizes
+
+            #furthest depth of the fine tiles, starting from g_min_depth, as uints like InterlockedMin.
+            tile_fx = (tile_chunk % tiles_w)[:, np.newaxis] * g_fine_tiles_per_tile + fine_x
+            tile_fy = (tile_chunk // tiles_w)[:, np.newaxis] * g_fine_tiles_per_tile + fine_y
+            furthest = np.minimum(np.min(depth[tile_fy * fine_w + tile_fx], axis=2), np.float32(g_min_depth)).astype('f').view(np.uint32)
+
+            #(fine tile, triangle) pairs of the fine tiles of each coarse tile near the triangle.
+            tile_first = np.stack([batch_tiles % tiles_w, batch_tiles // tiles_w], axis=1) * g_fine_tiles_per_tile
+            (pair_owners, pair_fx, pair_fy) = _expand_rects(
+                np.clip(fine_begin[batch_tris], tile_first, tile_first + g_fine_tiles_per_tile - 1),
+                np.clip(fine_end[batch_tris], tile_first, tile_first + g_fine_tiles_per_tile - 1))
+            pair_tris = batch_tris[pair_owners]
+            pair_slots = slots[pair_owners]
+            pair_chunk_tiles = np.repeat(np.arange(len(tile_chunk)), batch_sizes)[pair_owners]
+            pair_chunk_fine = (pair_fy % g_fine_tiles_per_tile) * g_fine_tiles_per_tile + pair_fx % g_fine_tiles_per_tile
+            depth_pass = end_z[pair_tris] > furthest[pair_chunk_tiles, pair_chunk_fine]
+
+            tile_offsets = np.stack([pair_fx, pair_fy], axis=1).astype('f') * np.float32(g_fine_tile_size)
+            v = (screen[pair_tris] - tile_offsets[:, np.newaxis, :]) / np.float32(g_fine_tile_size)
+            v[..., 1] = np.float32(1.0) - v[..., 1]
+
+            #pairs whose triangle bounds miss the tile would get an empty mask, skip them early.
+            with np.errstate(invalid='ignore'):
+                outside = np.any(np.max(v, axis=1) < 0.0, axis=1) | np.any(np.min(v, axis=1) > 1.0, axis=1)
+            pairs = np.flatnonzero(depth_pass & ~outside)
+            (pair_tris, pair_slots, pair_fx, pair_fy, v) = (pair_tris[pairs], pair_slots[pairs], pair_fx[pairs], pair_fy[pairs], v[pairs])
+            (pair_chunk_tiles, pair_chunk_fine) = (pair_chunk_tiles[pairs], pair_chunk_fine[pairs])
+            pair_fine = pair_fy * fine_w + pair_fx
+            (mask_lo, mask_hi) = triangle_coverage_mask(v[:, 0], v[:, 1], v[:, 2])
+            valid = np.flatnonzero((mask_lo != 0) | (mask_hi != 0))
+            fine_counts += np.bincount(pair_fine[valid], minlength=len(fine_counts))
+
+            #covered (pair, bit) candidates of the valid pairs.
+            masks = np.stack([mask_lo[valid], mask_hi[valid]], axis=1).astype('<u4')
+            bits = np.unpackbits(masks.view(np.uint8), axis=1, bitorder='little').astype(bool)
+            (candidate_pairs, candidate_bits) = np.nonzero(bits)
+            candidate_pairs = valid[candidate_pairs]
+            candidate_threads = bit_thread[candidate_bits]
+            thread_x = candidate_threads % g_fine_tile_size
+            thread_y = candidate_threads // g_fine_tile_size
+            pixels = np.stack([pair_fx[candidate_pairs] * g_fine_tile_size + thread_x, pair_fy[candidate_pairs] * g_fine_tile_size + thread_y], axis=1)
+
+            candidate_tris = pair_tris[candidate_pairs]
+            planes = triangle_planes[candidate_tris]
+            with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+                numerators = planes[:, 0, 0] + planes[:, 0, 1] * pixels[:, 0] + planes[:, 0, 2] * pixels[:, 1]
+                denominators = planes[:, 1, 0] + planes[:, 1, 1] * pixels[:, 0] + planes[:, 1, 2] * pixels[:, 1]
+                z = (numerators / denominators).astype('f')
+
+            #sequential IsDepthLess writes: the first triangle of the batch with the nearest depth
+            #wins, so take the max of (depth, -slot) per pixel of the chunk.
+            keys = (pair_chunk_tiles[candidate_pairs] * len(fine_x) + pair_chunk_fine[candidate_pairs]) * pixel_count + candidate_threads
+            best = np.zeros(len(tile_chunk) * len(fine_x) * pixel_count, dtype=np.uint64)
+            np.maximum.at(best, keys, (_depth_order_keys(z).astype(np.uint64) << np.uint64(32)) | (g_triangle_cache_count - 1 - pair_slots[candidate_pairs]).astype(np.uint64))
+            keys = np.flatnonzero(best)
+            best = best[keys]
+            best_z = _depth_from_order_keys(best >> np.uint64(32))
+            best_slots = g_triangle_cache_count - 1 - (best & np.uint64(0xffffffff)).astype(np.int64)
+            (key_tiles, key_fine, key_threads) = (keys // (len(fine_x) * pixel_count), (keys // pixel_count) % len(fine_x), keys % pixel_count)
+            depth_keys = (tile_fy[key_tiles, key_fine] * fine_w + tile_fx[key_tiles, key_fine]) * pixel_count + key_threads
+            write = best_z > depth.reshape(-1)[depth_keys]
+            depth.reshape(-1)[depth_keys[write]] = best_z[write]
+            winners.reshape(-1)[depth_keys[write]] = batch_tris[batch_starts[key_tiles[write]] + best_slots[write]]
+
+    #resolve colors from the winning triangles, then crop the fine tile grid to the output.
+    grid_y = np.arange(fine_h * g_fine_tile_size)[:, np.newaxis]
+    grid_x = np.arange(fine_w * g_fine_tile_size)[np.newaxis, :]
+    thread_index = (grid_y % g_fine_tile_size) * g_fine_tile_size + grid_x % g_fine_tile_size
+    fine_index = (grid_y // g_fine_tile_size) * fine_w + grid_x // g_fine_tile_size
+    pixel_winners = winners[fine_index, thread_index][0:height, 0:width]
+    pixel_depths = depth[fine_index, thread_index][0:height, 0:width]
+
+    visibility = np.zeros((height, width, 4), dtype='f')
+    (written_y, written_x) = np.nonzero(pixel_winners >= 0)
+    tris = pixel_winners[written_y, written_x]
+    visibility[written_y, written_x, 0:3] = perspective_barycentrics(og[tris], _pixel_to_h(np.stack([written_x, written_y], axis=1), size))
+    (out_fine_w, out_fine_h) = (math.ceil(width / g_fine_tile_size), math.ceil(height / g_fine_tile_size))
+    fine_counts = fine_counts.reshape((fine_h, fine_w))[0:out_fine_h, 0:out_fine_w].reshape(-1).astype(np.uint32)
+    return (visibility, pixel_depths, fine_counts)
+
+# single identity instance drawing all the triangles (and clusters) of mesh_data.
+def default_instance_table(mesh_data):
+    table = np.zeros(1, dtype=instances.g_instance_dtype)
+    table['world'] = np.identity(4, dtype='f').reshape(-1)
+    table['triangle_count'] = mesh_data.triangle_count
+    table['cluster_count'] = 0 if mesh_data.clusters is None else len(mesh_data.clusters)
+    return table
+
+# CPU counterpart of Rasterizer, rasterize() fills the same outputs: visibility buffer, bin
+# counters / offsets / elements, total records and fine tile counts. Geometry is a MeshData
+# (as registered in a GpuGeo) and a gpu instance table in its triangle / cluster ranges,
+# see instances.InstanceTable.build_table.
+class ReferenceRasterizer:
+
+    def __init__(self):
+        self.m_visibility_buffer = None
+        self.m_depth_buffer = None
+        self.m_bin_counts = None
+        self.m_bin_offsets = None
+        self.m_bin_elements = None
+        self.m_fine_tile_counts = None
+        self.m_timings = {}
+
+    def rasterize(self, w, h, view_matrix, proj_matrix, mesh_data, instance_table = None, view_settings = None):
+        import time
+        instance_table = default_instance_table(mesh_data) if instance_table is None else instance_table
+        cluster_culling = mesh_data.clusters is not None and len(mesh_data.clusters) > 0 and (view_settings is None or view_settings.cluster_culling)
+        cluster_cull_flags = meshlet.ClusterCullFlags.CLUSTER_CULL_FLAGS_BACKFACE if view_settings is not None and view_settings.cluster_backface_culling else 0
+        self.m_timings = {}
+        begin = time.perf_counter()
+        def mark(name):
+            nonlocal begin
+            now = time.perf_counter()
+            self.m_timings[name] = now - begin
+            begin = now
+
+        virtual_ids = virtual_triangle_ids(instance_table, mesh_data.clusters if cluster_culling else None, view_matrix, proj_matrix, cluster_cull_flags)
+        corners = load_triangles(mesh_data.vertices, mesh_data.indices, instance_table, virtual_ids)
+        (og, hh, p) = setup_triangles(corners, view_matrix, proj_matrix)
+        mark("setup")
+
+        #bins store virtual ids, the fine raster indexes the setup arrays with their positions.
+        (bin_ids, setup_ids) = bin_triangles(og, p, np.arange(len(virtual_ids)), w, h)
+        mark("binning")
+        (counts, offsets, setup_elements) = write_bin_elements(bin_ids, setup_ids, math.ceil(w / g_coarse_tile_size) * math.ceil(h / g_coarse_tile_size))
+        mark("bin_elements")
+        (self.m_visibility_buffer, self.m_depth_buffer, self.m_fine_tile_counts) = fine_raster(og, hh, p, counts, offsets, setup_elements, w, h)
+        mark("fine_raster")
+
+        self.m_bin_counts = counts
+        self.m_bin_offsets = offsets
+        self.m_bin_elements = virtual_ids[setup_elements.astype(np.int64)].astype(np.uint32)
+
+    @property
+    def visibility_buffer(self):
+        return self.m_visibility_buffer
+
+    @property
+    def depth_buffer(self):
+        return self.m_depth_buffer
+
+    @property
+    def bin_counts(self):
+        return self.m_bin_counts
+
+    @property
+    def bin_offsets(self):
+        return self.m_bin_offsets
+
+    @property
+    def bin_elements(self):
+        return self.m_bin_elements
+
+    @property
+    def total_records(self):
+        return len(self.m_bin_elements)
+
+    @property
+    def fine_tile_counts(self):
+        return self.m_fine_tile_counts
+
+    # seconds spent in each pass by the last rasterize call.
+    @property
+    def timings(self):
+        return self.m_timings
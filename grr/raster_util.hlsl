@@ -9,8 +9,22 @@
 
 #define FINE_TILE_TO_TILE_SHIFT (COARSE_TILE_POW - FINE_TILE_POW)
 
+#include "depth_utils.hlsl"
+#include "geometry.hlsl"
+
 namespace raster
 {
+    //Sort key of a triangle's nearest depth: keys sort nearest first. Depths are clamped to
+    //[0, 1] so their bits order like the floats.
+    uint depthSortKey(float nearestDepth)
+    {
+    #if INVERTED_DEPTH
+        return ~asuint(saturate(nearestDepth));
+    #else
+        return asuint(saturate(nearestDepth));
+    #endif
+    }
+
     //Size must match raster.py
     struct BinIntersectionRecord
     {
@@ -25,6 +39,14 @@ namespace raster
             tileId = inTileId;
         }
 
+        void init(int inTileId, int triId, int inBinOffset, uint tileBits)
+        {
+            init(inTileId, triId, inBinOffset);
+        }
+
+        int getTileId(uint tileBits) { return tileId; }
+        int getBinOffset(uint tileBits) { return binOffset; }
+
         int3 getIndices()
         {
             int3 baseIdx = triangleId * 3;
@@ -32,6 +54,71 @@ namespace raster
         }
     };
 
+    //8 byte record: the bin offset is packed above the tileBits bits of the tile id, tileBits comes
+    //from the screen's tile count. Bins are limited to 1 << (32 - tileBits) elements, binning drops
+    //the elements past it and raster.py falls back to the full records when bins get close.
+    struct PackedBinIntersectionRecord
+    {
+        int triangleId;
+        uint binData;
+
+        void init(int inTileId, int triId, int inBinOffset, uint tileBits)
+        {
+            triangleId = triId;
+            binData = ((uint)inBinOffset << tileBits) | (uint)inTileId;
+        }
+
+        int getTileId(uint tileBits) { return binData & ((1u << tileBits) - 1u); }
+        int getBinOffset(uint tileBits) { return binData >> tileBits; }
+    };
+
+    uint packedMaxBinCount(uint tileBits)
+    {
+        return 1u << (32u - tileBits);
+    }
+
+    //Post transform setup of a binned triangle, written by the binning per virtual triangle so the
+    //passes after it read it instead of loading and transforming the triangle again. Size must match raster.py
+    struct TriangleSetup
+    {
+        //screen points of the clipped triangle, see geometry::TriangleH
+        float3 p0;
+        float3 p1;
+        float3 p2;
+        //unclipped w of every vertex, with the vertex's clip bit in the lowest bit of the mantissa.
+        float3 w;
+
+        void init(geometry::TriangleH th)
+        {
+            p0 = th.p0;
+            p1 = th.p1;
+            p2 = th.p2;
+            uint3 clipBits = (th.clipZMask >> uint3(0, 1, 2)) & 1u;
+            w = asfloat((asuint(float3(th.og0.w, th.og1.w, th.og2.w)) & ~1u) | clipBits);
+        }
+
+        //The screen points are exact, which is all binning uses. Unclipped vertices have their
+        //homogeneous coordinates rebuilt from the points and w, clipped ones are on the near plane
+        //but lose their unclipped coordinates: with a clipZMask the fine raster transforms the
+        //triangle again for its barycentrics.
+        geometry::TriangleH triangle()
+        {
+            geometry::TriangleH th;
+            th.p0 = p0;
+            th.p1 = p1;
+            th.p2 = p2;
+            uint3 clipBits = asuint(w) & 1u;
+            th.clipZMask = clipBits.x | (clipBits.y << 1) | (clipBits.z << 2);
+            th.og0 = float4(p0 * w.x, w.x);
+            th.og1 = float4(p1 * w.y, w.y);
+            th.og2 = float4(p2 * w.z, w.z);
+            th.h0 = clipBits.x ? float4(p0 * MIN_DEPTH, MIN_DEPTH) : th.og0;
+            th.h1 = clipBits.y ? float4(p1 * MIN_DEPTH, MIN_DEPTH) : th.og1;
+            th.h2 = clipBits.z ? float4(p2 * MIN_DEPTH, MIN_DEPTH) : th.og2;
+            return th;
+        }
+    };
+
 }
 
 #endif
@@ -0,0 +1,80 @@
+// This value must match the group size in primitives/reduction.py
+#define GROUP_SIZE 128
+#define REDUCE_ITEMS_PER_THREAD 8
+#define REDUCE_PARTITION_SIZE (GROUP_SIZE * REDUCE_ITEMS_PER_THREAD)
+
+// REDUCE_OP: 0 sum, 1 min, 2 max. Must match primitives.reduction.ReduceOp
+#ifndef REDUCE_OP
+#define REDUCE_OP 0
+#endif
+
+Buffer<uint> g_inputBuffer : register(t0);
+RWBuffer<uint> g_outputBuffer : register(u0);
+
+cbuffer ConstantsReduce : register(b0)
+{
+    int4 g_reduceArgs0;
+}
+
+#define inputCount g_reduceArgs0.x
+#define groupCountX g_reduceArgs0.y
+
+uint reduceIdentity()
+{
+#if REDUCE_OP == 1
+    return 0xffffffff;
+#else
+    return 0;
+#endif
+}
+
+uint reduceOp(uint a, uint b)
+{
+#if REDUCE_OP == 1
+    return min(a, b);
+#elif REDUCE_OP == 2
+    return max(a, b);
+#else
+    return a + b;
+#endif
+}
+
+groupshared uint gs_reduceCache[GROUP_SIZE];
+
+//Each group reduces a partition of REDUCE_PARTITION_SIZE elements then merges it atomically into
+//g_outputBuffer[0], which holds the identity of the operation before the dispatch.
+[numthreads(GROUP_SIZE, 1, 1)]
+void csReduce(int3 groupID : SV_GroupID, int groupIndex : SV_GroupIndex)
+{
+    uint partitionOffset = (groupID.y * groupCountX + groupID.x) * REDUCE_PARTITION_SIZE;
+    uint value = reduceIdentity();
+    [unroll]
+    for (uint i = 0; i < REDUCE_ITEMS_PER_THREAD; ++i)
+    {
+        uint index = partitionOffset + i * GROUP_SIZE + groupIndex;
+        if (index < (uint)inputCount)
+            value = reduceOp(value, g_inputBuffer[index]);
+    }
+
+    gs_reduceCache[groupIndex] = value;
+    GroupMemoryBarrierWithGroupSync();
+
+    for (uint s = GROUP_SIZE / 2; s > 0; s >>= 1)
+    {
+        if ((uint)groupIndex < s)
+            gs_reduceCache[groupIndex] = reduceOp(gs_reduceCache[groupIndex], gs_reduceCache[groupIndex + s]);
+        GroupMemoryBarrierWithGroupSync();
+    }
+
+    if (groupIndex == 0)
+    {
+        uint unused;
+#if REDUCE_OP == 1
+        InterlockedMin(g_outputBuffer[0], gs_reduceCache[0], unused);
+#elif REDUCE_OP == 2
+        InterlockedMax(g_outputBuffer[0], gs_reduceCache[0], unused);
+#else
+        InterlockedAdd(g_outputBuffer[0], gs_reduceCache[0], unused);
+#endif
+    }
+}
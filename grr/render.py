@@ -0,0 +1,152 @@
+import argparse
+import concurrent.futures
+import json
+import os
+import struct
+import sys
+import time
+import zlib
+import numpy as np
+import coalpy.gpu as g
+from . import get_module_path
+from . import default_scenes as scenes
+from . import gpugeo
+from . import raster
+from . import scene_loader
+from . import camera_path
+from . import vertex_format
+from .raster import g_markers
+
+# Offline renderer: rasterizes every frame of a camera path into the rasterizer's offscreen
+# visibility buffer, no window or UI. Frames are read back and written to disk by worker
+# threads while the gpu keeps rendering, per frame timings go to timings.json.
+# Usage: python -m grr.render --scene teapot --resolution 1920x1080 --camera-path path.json --output out
+# Without a camera path the camera orbits the scene, see camera_path.CameraPath.orbit.
+
+def write_png(file_name, rgba):
+    (h, w, _) = rgba.shape
+    rows = np.concatenate([np.zeros((h, 1), dtype=np.uint8), rgba.reshape((h, w * 4))], axis=1)
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff)
+    with open(file_name, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", w, h, 8, 6, 0, 0, 0)))
+        f.write(chunk(b"IDAT", zlib.compress(rows.tobytes(), 1)))
+        f.write(chunk(b"IEND", b""))
+
+def resolve_scene_file(scene):
+    path = scenes.data.get(scene, scene)
+    if not isinstance(path, str):
+        raise ValueError("[render]: scene " + scene + " is not a file")
+    return get_module_path() + path if scene in scenes.data else path
+
+# Readbacks of the frames and marker timestamps in flight. Requests are resolved in order,
+# only once ready, so the cpu never waits on the gpu unless max_in_flight is reached.
+class FrameStream:
+
+    def __init__(self, output_dir, w, h, write_frames = True, max_in_flight = 4, worker_count = 4):
+        self.m_output_dir = output_dir
+        self.m_w = w
+        self.m_h = h
+        self.m_write_frames = write_frames
+        self.m_max_in_flight = max_in_flight
+        self.m_in_flight = []
+        self.m_writes = []
+        self.m_timings = []
+        self.m_executor = concurrent.futures.ThreadPoolExecutor(max_workers = worker_count, thread_name_prefix = "grr_frame_writer")
+
+    @property
+    def timings(self):
+        return self.m_timings
+
+    def push(self, frame, texture, marker_gpu_data, cpu_time):
+        frame_request = g.ResourceDownloadRequest(texture) if self.m_write_frames else None
+        marker_request = g.ResourceDownloadRequest(marker_gpu_data.timestamp_buffer)
+        self.m_in_flight.append((frame, frame_request, marker_gpu_data, marker_request, cpu_time))
+        self.flush(wait = len(self.m_in_flight) > self.m_max_in_flight)
+
+    def flush(self, wait = False):
+        while len(self.m_in_flight) > 0:
+            (frame, frame_request, marker_gpu_data, marker_request, cpu_time) = self.m_in_flight[0]
+            is_ready = marker_request.is_ready() and (frame_request is None or frame_request.is_ready())
+            if not is_ready and not wait:
+                return
+            marker_request.resolve()
+            timestamps = np.frombuffer(marker_request.data_as_bytearray(), dtype=np.uint64)
+            frame_timings = { 'frame' : frame, 'cpu_ms' : cpu_time * 1000.0 }
+            for (name, _, bi, ei) in marker_gpu_data.markers:
+                if name in g_markers:
+                    frame_timings[name + "_ms"] = (float(timestamps[ei]) - float(timestamps[bi])) * 1000.0 / marker_gpu_data.timestamp_frequency
+            self.m_timings.append(frame_timings)
+            if frame_request is not None:
+                frame_request.resolve()
+                data = np.frombuffer(frame_request.data_as_bytearray(), dtype=np.uint8)
+                #rows may be padded to the readback row pitch.
+                rgba = data[0:(len(data) // self.m_h) * self.m_h].reshape((self.m_h, -1))[:, 0:self.m_w * 4].reshape((self.m_h, self.m_w, 4)).copy()
+                file_name = os.path.join(self.m_output_dir, "frame_%05d.png" % frame)
+                self.m_writes.append(self.m_executor.submit(write_png, file_name, rgba))
+            self.m_in_flight.pop(0)
+            wait = wait and len(self.m_in_flight) > self.m_max_in_flight
+
+    def finish(self):
+        self.flush(wait = True)
+        self.m_executor.shutdown(wait = True)
+        for write in self.m_writes:
+            write.result()
+
+def render(geo, path, w, h, output_dir, write_frames = True):
+    rasterizer = raster.Rasterizer(w, h)
+    cam = path.create_camera(w, h)
+    stream = FrameStream(output_dir, w, h, write_frames)
+    begin = time.perf_counter()
+    for frame in range(path.frame_count):
+        frame_begin = time.perf_counter()
+        path.apply(cam, frame)
+        g.begin_collect_markers()
+        cmd_list = g.CommandList()
+        rasterizer.rasterize(cmd_list, w, h, cam.view_matrix, cam.proj_matrix, geo)
+        g.schedule(cmd_list)
+        marker_gpu_data = g.end_collect_markers()
+        stream.push(frame, rasterizer.visibility_buffer, marker_gpu_data, time.perf_counter() - frame_begin)
+    stream.finish()
+    total_time = time.perf_counter() - begin
+
+    report = {
+        'resolution' : [w, h],
+        'frame_count' : path.frame_count,
+        'total_s' : total_time,
+        'frames' : stream.timings
+    }
+    with open(os.path.join(output_dir, "timings.json"), "w") as f:
+        f.write(json.dumps(report, indent = 4))
+    return report
+
+def parse_resolution(value):
+    (w, h) = value.lower().split("x")
+    return (int(w), int(h))
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog = "python -m grr.render", description = "Renders a camera path offline, without the editor.")
+    parser.add_argument("--scene", default = "teapot", help = "one of " + ", ".join([k for (k, v) in scenes.data.items() if isinstance(v, str)]) + ", or an .obj file")
+    parser.add_argument("--resolution", type = parse_resolution, default = (1920, 1080), help = "WxH, 1920x1080 by default")
+    parser.add_argument("--camera-path", default = None, help = "camera path json, see camera_path.py. Orbits the scene when not set")
+    parser.add_argument("--frames", type = int, default = 120, help = "frame count of the orbit, when no camera path is given")
+    parser.add_argument("--output", default = "grr_render", help = "output directory of the frames and timings.json")
+    parser.add_argument("--no-frames", action = "store_true", help = "only write timings.json")
+    parser.add_argument("--compact-vertices", action = "store_true")
+    parser.add_argument("--optimize-vertex-cache", action = "store_true")
+    args = parser.parse_args(argv)
+
+    mesh_data = scene_loader.load_scene(resolve_scene_file(args.scene), args.optimize_vertex_cache)
+    geo = gpugeo.GpuGeo(vertex_format.VertexFormat.Compact if args.compact_vertices else vertex_format.VertexFormat.Full)
+    geo.register_mesh(mesh_data)
+    path = camera_path.CameraPath.load(args.camera_path) if args.camera_path is not None else camera_path.CameraPath.orbit(mesh_data.mesh_table, args.frames)
+
+    os.makedirs(args.output, exist_ok = True)
+    (w, h) = args.resolution
+    print("[render]: " + mesh_data.name + ", " + str(mesh_data.triangle_count) + " triangles, " + str(path.frame_count) + " frames at " + str(w) + "x" + str(h))
+    report = render(geo, path, w, h, args.output, not args.no_frames)
+    print("[render]: done in %.2f s, timings written to %s" % (report['total_s'], os.path.join(args.output, "timings.json")))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,77 @@
+#ifndef __SCAN_LOOKBACK__
+#define __SCAN_LOOKBACK__
+
+// Decoupled look-back (Merrill & Garland) of csPrefixSumSinglePass and csSegmentedScan. The
+// including shader declares g_scanState, [0] partition counter, then per partition: status
+// word, aggregate, inclusive prefix, and defines scanEpoch and scanGroupCount.
+
+// status of a partition, the upper 30 bits of a status word hold the epoch of the run that wrote
+// it: words of previous runs read as not published yet, so the state never needs clearing.
+// The status is also the offset of its value from the status word.
+#define SCAN_STATUS_AGGREGATE 1
+#define SCAN_STATUS_PREFIX 2
+
+uint scanStatusWord(uint status)
+{
+    return ((uint)scanEpoch << 2) | status;
+}
+
+uint scanStatusIndex(uint partitionIndex)
+{
+    return 1 + partitionIndex * 3;
+}
+
+//partitions are numbered in the order groups start running, so a group only ever waits on
+//groups that are already resident. Called by a single thread of the group.
+uint scanAcquirePartition()
+{
+    uint partitionIndex;
+    InterlockedAdd(g_scanState[0], 1, partitionIndex);
+    //the last index is handed out once every group took its own, reset the counter for the next run.
+    if (partitionIndex == (uint)scanGroupCount - 1)
+    {
+        uint unused;
+        InterlockedExchange(g_scanState[0], 0, unused);
+    }
+    return partitionIndex;
+}
+
+//the value has to be visible before the status word that announces it.
+void scanPublish(uint partitionIndex, uint status, uint value)
+{
+    uint statusIndex = scanStatusIndex(partitionIndex);
+    uint unused;
+    g_scanState[statusIndex + status] = value;
+    DeviceMemoryBarrier();
+    InterlockedExchange(g_scanState[statusIndex], scanStatusWord(status), unused);
+}
+
+//sum of the partitions before partitionIndex, walking back over their aggregates until an
+//inclusive prefix. Partition 0 always publishes a prefix, so partitionIndex must be past it.
+uint scanLookBack(uint partitionIndex)
+{
+    uint exclusivePrefix = 0;
+    uint lookbackIndex = partitionIndex - 1;
+    while (true)
+    {
+        uint lookbackStatusIndex = scanStatusIndex(lookbackIndex);
+        uint status;
+        InterlockedOr(g_scanState[lookbackStatusIndex], 0, status);
+        if (status == scanStatusWord(SCAN_STATUS_PREFIX))
+        {
+            DeviceMemoryBarrier();
+            exclusivePrefix += g_scanState[lookbackStatusIndex + SCAN_STATUS_PREFIX];
+            break;
+        }
+        else if (status == scanStatusWord(SCAN_STATUS_AGGREGATE))
+        {
+            DeviceMemoryBarrier();
+            exclusivePrefix += g_scanState[lookbackStatusIndex + SCAN_STATUS_AGGREGATE];
+            --lookbackIndex;
+        }
+        //otherwise not published yet, spin.
+    }
+    return exclusivePrefix;
+}
+
+#endif
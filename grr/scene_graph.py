@@ -0,0 +1,187 @@
+import numpy as np
+from . import transform
+
+# Hierarchy of transforms. Nodes have stable ids (indices into the local TransformArray) and
+# are kept in depth first order, so the subtree of a node is a contiguous range of that order.
+# update() only recomputes the world matrices of the subtrees of nodes changed since the last
+# update, a batch per depth level, with world inverses built from the closed form local inverses.
+# Structural changes (new nodes, reparenting) rebuild the order and all matrices on the next update.
+class SceneGraph:
+
+    def __init__(self):
+        self.m_local = transform.TransformArray()
+        self.m_parents = np.zeros(0, dtype=np.int64)
+        self.m_world_matrices = np.zeros((0, 4, 4), dtype='f')
+        self.m_world_inv_matrices = np.zeros((0, 4, 4), dtype='f')
+        #depth first order, position of each node in it, depths and subtree ends (in positions).
+        self.m_order = np.zeros(0, dtype=np.int64)
+        self.m_positions = np.zeros(0, dtype=np.int64)
+        self.m_depths = np.zeros(0, dtype=np.int64)
+        self.m_subtree_ends = np.zeros(0, dtype=np.int64)
+        self.m_dirty_nodes = []
+        self.m_structure_dirty = False
+
+    @property
+    def node_count(self):
+        return self.m_local.count
+
+    @property
+    def local_transforms(self):
+        return self.m_local
+
+    @property
+    def parents(self):
+        return self.m_parents[0:self.node_count]
+
+    @property
+    def depths(self):
+        self._update_structure()
+        return self.m_depths
+
+    @property
+    def world_matrices(self):
+        self.update()
+        return self.m_world_matrices[0:self.node_count]
+
+    @property
+    def world_inv_matrices(self):
+        self.update()
+        return self.m_world_inv_matrices[0:self.node_count]
+
+    def _reserve(self, capacity):
+        if capacity <= len(self.m_parents):
+            return
+        capacity = max(capacity, 2 * len(self.m_parents))
+        grow = capacity - len(self.m_parents)
+        self.m_parents = np.concatenate([self.m_parents, np.full(grow, -1, dtype=np.int64)])
+        self.m_world_matrices = np.concatenate([self.m_world_matrices, np.zeros((grow, 4, 4), dtype='f')])
+        self.m_world_inv_matrices = np.concatenate([self.m_world_inv_matrices, np.zeros((grow, 4, 4), dtype='f')])
+
+    # adds nodes with identity transforms under parents (-1 for roots), returns their ids.
+    # Parents must exist or be part of the same call, earlier in the list.
+    def add_nodes(self, parents):
+        parents = np.asarray(parents, dtype=np.int64).reshape(-1)
+        ids = np.arange(self.node_count, self.node_count + len(parents))
+        if np.any(parents >= ids) or np.any(parents < -1):
+            raise ValueError("[SceneGraph]: parents must be existing nodes, or -1")
+        self.m_local.add(len(parents))
+        self._reserve(self.node_count)
+        self.m_parents[ids] = parents
+        self.m_structure_dirty = True
+        return ids
+
+    def add_node(self, parent = -1):
+        return int(self.add_nodes([parent])[0])
+
+    def parent(self, node):
+        return int(self.m_parents[node])
+
+    def set_parent(self, node, parent):
+        if not 0 <= node < self.node_count or not -1 <= parent < self.node_count:
+            raise ValueError("[SceneGraph]: can't parent node " + str(node) + " to " + str(parent) + ", nodes must be existing nodes and parents existing nodes or -1")
+        ancestor = parent
+        while ancestor >= 0:
+            if ancestor == node:
+                raise ValueError("[SceneGraph]: node " + str(node) + " can't be parented to its own subtree")
+            ancestor = int(self.m_parents[ancestor])
+        self.m_parents[node] = parent
+        self.m_structure_dirty = True
+
+    # nodes is an int or an int array of node ids.
+    def set_translations(self, nodes, values):
+        self.m_local.set_translations(nodes, values)
+        self.m_dirty_nodes.append(np.asarray(nodes, dtype=np.int64).reshape(-1))
+
+    def set_rotations(self, nodes, values):
+        self.m_local.set_rotations(nodes, values)
+        self.m_dirty_nodes.append(np.asarray(nodes, dtype=np.int64).reshape(-1))
+
+    def set_scales(self, nodes, values):
+        self.m_local.set_scales(nodes, values)
+        self.m_dirty_nodes.append(np.asarray(nodes, dtype=np.int64).reshape(-1))
+
+    # all the nodes of the subtrees of nodes (included), in depth first order.
+    def subtree_nodes(self, nodes):
+        self._update_structure()
+        positions = self.m_positions[np.asarray(nodes, dtype=np.int64).reshape(-1)]
+        return self.m_order[SceneGraph._ranges(positions, self.m_subtree_ends[positions])]
+
+    # sorted unique positions of the union of the [begins, ends) ranges.
+    @staticmethod
+    def _ranges(begins, ends):
+        lengths = ends - begins
+        if len(lengths) == 0 or np.sum(lengths) == 0:
+            return np.zeros(0, dtype=np.int64)
+        starts = np.repeat(begins - (np.cumsum(lengths) - lengths), lengths)
+        return np.unique(starts + np.arange(int(np.sum(lengths))))
+
+    # depth first order, from the subtree sizes, computed a depth level at a time.
+    def _update_structure(self):
+        if not self.m_structure_dirty:
+            return
+        self.m_structure_dirty = False
+        count = self.node_count
+        parents = self.parents
+
+        #depths by pointer jumping, log(max depth) steps.
+        depths = (parents >= 0).astype(np.int64)
+        ancestors = parents.copy()
+        while np.any(ancestors >= 0):
+            has_ancestor = np.flatnonzero(ancestors >= 0)
+            jumps = ancestors[has_ancestor]
+            depths[has_ancestor] += depths[jumps]
+            ancestors[has_ancestor] = ancestors[jumps]
+
+        #nodes by depth, then parent, then id: siblings are contiguous inside a level.
+        by_level = np.lexsort((np.arange(count), parents, depths))
+        level_ends = np.searchsorted(depths[by_level], np.arange(np.max(depths) + 2 if count > 0 else 0), side='right')
+        levels = [by_level[level_ends[d - 1] if d > 0 else 0:level_ends[d]] for d in range(len(level_ends) - 1)]
+
+        sizes = np.ones(count, dtype=np.int64)
+        for level in reversed(levels[1:]):
+            np.add.at(sizes, parents[level], sizes[level])
+
+        positions = np.zeros(count, dtype=np.int64)
+        for level in levels:
+            level_parents = parents[level]
+            level_sizes = sizes[level]
+            #exclusive prefix of the sizes of the previous siblings.
+            ends = np.cumsum(level_sizes)
+            group_starts = np.concatenate([[True], level_parents[1:] != level_parents[:-1]]) if len(level) > 0 else np.zeros(0, dtype=bool)
+            group_bases = np.maximum.accumulate(np.where(group_starts, ends - level_sizes, 0))
+            sibling_offsets = ends - level_sizes - group_bases
+            positions[level] = np.where(level_parents >= 0, positions[np.maximum(level_parents, 0)] + 1, 0) + sibling_offsets
+
+        self.m_positions = positions
+        self.m_order = np.argsort(positions)
+        self.m_depths = depths
+        self.m_subtree_ends = np.zeros(count, dtype=np.int64)
+        self.m_subtree_ends[positions] = positions + sizes
+        self.m_dirty_nodes = [np.arange(count)]
+
+    # Recomputes the world matrices of the changed subtrees. Returns the ids of the nodes
+    # whose world matrix changed, ready to copy into instance matrices.
+    def update(self):
+        self._update_structure()
+        if not self.m_dirty_nodes:
+            return np.zeros(0, dtype=np.int64)
+
+        dirty_nodes = np.unique(np.concatenate(self.m_dirty_nodes))
+        self.m_dirty_nodes = []
+        self.m_local.update_mats(dirty_nodes)
+        local_matrices = self.m_local.m_transform_matrices
+        local_inv_matrices = self.m_local.m_transform_inv_matrices
+
+        positions = self.m_positions[dirty_nodes]
+        changed = self.m_order[SceneGraph._ranges(positions, self.m_subtree_ends[positions])]
+        changed = changed[np.argsort(self.m_depths[changed], kind='stable')]
+        level_ends = np.flatnonzero(np.diff(self.m_depths[changed])) + 1
+        for level in np.split(changed, level_ends):
+            level_parents = self.m_parents[level]
+            is_root = level_parents < 0
+            parent_ids = np.maximum(level_parents, 0)
+            parent_worlds = np.where(is_root[:, np.newaxis, np.newaxis], transform.Transform.Identity(), self.m_world_matrices[parent_ids])
+            parent_inv_worlds = np.where(is_root[:, np.newaxis, np.newaxis], transform.Transform.Identity(), self.m_world_inv_matrices[parent_ids])
+            self.m_world_matrices[level] = np.matmul(parent_worlds, local_matrices[level])
+            self.m_world_inv_matrices[level] = np.matmul(local_inv_matrices[level], parent_inv_worlds)
+        return changed
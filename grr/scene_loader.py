@@ -0,0 +1,127 @@
+import concurrent.futures
+import os
+from . import mesh_cache
+from . import obj_loader
+from . import meshlet
+from . import vertex_cache
+
+class LoadCancelled(Exception):
+    pass
+
+# State of a single scene load. The worker thread reports progress through it,
+# the main thread reads it to build the UI.
+class SceneLoadRequest:
+    def __init__(self, file_name, optimize_vertex_cache = False):
+        self.m_file_name = file_name
+        self.m_optimize_vertex_cache = optimize_vertex_cache
+        self.m_progress = 0.0
+        self.m_stage = "queued"
+        self.m_cancelled = False
+
+    @property
+    def file_name(self):
+        return self.m_file_name
+
+    @property
+    def name(self):
+        return os.path.basename(self.m_file_name)
+
+    @property
+    def optimize_vertex_cache(self):
+        return self.m_optimize_vertex_cache
+
+    @property
+    def progress(self):
+        return self.m_progress
+
+    @property
+    def stage(self):
+        return self.m_stage
+
+    @property
+    def cancelled(self):
+        return self.m_cancelled
+
+    def cancel(self):
+        self.m_cancelled = True
+
+    # called from the worker thread, raises when a newer load superseded this one.
+    def report(self, progress, stage):
+        if self.m_cancelled:
+            raise LoadCancelled()
+        self.m_progress = progress
+        self.m_stage = stage
+
+# Loads a scene on the calling thread, through the mesh cache like SceneLoader.
+def load_scene(file_name, optimize_vertex_cache = False):
+    return SceneLoader._load_job(SceneLoadRequest(file_name, optimize_vertex_cache))
+
+# Loads scenes on a background thread. Only the latest requested load is kept,
+# requesting a new one cancels the previous load (queued or running).
+# With optimize_vertex_cache, triangles and vertices are reordered for vertex fetch
+# locality (see vertex_cache.py), cached separately from the plain build.
+class SceneLoader:
+    def __init__(self, optimize_vertex_cache = False):
+        self.m_optimize_vertex_cache = optimize_vertex_cache
+        self.m_executor = concurrent.futures.ThreadPoolExecutor(max_workers = 1, thread_name_prefix = "grr_scene_loader")
+        self.m_request = None
+        self.m_future = None
+
+    @property
+    def is_loading(self):
+        return self.m_request is not None
+
+    @property
+    def request(self):
+        return self.m_request
+
+    def load(self, file_name):
+        self.cancel()
+        self.m_request = SceneLoadRequest(file_name, self.m_optimize_vertex_cache)
+        self.m_future = self.m_executor.submit(SceneLoader._load_job, self.m_request)
+
+    def cancel(self):
+        if self.m_request is None:
+            return
+        self.m_request.cancel()
+        self.m_future.cancel()
+        self.m_request = None
+        self.m_future = None
+
+    def _build_scene(file_name, request):
+        mesh_data = obj_loader.load_obj(file_name, request.report)
+        request.report(0.9, "building clusters")
+        mesh_data = meshlet.build(mesh_data)
+        if request.optimize_vertex_cache:
+            request.report(0.95, "optimizing vertex cache")
+            mesh_data = vertex_cache.optimize(mesh_data)
+        return mesh_data
+
+    def _load_job(request):
+        request.report(0.0, "reading")
+        mesh_data = mesh_cache.load(
+            request.file_name,
+            lambda file_name: SceneLoader._build_scene(file_name, request),
+            variant = "vcache" if request.optimize_vertex_cache else "")
+        request.report(1.0, "loaded")
+        return mesh_data
+
+    # Call once per frame from the main thread. Returns the loaded MeshData once, None otherwise.
+    def poll(self):
+        if self.m_future is None or not self.m_future.done():
+            return None
+
+        (request, future) = (self.m_request, self.m_future)
+        self.m_request = None
+        self.m_future = None
+        try:
+            return future.result()
+        except LoadCancelled:
+            return None
+        except Exception as err:
+            print ("[SceneLoader]: failed loading scene " + request.file_name + ", reason: " + str(err))
+            return None
+
+    def shutdown(self):
+        self.cancel()
+        self.m_executor.shutdown(wait = True, cancel_futures = True)
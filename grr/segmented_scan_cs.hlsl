@@ -0,0 +1,155 @@
+// This value must match the group size in primitives/segmented_scan.py
+#define GROUP_SIZE 128
+#define SCAN_ITEMS_PER_THREAD 8
+#define SCAN_PARTITION_SIZE (GROUP_SIZE * SCAN_ITEMS_PER_THREAD)
+
+// Single pass segmented scan, with the decoupled look-back and epoch tagged status words of
+// scan_lookback.hlsl shared with csPrefixSumSinglePass. A non zero head flag starts a new segment.
+// A partition holding a head knows its inclusive prefix (the sum since its last head)
+// right away and publishes it before looking back for its leading elements.
+
+Buffer<uint> g_inputBuffer : register(t0);
+Buffer<uint> g_headFlagsBuffer : register(t1);
+RWBuffer<uint> g_outputBuffer : register(u0);
+// [0] partition counter, then per partition: status word, aggregate, inclusive prefix.
+globallycoherent RWBuffer<uint> g_scanState : register(u1);
+
+cbuffer ConstantsSegmentedScan : register(b0)
+{
+    int4 g_scanArgs0;
+}
+
+#define scanInputCount g_scanArgs0.x
+#define scanEpoch g_scanArgs0.y
+#define scanGroupCount g_scanArgs0.z
+
+#include "scan_lookback.hlsl"
+
+groupshared uint gs_partitionIndex;
+groupshared uint gs_partitionPrefix;
+groupshared uint gs_partitionValues[SCAN_PARTITION_SIZE];
+groupshared uint gs_partitionFlags[SCAN_PARTITION_SIZE];
+groupshared uint gs_scanValues[GROUP_SIZE];
+groupshared uint gs_scanFlags[GROUP_SIZE];
+
+//Inclusive Hillis-Steele scan of (flag, value) pairs over the group: a flag stops the sum of the values before it.
+void groupSegmentedScanInclusive(uint groupIndex, inout uint flag, inout uint value)
+{
+    gs_scanValues[groupIndex] = value;
+    gs_scanFlags[groupIndex] = flag;
+    GroupMemoryBarrierWithGroupSync();
+
+    for (uint offset = 1; offset < GROUP_SIZE; offset <<= 1)
+    {
+        uint prevValue = 0;
+        uint prevFlag = 0;
+        if (groupIndex >= offset)
+        {
+            prevValue = gs_scanValues[groupIndex - offset];
+            prevFlag = gs_scanFlags[groupIndex - offset];
+        }
+        GroupMemoryBarrierWithGroupSync();
+
+        if (!flag)
+            value += prevValue;
+        flag |= prevFlag;
+        gs_scanValues[groupIndex] = value;
+        gs_scanFlags[groupIndex] = flag;
+        GroupMemoryBarrierWithGroupSync();
+    }
+}
+
+[numthreads(GROUP_SIZE, 1, 1)]
+void csSegmentedScan(int groupIndex : SV_GroupIndex)
+{
+    if (groupIndex == 0)
+        gs_partitionIndex = scanAcquirePartition();
+    GroupMemoryBarrierWithGroupSync();
+
+    uint partitionIndex = gs_partitionIndex;
+    uint partitionOffset = partitionIndex * SCAN_PARTITION_SIZE;
+    if (partitionOffset >= (uint)scanInputCount)
+        return;
+
+    [unroll]
+    for (uint i = 0; i < SCAN_ITEMS_PER_THREAD; ++i)
+    {
+        uint index = partitionOffset + i * GROUP_SIZE + groupIndex;
+        bool isValid = index < (uint)scanInputCount;
+        gs_partitionValues[i * GROUP_SIZE + groupIndex] = isValid ? g_inputBuffer[index] : 0u;
+        gs_partitionFlags[i * GROUP_SIZE + groupIndex] = isValid && g_headFlagsBuffer[index] != 0 ? 1u : 0u;
+    }
+    GroupMemoryBarrierWithGroupSync();
+
+    //serial segmented scan of the thread's consecutive elements, headMask has a bit per element
+    //that has a head at or before it in the thread.
+    uint threadInclusive[SCAN_ITEMS_PER_THREAD];
+    uint threadSum = 0;
+    uint threadFlag = 0;
+    uint headMask = 0;
+    [unroll]
+    for (uint j = 0; j < SCAN_ITEMS_PER_THREAD; ++j)
+    {
+        uint localIndex = groupIndex * SCAN_ITEMS_PER_THREAD + j;
+        if (gs_partitionFlags[localIndex])
+        {
+            threadSum = 0;
+            threadFlag = 1;
+        }
+        threadSum += gs_partitionValues[localIndex];
+        threadInclusive[j] = threadSum;
+        headMask |= threadFlag << j;
+    }
+
+    uint scanFlag = threadFlag;
+    uint scanValue = threadSum;
+    groupSegmentedScanInclusive(groupIndex, scanFlag, scanValue);
+    uint threadPrefix = groupIndex == 0 ? 0 : gs_scanValues[groupIndex - 1];
+    uint threadPrefixFlag = groupIndex == 0 ? 0 : gs_scanFlags[groupIndex - 1];
+    uint partitionFlag = gs_scanFlags[GROUP_SIZE - 1];
+    uint partitionSum = gs_scanValues[GROUP_SIZE - 1];
+
+    if (groupIndex == 0)
+    {
+        bool hasPrefix = partitionIndex == 0 || partitionFlag;
+        scanPublish(partitionIndex, hasPrefix ? SCAN_STATUS_PREFIX : SCAN_STATUS_AGGREGATE, partitionSum);
+
+        //the leading elements up to the first head take the prefix of the previous partitions.
+        uint exclusivePrefix = 0;
+        if (partitionIndex > 0 && !gs_partitionFlags[0])
+            exclusivePrefix = scanLookBack(partitionIndex);
+
+        if (!hasPrefix)
+            scanPublish(partitionIndex, SCAN_STATUS_PREFIX, exclusivePrefix + partitionSum);
+        gs_partitionPrefix = exclusivePrefix;
+    }
+    GroupMemoryBarrierWithGroupSync();
+
+    uint partitionPrefix = gs_partitionPrefix;
+    [unroll]
+    for (uint k = 0; k < SCAN_ITEMS_PER_THREAD; ++k)
+    {
+        uint localIndex = groupIndex * SCAN_ITEMS_PER_THREAD + k;
+        uint value = threadInclusive[k];
+        if (!((headMask >> k) & 1))
+        {
+            value += threadPrefix;
+            if (!threadPrefixFlag)
+                value += partitionPrefix;
+        }
+#ifdef EXCLUSIVE_PREFIX
+        value -= gs_partitionValues[localIndex];
+#endif
+        //every thread only reads back its own elements
+        gs_partitionValues[localIndex] = value;
+    }
+    GroupMemoryBarrierWithGroupSync();
+
+    [unroll]
+    for (uint l = 0; l < SCAN_ITEMS_PER_THREAD; ++l)
+    {
+        uint index = partitionOffset + l * GROUP_SIZE + groupIndex;
+        if (index < (uint)scanInputCount)
+            g_outputBuffer[index] = gs_partitionValues[l * GROUP_SIZE + groupIndex];
+    }
+}
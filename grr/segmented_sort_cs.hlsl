@@ -0,0 +1,173 @@
+// These values must match primitives/segmented_sort.py
+#define GROUP_SIZE 256
+#define SORT_CAPACITY 2048
+
+// In place sort of the (key, value) pairs of every segment, one group per segment, as a bitonic
+// sort. Pairs compare by key then by value, so equal keys keep a deterministic order.
+// Segments longer than SORT_CAPACITY are first sorted in LDS in chunks of SORT_CAPACITY pairs,
+// then the chunks are merged by the remaining bitonic steps: the steps between chunks run in
+// device memory, the ones within a chunk in LDS again.
+// Every step puts the smaller pair first (the bitonic variant that flips the first step of each
+// merge), so the padding past the end of a segment acts as the largest pair and never moves:
+// pairs reaching past the end are skipped.
+
+Buffer<uint> g_segmentOffsets : register(t0);
+Buffer<uint> g_segmentCounts : register(t1);
+RWBuffer<uint> g_keys : register(u0);
+RWBuffer<uint> g_values : register(u1);
+
+cbuffer ConstantsSegmentedSort : register(b0)
+{
+    int4 g_sortArgs0;
+}
+
+#define segmentCount g_sortArgs0.x
+#define groupCountX g_sortArgs0.y
+
+groupshared uint gs_sortKeys[SORT_CAPACITY];
+groupshared uint gs_sortValues[SORT_CAPACITY];
+
+bool pairGreater(uint keyA, uint valueA, uint keyB, uint valueB)
+{
+    return keyA > keyB || (keyA == keyB && valueA > valueB);
+}
+
+void sortPairLocal(uint i, uint j)
+{
+    if (pairGreater(gs_sortKeys[i], gs_sortValues[i], gs_sortKeys[j], gs_sortValues[j]))
+    {
+        uint key = gs_sortKeys[i];
+        uint value = gs_sortValues[i];
+        gs_sortKeys[i] = gs_sortKeys[j];
+        gs_sortValues[i] = gs_sortValues[j];
+        gs_sortKeys[j] = key;
+        gs_sortValues[j] = value;
+    }
+}
+
+void sortPairGlobal(uint i, uint j)
+{
+    uint keyI = g_keys[i];
+    uint valueI = g_values[i];
+    uint keyJ = g_keys[j];
+    uint valueJ = g_values[j];
+    if (pairGreater(keyI, valueI, keyJ, valueJ))
+    {
+        g_keys[i] = keyJ;
+        g_values[i] = valueJ;
+        g_keys[j] = keyI;
+        g_values[j] = valueI;
+    }
+}
+
+//padding sorts last, the largest possible pair.
+void loadChunk(uint groupIndex, uint chunkOffset, uint chunkSize, uint sortSize)
+{
+    for (uint i = groupIndex; i < sortSize; i += GROUP_SIZE)
+    {
+        bool isValid = i < chunkSize;
+        gs_sortKeys[i] = isValid ? g_keys[chunkOffset + i] : 0xffffffff;
+        gs_sortValues[i] = isValid ? g_values[chunkOffset + i] : 0xffffffff;
+    }
+    GroupMemoryBarrierWithGroupSync();
+}
+
+void storeChunk(uint groupIndex, uint chunkOffset, uint chunkSize)
+{
+    for (uint i = groupIndex; i < chunkSize; i += GROUP_SIZE)
+    {
+        g_keys[chunkOffset + i] = gs_sortKeys[i];
+        g_values[chunkOffset + i] = gs_sortValues[i];
+    }
+    AllMemoryBarrierWithGroupSync();
+}
+
+//the steps of distance j down to 1 of a merge, in LDS.
+void mergeLocal(uint groupIndex, uint sortSize, uint j)
+{
+    for (; j > 0; j >>= 1)
+    {
+        for (uint p = groupIndex; p < sortSize; p += GROUP_SIZE)
+        {
+            uint partner = p ^ j;
+            if (partner > p)
+                sortPairLocal(p, partner);
+        }
+        GroupMemoryBarrierWithGroupSync();
+    }
+}
+
+void sortLocal(uint groupIndex, uint sortSize)
+{
+    for (uint k = 2; k <= sortSize; k <<= 1)
+    {
+        //first step of a merge: pairs mirrored around the middle of every block of k.
+        for (uint p = groupIndex; p < sortSize; p += GROUP_SIZE)
+        {
+            uint partner = p ^ (k - 1);
+            if (partner > p)
+                sortPairLocal(p, partner);
+        }
+        GroupMemoryBarrierWithGroupSync();
+        mergeLocal(groupIndex, sortSize, k >> 2);
+    }
+}
+
+//a step of a merge between chunks, in device memory.
+void mergeStepGlobal(uint groupIndex, uint segmentOffset, uint segmentSize, uint mask)
+{
+    for (uint p = groupIndex; p < segmentSize; p += GROUP_SIZE)
+    {
+        uint partner = p ^ mask;
+        if (partner > p && partner < segmentSize)
+            sortPairGlobal(segmentOffset + p, segmentOffset + partner);
+    }
+    DeviceMemoryBarrierWithGroupSync();
+}
+
+uint nextPowerOfTwo(uint value)
+{
+    uint result = 1;
+    while (result < value)
+        result <<= 1;
+    return result;
+}
+
+[numthreads(GROUP_SIZE, 1, 1)]
+void csSegmentedSort(int3 groupID : SV_GroupID, int groupIndex : SV_GroupIndex)
+{
+    uint segment = groupID.y * groupCountX + groupID.x;
+    if (segment >= (uint)segmentCount)
+        return;
+
+    uint segmentOffset = g_segmentOffsets[segment];
+    uint segmentSize = g_segmentCounts[segment];
+    if (segmentSize <= 1)
+        return;
+
+    for (uint chunkBegin = 0; chunkBegin < segmentSize; chunkBegin += SORT_CAPACITY)
+    {
+        uint chunkSize = min(segmentSize - chunkBegin, SORT_CAPACITY);
+        uint sortSize = nextPowerOfTwo(chunkSize);
+        loadChunk(groupIndex, segmentOffset + chunkBegin, chunkSize, sortSize);
+        sortLocal(groupIndex, sortSize);
+        storeChunk(groupIndex, segmentOffset + chunkBegin, chunkSize);
+    }
+
+    //every block of k pairs is merged from its two sorted halves.
+    uint segmentSortSize = nextPowerOfTwo(segmentSize);
+    for (uint k = 2 * SORT_CAPACITY; k <= segmentSortSize; k <<= 1)
+    {
+        mergeStepGlobal(groupIndex, segmentOffset, segmentSize, k - 1);
+        for (uint j = k >> 2; j >= SORT_CAPACITY; j >>= 1)
+            mergeStepGlobal(groupIndex, segmentOffset, segmentSize, j);
+
+        for (uint mergeBegin = 0; mergeBegin < segmentSize; mergeBegin += SORT_CAPACITY)
+        {
+            uint chunkSize = min(segmentSize - mergeBegin, SORT_CAPACITY);
+            loadChunk(groupIndex, segmentOffset + mergeBegin, chunkSize, SORT_CAPACITY);
+            mergeLocal(groupIndex, SORT_CAPACITY, SORT_CAPACITY >> 1);
+            storeChunk(groupIndex, segmentOffset + mergeBegin, chunkSize);
+        }
+    }
+}
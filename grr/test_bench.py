@@ -2,7 +2,29 @@ import coalpy.gpu as g
 import numpy as np
 import math
 import functools
+import os
+import tempfile
 from . import prefix_sum as gpu_prefix_sum
+from . import prefix_sum_model
+from . import primitives
+from . import range_allocator
+from . import mesh
+from . import vertex_format
+from . import mesh_cache
+from . import obj_loader
+from . import meshlet
+from . import cluster_cull
+from . import camera
+from . import vertex_cache
+from . import instances
+from . import transform
+from . import scene_graph
+from . import gpugeo
+from . import raster
+from . import raster_reference
+from . import bench_raster
+from . import profiler
+from . import utilities
 
 def prefix_sum(input_data, is_exclusive = False):
     accum = 0
@@ -48,7 +70,867 @@ def test_cluster_gen_inclusive():
 def test_cluster_gen_exclusive():
     return test_cluster_gen(is_exclusive = True)
 
+# look-back model over runs of different sizes sharing one state: statuses of older epochs must be
+# ignored, and the partition counter must be back to 0 after every run.
+def test_prefix_sum_model():
+    rng = np.random.default_rng(0)
+    state = prefix_sum_model.allocate_state(128)
+    for (epoch, buffersz) in enumerate([1, 1000, 4000, 64 * 32, 3001], 1):
+        for is_exclusive in [False, True]:
+            input_data = rng.integers(0, 1000, size = buffersz)
+            (result, stats) = prefix_sum_model.run(state, input_data, epoch * 2 + int(is_exclusive), is_exclusive, partition_size = 32, resident_groups = 6, rng = rng)
+            if result.tolist() != prefix_sum(input_data.tolist(), is_exclusive) or state[0] != 0:
+                return False
+    return True
+
+def download_uint_buffer(buff, count):
+    dr = g.ResourceDownloadRequest(resource = buff)
+    dr.resolve()
+    return np.frombuffer(dr.data_as_bytearray(), dtype=np.uint32)[0:count].copy()
+
+# NumPy references of the primitives against the plain definitions.
+def test_primitives_reference():
+    rng = np.random.default_rng(0)
+    values = rng.integers(0, 1000, size = 3000).astype(np.uint32)
+    head_flags = (rng.random(3000) < 0.05).astype(np.uint32)
+    expected = []
+    for (i, (v, f)) in enumerate(zip(values.tolist(), head_flags.tolist())):
+        accum = v if f or i == 0 else accum + v
+        expected.append(accum)
+    keys = rng.integers(0, 1 << 32, size = 3000, dtype=np.uint64).astype(np.uint32)
+    (sorted_keys, sorted_values) = primitives.reference.radix_sort(keys, np.arange(3000))
+    return (primitives.reference.segmented_scan(values, head_flags).tolist() == expected
+        and np.array_equal(primitives.reference.segmented_scan(values, head_flags, is_exclusive = True), np.array(expected) - values)
+        and np.array_equal(sorted_values, np.argsort(keys, kind='stable')) and np.array_equal(sorted_keys, np.sort(keys))
+        and primitives.reference.compact(values, head_flags).tolist() == [v for (v, f) in zip(values.tolist(), head_flags.tolist()) if f])
+
+# every gpu primitive against its reference, over several partitions with a partial last one.
+def test_primitives(count = 70001):
+    rng = np.random.default_rng(1)
+    values = rng.integers(0, 1 << 20, size = count).astype(np.uint32)
+    flags = (rng.random(count) < 0.1).astype(np.uint32)
+    keys = rng.integers(0, 1 << 32, size = count, dtype=np.uint64).astype(np.uint32)
+    (values_buffer, flags_buffer, keys_buffer) = [g.Buffer(format = g.Format.R32_UINT, element_count = count) for _ in range(3)]
+    cmd_list = g.CommandList()
+    for (data, buff) in [(values, values_buffer), (flags, flags_buffer), (keys, keys_buffer)]:
+        cmd_list.upload_resource(source = data, destination = buff)
+    g.schedule(cmd_list)
+
+    def run(fn):
+        cmd_list = g.CommandList()
+        outputs = fn(cmd_list)
+        g.schedule(cmd_list)
+        return outputs
+
+    for op in [primitives.reduction.ReduceOp.Sum, primitives.reduction.ReduceOp.Min, primitives.reduction.ReduceOp.Max]:
+        reduce_buffer = run(lambda cmd_list: primitives.reduction.run(cmd_list, values_buffer, primitives.reduction.allocate_args(count), op))
+        if download_uint_buffer(reduce_buffer, 1)[0] != primitives.reference.reduce(values, op):
+            return False
+
+    scan_args = primitives.segmented_scan.allocate_args(count)
+    for is_exclusive in [False, True, False]:
+        scan_buffer = run(lambda cmd_list: primitives.segmented_scan.run(cmd_list, values_buffer, flags_buffer, scan_args, is_exclusive))
+        if not np.array_equal(download_uint_buffer(scan_buffer, count), primitives.reference.segmented_scan(values, flags, is_exclusive)):
+            return False
+
+    (compact_buffer, compact_count_buffer, compact_args_buffer) = run(lambda cmd_list: primitives.compact.run(cmd_list, values_buffer, flags_buffer, primitives.compact.allocate_args(count)))
+    expected = primitives.reference.compact(values, flags)
+    compact_count = int(download_uint_buffer(compact_count_buffer, 1)[0])
+    if compact_count != len(expected) or not np.array_equal(download_uint_buffer(compact_buffer, compact_count), expected):
+        return False
+    if download_uint_buffer(compact_args_buffer, 4).tolist() != [utilities.divup(len(expected), 64), 1, 1, 0]:
+        return False
+
+    #a small group count limit dispatches the partitions in rows, with padding groups in the last one.
+    max_group_count_x = primitives.radix_sort.g_max_group_count_x
+    for (key_bits, group_count_limit) in [(32, max_group_count_x), (12, max_group_count_x), (32, 7)]:
+        primitives.radix_sort.g_max_group_count_x = group_count_limit
+        (sorted_keys_buffer, sorted_values_buffer) = run(lambda cmd_list: primitives.radix_sort.run(cmd_list, keys_buffer, values_buffer, primitives.radix_sort.allocate_args(count), key_bits))
+        primitives.radix_sort.g_max_group_count_x = max_group_count_x
+        (sorted_keys, sorted_values) = primitives.reference.radix_sort(keys, values, key_bits)
+        if not np.array_equal(download_uint_buffer(sorted_keys_buffer, count), sorted_keys) or not np.array_equal(download_uint_buffer(sorted_values_buffer, count), sorted_values):
+            return False
+
+    #segments of every size up to several merges of sort capacity chunks, each sorted as a whole in place.
+    sort_capacity = primitives.segmented_sort.g_sort_capacity
+    segment_counts = rng.integers(0, 3 * sort_capacity, size = 24).astype(np.uint32)
+    segment_counts[0:7] = [0, 1, 2, sort_capacity, sort_capacity + 1, 4 * sort_capacity, 5 * sort_capacity + 7]
+    segment_offsets = (np.cumsum(segment_counts) - segment_counts).astype(np.uint32)
+    sort_count = int(np.sum(segment_counts))
+    sort_keys = rng.integers(0, 64, size = sort_count).astype(np.uint32)
+    sort_values = rng.permutation(sort_count).astype(np.uint32)
+    (sort_keys_buffer, sort_values_buffer) = [g.Buffer(format = g.Format.R32_UINT, element_count = sort_count) for _ in range(2)]
+    (offsets_buffer, counts_buffer) = [g.Buffer(format = g.Format.R32_UINT, element_count = len(segment_counts)) for _ in range(2)]
+    cmd_list = g.CommandList()
+    for (data, buff) in [(sort_keys, sort_keys_buffer), (sort_values, sort_values_buffer), (segment_offsets, offsets_buffer), (segment_counts, counts_buffer)]:
+        cmd_list.upload_resource(source = data, destination = buff)
+    primitives.segmented_sort.run(cmd_list, sort_keys_buffer, sort_values_buffer, offsets_buffer, counts_buffer, len(segment_counts))
+    g.schedule(cmd_list)
+    (sorted_keys, sorted_values) = primitives.reference.segmented_sort(sort_keys, sort_values, segment_offsets, segment_counts)
+    return np.array_equal(download_uint_buffer(sort_keys_buffer, sort_count), sorted_keys) and np.array_equal(download_uint_buffer(sort_values_buffer, sort_count), sorted_values)
+
+# random allocations and frees checked against an occupancy array, then compacted.
+def test_range_allocator():
+    rng = np.random.default_rng(0)
+    allocator = range_allocator.RangeAllocator(1024)
+    occupancy = np.zeros(allocator.capacity, dtype='i')
+    allocations = {}
+    for it in range(4000):
+        if rng.random() < 0.55 or not allocations:
+            size = int(rng.integers(1, 64))
+            offset = allocator.allocate(size)
+            if offset is None:
+                allocator.grow(allocator.capacity * 2)
+                occupancy = np.concatenate([occupancy, np.zeros(len(occupancy), dtype='i')])
+                offset = allocator.allocate(size)
+            if np.any(occupancy[offset:offset + size] != 0):
+                return False
+            occupancy[offset:offset + size] = 1
+            allocations[offset] = size
+        else:
+            offset = list(allocations.keys())[int(rng.integers(0, len(allocations)))]
+            occupancy[offset:offset + allocations.pop(offset)] = 0
+            allocator.free(offset)
+
+        free_ranges = allocator.free_ranges()
+        if allocator.used != np.sum(occupancy) or sum([sz for (_, sz) in free_ranges]) != allocator.free_size:
+            return False
+
+    move = allocator.compact_step()
+    while move is not None:
+        (src, dst, size) = move
+        allocations[dst] = allocations.pop(src)
+        move = allocator.compact_step()
+
+    packed_offsets = np.cumsum([0] + [sz for (_, sz) in sorted(allocations.items())])
+    return list(sorted(allocations.keys())) == packed_offsets[:-1].tolist() and allocator.fragmented_size == 0 and allocator.free_range_count <= 1
+
+# cache entries hit once stored, miss on a changed source size or content (and are stored again),
+# hit on a touched source with the same content, and corrupt entries are rebuilt instead of raising.
+def test_mesh_cache():
+    build_calls = []
+    def build(source_path):
+        build_calls.append(source_path)
+        with open(source_path, "rb") as f:
+            rng = np.random.default_rng(len(f.read()))
+        return mesh.MeshData(rng.uniform(-1.0, 1.0, (48, 3)).astype('f'), rng.permutation(48).astype(np.uint32).reshape((-1, 3)), "random")
+
+    def touch(source_path, mtime_offset):
+        st = os.stat(source_path)
+        os.utime(source_path, ns = (st.st_atime_ns, st.st_mtime_ns + mtime_offset))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache_dir = os.path.join(tmp_dir, "cache")
+        source_path = os.path.join(tmp_dir, "mesh.obj")
+        with open(source_path, "w") as f:
+            f.write("aaaa")
+
+        expected = build(source_path)
+        build_calls.clear()
+        stored = mesh_cache.load(source_path, build, cache_dir)
+        cached = mesh_cache.load(source_path, build, cache_dir)
+        if len(build_calls) != 1 or not np.array_equal(cached.vertices, expected.vertices) or not np.array_equal(cached.indices, stored.indices):
+            return False
+        #cached arrays are memory mapped, release them before the entry files get replaced.
+        del stored, cached
+
+        #same content, new mtime: hit, and the entry takes the new mtime.
+        touch(source_path, 10 ** 9)
+        mesh_cache.load(source_path, build, cache_dir)
+        entry_dir = mesh_cache._entry_dir(cache_dir, source_path)
+        if len(build_calls) != 1 or mesh_cache._read_meta(entry_dir)['mtime_ns'] != os.stat(source_path).st_mtime_ns:
+            return False
+
+        #same size, new content and mtime: miss, then the refreshed entry hits.
+        with open(source_path, "w") as f:
+            f.write("bbbb")
+        touch(source_path, 2 * 10 ** 9)
+        mesh_cache.load(source_path, build, cache_dir)
+        mesh_cache.load(source_path, build, cache_dir)
+        if len(build_calls) != 2:
+            return False
+
+        #new size: miss.
+        with open(source_path, "w") as f:
+            f.write("cccccc")
+        resized = mesh_cache.load(source_path, build, cache_dir)
+        if len(build_calls) != 3 or not np.array_equal(resized.vertices, build(source_path).vertices):
+            return False
+        del resized
+        build_calls.clear()
+
+        #corrupt arrays, then an unreadable meta: both rebuilt and stored again.
+        with open(os.path.join(entry_dir, "vertices.npy"), "wb") as f:
+            f.write(b"corrupt")
+        mesh_cache.load(source_path, build, cache_dir)
+        with open(os.path.join(entry_dir, mesh_cache.g_meta_file_name), "w") as f:
+            f.write("{ corrupt")
+        mesh_cache.load(source_path, build, cache_dir)
+        mesh_cache.load(source_path, build, cache_dir)
+        return len(build_calls) == 2
+
+# pool sizes of a new GpuGeo, ranges of registered meshes, reuse of a freed range and
+# compaction of the hole left, checking the rebased indices stay in their mesh vertex range.
+def test_gpugeo_pools():
+    geo = gpugeo.GpuGeo()
+    compact_geo = gpugeo.GpuGeo(vertex_format.VertexFormat.Compact)
+    if geo.vertex_buffer_byte_size != gpugeo.GpuGeo.vertex_pool_byte_size or compact_geo.vertex_allocator.capacity != gpugeo.GpuGeo.vertex_pool_byte_size // compact_geo.vertex_byte_size:
+        return False
+    if geo.index_allocator.capacity != gpugeo.GpuGeo.index_pool_byte_size // gpugeo.GpuGeo.triangle_byte_size or geo.index_buffer_byte_size > gpugeo.GpuGeo.index_pool_byte_size:
+        return False
+
+    rng = np.random.default_rng(0)
+    handles = [geo.register_mesh(random_mesh(rng, triangle_count, 1)) for triangle_count in [100, 50, 200]]
+    if geo.mesh_table['index_offset'].tolist() != [0, 300, 450] or geo.mesh_table['vertex_base'].tolist() != [0, 300, 450]:
+        return False
+
+    geo.unregister_mesh(handles[1])
+    if geo.vertex_allocator.used != 900 or geo.index_allocator.used != 300 or geo.vertex_allocator.free_ranges()[0] != (300, 150):
+        return False
+
+    # first fit, in the hole of the freed mesh. The upload then compacts what is left of the hole.
+    geo.begin_mesh_upload(random_mesh(rng, 20, 1))
+    if geo.vertex_allocator.free_ranges()[0] != (360, 90) or geo.index_allocator.free_ranges()[0] != (120, 30):
+        return False
+
+    while geo.vertex_allocator.fragmented_size + geo.index_allocator.fragmented_size > 0:
+        geo.update_uploads()
+    if geo.mesh_table['index_offset'].tolist() != [0, 300, 360] or geo.mesh_table['vertex_base'].tolist() != [0, 300, 360]:
+        return False
+
+    index_count = 3 * geo.index_allocator.high_water
+    pool_indices = download_uint_buffer(geo.m_index_buffer, index_count)
+    for m in geo.mesh_table:
+        mesh_indices = pool_indices[m['index_offset']:m['index_offset'] + 3 * m['triangle_count']]
+        if np.any(mesh_indices < m['vertex_base']) or np.any(mesh_indices >= m['vertex_base'] + m['vertex_count']):
+            return False
+
+    geo.unregister_all_meshes()
+    return geo.vertex_allocator.used == 0 and geo.index_allocator.used == 0 and geo.mesh_count == 0
+
+# compact vertices decode within the documented bounds, for a random mesh, a flat mesh and a
+# single point mesh, with normals on each axis, and encoding a slice at a time matches.
+def test_compact_vertex_format():
+    rng = np.random.default_rng(0)
+    vertices = np.zeros((336, 8), dtype='f')
+    vertices[0:300, 0:3] = rng.uniform(-20.0, 20.0, (300, 3))
+    vertices[300:330, 0:3] = rng.uniform(-5.0, 5.0, (30, 3))
+    vertices[300:330, 2] = 3.0
+    vertices[330:336, 0:3] = [7.0, -1.0, 2.0]
+    normals = rng.normal(size = (336, 3))
+    normals[0:6] = [[1, 0, 0], [-1, 0, 0], [0, 1, 0], [0, -1, 0], [0, 0, 1], [0, 0, -1]]
+    vertices[:, 3:6] = normals / np.linalg.norm(normals, axis=1)[:, np.newaxis]
+    vertices[:, 6:8] = rng.uniform(-4.0, 4.0, (336, 2))
+    vertices[0:2, 6:8] = [[0.0, 1.0], [1.0, 0.0]]
+    indices = np.arange(336, dtype=np.uint32).reshape((-1, 3))
+    mesh_table = mesh.build_mesh_table(vertices, indices, [100, 10, 2])
+
+    compact = vertex_format.encode_compact(vertices, mesh_table)
+    sliced = np.concatenate([vertex_format.encode_compact(vertices[b:e], mesh_table, b) for (b, e) in [(0, 250), (250, 310), (310, 336)]])
+    decoded = vertex_format.decode_compact(compact, mesh_table)
+    if not np.array_equal(compact, sliced) or not np.array_equal(vertex_format.decode_compact(sliced[250:], mesh_table, 250), decoded[250:]):
+        return False
+
+    mesh_ids = np.repeat(np.arange(3), [300, 30, 6])
+    (aabb_min, aabb_max) = (mesh_table['aabb_min'][mesh_ids], mesh_table['aabb_max'][mesh_ids])
+    position_bounds = 0.5 * (aabb_max - aabb_min) / 65535.0 + 4.0 * np.finfo('f').eps * np.maximum(np.abs(aabb_min), np.abs(aabb_max))
+    if np.any(np.abs(decoded[:, 0:3] - vertices[:, 0:3]) > position_bounds):
+        return False
+    # exact on the lower bounds and on flat axes.
+    at_min = vertices[:, 0:3] == aabb_min
+    if np.any(decoded[:, 0:3][at_min] != vertices[:, 0:3][at_min]) or np.any(decoded[300:336, 2] != vertices[300:336, 2]):
+        return False
+
+    cosines = np.sum(decoded[:, 3:6] * vertices[:, 3:6], axis=1)
+    if np.any(cosines < np.cos(np.radians(1.0))):
+        return False
+    uv_bounds = np.maximum(np.abs(vertices[:, 6:8]) * 2.0 ** -11, 2.0 ** -25)
+    return bool(np.all(np.abs(decoded[:, 6:8] - vertices[:, 6:8]) <= uv_bounds))
+
+# random small triangles facing +z, every other mesh facing -z.
+def random_mesh(rng, triangle_count, mesh_count):
+    vertices = np.zeros((triangle_count * 3, 8), dtype='f')
+    centers = rng.uniform(-20.0, 20.0, (triangle_count, 3))
+    shape = np.array([[0.0, 0.0, 0.0], [1.0, 0.0, 0.0], [0.0, 1.0, 0.0]])
+    vertices[:, 0:3] = np.repeat(centers, 3, axis=0) + np.tile(shape, (triangle_count, 1)) + rng.uniform(-0.2, 0.2, (triangle_count * 3, 3))
+    indices = np.arange(triangle_count * 3, dtype=np.uint32).reshape((-1, 3))
+    triangle_counts = np.diff(np.linspace(0, triangle_count, mesh_count + 1).astype(np.int64))
+    mesh_ids = np.repeat(np.arange(mesh_count), triangle_counts)
+    indices[mesh_ids % 2 == 1] = indices[mesh_ids % 2 == 1][:, ::-1]
+    mesh_table = mesh.build_mesh_table(vertices, indices, triangle_counts)
+    return mesh.MeshData(vertices, indices, "random", mesh_table)
+
+# mesh table ranges of contiguous meshes, with empty meshes first, in between and last.
+def test_mesh_table():
+    vertices = np.zeros((9, 8), dtype='f')
+    vertices[:, 0:3] = np.arange(27, dtype='f').reshape((9, 3))
+    indices = np.array([[0, 1, 2], [2, 1, 3], [4, 5, 6], [6, 7, 8]], dtype=np.uint32)
+    mesh_table = mesh.build_mesh_table(vertices, indices, [0, 2, 0, 0, 1, 1, 0])
+    if mesh_table['index_offset'].tolist() != [0, 0, 6, 6, 6, 9, 12] or mesh_table['triangle_count'].tolist() != [0, 2, 0, 0, 1, 1, 0]:
+        return False
+    if mesh_table['vertex_base'].tolist() != [0, 0, 4, 4, 4, 6, 9] or mesh_table['vertex_count'].tolist() != [0, 4, 0, 0, 3, 3, 0]:
+        return False
+    non_empty = [1, 4, 5]
+    if not np.array_equal(mesh_table['aabb_min'][non_empty], vertices[[0, 4, 6], 0:3]) or not np.array_equal(mesh_table['aabb_max'][non_empty], vertices[[3, 6, 8], 0:3]):
+        return False
+    return np.all(mesh_table['aabb_min'][[0, 2, 3, 6]] == 0) and np.all(mesh_table['aabb_max'][[0, 2, 3, 6]] == 0)
+
+# obj parser edge cases against hand written outputs: fan triangulated n-gons, negative indices
+# relative to the statements declared so far, and mixed v, v/vt, v//vn and v/vt/vn corners.
+def test_obj_loader():
+    positions = [[0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0], [0, 2, 0], [1, 2, 0]]
+    v_lines = "".join(["v %g %g %g\n" % tuple(p) for p in positions])
+
+    pentagon = obj_loader.parse_obj((v_lines + "f 1 2 3 4 5\n").encode())
+    if pentagon.indices.tolist() != [[0, 1, 2], [0, 2, 3], [0, 3, 4]] or not np.array_equal(pentagon.vertices[:, 0:3], positions):
+        return False
+
+    relative = obj_loader.parse_obj((v_lines[0:24] + "f -3 -2 -1\n" + v_lines[24:] + "f -3 -1 -2\nf 1 -1 -4\n").encode())
+    if relative.indices.tolist() != [[0, 1, 2], [3, 5, 4], [0, 5, 2]]:
+        return False
+
+    mixed = obj_loader.parse_obj((v_lines + "vt 0.25 0.5\nvt 0.75 1\nvn 0 0 1\nvn 0 1 0\nf 1 2/1 3//1 4/2/2\nf 4/2/1 3//1 5\n").encode())
+    # corners weld by (v, vt, vn), vertices ordered by v then vt then vn.
+    expected_vertices = np.array([
+        [0, 0, 0,  0, 0, 0,  0, 0],
+        [1, 0, 0,  0, 0, 0,  0.25, 0.5],
+        [1, 1, 0,  0, 0, 1,  0, 0],
+        [0, 1, 0,  0, 0, 1,  0.75, 1],
+        [0, 1, 0,  0, 1, 0,  0.75, 1],
+        [0, 2, 0,  0, 0, 0,  0, 0]], dtype='f')
+    if mixed.indices.tolist() != [[0, 1, 2], [0, 2, 4], [3, 2, 5]] or not np.array_equal(mixed.vertices, expected_vertices):
+        return False
+    if mixed.mesh_table['triangle_count'].tolist() != [3] or mixed.mesh_table['vertex_count'].tolist() != [6]:
+        return False
+
+    # a single corner format per line, but a different one on each line.
+    per_line = obj_loader.parse_obj((v_lines + "vt 0.25 0.5\nvt 0.75 1\nvn 0 0 1\nvn 0 1 0\nf 1/1 2/2 3/1\nf 3//1 4//2 5//1\nf 6 1 2\n").encode())
+    expected_vertices = np.array([
+        [0, 0, 0,  0, 0, 0,  0, 0],
+        [0, 0, 0,  0, 0, 0,  0.25, 0.5],
+        [1, 0, 0,  0, 0, 0,  0, 0],
+        [1, 0, 0,  0, 0, 0,  0.75, 1],
+        [1, 1, 0,  0, 0, 1,  0, 0],
+        [1, 1, 0,  0, 0, 0,  0.25, 0.5],
+        [0, 1, 0,  0, 1, 0,  0, 0],
+        [0, 2, 0,  0, 0, 1,  0, 0],
+        [1, 2, 0,  0, 0, 0,  0, 0]], dtype='f')
+    return per_line.indices.tolist() == [[1, 3, 5], [4, 6, 7], [8, 0, 2]] and np.array_equal(per_line.vertices, expected_vertices)
+
+# clusters cover every triangle once and their bounds contain their triangles.
+def test_meshlet_build():
+    mesh_data = meshlet.build(random_mesh(np.random.default_rng(0), 10000, 7))
+    clusters = mesh_data.clusters
+    if np.sum(clusters['triangle_count']) != mesh_data.triangle_count or np.any(clusters['triangle_count'] > meshlet.g_cluster_size):
+        return False
+    if np.any(clusters['triangle_offset'][1:] != clusters['triangle_offset'][:-1] + clusters['triangle_count'][:-1]):
+        return False
+    triangle_clusters = np.repeat(np.arange(len(clusters)), clusters['triangle_count'].astype(np.int64))
+    corners = mesh_data.vertices[mesh_data.indices.astype(np.int64), 0:3]
+    in_aabb = np.all(corners >= clusters['aabb_min'][triangle_clusters][:, np.newaxis, :]) and np.all(corners <= clusters['aabb_max'][triangle_clusters][:, np.newaxis, :])
+    distances = np.linalg.norm(corners - clusters['center'][triangle_clusters][:, np.newaxis, :], axis=2)
+    in_sphere = np.all(distances <= clusters['radius'][triangle_clusters][:, np.newaxis] * 1.0001 + 1e-5)
+    return bool(in_aabb and in_sphere)
+
+# gpu cluster culling of a few instances against the numpy reference.
+def test_cluster_cull(flags = 0):
+    clusters = meshlet.build(random_mesh(np.random.default_rng(1), 64000, 3)).clusters
+    cam = camera.Camera(1920, 1080)
+    cam.pos = np.array([0.0, 0.0, -30.0], dtype='f')
+    view_matrix = cam.view_matrix.astype('f')
+    proj_matrix = cam.proj_matrix.astype('f')
+
+    instance_table = instances.InstanceTable()
+    worlds = [np.identity(4, dtype='f'), np.diag([1.0, 2.0, 1.0, 1.0]).astype('f'), transform.Transform.Identity().astype('f')]
+    worlds[2][0:3, 3] = [15.0, 0.0, 10.0]
+    worlds[2][0:3, 0:3] = [[0.0, 0.0, 1.0], [0.0, 1.0, 0.0], [-1.0, 0.0, 0.0]]
+    for world in worlds:
+        instance_table.add(0, world)
+    table = instance_table.build_table({ 0 : (0, int(np.sum(clusters['triangle_count'])), 0, len(clusters)) })
+
+    cluster_buffer = g.Buffer(type = g.BufferType.Structured, stride = meshlet.g_cluster_dtype.itemsize, element_count = len(clusters))
+    instance_buffer = g.Buffer(type = g.BufferType.Structured, stride = instances.g_instance_dtype.itemsize, element_count = len(table))
+    cluster_count = len(clusters) * len(table)
+    cull_args = cluster_cull.allocate_args(cluster_count)
+    cmd_list = g.CommandList()
+    cmd_list.upload_resource(source = clusters.view(np.uint8), destination = cluster_buffer)
+    cmd_list.upload_resource(source = table.view(np.uint8), destination = instance_buffer)
+    (visible_buffer, count_buffer, _) = cluster_cull.run(cmd_list, cluster_buffer, instance_buffer, len(table), cluster_count, view_matrix, proj_matrix, cull_args, flags)
+    g.schedule(cmd_list)
+
+    dr = g.ResourceDownloadRequest(resource = count_buffer)
+    dr.resolve()
+    count = int(np.frombuffer(dr.data_as_bytearray(), dtype=np.uint32)[0])
+    dr = g.ResourceDownloadRequest(resource = visible_buffer)
+    dr.resolve()
+    visible = np.sort(np.frombuffer(dr.data_as_bytearray(), dtype=np.uint32)[0:count])
+
+    expected = np.concatenate([np.nonzero(meshlet.cull_clusters(clusters, view_matrix, proj_matrix, flags, world))[0] + i * len(clusters) for (i, world) in enumerate(worlds)])
+    return count > 0 and count < cluster_count and np.array_equal(visible, expected)
+
+def test_cluster_cull_frustum():
+    return test_cluster_cull(flags = 0)
+
+def test_cluster_cull_backface():
+    return test_cluster_cull(flags = meshlet.ClusterCullFlags.CLUSTER_CULL_FLAGS_BACKFACE)
+
+# vertex cache optimization keeps the triangles of each cluster and lowers the cache misses.
+def test_vertex_cache():
+    rng = np.random.default_rng(2)
+    grid = np.arange(64 * 64).reshape((64, 64))
+    quads = np.stack([grid[:-1, :-1], grid[:-1, 1:], grid[1:, 1:], grid[1:, :-1]], axis=-1).reshape((-1, 4))
+    indices = np.concatenate([quads[:, [0, 1, 2]], quads[:, [0, 2, 3]]])
+    indices = indices[rng.permutation(len(indices))].astype(np.uint32)
+    vertices = np.zeros((64 * 64, 8), dtype='f')
+    vertices[:, 0:2] = np.stack(np.unravel_index(np.arange(64 * 64), (64, 64)), axis=1)
+    mesh_data = meshlet.build(mesh.MeshData(vertices, indices, "grid"), reorder = False)
+    optimized = vertex_cache.optimize(mesh_data)
+
+    def cluster_triangles(md, offset, count):
+        corners = md.vertices[md.indices[offset:offset + count].astype(np.int64), 0:2]
+        return sorted([tuple(sorted(map(tuple, tri.tolist()))) for tri in corners])
+
+    clusters = mesh_data.clusters
+    for (offset, count) in zip(clusters['triangle_offset'], clusters['triangle_count']):
+        if cluster_triangles(mesh_data, offset, count) != cluster_triangles(optimized, offset, count):
+            return False
+    return vertex_cache.cache_metrics(optimized.indices)['acmr'] < vertex_cache.cache_metrics(mesh_data.indices)['acmr']
+
+# instance adds / moves / removes against a dict, and the virtual ranges of the gpu table.
+def test_instance_table():
+    rng = np.random.default_rng(3)
+    instance_table = instances.InstanceTable(capacity = 4)
+    expected = {}
+    for it in range(2000):
+        op = rng.random()
+        if op < 0.5 or not expected:
+            world = rng.random((4, 4)).astype('f')
+            handle = int(rng.integers(0, 4))
+            expected[instance_table.add(handle, world)] = (handle, world)
+        elif op < 0.8:
+            instance_id = list(expected.keys())[int(rng.integers(0, len(expected)))]
+            world = rng.random((4, 4)).astype('f')
+            instance_table.move(instance_id, world)
+            expected[instance_id] = (expected[instance_id][0], world)
+        else:
+            instance_id = list(expected.keys())[int(rng.integers(0, len(expected)))]
+            instance_table.remove(instance_id)
+            del expected[instance_id]
+
+    if sorted(instance_table.ids()) != sorted(expected.keys()):
+        return False
+    for (instance_id, (handle, world)) in expected.items():
+        if instance_table.mesh_handle(instance_id) != handle or not np.array_equal(instance_table.world_matrix(instance_id), world):
+            return False
+
+    #mesh 3 is not resident, its instances are skipped.
+    mesh_ranges = { 0 : (0, 10, 0, 1), 1 : (10, 100, 1, 2), 2 : (110, 1000, 3, 16) }
+    table = instance_table.build_table(mesh_ranges)
+    resident_count = len([h for (h, _) in expected.values() if h in mesh_ranges])
+    virtual_ends = table['virtual_triangle_offset'].astype(np.int64) + table['triangle_count']
+    return len(table) == resident_count and table['virtual_triangle_offset'][0] == 0 and np.array_equal(virtual_ends[:-1], table['virtual_triangle_offset'][1:])
+
+# batched TRS matrices and closed form inverses against Transform.
+def test_transform_array():
+    rng = np.random.default_rng(4)
+    count = 256
+    transforms = transform.TransformArray(count)
+    translations = rng.normal(size = (count, 3)).astype('f')
+    rotations = rng.normal(size = (count, 4)).astype('f')
+    scales = rng.uniform(0.1, 4.0, size = (count, 3)).astype('f')
+    transforms.set_translations(slice(None), translations)
+    transforms.set_rotations(slice(None), rotations)
+    transforms.set_scales(slice(None), scales)
+    if len(transforms.update_mats()) != count or len(transforms.update_mats()) != 0:
+        return False
+
+    for i in range(count):
+        t = transform.Transform()
+        t.translation = translations[i]
+        t.scale = scales[i]
+        t.rotation = np.quaternion(*rotations[i].tolist()).normalized()
+        if not np.allclose(t.transform_matrix, transforms.transform_matrices[i], atol = 1e-4):
+            return False
+        if not np.allclose(t.transform_inv_matrix, transforms.transform_inv_matrices[i], atol = 1e-3):
+            return False
+
+    #views are read only, writing through them would skip the dirty mask.
+    try:
+        transforms.translations[0] = 0.0
+        return False
+    except ValueError:
+        pass
+    return True
+
+def test_scene_graph():
+    rng = np.random.default_rng(5)
+    graph = scene_graph.SceneGraph()
+    graph.add_nodes([-1, -1])
+    for i in range(8):
+        graph.add_nodes(rng.integers(-1, graph.node_count, size = 64))
+
+    def check():
+        graph.update()
+        for node in range(graph.node_count):
+            world = np.identity(4, dtype='f')
+            ancestor = node
+            while ancestor >= 0:
+                world = np.matmul(graph.local_transforms.transform_matrices[ancestor], world)
+                ancestor = graph.parent(ancestor)
+            if not np.allclose(world, graph.world_matrices[node], atol = 1e-3):
+                return False
+            if not np.allclose(np.matmul(graph.world_matrices[node], graph.world_inv_matrices[node]), np.identity(4), atol = 1e-3):
+                return False
+        return True
+
+    for i in range(3):
+        nodes = rng.choice(graph.node_count, size = 16, replace = False)
+        graph.set_translations(nodes, rng.normal(size = (16, 3)).astype('f'))
+        graph.set_rotations(nodes, rng.normal(size = (16, 4)).astype('f'))
+        graph.set_scales(nodes, rng.uniform(0.5, 2.0, size = (16, 3)).astype('f'))
+        if not check():
+            return False
+
+    #only the subtrees of the changed nodes are recomputed.
+    node = int(rng.integers(0, graph.node_count))
+    graph.set_translations(node, [1.0, 2.0, 3.0])
+    if sorted(graph.update().tolist()) != sorted(graph.subtree_nodes(node).tolist()):
+        return False
+
+    graph.set_parent(int(graph.subtree_nodes(0)[-1]), 1)
+    for (node, parent) in [(0, int(graph.subtree_nodes(0)[-1])), (graph.node_count, 0), (-1, 0), (0, graph.node_count), (0, -2)]:
+        try:
+            graph.set_parent(node, parent)
+            return False
+        except ValueError:
+            pass
+    return check()
+
+# numpy reference alone on a known scene in clip space (identity matrices), 96x64 pixels so
+# 3x2 coarse tiles: a full screen triangle at depth 0.5, a back facing full screen triangle
+# in front of it, binned but never drawn, and a quad at depth 0.75 over the pixels of tile 0.
+def test_reference_rasterizer_cpu(w = 96, h = 64):
+    corners = [
+        [-1.0, -1.0, 0.5], [3.0, -1.0, 0.5], [-1.0, 3.0, 0.5],
+        [-1.0, -1.0, 0.9], [-1.0, 3.0, 0.9], [3.0, -1.0, 0.9],
+        [-1.0, -1.0, 0.75], [-1.0 / 3.0, -1.0, 0.75], [-1.0 / 3.0, 0.0, 0.75],
+        [-1.0, -1.0, 0.75], [-1.0 / 3.0, 0.0, 0.75], [-1.0, 0.0, 0.75]]
+    vertices = np.zeros((len(corners), 8), dtype='f')
+    vertices[:, 0:3] = corners
+    mesh_data = mesh.MeshData(vertices, np.arange(len(corners), dtype=np.uint32).reshape((-1, 3)), "clip_space")
+    reference = raster_reference.ReferenceRasterizer()
+    reference.rasterize(w, h, np.identity(4, dtype='f'), np.identity(4, dtype='f'), mesh_data)
+
+    if reference.bin_counts.tolist() != [4, 2, 2, 2, 2, 2] or reference.bin_offsets.tolist() != [0, 4, 6, 8, 10, 12]:
+        return False
+    if reference.bin_elements.tolist() != [0, 1, 2, 3] + [0, 1] * 5:
+        return False
+
+    expected_depth = np.full((h, w), 0.5, dtype='f')
+    expected_depth[0:32, 0:32] = 0.75
+    if not np.array_equal(reference.depth_buffer, expected_depth):
+        return False
+
+    #one triangle per 8x8 fine tile, two over the quad and three along its diagonal.
+    expected_fine_counts = np.ones((h // 8, w // 8), dtype=np.uint32)
+    expected_fine_counts[0:4, 0:4] += 1 + np.identity(4, dtype=np.uint32)
+    if not np.array_equal(reference.fine_tile_counts, expected_fine_counts.reshape(-1)):
+        return False
+
+    #barycentrics of the full screen triangle at the pixel centers outside the quad.
+    (y, x) = np.mgrid[0:h, 0:w]
+    (hx, hy) = ((x + 0.5) / w * 2.0 - 1.0, (y + 0.5) / h * 2.0 - 1.0)
+    expected_barycentrics = np.stack([1.0 - (hx + 1.0) / 4.0 - (hy + 1.0) / 4.0, (hx + 1.0) / 4.0, (hy + 1.0) / 4.0], axis=-1)
+    outside_quad = expected_depth == 0.5
+    return np.allclose(reference.visibility_buffer[outside_quad][:, 0:3], expected_barycentrics[outside_quad], atol = 1e-6)
+
+# random_mesh clusters registered in a GpuGeo, and a camera at cam_pos looking down +z at them.
+def make_random_scene(seed, w, h, cam_pos, triangle_count = 20000):
+    mesh_data = meshlet.build(random_mesh(np.random.default_rng(seed), triangle_count, 2))
+    cam = camera.Camera(w, h)
+    cam.pos = np.array(cam_pos, dtype='f')
+    geo = gpugeo.GpuGeo()
+    geo.register_mesh(mesh_data)
+    return (mesh_data, cam, geo)
+
+# gpu rasterizer against the numpy reference: same bins, and the same visibility buffer
+# up to the 8 bit quantization, except on depth ties resolved in a different order.
+def test_reference_rasterizer(w = 640, h = 384):
+    (mesh_data, cam, geo) = make_random_scene(6, w, h, [0.0, 0.0, -30.0])
+    view_matrix = cam.view_matrix.astype('f')
+    proj_matrix = cam.proj_matrix.astype('f')
+
+    rasterizer = raster.Rasterizer(w, h)
+    cmd_list = g.CommandList()
+    rasterizer.rasterize(cmd_list, w, h, view_matrix, proj_matrix, geo)
+    g.schedule(cmd_list)
+
+    dr = g.ResourceDownloadRequest(resource = rasterizer.m_bin_counter_buffer)
+    dr.resolve()
+    (tiles_w, tiles_h) = rasterizer.get_tile_size(w, h)
+    bin_counts = np.frombuffer(dr.data_as_bytearray(), dtype=np.uint32)[0:tiles_w * tiles_h]
+    dr = g.ResourceDownloadRequest(resource = rasterizer.visibility_buffer)
+    dr.resolve()
+    visibility = np.frombuffer(dr.data_as_bytearray(), dtype=np.uint8)[0:w * h * 4].reshape((h, w, 4)) / 255.0
+
+    reference = raster_reference.ReferenceRasterizer()
+    reference.rasterize(w, h, view_matrix, proj_matrix, mesh_data, geo.instance_table)
+    mismatches = np.count_nonzero(np.any(np.abs(visibility - reference.visibility_buffer) > 1.5 / 255.0, axis=2))
+    return np.array_equal(bin_counts, reference.bin_counts) and mismatches < w * h * 0.001
+
+# depth sorted bins: same bins and image as the unsorted ones, and every bin nearest first.
+def test_depth_sorted_bins(w = 640, h = 384):
+    (_, cam, geo) = make_random_scene(7, w, h, [0.0, 0.0, -30.0])
+    rasterizer = raster.Rasterizer(w, h)
+    (tiles_w, tiles_h) = rasterizer.get_tile_size(w, h)
+    results = []
+    for depth_sorted_bins in [False, True]:
+        cmd_list = g.CommandList()
+        rasterizer.rasterize(cmd_list, w, h, cam.view_matrix, cam.proj_matrix, geo, raster.ViewSettings(depth_sorted_bins = depth_sorted_bins, cluster_culling = False))
+        g.schedule(cmd_list)
+        bin_counts = download_uint_buffer(rasterizer.m_bin_counter_buffer, tiles_w * tiles_h)
+        bin_offsets = download_uint_buffer(rasterizer.m_bin_offsets_buffer, tiles_w * tiles_h)
+        dr = g.ResourceDownloadRequest(resource = rasterizer.visibility_buffer)
+        dr.resolve()
+        visibility = np.frombuffer(dr.data_as_bytearray(), dtype=np.uint8)[0:w * h * 4].reshape((h, w, 4)).astype('i')
+        results.append((bin_counts, visibility))
+
+    record_count = int(np.sum(bin_counts))
+    keys = download_uint_buffer(rasterizer.m_bin_sort_key_buffer, record_count)
+    for (offset, count) in zip(bin_offsets.tolist(), bin_counts.tolist()):
+        if np.any(np.diff(keys[offset:offset + min(count, primitives.segmented_sort.g_sort_capacity)].astype(np.int64)) < 0):
+            return False
+    mismatches = np.count_nonzero(np.any(np.abs(results[0][1] - results[1][1]) > 1, axis=2))
+    return np.array_equal(results[0][0], results[1][0]) and mismatches < w * h * 0.001
+
+# bin records start too small: the overflowing frames drop records, then the capacity grows from the
+# readbacks, and the image rasterized over several fine passes matches the single pass one.
+def test_bin_record_growth(w = 640, h = 384, max_frames = 32):
+    (_, cam, geo) = make_random_scene(8, w, h, [0.0, 0.0, -30.0])
+    (tiles_w, tiles_h) = raster.Rasterizer(w, h).get_tile_size(w, h)
+    def render(rasterizer):
+        cmd_list = g.CommandList()
+        rasterizer.rasterize(cmd_list, w, h, cam.view_matrix, cam.proj_matrix, geo, raster.ViewSettings(cluster_culling = False))
+        g.schedule(cmd_list)
+        dr = g.ResourceDownloadRequest(resource = rasterizer.visibility_buffer)
+        dr.resolve()
+        return (download_uint_buffer(rasterizer.m_bin_counter_buffer, tiles_w * tiles_h), np.frombuffer(dr.data_as_bytearray(), dtype=np.uint8)[0:w * h * 4].reshape((h, w, 4)).astype('i'))
+
+    (bin_counts, visibility) = render(raster.Rasterizer(w, h))
+    rasterizer = raster.Rasterizer(w, h)
+    rasterizer.allocate_bin_records(1024)
+    rasterizer.fine_raster_pass_element_count = 64
+    (overflow_counts, _) = render(rasterizer)
+    if int(np.sum(overflow_counts)) != 1024 or int(np.sum(bin_counts)) <= 1024:
+        return False
+
+    for _ in range(max_frames):
+        (multi_pass_counts, multi_pass_visibility) = render(rasterizer)
+        if rasterizer.bin_record_capacity >= int(np.sum(bin_counts)) and rasterizer.fine_raster_pass_count > 1:
+            break
+    (multi_pass_counts, multi_pass_visibility) = render(rasterizer)
+    mismatches = np.count_nonzero(np.any(np.abs(visibility - multi_pass_visibility) > 1, axis=2))
+    return rasterizer.fine_raster_pass_count > 1 and np.array_equal(bin_counts, multi_pass_counts) and mismatches < w * h * 0.001
+
+# bin counts, per bin sorted elements and visibility of a frame, to compare rasterizer variants.
+def rasterize_bins(rasterizer, geo, cam, w, h, view_settings):
+    (tiles_w, tiles_h) = rasterizer.get_tile_size(w, h)
+    cmd_list = g.CommandList()
+    rasterizer.rasterize(cmd_list, w, h, cam.view_matrix, cam.proj_matrix, geo, view_settings)
+    g.schedule(cmd_list)
+    bin_counts = download_uint_buffer(rasterizer.m_bin_counter_buffer, tiles_w * tiles_h)
+    bin_offsets = download_uint_buffer(rasterizer.m_bin_offsets_buffer, tiles_w * tiles_h)
+    elements = download_uint_buffer(rasterizer.m_bin_element_buffer, int(np.sum(bin_counts)))
+    bins = [np.sort(elements[offset:offset + count]) for (offset, count) in zip(bin_offsets.tolist(), bin_counts.tolist())]
+    dr = g.ResourceDownloadRequest(resource = rasterizer.visibility_buffer)
+    dr.resolve()
+    return (bin_counts, bins, np.frombuffer(dr.data_as_bytearray(), dtype=np.uint8)[0:w * h * 4].reshape((h, w, 4)).astype('i'))
+
+def same_bins(a, b, w, h):
+    ((counts, bins, visibility), (other_counts, other_bins, other_visibility)) = (a, b)
+    mismatches = np.count_nonzero(np.any(np.abs(visibility - other_visibility) > 1, axis=2))
+    return np.array_equal(counts, other_counts) and all([np.array_equal(x, y) for (x, y) in zip(bins, other_bins)]) and mismatches < w * h * 0.001
+
+# packed and full bin records: same bins, same elements per bin, same image.
+def test_bin_record_layouts(w = 640, h = 384):
+    (_, cam, geo) = make_random_scene(9, w, h, [0.0, 0.0, -30.0])
+    results = []
+    for layout in [raster.BinRecordLayout.Full, raster.BinRecordLayout.Packed]:
+        rasterizer = raster.Rasterizer(w, h, layout)
+        if rasterizer.bin_record_layout != layout:
+            return False
+        results.append(rasterize_bins(rasterizer, geo, cam, w, h, raster.ViewSettings(cluster_culling = False)))
+    return same_bins(results[0], results[1], w, h)
+
+# load balanced binning, with every triangle expanded: same bins, elements and image as the
+# triangle per thread binning, with and without cluster culling.
+def test_load_balanced_binning(w = 640, h = 384):
+    (_, cam, geo) = make_random_scene(10, w, h, [0.0, 0.0, -12.0])
+    rasterizer = raster.Rasterizer(w, h)
+    rasterizer.bin_expand_tile_threshold = 0
+    for cluster_culling in [False, True]:
+        results = [rasterize_bins(rasterizer, geo, cam, w, h, raster.ViewSettings(cluster_culling = cluster_culling, load_balanced_binning = load_balanced_binning)) for load_balanced_binning in [False, True]]
+        if not same_bins(results[0], results[1], w, h):
+            return False
+    return True
+
+# group staged binning, with stages filling up several times per group: same bins, elements and
+# image as two global atomics per record.
+def test_staged_binning(w = 640, h = 384):
+    (_, cam, geo) = make_random_scene(11, w, h, [0.0, 0.0, -8.0])
+    rasterizer = raster.Rasterizer(w, h)
+    results = []
+    for staged_binning in [False, True]:
+        rasterizer.staged_binning = staged_binning
+        results.append(rasterize_bins(rasterizer, geo, cam, w, h, raster.ViewSettings(cluster_culling = False)))
+    return same_bins(results[0], results[1], w, h)
+
+# the fine raster tile list holds the non-empty coarse tiles in order, and the fine tiles of
+# the empty ones shade nothing.
+def test_occupied_tiles(w = 640, h = 384):
+    (_, cam, geo) = make_random_scene(12, w, h, [10.0, 0.0, -60.0], 2000)
+    rasterizer = raster.Rasterizer(w, h)
+    (tiles_w, tiles_h) = rasterizer.get_tile_size(w, h)
+    (fine_tiles_w, fine_tiles_h) = rasterizer.get_fine_tile_size(w, h)
+    cmd_list = g.CommandList()
+    rasterizer.rasterize(cmd_list, w, h, cam.view_matrix, cam.proj_matrix, geo, raster.ViewSettings(debug_fine_tiles = True))
+    g.schedule(cmd_list)
+    bin_counts = download_uint_buffer(rasterizer.m_bin_counter_buffer, tiles_w * tiles_h)
+    occupied_count = int(download_uint_buffer(rasterizer.m_occupied_tile_count_buffer, 1)[0])
+    occupied_tiles = download_uint_buffer(rasterizer.m_occupied_tiles_buffer, occupied_count)
+    fine_counts = download_uint_buffer(rasterizer.m_fine_tile_counter_buffer, fine_tiles_w * fine_tiles_h).reshape((fine_tiles_h, fine_tiles_w))
+    empty_tiles = np.repeat(np.repeat((bin_counts == 0).reshape((tiles_h, tiles_w)), 4, axis=0), 4, axis=1)[0:fine_tiles_h, 0:fine_tiles_w]
+    if occupied_count == 0 or occupied_count == tiles_w * tiles_h:
+        return False
+    return np.array_equal(occupied_tiles, np.flatnonzero(bin_counts)) and not np.any(fine_counts[empty_tiles])
+
+# fine bins: every fine bin holds triangles of its coarse bin, fewer triangle visits per pixel,
+# and the same image as the coarse bins, depth sorted or not.
+def test_fine_bins(w = 640, h = 384):
+    (_, cam, geo) = make_random_scene(13, w, h, [0.0, 0.0, -12.0])
+    rasterizer = raster.Rasterizer(w, h)
+    (tiles_w, tiles_h) = rasterizer.get_tile_size(w, h)
+    (fine_tiles_w, fine_tiles_h) = rasterizer.get_fine_tile_size(w, h)
+    for depth_sorted_bins in [False, True]:
+        (_, _, visibility) = rasterize_bins(rasterizer, geo, cam, w, h, raster.ViewSettings(depth_sorted_bins = depth_sorted_bins, cluster_culling = False))
+        (bin_counts, bins, fine_visibility) = rasterize_bins(rasterizer, geo, cam, w, h, raster.ViewSettings(depth_sorted_bins = depth_sorted_bins, cluster_culling = False, fine_bins = True))
+        (coarse_visits, fine_visits) = rasterizer.read_triangle_visits_per_pixel(w, h, fine_bins = True)
+        fine_counts = download_uint_buffer(rasterizer.m_fine_bin_counter_buffer, fine_tiles_w * fine_tiles_h)
+        fine_offsets = download_uint_buffer(rasterizer.m_fine_bin_offsets_buffer, fine_tiles_w * fine_tiles_h)
+        fine_elements = download_uint_buffer(rasterizer.m_fine_bin_element_buffer, int(np.sum(fine_counts)))
+        for fine_tile_id in range(fine_tiles_w * fine_tiles_h):
+            tile_id = (fine_tile_id // fine_tiles_w // 4) * tiles_w + (fine_tile_id % fine_tiles_w) // 4
+            fine_bin = fine_elements[fine_offsets[fine_tile_id]:fine_offsets[fine_tile_id] + fine_counts[fine_tile_id]]
+            if not np.all(np.isin(fine_bin, bins[tile_id])):
+                return False
+        mismatches = np.count_nonzero(np.any(np.abs(visibility - fine_visibility) > 1, axis=2))
+        if fine_visits is None or not (0 < fine_visits < coarse_visits) or mismatches >= w * h * 0.001:
+            return False
+    return True
+
+# binning passes and fine raster reading the binning's triangle setups: same bins, fine bins and
+# image as transforming the triangles again, with cluster culling, load balanced binning and fine bins.
+def test_triangle_setup(w = 640, h = 384):
+    (_, cam, geo) = make_random_scene(14, w, h, [0.0, 0.0, -12.0])
+    rasterizer = raster.Rasterizer(w, h)
+    rasterizer.bin_expand_tile_threshold = 0
+    (fine_tiles_w, fine_tiles_h) = rasterizer.get_fine_tile_size(w, h)
+    def download_fine_bins():
+        fine_counts = download_uint_buffer(rasterizer.m_fine_bin_counter_buffer, fine_tiles_w * fine_tiles_h)
+        fine_offsets = download_uint_buffer(rasterizer.m_fine_bin_offsets_buffer, fine_tiles_w * fine_tiles_h)
+        fine_elements = download_uint_buffer(rasterizer.m_fine_bin_element_buffer, int(np.sum(fine_counts)))
+        return (fine_counts, [np.sort(fine_elements[offset:offset + count]) for (offset, count) in zip(fine_offsets.tolist(), fine_counts.tolist())])
+    for cluster_culling in [False, True]:
+        for load_balanced_binning in [False, True]:
+            for fine_bins in [False, True]:
+                results = []
+                fine_results = []
+                for triangle_setup in [False, True]:
+                    rasterizer.triangle_setup = triangle_setup
+                    results.append(rasterize_bins(rasterizer, geo, cam, w, h, raster.ViewSettings(cluster_culling = cluster_culling, load_balanced_binning = load_balanced_binning, fine_bins = fine_bins)))
+                    if fine_bins:
+                        fine_results.append(download_fine_bins())
+                if not same_bins(results[0], results[1], w, h):
+                    return False
+                if fine_bins:
+                    ((fine_counts, fine_bin_list), (other_fine_counts, other_fine_bin_list)) = fine_results
+                    if not np.array_equal(fine_counts, other_fine_counts) or not all([np.array_equal(x, y) for (x, y) in zip(fine_bin_list, other_fine_bin_list)]):
+                        return False
+    return rasterizer.triangle_setup_byte_size == geo.instance_triangle_count * raster.g_triangle_setup_byte_size
+
+# regressions are medians slower than the threshold, runs missing from the baseline are skipped.
+def test_bench_compare():
+    def report(fine_raster_times, scene = "teapot", config = "default"):
+        markers = { 'fine_raster' : bench_raster.summarize(fine_raster_times), 'raster_binning' : bench_raster.summarize([0.001] * 8) }
+        return { 'runs' : [{ 'scene' : scene, 'resolution' : "1080p", 'config' : config, 'path' : "orbit", 'markers' : markers }] }
+    baseline = report([0.002] * 8)
+    regressions = bench_raster.compare_reports(report([0.0025] * 8), baseline, threshold = 0.1)
+    if regressions != [(("teapot", "1080p", "default", "orbit"), 'fine_raster', 2.0, 2.5)]:
+        return False
+    if baseline['runs'][0]['markers']['fine_raster']['p95_ms'] != 2.0:
+        return False
+
+    #runs of a baseline without configurations compare against the default configuration.
+    del baseline['runs'][0]['config']
+    if len(bench_raster.compare_reports(report([0.0025] * 8), baseline)) != 1:
+        return False
+    return bench_raster.compare_reports(report([0.00205] * 8), baseline) == [] and bench_raster.compare_reports(report([0.1] * 8, "cube"), baseline) == [] and bench_raster.compare_reports(report([0.1] * 8, config = "other"), baseline) == []
+
+# bounded in flight captures, per marker histories and the cpu / gpu tracks of the trace.
+def test_profiler(frame_count = 40):
+    frame_profiler = profiler.Profiler(max_in_flight = 2, history_capacity = 16)
+    clear_buffer = g.Buffer(format = g.Format.R32_UINT, element_count = 1024)
+    for i in range(frame_count):
+        frame_profiler.begin_capture()
+        with profiler.cpu_marker("record"):
+            cmd_list = g.CommandList()
+            cmd_list.begin_marker("clear")
+            utilities.clear_uint_buffer(cmd_list, 0, clear_buffer, 0, 1024)
+            cmd_list.end_marker()
+            g.schedule(cmd_list)
+        frame_profiler.end_capture()
+        if len(frame_profiler.m_in_flight) > 2:
+            return False
+    frame_profiler.flush()
+
+    if profiler.cpu_marker("record") is not profiler.g_null_cpu_marker:
+        return False
+    gpu_stats = frame_profiler.marker_stats("clear")
+    cpu_stats = frame_profiler.marker_stats("record", cpu = True)
+    if gpu_stats is None or cpu_stats is None or not (gpu_stats['min'] <= gpu_stats['p50'] <= gpu_stats['p99']):
+        return False
+    events = frame_profiler.trace_events()
+    return len([e for e in events if e['name'] == "clear" and e['tid'] == 1]) == frame_count and len([e for e in events if e['name'] == "record" and e['tid'] == 0]) == frame_count
+
 if __name__ == "__main__":
     run_test("test prefix sum inclusive", test_cluster_gen_inclusive)
     run_test("test prefix sum exclusive", test_cluster_gen_exclusive)
+    run_test("test prefix sum model", test_prefix_sum_model)
+    run_test("test primitives reference", test_primitives_reference)
+    run_test("test primitives", test_primitives)
+    run_test("test range allocator", test_range_allocator)
+    run_test("test compact vertex format", test_compact_vertex_format)
+    run_test("test gpugeo pools", test_gpugeo_pools)
+    run_test("test mesh cache", test_mesh_cache)
+    run_test("test mesh table", test_mesh_table)
+    run_test("test obj loader", test_obj_loader)
+    run_test("test meshlet build", test_meshlet_build)
+    run_test("test cluster cull frustum", test_cluster_cull_frustum)
+    run_test("test cluster cull backface", test_cluster_cull_backface)
+    run_test("test vertex cache", test_vertex_cache)
+    run_test("test instance table", test_instance_table)
+    run_test("test transform array", test_transform_array)
+    run_test("test scene graph", test_scene_graph)
+    run_test("test reference rasterizer cpu", test_reference_rasterizer_cpu)
+    run_test("test reference rasterizer", test_reference_rasterizer)
+    run_test("test depth sorted bins", test_depth_sorted_bins)
+    run_test("test bin record growth", test_bin_record_growth)
+    run_test("test bin record layouts", test_bin_record_layouts)
+    run_test("test load balanced binning", test_load_balanced_binning)
+    run_test("test staged binning", test_staged_binning)
+    run_test("test occupied tiles", test_occupied_tiles)
+    run_test("test fine bins", test_fine_bins)
+    run_test("test triangle setup", test_triangle_setup)
+    run_test("test bench compare", test_bench_compare)
+    run_test("test profiler", test_profiler)
 
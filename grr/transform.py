@@ -148,3 +148,144 @@ def projection_matrix_from_aspect(fov, aspect, n, f):
 
 def to_radians():
     return np.pi * 2.0 / 360.0
+
+# (N,4) quaternions (w, x, y, z) into (N,3,3) rotation matrices, quaternions are normalized.
+def rotation_matrices(rotations):
+    q = rotations / np.maximum(np.linalg.norm(rotations, axis=1), 1e-30)[:, np.newaxis]
+    (w, x, y, z) = (q[:, 0], q[:, 1], q[:, 2], q[:, 3])
+    m = np.empty((len(q), 3, 3), dtype=rotations.dtype)
+    m[:, 0, 0] = 1.0 - 2.0 * (y * y + z * z)
+    m[:, 0, 1] = 2.0 * (x * y - w * z)
+    m[:, 0, 2] = 2.0 * (x * z + w * y)
+    m[:, 1, 0] = 2.0 * (x * y + w * z)
+    m[:, 1, 1] = 1.0 - 2.0 * (x * x + z * z)
+    m[:, 1, 2] = 2.0 * (y * z - w * x)
+    m[:, 2, 0] = 2.0 * (x * z - w * y)
+    m[:, 2, 1] = 2.0 * (y * z + w * x)
+    m[:, 2, 2] = 1.0 - 2.0 * (x * x + y * y)
+    return m
+
+# (N,4,4) T * R * S matrices and their inverses, S^-1 * R^T * T^-1, without a general inverse.
+# Zero scales invert to zero.
+def trs_matrices(translations, rotations, scales):
+    r = rotation_matrices(rotations)
+    inv_scales = np.where(scales != 0.0, 1.0 / np.where(scales != 0.0, scales, 1.0), 0.0)
+
+    matrices = np.zeros((len(r), 4, 4), dtype=r.dtype)
+    matrices[:, 0:3, 0:3] = r * scales[:, np.newaxis, :]
+    matrices[:, 0:3, 3] = translations
+    matrices[:, 3, 3] = 1.0
+
+    inv_matrices = np.zeros((len(r), 4, 4), dtype=r.dtype)
+    inv_matrices[:, 0:3, 0:3] = np.swapaxes(r, 1, 2) * inv_scales[:, :, np.newaxis]
+    inv_matrices[:, 0:3, 3] = -np.einsum('nij,nj->ni', inv_matrices[:, 0:3, 0:3], translations)
+    inv_matrices[:, 3, 3] = 1.0
+    return (matrices, inv_matrices)
+
+# view of the first count entries of array that numpy refuses to write to.
+def _read_only(array, count):
+    view = array[0:count]
+    view.flags.writeable = False
+    return view
+
+# Struct of arrays version of Transform for many objects: translations (N,3), rotations (N,4)
+# quaternions as (w, x, y, z) and scales (N,3). Setters mark entries in a dirty mask, and
+# update_mats recomputes all dirty matrices in a single vectorized call.
+class TransformArray:
+
+    def __init__(self, count = 0):
+        self.m_count = 0
+        self.m_translations = np.zeros((0, 3), dtype='f')
+        self.m_rotations = np.zeros((0, 4), dtype='f')
+        self.m_scales = np.zeros((0, 3), dtype='f')
+        self.m_transform_matrices = np.zeros((0, 4, 4), dtype='f')
+        self.m_transform_inv_matrices = np.zeros((0, 4, 4), dtype='f')
+        self.m_dirty = np.zeros(0, dtype=bool)
+        self.add(count)
+
+    @property
+    def count(self):
+        return self.m_count
+
+    # read only views, use the setters to change them. Views are not kept across add(),
+    # which reallocates the arrays when the capacity grows.
+    @property
+    def translations(self):
+        return _read_only(self.m_translations, self.m_count)
+
+    @property
+    def rotations(self):
+        return _read_only(self.m_rotations, self.m_count)
+
+    @property
+    def scales(self):
+        return _read_only(self.m_scales, self.m_count)
+
+    @property
+    def dirty_mask(self):
+        return _read_only(self.m_dirty, self.m_count)
+
+    @property
+    def transform_matrices(self):
+        self.update_mats()
+        return _read_only(self.m_transform_matrices, self.m_count)
+
+    @property
+    def transform_inv_matrices(self):
+        self.update_mats()
+        return _read_only(self.m_transform_inv_matrices, self.m_count)
+
+    # (N, 16) float32 object to world matrices, flattened like the instance table world field.
+    def instance_matrices(self):
+        return self.transform_matrices.reshape((-1, 16))
+
+    def _reserve(self, capacity):
+        if capacity <= len(self.m_dirty):
+            return
+        capacity = max(capacity, 2 * len(self.m_dirty))
+        grow = capacity - len(self.m_dirty)
+        self.m_translations = np.concatenate([self.m_translations, np.zeros((grow, 3), dtype='f')])
+        self.m_rotations = np.concatenate([self.m_rotations, np.zeros((grow, 4), dtype='f')])
+        self.m_scales = np.concatenate([self.m_scales, np.zeros((grow, 3), dtype='f')])
+        self.m_transform_matrices = np.concatenate([self.m_transform_matrices, np.zeros((grow, 4, 4), dtype='f')])
+        self.m_transform_inv_matrices = np.concatenate([self.m_transform_inv_matrices, np.zeros((grow, 4, 4), dtype='f')])
+        self.m_dirty = np.concatenate([self.m_dirty, np.zeros(grow, dtype=bool)])
+
+    # appends count identity transforms, returns the index of the first one.
+    def add(self, count = 1):
+        first = self.m_count
+        self._reserve(first + count)
+        self.m_count += count
+        new_range = slice(first, self.m_count)
+        self.m_translations[new_range] = 0.0
+        self.m_rotations[new_range] = [1.0, 0.0, 0.0, 0.0]
+        self.m_scales[new_range] = 1.0
+        self.m_transform_matrices[new_range] = Transform.Identity()
+        self.m_transform_inv_matrices[new_range] = Transform.Identity()
+        self.m_dirty[new_range] = False
+        return first
+
+    # indices is anything numpy can index with (int, slice, int array, bool mask).
+    def set_translations(self, indices, values):
+        self.m_translations[0:self.m_count][indices] = values
+        self.m_dirty[0:self.m_count][indices] = True
+
+    def set_rotations(self, indices, values):
+        self.m_rotations[0:self.m_count][indices] = values
+        self.m_dirty[0:self.m_count][indices] = True
+
+    def set_scales(self, indices, values):
+        self.m_scales[0:self.m_count][indices] = values
+        self.m_dirty[0:self.m_count][indices] = True
+
+    # recomputes the matrices of the dirty entries, returns their indices. Callers that track
+    # their dirty entries can pass them as dirty_indices to skip the scan of the mask.
+    def update_mats(self, dirty_indices = None):
+        dirty_indices = np.flatnonzero(self.dirty_mask) if dirty_indices is None else np.asarray(dirty_indices, dtype=np.int64)
+        if len(dirty_indices) == 0:
+            return dirty_indices
+        (matrices, inv_matrices) = trs_matrices(self.m_translations[dirty_indices], self.m_rotations[dirty_indices], self.m_scales[dirty_indices])
+        self.m_transform_matrices[dirty_indices] = matrices
+        self.m_transform_inv_matrices[dirty_indices] = inv_matrices
+        self.m_dirty[dirty_indices] = False
+        return dirty_indices
@@ -0,0 +1,139 @@
+import numpy as np
+from . import mesh
+
+# Optional load time reordering of the index and vertex arrays for vertex fetch locality.
+# Triangles are reordered with tipsify (Sander et al. 2007, "Fast Triangle Reordering for
+# Vertex Locality and Reduced Overdraw") inside each cluster, so meshlet clusters and their
+# bounds stay valid. Vertices are then renumbered in first use order.
+g_cache_size = 16
+
+# Triangle order of indices ((triangle_count, 3), values in [0, vertex_count)) for a
+# vertex cache of cache_size entries.
+def tipsify(indices, vertex_count, cache_size = g_cache_size):
+    triangle_count = len(indices)
+    if triangle_count == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    flat = np.asarray(indices, dtype=np.int64).reshape(-1)
+    valences = np.bincount(flat, minlength=vertex_count)
+    adjacency = (np.argsort(flat, kind='stable') // 3).tolist()
+    adjacency_offsets = np.concatenate([[0], np.cumsum(valences)]).tolist()
+    live = valences.tolist()
+    triangles = np.asarray(indices, dtype=np.int64).tolist()
+    cache_time = [0] * vertex_count
+    emitted = [False] * triangle_count
+    dead_end = []
+    output = []
+    time = cache_size + 1
+    cursor = 0
+
+    fanning = int(flat[0])
+    while fanning >= 0:
+        candidates = []
+        for t in adjacency[adjacency_offsets[fanning]:adjacency_offsets[fanning + 1]]:
+            if emitted[t]:
+                continue
+            emitted[t] = True
+            output.append(t)
+            for v in triangles[t]:
+                live[v] -= 1
+                dead_end.append(v)
+                candidates.append(v)
+                if time - cache_time[v] > cache_size:
+                    cache_time[v] = time
+                    time += 1
+
+        #next fanning vertex: the one that stays longest in the cache after its remaining triangles.
+        fanning = -1
+        best_priority = -1
+        for v in candidates:
+            if live[v] <= 0:
+                continue
+            priority = time - cache_time[v] if time - cache_time[v] + 2 * live[v] <= cache_size else 0
+            if priority > best_priority:
+                (fanning, best_priority) = (v, priority)
+
+        while fanning < 0 and dead_end:
+            v = dead_end.pop()
+            if live[v] > 0:
+                fanning = v
+
+        while fanning < 0 and cursor < vertex_count:
+            if live[cursor] > 0:
+                fanning = cursor
+            cursor += 1
+
+    return np.array(output, dtype=np.int64)
+
+# Triangle order that runs tipsify inside each (triangle_offset, triangle_count) batch.
+# Vertices are made unique per batch, so a batch is finished before the next one starts
+# and the batches keep their triangle ranges.
+def batched_tipsify(indices, batch_offsets, batch_counts, cache_size = g_cache_size):
+    triangle_count = len(indices)
+    batch_ids = np.repeat(np.arange(len(batch_counts)), batch_counts)
+    if len(batch_ids) != triangle_count:
+        raise ValueError("[vertex_cache]: batches must cover all triangles")
+    if np.any(batch_offsets != np.concatenate([[0], np.cumsum(batch_counts)[:-1]])):
+        raise ValueError("[vertex_cache]: batches must be contiguous and in triangle order")
+
+    keys = batch_ids[:, np.newaxis] * (int(np.max(indices)) + 1 if triangle_count > 0 else 1) + np.asarray(indices, dtype=np.int64)
+    (unique_keys, batch_indices) = np.unique(keys, return_inverse=True)
+    return tipsify(batch_indices.reshape((-1, 3)), len(unique_keys), cache_size)
+
+# (new to old, old to new) vertex maps in first use order. Unreferenced vertices are dropped
+# (old to new is -1 for them).
+def first_use_vertex_order(indices, vertex_count):
+    (used_vertices, first_uses) = np.unique(np.asarray(indices, dtype=np.int64).reshape(-1), return_index=True)
+    new_to_old = used_vertices[np.argsort(first_uses, kind='stable')]
+    old_to_new = np.full(vertex_count, -1, dtype=np.int64)
+    old_to_new[new_to_old] = np.arange(len(new_to_old))
+    return (new_to_old, old_to_new)
+
+# Returns a MeshData with the triangles of each cluster (or mesh when there are no
+# clusters) in tipsify order and the vertices in first use order. Vertex ranges of
+# the meshes must not overlap, as for the compact vertex format.
+def optimize(mesh_data, cache_size = g_cache_size):
+    vertices = np.asarray(mesh_data.vertices)
+    indices = np.asarray(mesh_data.indices)
+    mesh_table = np.array(mesh_data.mesh_table)
+    if mesh_data.clusters is not None:
+        (batch_offsets, batch_counts) = (mesh_data.clusters['triangle_offset'], mesh_data.clusters['triangle_count'])
+    else:
+        (batch_offsets, batch_counts) = (mesh_table['index_offset'] // 3, mesh_table['triangle_count'])
+    indices = indices[batched_tipsify(indices, batch_offsets.astype(np.int64), batch_counts.astype(np.int64), cache_size)]
+
+    (new_to_old, old_to_new) = first_use_vertex_order(indices, len(vertices))
+    vertices = vertices[new_to_old]
+    indices = old_to_new[indices].astype(np.uint32)
+
+    #vertex ranges of each mesh in the new order, empty meshes point past the last vertex.
+    for m in range(len(mesh_table)):
+        begin = int(mesh_table['index_offset'][m])
+        mesh_indices = indices.reshape(-1)[begin:begin + 3 * int(mesh_table['triangle_count'][m])]
+        if len(mesh_indices) == 0:
+            mesh_table['vertex_base'][m] = len(vertices)
+            mesh_table['vertex_count'][m] = 0
+            continue
+        mesh_table['vertex_base'][m] = np.min(mesh_indices)
+        mesh_table['vertex_count'][m] = np.max(mesh_indices) - np.min(mesh_indices) + 1
+
+    return mesh.MeshData(vertices, indices, mesh_data.name, mesh_table, mesh_data.mesh_names, mesh_data.clusters)
+
+# Average cache miss ratio (misses per triangle) and average transformed vertex ratio
+# (misses per referenced vertex) of a FIFO vertex cache of cache_size entries.
+def cache_metrics(indices, cache_size = g_cache_size):
+    flat = np.asarray(indices, dtype=np.int64).reshape(-1)
+    if len(flat) == 0:
+        return { 'acmr' : 0.0, 'atvr' : 0.0 }
+
+    insert_time = {}
+    misses = 0
+    for v in flat.tolist():
+        t = insert_time.get(v)
+        if t is None or misses - t >= cache_size:
+            insert_time[v] = misses
+            misses += 1
+    return {
+        'acmr' : misses / (len(flat) // 3),
+        'atvr' : misses / len(insert_time)
+    }
@@ -0,0 +1,110 @@
+import numpy as np
+
+# Vertex formats of the GpuGeo vertex pool, must match VERTEX_FORMAT_COMPACT in geometry.hlsl
+#  Full: 3 floats (pos) + 3 floats (normal) + 2 floats (uv), 32 bytes.
+#  Compact: 3 x 16 bit unorm positions relative to the AABB of the vertex mesh,
+#           2 x 8 bit octahedral normal, 2 x half uv, 12 bytes:
+#           dword 0: pos.x | pos.y << 16
+#           dword 1: pos.z | oct.x << 16 | oct.y << 24
+#           dword 2: uv.x (half) | uv.y (half) << 16
+#           Decoded positions are within half a 16 bit step of the mesh extent on each axis
+#           (exact on flat axes), unit normals within 1 degree, and uvs within half float
+#           rounding (2^-11 relative).
+class VertexFormat:
+    Full = 0
+    Compact = 1
+
+g_vertex_byte_sizes = {
+    VertexFormat.Full : (4 * 3) + (4 * 3) + (4 * 2),
+    VertexFormat.Compact : 4 * 3
+}
+
+def vertex_byte_size(vertex_format):
+    return g_vertex_byte_sizes[vertex_format]
+
+def _sign_not_zero(v):
+    return np.where(v >= 0.0, 1.0, -1.0).astype('f')
+
+def encode_octahedral(normals):
+    lengths = np.linalg.norm(normals, axis=1)
+    n = np.where(lengths[:, np.newaxis] > 0.0, normals / np.maximum(lengths, 1e-30)[:, np.newaxis], np.array([0.0, 0.0, 1.0], dtype='f'))
+    p = n[:, 0:2] / np.sum(np.abs(n), axis=1)[:, np.newaxis]
+    folded = (1.0 - np.abs(p[:, ::-1])) * _sign_not_zero(p)
+    return np.where(n[:, 2:3] < 0.0, folded, p).astype('f')
+
+def decode_octahedral(p):
+    n = np.stack([p[:, 0], p[:, 1], 1.0 - np.abs(p[:, 0]) - np.abs(p[:, 1])], axis=1)
+    t = np.maximum(-n[:, 2:3], 0.0)
+    n[:, 0:2] += np.where(n[:, 0:2] >= 0.0, -t, t)
+    return (n / np.linalg.norm(n, axis=1)[:, np.newaxis]).astype('f')
+
+# mesh of each vertex, from the vertex ranges of the mesh table. Unreferenced vertices go to
+# the mesh of the previous range.
+def _vertex_mesh_ids(first_vertex, vertex_count, mesh_table):
+    if len(mesh_table) == 0:
+        return np.zeros(vertex_count, dtype=np.int64)
+    order = np.argsort(mesh_table['vertex_base'], kind='stable')
+    mesh_ids = np.searchsorted(mesh_table['vertex_base'][order], np.arange(first_vertex, first_vertex + vertex_count), side='right') - 1
+    return order[np.maximum(mesh_ids, 0)]
+
+def _vertex_bounds(first_vertex, vertex_count, mesh_table):
+    if len(mesh_table) == 0:
+        return (np.zeros((vertex_count, 3), dtype='f'), np.zeros((vertex_count, 3), dtype='f'))
+    mesh_ids = _vertex_mesh_ids(first_vertex, vertex_count, mesh_table)
+    return (mesh_table['aabb_min'][mesh_ids], mesh_table['aabb_max'][mesh_ids])
+
+# (vertex_count, 8) float32 vertices into (vertex_count, 3) uint32 compact vertices.
+# Vertex ranges of the meshes in mesh_table must not overlap. first_vertex is the index
+# of vertices[0] in the mesh, to encode a mesh a slice at a time.
+def encode_compact(vertices, mesh_table, first_vertex = 0):
+    (aabb_min, aabb_max) = _vertex_bounds(first_vertex, len(vertices), mesh_table)
+    extents = aabb_max - aabb_min
+    scales = np.where(extents > 0.0, 65535.0 / np.where(extents > 0.0, extents, 1.0), 0.0)
+    positions = np.clip(np.rint((vertices[:, 0:3] - aabb_min) * scales), 0, 65535).astype(np.uint32)
+    octahedral = np.clip(np.rint((encode_octahedral(vertices[:, 3:6]) * 0.5 + 0.5) * 255.0), 0, 255).astype(np.uint32)
+    uvs = vertices[:, 6:8].astype(np.float16).view(np.uint16).astype(np.uint32)
+
+    compact = np.zeros((len(vertices), 3), dtype=np.uint32)
+    compact[:, 0] = positions[:, 0] | (positions[:, 1] << 16)
+    compact[:, 1] = positions[:, 2] | (octahedral[:, 0] << 16) | (octahedral[:, 1] << 24)
+    compact[:, 2] = uvs[:, 0] | (uvs[:, 1] << 16)
+    return compact
+
+# Reference of the hlsl decoder, back to (vertex_count, 8) float32 vertices.
+def decode_compact(compact, mesh_table, first_vertex = 0):
+    (aabb_min, aabb_max) = _vertex_bounds(first_vertex, len(compact), mesh_table)
+    positions = np.stack([compact[:, 0] & 0xffff, compact[:, 0] >> 16, compact[:, 1] & 0xffff], axis=1).astype('f')
+    octahedral = np.stack([(compact[:, 1] >> 16) & 0xff, compact[:, 1] >> 24], axis=1).astype('f')
+    uvs = np.stack([compact[:, 2] & 0xffff, compact[:, 2] >> 16], axis=1).astype(np.uint16).view(np.float16)
+
+    vertices = np.zeros((len(compact), 8), dtype='f')
+    vertices[:, 0:3] = aabb_min + positions * ((aabb_max - aabb_min) / 65535.0)
+    vertices[:, 3:6] = decode_octahedral(octahedral / 255.0 * 2.0 - 1.0)
+    vertices[:, 6:8] = uvs.astype('f')
+    return vertices
+
+# Worst case errors of the compact format on a mesh. Position errors are in object space
+# and relative to the largest mesh extent. Normal errors are in degrees, zero length normals
+# are skipped.
+def compact_error_report(mesh_data):
+    vertices = np.asarray(mesh_data.vertices, dtype='f')
+    decoded = decode_compact(encode_compact(vertices, mesh_data.mesh_table), mesh_data.mesh_table)
+    position_errors = np.max(np.abs(decoded[:, 0:3] - vertices[:, 0:3]), axis=1) if len(vertices) > 0 else np.zeros(1)
+    extents = mesh_data.mesh_table['aabb_max'] - mesh_data.mesh_table['aabb_min']
+    max_extent = float(np.max(extents)) if len(extents) > 0 else 0.0
+
+    normal_lengths = np.linalg.norm(vertices[:, 3:6], axis=1)
+    has_normal = normal_lengths > 0.0
+    cosines = np.sum(decoded[has_normal, 3:6] * vertices[has_normal, 3:6], axis=1) / normal_lengths[has_normal]
+    normal_errors = np.degrees(np.arccos(np.clip(cosines, -1.0, 1.0))) if np.any(has_normal) else np.zeros(1)
+    uv_errors = np.abs(decoded[:, 6:8] - vertices[:, 6:8]) if len(vertices) > 0 else np.zeros(1)
+
+    return {
+        'vertex_count' : len(vertices),
+        'full_byte_size' : len(vertices) * vertex_byte_size(VertexFormat.Full),
+        'compact_byte_size' : len(vertices) * vertex_byte_size(VertexFormat.Compact),
+        'max_position_error' : float(np.max(position_errors)),
+        'max_relative_position_error' : float(np.max(position_errors)) / max_extent if max_extent > 0.0 else 0.0,
+        'max_normal_error_degrees' : float(np.max(normal_errors)),
+        'max_uv_error' : float(np.max(uv_errors))
+    }